@@ -1,30 +1,122 @@
+import logging
+import threading
+
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
 from flask_socketio import SocketIO
 from config import Config
+from app.tasks import TaskQueue
+from app.mpesa import MpesaClient
+from app.mailer import MailDispatcher
+from app.exports import PdfExporter
+from app.limits import WithdrawalLimiter
+from app.search import SearchIndexer
+from app.cache import ResponseCache
+from app.instrumentation import RequestMetrics, init_query_budgets
+from app.database import engine_options, init_database
+from app.replicas import ReplicaSet, RoutingSession
+from app.tenancy import TenantRegistry
+
+# Extensions are created unbound and attached to the app in create_app()
+db = SQLAlchemy(session_options={'class_': RoutingSession})  # Routes tenant databases and replica reads
+login_manager = LoginManager()
+socketio = SocketIO()
+task_queue = TaskQueue()
+mpesa = MpesaClient()
+mail_dispatcher = MailDispatcher()
+metrics = RequestMetrics()
+pdf_exporter = PdfExporter()
+withdrawal_limiter = WithdrawalLimiter()
+search_indexer = SearchIndexer()
+response_cache = ResponseCache()
+tenants = TenantRegistry()
+replicas = ReplicaSet()
+
+
+def create_app(config_class=Config, migrations=True):
+    """Build the Flask app, bind the extensions and register the blueprints.
+
+    The schema is managed by migrations (``flask db upgrade``), not created on
+    start-up. Servers pass ``migrations=False``: Flask-Migrate (and Alembic
+    behind it) is only needed by the ``flask db`` commands.
+    """
+    app = Flask(__name__)
+    app.config.from_object(config_class)
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config)
+
+    db.init_app(app)
+    init_database(app, db)
+    tenants.init_app(app, db)  # First, so every other request hook runs as the request's tenant
+    replicas.init_app(app)
+    if migrations:
+        from flask_migrate import Migrate
+        Migrate(app, db, render_as_batch=True)  # Batch mode lets Alembic alter SQLite tables
+    login_manager.init_app(app)
+    metrics.init_app(app)
+    socketio.init_app(app, message_queue=app.config['SOCKETIO_MESSAGE_QUEUE'],
+                      async_mode=app.config['SOCKETIO_ASYNC_MODE'])
+    task_queue.init_app(app)
+    mpesa.init_app(app)
+    mail_dispatcher.init_app(app, db)
+    pdf_exporter.init_app(app)
+    withdrawal_limiter.init_app(app)
+    search_indexer.init_app(app, db)
+    response_cache.init_app(app)
+    init_query_budgets(app)
+
+    from app import models, services  # noqa: F401 - services registers the session hooks
+    from app.views import register_blueprints
+    register_blueprints(app)
+    logging.basicConfig(level=logging.INFO)
+    return app
 
-# Initialize Flask app
-app = Flask(__name__)
-app.config['SECRET_KEY'] = 'your_secret_key'
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///site.db'  # Change as needed
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config.from_object(Config)
 
-# Initialize extensions
-db = SQLAlchemy(app)
-login_manager = LoginManager(app)
-socketio = SocketIO(app)
+def warm_up(app):
+    """Do the one-off work of a worker's first requests up front.
+
+    Run in a preloading server's master (see ``gunicorn.conf.py``) so forked
+    workers share the result instead of each paying for it.
+    """
+    import flask_mail  # noqa: F401 - imported lazily by the mail dispatcher and the MFA views
+    import pyotp  # noqa: F401
+    import requests  # noqa: F401
+    app.url_map.update()
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+
+
+def after_fork(app):
+    """Reset what a forked worker must not share with its parent: pooled connections and the local cache.
+
+    Background threads are started on first use in whichever process needs
+    them, so none are inherited.
+    """
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)  # The parent's connections stay usable by the parent
+    tenants.after_fork()
+    replicas.after_fork()
+    mpesa.after_fork()
+    response_cache.after_fork()
+
 
 # User loader for Flask-Login
 @login_manager.user_loader
 def load_user(user_id):
     from app.models import User
-    return User.query.get(int(user_id))
+    return db.session.get(User, int(user_id))
+
+
+_default_app_lock = threading.Lock()
 
-# Import routes, models, utils, services after app initialization to avoid circular imports
-from app import routes, models, utils, services
 
-# Create the database tables
-with app.app_context():
-    db.create_all()
+def __getattr__(name):
+    # ``from app import app`` (``flask --app app``, batch.py, the benchmarks) builds the default app
+    # on first use; servers import wsgi.py instead
+    if name != 'app':
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    with _default_app_lock:
+        if 'app' not in globals():
+            globals()['app'] = create_app()
+    return globals()['app']
@@ -0,0 +1,100 @@
+# archive.py
+"""Hot/cold tiering: move old chat messages and read notifications to archive tables.
+
+``message`` and ``notification`` only ever grow, and every inbox page, chat
+backlog and insert pays for the size of their indexes. The archive job moves
+chat messages older than ``ARCHIVE_MESSAGES_AFTER_DAYS`` to
+``message_archive`` and read notifications older than
+``ARCHIVE_NOTIFICATIONS_AFTER_DAYS`` to ``notification_archive``, so the hot
+tables hold recent rows only and their indexes stay small enough to be cached.
+
+Rows move ``ARCHIVE_BATCH_SIZE`` at a time. Each batch is one short
+transaction that deletes the rows from the hot table (``DELETE ... RETURNING``)
+and inserts exactly what it deleted into the archive: readers see every row in
+one table or the other, live writers wait for one batch at most, two archivers
+never copy the same row, and an interrupted run just picks up where it was.
+The job sleeps ``ARCHIVE_BATCH_PAUSE`` seconds between batches so that writers
+waiting on the database lock get it before the next batch does.
+
+Messages are archived in id order, stopping at the first one that is still
+too new, so every archived message id is lower than every hot one. The read
+paths in ``MessageService``, ``NotificationService`` and ``SearchService`` fall
+back to the archive tables when a page runs past the hot rows.
+"""
+import time
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import delete, insert, select
+
+from app import db
+from app.models import ArchivedMessage, ArchivedNotification, Message, Notification
+
+
+def _move(model, archive_model, *criteria):
+    """Move the rows of ``model`` matching ``criteria`` to ``archive_model`` in one transaction."""
+    columns = [getattr(model, column.name) for column in archive_model.__table__.columns]
+    rows = db.session.execute(
+        delete(model).where(*criteria).returning(*columns).execution_options(synchronize_session=False)
+    ).all()
+    if rows:
+        db.session.execute(insert(archive_model), [row._asdict() for row in rows])
+    db.session.commit()
+    return rows
+
+
+def archive_messages(batch_size=None, progress=None):
+    """Move chat messages older than ``ARCHIVE_MESSAGES_AFTER_DAYS`` to the archive; returns how many moved."""
+    config = current_app.config
+    cutoff = datetime.utcnow() - timedelta(days=config['ARCHIVE_MESSAGES_AFTER_DAYS'])
+    batch_size = batch_size or config['ARCHIVE_BATCH_SIZE']
+    moved = 0
+    started = time.perf_counter()
+    while True:
+        # The oldest messages by id, up to the first that is too new to archive
+        head = db.session.execute(
+            select(Message.id, Message.timestamp).order_by(Message.id).limit(batch_size)
+        ).all()
+        upper = None
+        for message_id, timestamp in head:
+            if timestamp is not None and timestamp >= cutoff:
+                break
+            upper = message_id
+        if upper is None:
+            db.session.commit()
+            return moved
+        moved += len(_move(Message, ArchivedMessage, Message.id <= upper))
+        if progress:
+            progress('messages', moved, time.perf_counter() - started)
+        time.sleep(config['ARCHIVE_BATCH_PAUSE'])
+
+
+def archive_notifications(batch_size=None, progress=None):
+    """Move read notifications older than ``ARCHIVE_NOTIFICATIONS_AFTER_DAYS`` to the archive.
+
+    Unread ones stay in place however old they are: they still count towards
+    the member's unread badge and can be marked read. Returns how many moved.
+    """
+    config = current_app.config
+    cutoff = datetime.utcnow() - timedelta(days=config['ARCHIVE_NOTIFICATIONS_AFTER_DAYS'])
+    batch_size = batch_size or config['ARCHIVE_BATCH_SIZE']
+    moved, after = 0, 0
+    started = time.perf_counter()
+    while True:
+        ids = (select(Notification.id)
+               .where(Notification.id > after, Notification.is_read.is_(True), Notification.timestamp < cutoff)
+               .order_by(Notification.id).limit(batch_size).scalar_subquery())
+        rows = _move(Notification, ArchivedNotification, Notification.id.in_(ids))
+        if not rows:
+            return moved
+        moved += len(rows)
+        after = max(row.id for row in rows)
+        if progress:
+            progress('notifications', moved, time.perf_counter() - started)
+        time.sleep(config['ARCHIVE_BATCH_PAUSE'])
+
+
+def archive_all(batch_size=None, progress=None):
+    """Run both archive passes; returns ``{'messages': n, 'notifications': n}``."""
+    return {'messages': archive_messages(batch_size, progress),
+            'notifications': archive_notifications(batch_size, progress)}
@@ -0,0 +1,229 @@
+# cache.py
+"""Response cache for read-mostly pages: cached values, rendered blocks and conditional GETs.
+
+The dashboard, group, calendar and admin dashboard pages are read far more
+often than the rows behind them change. Everything they cache is keyed on the
+version counters of the *scopes* it was built from: ``user:<id>`` (a member's
+balance, inbox and groups, and the navbar's unread badge) and ``group:<id>``
+(a group's details, members and meetings), prefixed for tenants with a
+database of their own, whose ids repeat the main database's. Session hooks
+in ``services.py`` collect the scopes a transaction touches and bump their counters once it
+commits. Entries built from older versions are never read again; nothing is
+deleted, they just age out (``CACHE_DEFAULT_TIMEOUT``) or fall off the LRU.
+
+* ``cached`` memoises a value, e.g. a group's summary;
+* ``cache_block`` (a Jinja global, used with ``{% call %}``) caches a rendered
+  template block. Its body only runs on a miss, so the queries it needs are
+  passed in by the view as loaders and called from inside the block;
+* ``conditional`` sets an ETag and Last-Modified from the versions and answers
+  a repeat view with 304 before the page is rendered.
+
+Backends:
+
+* ``MemoryCache`` - in-process LRU with per-entry TTL, for a single process.
+  Its counters are per process too: with several workers a commit in one is
+  only seen by the others once their entries expire, and ETags carry a
+  per-process token so they never validate against another process;
+* ``RedisCache`` - set ``CACHE_BACKEND=redis://...`` to share entries and
+  counters between workers and nodes.
+"""
+import hashlib
+import pickle
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from flask import Response, g, has_app_context, make_response, request, session
+from markupsafe import Markup
+from werkzeug.http import is_resource_modified
+
+from app.tenancy import scope_prefix
+
+_MISSING = object()
+
+
+def user_scope(user_id):
+    return f'{scope_prefix()}user:{user_id}'
+
+
+def group_scope(group_id):
+    return f'{scope_prefix()}group:{group_id}'
+
+
+class MemoryCache:
+    """Per-process LRU of ``key -> (expires, value)`` and the scope counters, under one lock.
+
+    Values are stored as they are, not copied: callers must not mutate what
+    they get back.
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.token = uuid.uuid4().hex[:8]  # Counters of different processes are unrelated
+        self._entries = OrderedDict()
+        self._versions = {}  # scope -> (counter, bumped at); one per user/group, never evicted
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return _MISSING
+            if item[0] <= time.monotonic():
+                del self._entries[key]
+                return _MISSING
+            self._entries.move_to_end(key)
+            return item[1]
+
+    def set(self, key, value, timeout):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + timeout, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def versions(self, scopes):
+        """``(counter, bumped at)`` per scope; a scope never bumped starts at ``(0, now)``."""
+        now = time.time()
+        with self._lock:
+            return [self._versions.setdefault(scope, (0, now)) for scope in scopes]
+
+    def bump(self, scopes):
+        now = time.time()
+        with self._lock:
+            for scope in scopes:
+                counter, _ = self._versions.get(scope, (0, now))
+                self._versions[scope] = (counter + 1, now)
+
+
+class RedisCache:
+    """Entries and counters shared by every process through Redis.
+
+    A counter is a hash of ``v`` (counter) and ``t`` (bumped at). Keys include
+    ``t``, so a counter that Redis evicts and recreates at zero cannot bring
+    back entries built from the old one.
+    """
+
+    token = ''
+
+    def __init__(self, url, prefix='sacco:cache:'):
+        import redis  # Only needed when a Redis backend is configured
+        self._redis = redis.Redis.from_url(url)
+        self._prefix = prefix
+
+    def get(self, key):
+        value = self._redis.get(self._prefix + key)
+        return _MISSING if value is None else pickle.loads(value)
+
+    def set(self, key, value, timeout):
+        self._redis.set(self._prefix + key, pickle.dumps(value), ex=max(int(timeout), 1))
+
+    def versions(self, scopes):
+        now = repr(time.time())
+        pipe = self._redis.pipeline()
+        for scope in scopes:
+            pipe.hsetnx(f'{self._prefix}v:{scope}', 't', now)
+            pipe.hmget(f'{self._prefix}v:{scope}', 'v', 't')
+        return [(int(counter or 0), float(bumped)) for counter, bumped in pipe.execute()[1::2]]
+
+    def bump(self, scopes):
+        now = repr(time.time())
+        pipe = self._redis.pipeline()
+        for scope in scopes:
+            pipe.hincrby(f'{self._prefix}v:{scope}', 'v', 1)
+            pipe.hset(f'{self._prefix}v:{scope}', 't', now)
+        pipe.execute()
+
+
+class ResponseCache:
+    """Version-keyed cache of values, template blocks and page validators."""
+
+    def __init__(self, app=None):
+        self.app = None
+        self.backend = None
+        self.started = time.time()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        config = app.config
+        config.setdefault('CACHE_ENABLED', True)
+        config.setdefault('CACHE_DEFAULT_TIMEOUT', 300)
+        config.setdefault('CACHE_MAX_ENTRIES', 10000)
+        backend = config.setdefault('CACHE_BACKEND', 'memory')
+        self.backend = MemoryCache(config['CACHE_MAX_ENTRIES']) if backend == 'memory' else RedisCache(backend)
+        app.jinja_env.globals.update(cache_block=self.cache_block, user_scope=user_scope, group_scope=group_scope)
+        app.extensions['response_cache'] = self
+
+    def after_fork(self):
+        """Give a forked worker an in-process cache (and ETag token) of its own."""
+        if isinstance(self.backend, MemoryCache):
+            self.backend = MemoryCache(self.backend.max_entries)
+
+    @property
+    def enabled(self):
+        return self.app.config['CACHE_ENABLED']
+
+    def versions(self, scopes):
+        """Versions of ``scopes``, read from the backend once per request."""
+        known = g.setdefault('_cache_versions', {})
+        missing = [scope for scope in scopes if scope not in known]
+        if missing:
+            known.update(zip(missing, self.backend.versions(missing)))
+        return [known[scope] for scope in scopes]
+
+    def bump(self, scopes):
+        """Make everything cached under ``scopes`` stale; called once a change has committed."""
+        scopes = sorted(set(scopes))
+        if scopes:
+            self.backend.bump(scopes)
+        if has_app_context():
+            g.pop('_cache_versions', None)
+
+    def _digest(self, name, scopes):
+        versions = self.versions(scopes)
+        key = repr((self.backend.token, name, list(zip(scopes, versions))))
+        return hashlib.sha1(key.encode()).hexdigest(), versions
+
+    def cached(self, name, scopes, loader, timeout=None):
+        """Return ``loader()``, computed once per version of ``scopes``."""
+        if not self.enabled:
+            return loader()
+        digest, _ = self._digest(name, scopes)
+        key = f'{name}@{digest}'
+        value = self.backend.get(key)
+        if value is _MISSING:
+            value = loader()
+            self.backend.set(key, value, timeout or self.app.config['CACHE_DEFAULT_TIMEOUT'])
+        return value
+
+    def cache_block(self, name, *scopes, timeout=None, caller=None):
+        """``{% call cache_block(name, scope, ...) %}...{% endcall %}``: the body renders on a miss only."""
+        return Markup(self.cached(f'block:{name}', scopes, lambda: str(caller()), timeout))
+
+    def conditional(self, name, scopes, render):
+        """Respond with ``render()`` and validators, or 304 if the client's copy is still current.
+
+        ``name`` identifies the page (including any query arguments it depends
+        on), ``scopes`` everything it shows. Pages with flashed messages waiting
+        are always rendered and never validated: the flash is part of the body.
+        """
+        if not self.enabled or '_flashes' in session:
+            return make_response(render())
+        etag, versions = self._digest(f'page:{name}', scopes)
+        last_modified = datetime.fromtimestamp(max((bumped for _, bumped in versions), default=self.started),
+                                               timezone.utc)
+        if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+            response = Response(status=304)
+        else:
+            response = make_response(render())
+        response.set_etag(etag)
+        response.last_modified = last_modified
+        # Browsers keep the page but check back every time; only this user may reuse it
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        response.vary.add('Cookie')
+        return response
@@ -0,0 +1,68 @@
+# database.py
+from functools import partial
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+
+
+def _is_memory_sqlite(url):
+    return url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:')
+
+
+def engine_options(config):
+    """Build ``SQLALCHEMY_ENGINE_OPTIONS`` from the ``DB_*`` settings.
+
+    Pool sizing applies to server databases and file-backed SQLite (a
+    ``QueuePool``); an in-memory SQLite database keeps its single-connection
+    pool. Options already in ``SQLALCHEMY_ENGINE_OPTIONS`` win.
+    """
+    url = make_url(config['SQLALCHEMY_DATABASE_URI'])
+    options = {'pool_pre_ping': config['DB_POOL_PRE_PING']}
+    if not _is_memory_sqlite(url):
+        options.update(
+            pool_size=config['DB_POOL_SIZE'],
+            max_overflow=config['DB_MAX_OVERFLOW'],
+            pool_timeout=config['DB_POOL_TIMEOUT'],
+            pool_recycle=config['DB_POOL_RECYCLE'],
+        )
+    options.update(config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    return options
+
+
+def sqlite_pragmas(config):
+    """PRAGMAs run on every new SQLite connection (dev and single-node deployments)."""
+    pragmas = {'busy_timeout': config['SQLITE_BUSY_TIMEOUT']}  # Wait for a competing writer instead of failing
+    if config['SQLITE_WAL']:
+        pragmas.update(
+            journal_mode='WAL',  # Readers no longer block the writer (or each other)
+            synchronous='NORMAL',  # Durable at checkpoints; safe with WAL
+            cache_size=-config['SQLITE_CACHE_KB'],  # Negative means KiB
+            temp_store='MEMORY',
+        )
+    return pragmas
+
+
+def _apply_pragmas(pragmas, dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name}={value}')
+    finally:
+        cursor.close()
+
+
+def init_database(app, db):
+    """Apply the connection PRAGMAs to every SQLite engine of ``app``."""
+    with app.app_context():
+        for engine in db.engines.values():
+            if engine.dialect.name == 'sqlite' and not _is_memory_sqlite(engine.url):
+                event.listen(engine, 'connect', partial(_apply_pragmas, sqlite_pragmas(app.config)))
+
+
+def create_engine_like(config, uri):
+    """An engine for another database (a tenant's, a replica) with the app's pool settings and PRAGMAs."""
+    engine = create_engine(uri, **engine_options({**config, 'SQLALCHEMY_DATABASE_URI': uri,
+                                                  'SQLALCHEMY_ENGINE_OPTIONS': None}))
+    if engine.dialect.name == 'sqlite' and not _is_memory_sqlite(engine.url):
+        event.listen(engine, 'connect', partial(_apply_pragmas, sqlite_pragmas(config)))
+    return engine
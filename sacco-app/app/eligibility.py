@@ -0,0 +1,201 @@
+# eligibility.py
+"""Loan eligibility: how much a member can borrow right now.
+
+A member may owe at most ``LOAN_SAVINGS_MULTIPLE`` times their savings, so
+their available credit is that limit minus what they already owe (their
+exposure, ``MemberBalance.loan_cents``, which includes accrued interest) and
+minus the loan requests they have outstanding: pending ones, and approved ones,
+which are not on the ledger. A pending request can be approved while it fits
+within the limit less exposure and approved requests (``approvable``).
+Members whose share of on-time repayments is below ``LOAN_MIN_ON_TIME_RATIO``
+get no new credit until their record improves.
+
+Nothing here scans history on the request path. Savings and exposure come
+from the balance snapshot the ledger keeps; the repayment record is a
+``CreditProfile`` row per member, incremented as each repayment of a loan
+posts (``LedgerService.post`` of a ``loan_repayment`` referencing the loan). One lookup by
+primary key (or one ``IN`` query for a page of the loan queue) answers
+``available_credit``. ``rebuild_profiles`` (``python batch.py eligibility``)
+recomputes every profile from the ledger in member_id slices.
+
+A repayment is on time if, once applied, the loan is not behind a flat
+schedule: by the end of month *n* after approval, *n* equal instalments of the
+total due.
+"""
+import time
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import String, delete, func, insert, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app import db
+from app.models import CreditProfile, LedgerEntry, Loan, LoanRequest, MemberBalance
+from app.money import from_cents, to_cents
+
+
+def months_between(start, at):
+    """Whole months from ``start`` to ``at`` (0 while the first month is running)."""
+    months = (at.year - start.year) * 12 + at.month - start.month
+    if (at.day, at.time()) < (start.day, start.time()):
+        months -= 1
+    return max(months, 0)
+
+
+def repayment_on_time(due_cents, repayment_period, start, paid_cents, at):
+    """Whether a loan that has ``paid_cents`` repaid at ``at`` is up to date with its schedule."""
+    period = max(repayment_period or 1, 1)
+    instalments = min(months_between(start, at), period)
+    return paid_cents >= due_cents * instalments // period
+
+
+def loan_on_time(loan, at=None):
+    """``repayment_on_time`` for a ``Loan`` whose ``total_paid`` already includes the latest repayment."""
+    return repayment_on_time(to_cents(loan.calculate_total_due()), loan.repayment_period,
+                             loan.approved_at or loan.requested_at, to_cents(loan.total_paid or 0),
+                             at or datetime.utcnow())
+
+
+def credit_limit(savings_cents, exposure_cents, repayments, on_time_repayments, config=None, pending_cents=0,
+                 approved_cents=0):
+    """The credit profile of a member with these balances, outstanding requests and repayment record."""
+    config = config or current_app.config
+    ratio = on_time_repayments / repayments if repayments else None
+    max_loan_cents = int(savings_cents * config['LOAN_SAVINGS_MULTIPLE'])
+    approvable_cents = max(max_loan_cents - exposure_cents - approved_cents, 0)
+    available_cents = max(approvable_cents - pending_cents, 0)
+    reason = None
+    if ratio is not None and ratio < config['LOAN_MIN_ON_TIME_RATIO']:
+        available_cents, approvable_cents, reason = 0, 0, 'Too few repayments made on time.'
+    elif not available_cents:
+        reason = ('Savings do not cover any more borrowing.' if not pending_cents + approved_cents
+                  else 'Savings do not cover any more borrowing beyond the loan requests outstanding.')
+    return {
+        'savings': from_cents(savings_cents),
+        'exposure': from_cents(exposure_cents),
+        'requested': from_cents(pending_cents + approved_cents),
+        'max_loan': from_cents(max_loan_cents),
+        'available': from_cents(available_cents),
+        'available_cents': available_cents,
+        'approvable': from_cents(approvable_cents),
+        'approvable_cents': approvable_cents,
+        'repayments': repayments,
+        'on_time_ratio': ratio,
+        'reason': reason,
+    }
+
+
+def _requested(status):
+    """The member's total of loan requests in ``status``, as a column of the balance query."""
+    return (select(func.coalesce(func.sum(LoanRequest.amount), 0.0))
+            .where(LoanRequest.member_id == MemberBalance.member_id, LoanRequest.status == status)
+            .scalar_subquery())
+
+
+def available_credit_many(member_ids):
+    """``{member_id: credit profile}`` for ``member_ids``, in one query."""
+    member_ids = list(dict.fromkeys(member_ids))
+    if not member_ids:
+        return {}
+    rows = {row.member_id: row for row in db.session.execute(
+        select(MemberBalance.member_id, MemberBalance.savings_cents, MemberBalance.loan_cents,
+               CreditProfile.repayments, CreditProfile.on_time_repayments,
+               _requested('pending').label('pending'), _requested('approved').label('approved'))
+        .outerjoin(CreditProfile, CreditProfile.member_id == MemberBalance.member_id)
+        .where(MemberBalance.member_id.in_(member_ids))
+    )}
+    config = current_app.config
+    profiles = {}
+    for member_id in member_ids:
+        row = rows.get(member_id)
+        if row is None:
+            profiles[member_id] = credit_limit(0, 0, 0, 0, config)
+        else:
+            profiles[member_id] = credit_limit(row.savings_cents, row.loan_cents, row.repayments or 0,
+                                               row.on_time_repayments or 0, config,
+                                               to_cents(row.pending), to_cents(row.approved))
+    return profiles
+
+
+def available_credit(member_id):
+    """The member's credit profile: savings, exposure, limits and repayment record."""
+    return available_credit_many([member_id])[member_id]
+
+
+def record_repayment(member_id, on_time, at=None):
+    """Count one repayment in the member's profile; part of the caller's transaction."""
+    at = at or datetime.utcnow()
+    row = {'member_id': member_id, 'repayments': 0, 'on_time_repayments': 0, 'updated_at': at}
+    dialect = db.session.get_bind(mapper=CreditProfile).dialect.name
+    if dialect == 'sqlite':
+        db.session.execute(sqlite.insert(CreditProfile).on_conflict_do_nothing(), [row])
+    elif dialect == 'postgresql':
+        db.session.execute(postgresql.insert(CreditProfile).on_conflict_do_nothing(), [row])
+    elif db.session.get(CreditProfile, member_id) is None:
+        db.session.execute(insert(CreditProfile), [row])
+    db.session.execute(
+        update(CreditProfile).where(CreditProfile.member_id == member_id)
+        .values(repayments=CreditProfile.repayments + 1,
+                on_time_repayments=CreditProfile.on_time_repayments + (1 if on_time else 0),
+                last_repayment_at=at, updated_at=at)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def _slice_profiles(after, upper):
+    """Profile rows for members in ``(after, upper]``, replayed from their repayment entries."""
+    paid_after = func.sum(LedgerEntry.amount_cents).over(partition_by=LedgerEntry.reference, order_by=LedgerEntry.id)
+    rows = db.session.execute(
+        select(LedgerEntry.member_id, LedgerEntry.created_at, paid_after.label('paid_cents'), Loan.amount,
+               Loan.interest_rate, Loan.repayment_period, Loan.approved_at, Loan.requested_at)
+        .join(Loan, (Loan.id.cast(String) == LedgerEntry.reference) & (Loan.borrower_id == LedgerEntry.member_id))
+        .where(LedgerEntry.entry_type == 'loan_repayment',
+               LedgerEntry.member_id > after, LedgerEntry.member_id <= upper)
+    )
+    now = datetime.utcnow()
+    profiles = {}
+    for row in rows:
+        due_cents = to_cents(row.amount * (1 + row.interest_rate / 100))  # Loan.calculate_total_due
+        on_time = repayment_on_time(due_cents, row.repayment_period, row.approved_at or row.requested_at,
+                                    row.paid_cents, row.created_at)
+        profile = profiles.setdefault(row.member_id, {'member_id': row.member_id, 'repayments': 0,
+                                                      'on_time_repayments': 0, 'last_repayment_at': None,
+                                                      'updated_at': now})
+        profile['repayments'] += 1
+        profile['on_time_repayments'] += on_time
+        if profile['last_repayment_at'] is None or row.created_at > profile['last_repayment_at']:
+            profile['last_repayment_at'] = row.created_at
+    return list(profiles.values())
+
+
+def rebuild_profiles(chunk_size=None, progress=None):
+    """Recompute every credit profile from the ledger, ``chunk_size`` members per transaction.
+
+    Each slice locks its members' balance rows (where the database supports
+    it), so repayments posted meanwhile wait for the slice instead of being
+    lost. Returns ``{'members': n, 'profiles': n, 'elapsed': seconds}``.
+    """
+    chunk_size = chunk_size or current_app.config['BATCH_CHUNK_SIZE']
+    started = time.perf_counter()
+    after, members, written = 0, 0, 0
+    while True:
+        ids = db.session.execute(
+            select(MemberBalance.member_id).where(MemberBalance.member_id > after)
+            .order_by(MemberBalance.member_id).limit(chunk_size).with_for_update()
+        ).scalars().all()
+        if not ids:
+            db.session.commit()
+            break
+        upper = ids[-1]
+        profiles = _slice_profiles(after, upper)
+        # CreditProfile has no tenant_id: delete by the slice's own members, as other tenants' ids interleave
+        db.session.execute(delete(CreditProfile).where(CreditProfile.member_id.in_(ids)))
+        if profiles:
+            db.session.execute(insert(CreditProfile), profiles)
+        db.session.commit()
+        members += len(ids)
+        written += len(profiles)
+        after = upper
+        if progress is not None:
+            progress(members, written, time.perf_counter() - started)
+    return {'members': members, 'profiles': written, 'elapsed': time.perf_counter() - started}
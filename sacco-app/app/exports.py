@@ -0,0 +1,332 @@
+# exports.py
+"""Streaming CSV/XLSX writers and the PDF statement renderer behind the export routes.
+
+Rows come from ``iter_rows``, which runs a Core SELECT with ``yield_per`` (a
+server-side cursor where the driver supports one) and hands them over one
+partition at a time, so an export of millions of rows never holds more than a
+chunk in memory. The writers are generators of ``bytes`` for a streamed
+Flask ``Response``:
+
+* ``stream_csv`` yields a few hundred rows of CSV at a time;
+* ``stream_xlsx`` writes a minimal SpreadsheetML workbook into a zip stream
+  (no seeking; entry sizes go in data descriptors), starting a new sheet every
+  ``XLSX_MAX_ROWS`` rows because Excel stops at 1,048,576.
+
+PDF statements are rendered by ``PdfExporter`` on a process pool; the web
+worker only submits the job and polls for the finished file.
+"""
+import csv
+import io
+import logging
+import multiprocessing
+import os
+import re
+import threading
+import uuid
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime
+from decimal import Decimal
+from xml.sax.saxutils import escape
+
+from flask import Response, stream_with_context
+
+from app.tenancy import current_tenant, tenant_context
+
+logger = logging.getLogger(__name__)
+
+XLSX_MAX_ROWS = 1000000  # Data rows per sheet; Excel's limit is 1,048,576 including the header
+_FLUSH_ROWS = 500  # Rows formatted between writes to the response stream
+
+
+def iter_rows(session, statement, chunk_size):
+    """Yield result rows of ``statement`` while fetching only ``chunk_size`` at a time."""
+    result = session.execute(statement.execution_options(yield_per=chunk_size))
+    for partition in result.partitions():
+        yield from partition
+
+
+def _text(value):
+    if value is None:
+        return ''
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    return str(value)
+
+
+def stream_csv(headers, rows):
+    """Yield ``rows`` as UTF-8 CSV (with a BOM so Excel detects the encoding)."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(headers)
+    yield '\ufeff'.encode() + buffer.getvalue().encode()
+    buffer.seek(0)
+    buffer.truncate()
+    for n, row in enumerate(rows, 1):
+        writer.writerow([_text(value) for value in row])
+        if n % _FLUSH_ROWS == 0:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode()
+
+
+class _StreamSink:
+    """Write-only file object for ZipFile: collects bytes until the generator drains them."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+_ILLEGAL_XML = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+
+def _column_name(index):
+    name = ''
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        name = chr(65 + remainder) + name
+    return name
+
+
+def _cell(ref, value):
+    if value is None:
+        return ''
+    if isinstance(value, (int, float, Decimal)) and not isinstance(value, bool):
+        return f'<c r="{ref}"><v>{value}</v></c>'
+    if isinstance(value, datetime):
+        value = value.strftime('%Y-%m-%d %H:%M:%S')
+    elif isinstance(value, date):
+        value = value.isoformat()
+    text = escape(_ILLEGAL_XML.sub('', str(value)))
+    return f'<c r="{ref}" t="inlineStr"><is><t>{text}</t></is></c>'
+
+
+_SHEET_HEAD = (b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+               b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>')
+_SHEET_TAIL = b'</sheetData></worksheet>'
+
+
+def stream_xlsx(headers, rows, sheet_name='Export'):
+    """Yield an .xlsx workbook of ``rows`` without building it in memory."""
+    sink = _StreamSink()
+    columns = [_column_name(i) for i in range(len(headers))]
+    sheets = 0
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED) as workbook:
+        sheet = None
+        sheet_rows = 0
+        rows = iter(rows)
+        while True:
+            if sheet is None:
+                sheets += 1
+                sheet = workbook.open(f'xl/worksheets/sheet{sheets}.xml', 'w', force_zip64=True)
+                sheet.write(_SHEET_HEAD)
+                sheet.write(('<row r="1">' + ''.join(_cell(f'{c}1', h) for c, h in zip(columns, headers))
+                             + '</row>').encode())
+                sheet_rows = 1
+            parts = []
+            for row in rows:
+                sheet_rows += 1
+                parts.append(f'<row r="{sheet_rows}">'
+                             + ''.join(_cell(f'{c}{sheet_rows}', v) for c, v in zip(columns, row)) + '</row>')
+                if len(parts) == _FLUSH_ROWS or sheet_rows > XLSX_MAX_ROWS:
+                    break
+            else:
+                rows = None
+            if parts:
+                sheet.write(''.join(parts).encode())
+            if rows is None or sheet_rows > XLSX_MAX_ROWS:
+                sheet.write(_SHEET_TAIL)
+                sheet.close()
+                sheet = None
+            yield sink.drain()
+            if rows is None:
+                break
+        _write_workbook_parts(workbook, sheet_name, sheets)
+    yield sink.drain()
+
+
+def _write_workbook_parts(workbook, sheet_name, sheets):
+    names = [sheet_name[:31] if n == 1 else f'{sheet_name[:27]} ({n})' for n in range(1, sheets + 1)]
+    workbook.writestr('[Content_Types].xml', (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        + ''.join(f'<Override PartName="/xl/worksheets/sheet{n}.xml" '
+                  'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+                  for n in range(1, sheets + 1))
+        + '</Types>'))
+    workbook.writestr('_rels/.rels', (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/></Relationships>'))
+    workbook.writestr('xl/workbook.xml', (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships"><sheets>'
+        + ''.join(f'<sheet name="{escape(name)}" sheetId="{n}" r:id="rId{n}"/>' for n, name in enumerate(names, 1))
+        + '</sheets></workbook>'))
+    workbook.writestr('xl/_rels/workbook.xml.rels', (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        + ''.join(f'<Relationship Id="rId{n}" '
+                  'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+                  f'Target="worksheets/sheet{n}.xml"/>' for n in range(1, sheets + 1))
+        + '</Relationships>'))
+
+
+EXPORT_FORMATS = {
+    'csv': ('text/csv; charset=utf-8', stream_csv),
+    'xlsx': ('application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', stream_xlsx),
+}
+
+
+def export_response(filename, fmt, headers, rows):
+    """A streamed download of ``rows`` as ``filename.<fmt>`` (``csv`` or ``xlsx``)."""
+    mimetype, writer = EXPORT_FORMATS[fmt]
+    response = Response(stream_with_context(writer(headers, rows)), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}.{fmt}"'
+    return response
+
+
+def render_pdf(title, lines, lines_per_page=64):
+    """Render ``lines`` of monospaced text as a paginated PDF and return its bytes."""
+    def pdf_text(value):
+        return value.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)').encode('latin-1', 'replace')
+
+    pages = [lines[i:i + lines_per_page] for i in range(0, len(lines), lines_per_page)] or [[]]
+    objects = [b'<< /Type /Catalog /Pages 2 0 R >>', None,
+               b'<< /Type /Font /Subtype /Type1 /BaseFont /Courier >>']
+    page_ids = []
+    for number, page in enumerate(pages, 1):
+        content = [b'BT /F1 8 Tf 10 TL 36 806 Td']
+        content.append(b'(' + pdf_text(f'{title}    page {number} of {len(pages)}') + b') Tj T* T*')
+        content.extend(b'(' + pdf_text(line) + b") '" for line in page)
+        content.append(b'ET')
+        stream = b'\n'.join(content)
+        objects.append(b'<< /Length %d >>\nstream\n' % len(stream) + stream + b'\nendstream')
+        objects.append(b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] '
+                       b'/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>' % len(objects))
+        page_ids.append(len(objects))
+    objects[1] = (b'<< /Type /Pages /Kids [' + b' '.join(b'%d 0 R' % i for i in page_ids)
+                  + b'] /Count %d >>' % len(page_ids))
+
+    out = io.BytesIO()
+    out.write(b'%PDF-1.4\n')
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(out.tell())
+        out.write(b'%d 0 obj\n' % number + body + b'\nendobj\n')
+    xref = out.tell()
+    out.write(b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1))
+    out.writelines(b'%010d 00000 n \n' % offset for offset in offsets)
+    out.write(b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, xref))
+    return out.getvalue()
+
+
+_app = None
+
+
+def _worker_app():
+    # The worker process builds its own app (and engine) on first use; it serves no requests
+    global _app
+    if _app is None:
+        from app import create_app
+        _app = create_app(migrations=False)
+    return _app
+
+
+def _render_statement(member_id, path, tenant_slug=None):
+    """Process-pool entry point: query one member's statement, as its tenant, and write it to ``path`` as a PDF."""
+    from app.services import ExportService
+    app = _worker_app()
+    with app.app_context():
+        tenant = app.extensions['tenants'].get(tenant_slug) if tenant_slug else None
+        with tenant_context(tenant):
+            title, lines = ExportService.statement_lines(member_id)
+    with open(path + '.part', 'wb') as handle:
+        handle.write(render_pdf(title, lines))
+    os.replace(path + '.part', path)
+    return len(lines)
+
+
+class PdfExporter:
+    """Render PDF statements on a process pool so web workers only queue them.
+
+    ``submit(owner_id, member_id)`` returns a job id; ``job(job_id)`` reports
+    ``pending``/``done``/``failed`` and the file path once it is written to
+    ``EXPORT_DIR``. Jobs are tracked in this process, so poll the worker that
+    accepted the job (or point ``EXPORT_DIR`` at shared storage and serve it).
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._executor = None
+        self._jobs = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.config.setdefault('EXPORT_PDF_WORKERS', 2)
+        if not app.config.get('EXPORT_DIR'):
+            app.config['EXPORT_DIR'] = os.path.join(app.instance_path, 'exports')
+        app.extensions['pdf_exporter'] = self
+
+    def _get_executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    # 'spawn': the web process has threads (Socket.IO, queues) that must not be forked
+                    self._executor = ProcessPoolExecutor(max_workers=self.app.config['EXPORT_PDF_WORKERS'],
+                                                         mp_context=multiprocessing.get_context('spawn'))
+        return self._executor
+
+    def submit(self, owner_id, member_id):
+        tenant = current_tenant()  # The worker process resolves it again by slug
+        export_dir = self.app.config['EXPORT_DIR']
+        os.makedirs(export_dir, exist_ok=True)
+        job_id = uuid.uuid4().hex
+        path = os.path.join(export_dir, f'statement-{member_id}-{job_id}.pdf')
+        future = self._get_executor().submit(_render_statement, member_id, path, tenant and tenant.slug)
+        self._jobs[job_id] = {'owner_id': owner_id, 'member_id': member_id, 'path': path, 'future': future}
+        return job_id
+
+    def job(self, job_id):
+        """Return ``{'status', 'owner_id', 'path', 'lines'}`` for a job, or None if it is unknown."""
+        job = self._jobs.get(job_id)
+        if job is None:
+            return None
+        future = job['future']
+        info = {'status': 'pending', 'owner_id': job['owner_id'], 'path': None, 'lines': None}
+        if future.done():
+            if future.exception() is not None:
+                logger.error('PDF statement for member %s failed: %s', job['member_id'], future.exception())
+                info['status'] = 'failed'
+            else:
+                info.update(status='done', path=job['path'], lines=future.result())
+        return info
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
@@ -1,6 +1,8 @@
 from flask_wtf import FlaskForm
-from wtforms import StringField, PasswordField, SubmitField, TextAreaField, DateField, TimeField, DecimalField, SelectField
-from wtforms.validators import DataRequired, Length, Email, EqualTo, NumberRange
+from flask_wtf.file import FileAllowed, FileField, FileRequired
+from wtforms import (StringField, PasswordField, SubmitField, TextAreaField, DateField, TimeField, DecimalField,
+                     SelectField, IntegerField, BooleanField)
+from wtforms.validators import DataRequired, Length, Email, EqualTo, NumberRange, Optional
 
 class RegistrationForm(FlaskForm):
     username = StringField('Username', validators=[DataRequired(), Length(min=2, max=150)])
@@ -35,6 +37,17 @@ class SavingsForm(FlaskForm):
     amount = DecimalField('Amount', validators=[DataRequired(), NumberRange(min=0, message="Amount must be positive")])
     submit = SubmitField('Deposit')
 
+class WithdrawalForm(FlaskForm):
+    amount = DecimalField('Amount', validators=[DataRequired(), NumberRange(min=0.01, message="Amount must be positive")])
+    submit = SubmitField('Withdraw')
+
+# Admin upload of a bank or M-Pesa statement of contributions
+class StatementImportForm(FlaskForm):
+    statement = FileField('Statement (CSV or XLSX)', validators=[FileRequired(), FileAllowed(['csv', 'xlsx'])])
+    group_id = IntegerField('Group ID', validators=[Optional()], description='Only accept members of this group')
+    dry_run = BooleanField('Dry run: check the rows without importing them', default=True)
+    submit = SubmitField('Upload')
+
 # New form for loan requests
 class LoanRequestForm(FlaskForm):
     amount = DecimalField('Loan Amount', validators=[DataRequired(), NumberRange(min=1, message="Loan amount must be positive")])
@@ -0,0 +1,602 @@
+# imports.py
+"""Bulk import of contributions from bank and M-Pesa statement files.
+
+Groups that collect contributions offline hand the treasurer a statement;
+``import_statement`` turns its credit rows into completed ``Savings`` deposits
+without going through M-Pesa. Statements are CSV or XLSX of any size: rows
+are read as a stream (CSV with the ``csv`` module, XLSX by parsing each sheet
+with ``iterparse``; shared strings are spooled to a temporary file) and
+handled ``IMPORT_CHUNK_SIZE`` at a time, so memory stays flat.
+
+Each chunk is one transaction: its members are resolved with one query per
+kind of key (member id, email, phone number), the deposits go in with one
+bulk insert, the ledger and balance snapshots move with
+``LedgerService.post_many`` and the members are notified with
+``NotificationService.notify_each``. The statement reference becomes the
+deposit's ``transaction_id``, which is unique, so a row is never imported
+twice - not from a re-run, an overlapping statement or a duplicated line.
+The constraint spans every tenant sharing the database: a reference already on
+file for another SACCO is rejected as a conflict, not counted as a duplicate.
+
+Imports are checkpointed in ``JobRun`` (job ``contribution_import``, period
+= the file's SHA-256 prefix): the checkpoint (the last statement row handled)
+commits with each chunk, so re-running an import that failed resumes after
+the last committed chunk, and re-running a completed one is a no-op. A dry
+run validates and matches every row and reports what would be imported,
+without writing anything.
+
+Columns are found by header name, whichever bank or M-Pesa layout the file
+uses (see ``COLUMNS``); rows before the header (statement preambles) and rows
+with nothing paid in (withdrawals, charges) are skipped.
+"""
+import array
+import csv
+import hashlib
+import logging
+import os
+import re
+import tempfile
+import time
+import xml.etree.ElementTree as ElementTree
+import zipfile
+from datetime import datetime, timedelta
+from decimal import Decimal, InvalidOperation
+
+from flask import current_app
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app import db
+from app.jobs import JobConflict, _claim_slice, _start_run
+from app.models import JobRun, Savings, User, group_members
+from app.money import from_cents, to_cents
+from app.services import LedgerService, NotificationService
+from app.tenancy import current_tenant_id
+
+logger = logging.getLogger(__name__)
+
+JOB = 'contribution_import'
+FORMATS = ('csv', 'xlsx')
+
+# Field -> normalised header names it may appear under (lower case, letters and digits only)
+COLUMNS = {
+    'reference': ('reference', 'receiptno', 'receipt', 'transactionid', 'transactionref', 'transactionreference',
+                  'ref', 'refno', 'bankreference'),
+    'amount': ('paidin', 'amount', 'credit', 'creditamount', 'deposit', 'deposits', 'moneyin'),
+    'member': ('memberid', 'member', 'memberno', 'phone', 'phonenumber', 'msisdn', 'mobile', 'email',
+               'otherpartyinfo', 'account', 'accountno', 'details', 'narrative', 'description', 'particulars'),
+    'date': ('completiontime', 'date', 'transactiondate', 'valuedate', 'posteddate', 'bookingdate'),
+}
+# Member columns whose header says what they hold; others (narratives, account fields) are searched for one
+_MEMBER_KINDS = {'memberid': 'id', 'memberno': 'id', 'email': 'email', 'phone': 'phone', 'phonenumber': 'phone',
+                 'msisdn': 'phone', 'mobile': 'phone'}
+_HEADER_SEARCH_ROWS = 50  # Statement preambles (account holder, period, ...) come before the header
+_ERROR_SAMPLES = 50  # Rejected rows kept in the summary; --rejects writes all of them
+
+_IN_BATCH = 5000  # Values per IN (...) lookup; SQLite allows 32766 bound parameters a statement
+# Day-first formats tried when a date is not ISO 8601
+_DATE_FORMATS = ('%d/%m/%Y %H:%M:%S', '%d/%m/%Y %H:%M', '%d/%m/%Y', '%d-%m-%Y', '%d.%m.%Y', '%d %b %Y', '%d-%b-%Y')
+_EXCEL_EPOCH = datetime(1899, 12, 30)
+_PHONE = re.compile(r'(?<!\d)(?:\+?254|0)?([17]\d{8})(?!\d)')
+_EMAIL = re.compile(r'[^\s@,;]+@[^\s@,;]+\.[^\s@,;]+')
+_NOT_ALNUM = re.compile(r'[^a-z0-9]')
+
+
+class StatementError(ValueError):
+    """Raised when a statement file cannot be read or has no usable header."""
+
+
+def _normalise(header):
+    return _NOT_ALNUM.sub('', str(header or '').lower())
+
+
+def find_columns(row):
+    """``{field: column index}`` if ``row`` is a statement header, else None.
+
+    ``member_kind`` is set when the member column's header says whether it
+    holds member ids, emails or phone numbers.
+    """
+    names = [_normalise(value) for value in row]
+    columns = {}
+    for field, aliases in COLUMNS.items():
+        for alias in aliases:
+            if alias in names:
+                columns[field] = names.index(alias)
+                if field == 'member':
+                    columns['member_kind'] = _MEMBER_KINDS.get(alias)
+                break
+    if 'reference' in columns and 'amount' in columns and 'member' in columns:
+        return columns
+    return None
+
+
+# Readers: each yields the file's rows as lists of cell values
+
+def _csv_rows(path):
+    with open(path, newline='', encoding='utf-8-sig', errors='replace') as handle:
+        sample = handle.read(64 * 1024)
+        handle.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=',;\t|')
+        except csv.Error:
+            dialect = csv.excel
+        yield from csv.reader(handle, dialect)
+
+
+_MAIN = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+_RELS = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+_DOC_RELS = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+
+
+class _SharedStrings:
+    """A workbook's shared-string table, spooled to a temporary file with 8 bytes of index per string."""
+
+    def __init__(self, archive, name):
+        self._file = tempfile.TemporaryFile()
+        self._offsets = array.array('Q', [0])
+        with archive.open(name) as stream:
+            for _, elem in ElementTree.iterparse(stream):
+                if elem.tag == _MAIN + 'si':
+                    self._file.write(''.join(elem.itertext()).encode())
+                    self._offsets.append(self._file.tell())
+                    elem.clear()
+
+    def __getitem__(self, index):
+        start, end = self._offsets[index], self._offsets[index + 1]
+        self._file.seek(start)
+        return self._file.read(end - start).decode()
+
+    def close(self):
+        self._file.close()
+
+
+def _sheet_names(archive):
+    """Worksheet part names in workbook order."""
+    names = set(archive.namelist())
+    try:
+        workbook = ElementTree.fromstring(archive.read('xl/workbook.xml'))
+        rels = ElementTree.fromstring(archive.read('xl/_rels/workbook.xml.rels'))
+    except KeyError:
+        return sorted(name for name in names if name.startswith('xl/worksheets/') and name.endswith('.xml'))
+    targets = {rel.get('Id'): rel.get('Target') for rel in rels.iter(_RELS + 'Relationship')}
+    sheets = []
+    for sheet in workbook.iter(_MAIN + 'sheet'):
+        target = targets.get(sheet.get(_DOC_RELS + 'id'), '')
+        name = target.lstrip('/') if target.startswith('/') else 'xl/' + target
+        if name in names:
+            sheets.append(name)
+    return sheets
+
+
+def _column_index(ref):
+    index = 0
+    for char in ref:
+        if not char.isalpha():
+            break
+        index = index * 26 + ord(char.upper()) - 64
+    return index - 1
+
+
+def _xlsx_rows(path):
+    try:
+        archive = zipfile.ZipFile(path)
+    except zipfile.BadZipFile as exc:
+        raise StatementError('Not an XLSX workbook.') from exc
+    with archive:
+        strings = (_SharedStrings(archive, 'xl/sharedStrings.xml')
+                   if 'xl/sharedStrings.xml' in archive.namelist() else None)
+        try:
+            for name in _sheet_names(archive):
+                with archive.open(name) as stream:
+                    sheet_data = None
+                    for event, elem in ElementTree.iterparse(stream, events=('start', 'end')):
+                        if event == 'start':
+                            if elem.tag == _MAIN + 'sheetData':
+                                sheet_data = elem
+                            continue
+                        if elem.tag != _MAIN + 'row':
+                            continue
+                        values = []
+                        for cell in elem.iter(_MAIN + 'c'):
+                            ref = cell.get('r')
+                            index = _column_index(ref) if ref else len(values)
+                            values.extend([None] * (index - len(values)))
+                            kind = cell.get('t')
+                            if kind == 'inlineStr':
+                                value = ''.join(cell.find(_MAIN + 'is').itertext())
+                            else:
+                                value = cell.findtext(_MAIN + 'v')
+                                if value is not None and kind == 's':
+                                    value = strings[int(value)]
+                                elif value is not None and kind in (None, 'n'):
+                                    value = float(value)
+                            values.append(value)
+                        yield values
+                        if sheet_data is not None:
+                            sheet_data.clear()  # Drop parsed rows; iterparse keeps them otherwise
+        finally:
+            if strings is not None:
+                strings.close()
+
+
+def statement_format(filename):
+    """``'csv'`` or ``'xlsx'`` from the file name, or None if it is neither."""
+    extension = os.path.splitext(filename)[1].lower().lstrip('.')
+    return extension if extension in FORMATS else None
+
+
+def read_statement(path, fmt=None):
+    """Return ``(columns, rows)``: the header's column indexes and an iterator of ``(row number, values)``.
+
+    Row numbers count data rows after the header, from 1. In workbooks the
+    header may be repeated at the top of later sheets; those copies are skipped.
+    """
+    fmt = fmt or statement_format(path)
+    if fmt not in FORMATS:
+        raise StatementError('Statements must be CSV or XLSX files.')
+    rows = _csv_rows(path) if fmt == 'csv' else _xlsx_rows(path)
+    header = columns = None
+    for n, row in enumerate(rows):
+        columns = find_columns(row)
+        if columns is not None:
+            header = row
+            break
+        if n >= _HEADER_SEARCH_ROWS:
+            break
+    if columns is None:
+        rows.close()
+        raise StatementError('No header row with reference, amount and member (account or phone) columns found.')
+
+    def data_rows():
+        number = 0
+        for row in rows:
+            if row == header or not any(value not in (None, '') for value in row):
+                continue
+            number += 1
+            yield number, row
+
+    return columns, data_rows()
+
+
+# Cell parsing
+
+def parse_amount(value):
+    """Amount paid in as a ``Decimal``, or None if the cell is empty or not a credit."""
+    if value is None:
+        return None
+    if isinstance(value, float):
+        value = repr(value)
+    text = str(value).strip().replace(',', '')
+    for prefix in ('KES', 'KSH', 'KSHS'):
+        if text.upper().startswith(prefix):
+            text = text[len(prefix):].strip()
+    if not text or text == '-':
+        return None
+    if text.startswith('(') and text.endswith(')'):
+        text = '-' + text[1:-1]
+    try:
+        return Decimal(text)
+    except InvalidOperation:
+        raise ValueError(f'unreadable amount {value!r}')
+
+
+def parse_date(value):
+    """The transaction time from a text cell or an Excel serial date."""
+    if isinstance(value, float):
+        return _EXCEL_EPOCH + timedelta(days=value)
+    text = str(value or '').strip()
+    if not text:
+        raise ValueError('missing date')
+    try:
+        return datetime.fromisoformat(text)  # Most exports; far cheaper than trying strptime formats
+    except ValueError:
+        pass
+    for fmt in _DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt)
+        except ValueError:
+            continue
+    raise ValueError(f'unreadable date {value!r}')
+
+
+def member_key(value, kind=None):
+    """How the member cell identifies a member: ``('id', 12)``, ``('email', ...)`` or ``('phone', '2547...')``.
+
+    ``kind`` restricts the cell to one of those; without it the cell is
+    searched for an email, then a phone number, then taken as a member id.
+    """
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    text = str(value or '').strip()
+    if not text:
+        return None
+    if kind in (None, 'email'):
+        email = _EMAIL.search(text)
+        if email:
+            return 'email', email.group(0).lower()
+    if kind in (None, 'phone'):
+        phone = _PHONE.search(text.replace(' ', ''))
+        if phone:
+            return 'phone', '254' + phone.group(1)
+    if kind in (None, 'id') and text.isdigit():
+        return 'id', int(text)
+    return None
+
+
+def _phone_forms(phone):
+    """The ways a normalised ``254...`` number may have been typed into ``User.phone_number``."""
+    local = phone[3:]
+    return (phone, '+' + phone, '0' + local, local)
+
+
+def _lookup(statement, column, values):
+    """Rows of ``statement`` where ``column`` is one of ``values``, ``_IN_BATCH`` values per query."""
+    values = list(values)
+    for start in range(0, len(values), _IN_BATCH):
+        yield from db.session.execute(statement.where(column.in_(values[start:start + _IN_BATCH])))
+
+
+def _resolve_members(keys, group_id=None):
+    """``{member key: member_id}`` for the keys that match a member (of ``group_id``, if given)."""
+    ids = {value for kind, value in keys if kind == 'id'}
+    emails = {value for kind, value in keys if kind == 'email'}
+    phones = {value for kind, value in keys if kind == 'phone'}
+    found = {}
+    found.update((('id', member_id), member_id) for member_id, in _lookup(select(User.id), User.id, ids))
+    email = func.lower(User.email)
+    found.update((('email', address), member_id)
+                 for member_id, address in _lookup(select(User.id, email), email, emails))
+    forms = {form: phone for phone in phones for form in _phone_forms(phone)}
+    found.update((('phone', forms[number]), member_id) for member_id, number in
+                 _lookup(select(User.id, User.phone_number), User.phone_number, forms))
+    if group_id is not None and found:
+        in_group = {member_id for member_id, in _lookup(
+            select(group_members.c.user_id).where(group_members.c.group_id == group_id),
+            group_members.c.user_id, set(found.values()))}
+        found = {key: member_id for key, member_id in found.items() if member_id in in_group}
+    return found
+
+
+def _references_on_file(references):
+    """``{reference: tenant_id}`` for the references already on file, under any tenant."""
+    table = Savings.__table__  # Core columns, so the ORM's tenant criteria don't hide other tenants' rows
+    return dict(_lookup(select(table.c.transaction_id, table.c.tenant_id), table.c.transaction_id, references))
+
+
+def _count_on_file(rows, on_file, summary, numbered):
+    """Count the ``rows`` whose reference is on file: the tenant's own as duplicates, another's as rejected."""
+    tenant_id = current_tenant_id()
+    for row in rows:
+        owner = on_file.get(row['transaction_id'])
+        if owner is None:
+            continue
+        if owner == tenant_id:
+            summary.duplicates += 1
+        else:
+            number, values = numbered[row['transaction_id']]
+            summary.reject(number, 'reference on file for another SACCO', values)
+
+
+def _insert_deposits(rows):
+    """Insert completed deposits, skipping references already on file; returns the inserted rows."""
+    table = Savings.__table__
+    dialect = db.session.get_bind(mapper=Savings).dialect.name
+    if dialect == 'sqlite':
+        stmt = sqlite.insert(table).on_conflict_do_nothing()
+    elif dialect == 'postgresql':
+        stmt = postgresql.insert(table).on_conflict_do_nothing()
+    else:
+        existing = _references_on_file([row['transaction_id'] for row in rows])
+        unique = {}
+        for row in rows:
+            if row['transaction_id'] not in existing:
+                unique.setdefault(row['transaction_id'], row)
+        rows, stmt = list(unique.values()), insert(table)
+    if not rows:
+        return []
+    return db.session.execute(stmt.returning(table.c.id, table.c.member_id, table.c.amount, table.c.created_at,
+                                             table.c.transaction_id), rows).all()
+
+
+class _Summary:
+    """Counts for an import, with a bounded sample of the rejected rows."""
+
+    def __init__(self, rejects=None):
+        self.rows = self.imported = self.duplicates = self.skipped = self.rejected = 0
+        self.amount_cents = 0
+        self.errors = []
+        self.reasons = {}
+        self._rejects = rejects
+
+    def reject(self, number, reason, row):
+        self.rejected += 1
+        self.reasons[reason] = self.reasons.get(reason, 0) + 1
+        if len(self.errors) < _ERROR_SAMPLES:
+            self.errors.append((number, reason))
+        if self._rejects is not None:
+            self._rejects.writerow([number, reason, *row])
+
+
+def _parse_chunk(chunk, columns, summary, seen):
+    """Validate a chunk of ``(number, row)``; returns ``[(number, reference, member key, cents, when)]``."""
+    parsed = []
+    now = datetime.utcnow()
+    amount_at, reference_at, member_at = columns['amount'], columns['reference'], columns['member']
+    date_at, member_kind = columns.get('date'), columns.get('member_kind')
+    for number, row in chunk:
+        width = len(row)
+        try:
+            amount = parse_amount(row[amount_at] if amount_at < width else None)
+            if amount is None or amount <= 0:
+                summary.skipped += 1
+                continue
+            reference = row[reference_at] if reference_at < width else None
+            if isinstance(reference, float) and reference.is_integer():
+                reference = int(reference)  # Numeric receipt numbers in a workbook
+            reference = str(reference).strip() if reference is not None else ''
+            if not reference:
+                raise ValueError('missing reference')
+            if len(reference) > 64:
+                raise ValueError('reference longer than 64 characters')
+            key = member_key(row[member_at] if member_at < width else None, member_kind)
+            if key is None:
+                raise ValueError('no member id, email or phone number')
+            if date_at is None:
+                when = now
+            else:
+                when = parse_date(row[date_at] if date_at < width else None)
+        except ValueError as exc:
+            summary.reject(number, str(exc), row)
+            continue
+        if reference in seen:
+            summary.duplicates += 1
+            continue
+        seen.add(reference)
+        parsed.append((number, reference, key, to_cents(amount), when, row))
+    return parsed
+
+
+def _apply_chunk(parsed, summary, group_id, dry_run, members):
+    """Match a parsed chunk to members and (unless ``dry_run``) write its deposits, ledger entries and notifications.
+
+    ``members`` caches ``{member key: member_id or None}`` across the chunks
+    of one import: a statement names the same few thousand payers over and
+    over, so only keys not seen in an earlier chunk are looked up.
+    """
+    unknown = {key for _, _, key, _, _, _ in parsed if key not in members}
+    if unknown:
+        found = _resolve_members(unknown, group_id)
+        members.update((key, found.get(key)) for key in unknown)
+    rows = []
+    numbered = {}
+    for number, reference, key, cents, when, row in parsed:
+        member_id = members.get(key)
+        if member_id is None:
+            summary.reject(number, 'member not found' if group_id is None else 'member not in group', row)
+            continue
+        numbered[reference] = number, row
+        rows.append({'member_id': member_id, 'amount': float(from_cents(cents)), 'transaction_id': reference,
+                     'payment_status': 'completed', 'created_at': when})
+    if dry_run:
+        on_file = _references_on_file([row['transaction_id'] for row in rows]) if rows else {}
+        fresh = [row for row in rows if row['transaction_id'] not in on_file]
+        _count_on_file(rows, on_file, summary, numbered)
+        summary.imported += len(fresh)
+        summary.amount_cents += sum(to_cents(row['amount']) for row in fresh)
+        return 0, 0
+    inserted = _insert_deposits(rows)
+    if len(inserted) < len(rows):
+        added = {row.transaction_id for row in inserted}
+        passed = [row for row in rows if row['transaction_id'] not in added]
+        _count_on_file(passed, _references_on_file([row['transaction_id'] for row in passed]), summary, numbered)
+    LedgerService.post_many([(row.member_id, 'deposit', row.amount, row.id) for row in inserted], commit=False)
+    NotificationService.notify_each([(row.member_id, f"Your contribution of {row.amount} on "
+                                      f"{row.created_at:%Y-%m-%d} has been recorded.") for row in inserted],
+                                    commit=False)
+    cents = sum(to_cents(row.amount) for row in inserted)
+    summary.imported += len(inserted)
+    summary.amount_cents += cents
+    return len(inserted), cents
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as handle:
+        for block in iter(lambda: handle.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _chunks(rows, size):
+    chunk = []
+    for item in rows:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def import_statement(path, fmt=None, group_id=None, dry_run=False, chunk_size=None, rejects=None,
+                     filename=None, progress=None):
+    """Import the contributions in a statement file; see the module docstring.
+
+    ``group_id`` only accepts members of that group. ``rejects`` is an
+    optional ``csv.writer`` that receives every rejected row with its row
+    number and reason. ``progress(summary, elapsed)`` is called after each
+    chunk. Returns a summary dict: row counts by outcome, the amount imported
+    (or, for a dry run, that would be), sample errors and rows/sec.
+    """
+    chunk_size = chunk_size or current_app.config['IMPORT_CHUNK_SIZE']
+    started = time.perf_counter()
+    columns, rows = read_statement(path, fmt)
+    summary = _Summary(rejects)
+    run = None
+    resumed_from = 0
+    if not dry_run:
+        period = file_digest(path)[:20]
+        run = _start_run(JOB, period, lambda: {'filename': filename or os.path.basename(path),
+                                               'group_id': group_id})
+        resumed_from = run.cursor
+    seen = set()  # References in the current chunk; the unique constraint covers the rest of the file
+    members = {}
+    try:
+        for chunk in _chunks(rows, chunk_size):
+            if run is not None and run.status != 'running':
+                break
+            if chunk[-1][0] <= resumed_from:
+                continue
+            chunk = [(number, row) for number, row in chunk if number > resumed_from]
+            summary.rows += len(chunk)
+            seen.clear()
+            parsed = _parse_chunk(chunk, columns, summary, seen)
+            imported, cents = _apply_chunk(parsed, summary, group_id, dry_run, members)
+            if run is not None:
+                _claim_slice(run, run.cursor, chunk[-1][0])
+                db.session.execute(
+                    update(JobRun).where(JobRun.id == run.id)
+                    .values(rows_processed=JobRun.rows_processed + imported,
+                            amount_cents=JobRun.amount_cents + cents)
+                    .execution_options(synchronize_session=False)
+                )
+                db.session.commit()
+                db.session.refresh(run)
+            if progress is not None:
+                progress(summary, time.perf_counter() - started)
+        if run is not None and run.status == 'running':
+            run.status = 'completed'
+            run.finished_at = datetime.utcnow()
+            db.session.commit()
+    except Exception as exc:
+        db.session.rollback()
+        if run is not None and not isinstance(exc, JobConflict):
+            db.session.execute(update(JobRun).where(JobRun.id == run.id, JobRun.status == 'running')
+                               .values(status='failed', updated_at=datetime.utcnow()))
+            db.session.commit()
+            logger.exception('Contribution import %s stopped after row %s', run.period, run.cursor)
+        raise
+    finally:
+        rows.close()
+    elapsed = time.perf_counter() - started
+    return {
+        'status': 'dry_run' if dry_run else run.status,
+        'rows': summary.rows,
+        'imported': summary.imported,
+        'duplicates': summary.duplicates,
+        'skipped': summary.skipped,
+        'rejected': summary.rejected,
+        'amount_cents': summary.amount_cents,
+        'errors': summary.errors,
+        'reasons': summary.reasons,
+        'resumed_from': resumed_from,
+        'total_rows': run.rows_processed if run is not None else summary.imported,
+        'total_amount_cents': run.amount_cents if run is not None else summary.amount_cents,
+        'elapsed': elapsed,
+        'rows_per_second': summary.rows / elapsed if elapsed > 0 else 0.0,
+    }
+
+
+def recent_imports(limit=20):
+    """The latest import runs, newest first."""
+    return JobRun.query.filter_by(job=JOB).order_by(JobRun.started_at.desc()).limit(limit).all()
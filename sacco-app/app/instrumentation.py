@@ -0,0 +1,381 @@
+# instrumentation.py
+import logging
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter, deque
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import g, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Raised when a route runs more SQL statements than its declared budget."""
+
+
+class QueryCounter:
+    """Count the SQL statements executed on ``engine`` inside a ``with`` block.
+
+        with QueryCounter(db.engine) as counter:
+            client.get('/savings')
+        assert counter.count <= 4, counter.statements
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+        self.statements = []
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self._on_execute)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, 'before_cursor_execute', self._on_execute)
+        return False
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+        self.statements.append(statement)
+
+
+def query_budget(max_queries):
+    """Declare the most SQL statements a view may run (including the user loader).
+
+    Budgets are checked after every request when ``ENFORCE_QUERY_BUDGETS`` is on
+    (the testing config), so a test client request to a route that regresses into
+    N+1 loading fails with ``QueryBudgetExceeded``. ``tests/test_query_budgets.py``
+    requests every view that declares a budget.
+    """
+    def decorator(view):
+        view.query_budget = max_queries  # functools.wraps in outer decorators copies this along
+        return view
+    return decorator
+
+
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    if has_app_context() and 'request_queries' in g:
+        g.request_queries.append(statement)
+
+
+def init_query_budgets(app):
+    app.config.setdefault('ENFORCE_QUERY_BUDGETS', False)
+    if not app.config['ENFORCE_QUERY_BUDGETS']:
+        return
+    event.listen(Engine, 'before_cursor_execute', _count_query)
+
+    @app.before_request
+    def start_query_count():
+        g.request_queries = []
+
+    @app.after_request
+    def check_query_budget(response):
+        view = app.view_functions.get(request.endpoint)
+        budget = getattr(view, 'query_budget', None)
+        queries = g.pop('request_queries', [])
+        if budget is not None and len(queries) > budget:
+            raise QueryBudgetExceeded(
+                f'{request.endpoint} ran {len(queries)} queries (budget {budget}):\n' + '\n'.join(queries)
+            )
+        return response
+
+
+# Request metrics ------------------------------------------------------------
+
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144)
+
+# name: (help, buckets); every family is labelled by kind ('http' or 'socketio') and endpoint
+REQUEST_HISTOGRAMS = {
+    'sacco_request_duration_seconds': ('Wall time per Flask endpoint or Socket.IO event.', SECONDS_BUCKETS),
+    'sacco_request_db_queries': ('SQL statements executed per request or event.', QUERY_COUNT_BUCKETS),
+    'sacco_request_db_duration_seconds': ('Time spent in SQL per request or event.', SECONDS_BUCKETS),
+    'sacco_request_external_duration_seconds': ('Time spent in external HTTP calls (M-Pesa) per request or event.',
+                                                SECONDS_BUCKETS),
+}
+EXTERNAL_HISTOGRAM = ('sacco_external_http_duration_seconds',
+                      'Duration of every external HTTP call, including background ones, by service.')
+
+
+class Histogram:
+    """Bucket counts for one label set; only the owning thread writes to it."""
+    __slots__ = ('bounds', 'counts', 'sum')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # The last slot is +Inf
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    def merge(self, other):
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.sum += other.sum
+
+
+class RequestMetrics:
+    """Per-endpoint latency, SQL and external-call histograms, exported as Prometheus text.
+
+    Each thread observes into its own buffer, so recording a request takes no
+    lock; ``render()`` merges the buffers (and folds in those of finished
+    threads) when ``/metrics`` is scraped. The current request's SQL count and
+    time come from engine events and its external HTTP time from
+    ``external_call()``.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.profiler = SlowRequestProfiler()
+        self._local = threading.local()
+        self._buffers = []  # (thread, {key: Histogram}) for every thread that recorded something
+        self._retired = {}  # Merged buffers of threads that have exited
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.config.setdefault('METRICS_ENABLED', True)
+        app.config.setdefault('METRICS_TOKEN', None)
+        self.profiler.init_app(app)
+        app.extensions['request_metrics'] = self
+        if not app.config['METRICS_ENABLED']:
+            return
+        if not getattr(self, '_listening', False):
+            event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+            self._listening = True
+        app.before_request(self._start_request)
+        app.teardown_request(self._finish_request)
+
+    # Recording -----------------------------------------------------------
+
+    def _histogram(self, name, labels, bounds):
+        buffer = getattr(self._local, 'buffer', None)
+        if buffer is None:
+            buffer = self._local.buffer = {}
+            with self._lock:
+                if len(self._buffers) >= 64:
+                    self._retire_dead_threads()  # Servers that spawn a thread per request
+                self._buffers.append((threading.current_thread(), buffer))
+        key = (name, labels)
+        histogram = buffer.get(key)
+        if histogram is None:
+            histogram = buffer[key] = Histogram(bounds)
+        return histogram
+
+    def start(self):
+        """Begin tracking a request or event on this thread; nested calls are folded into the outer one."""
+        if getattr(self._local, 'current', None) is not None:
+            return False
+        self._local.current = [time.perf_counter(), 0, 0.0, 0.0]  # started, queries, db seconds, external seconds
+        self.profiler.start()
+        return True
+
+    def finish(self, kind, endpoint):
+        current, self._local.current = getattr(self._local, 'current', None), None
+        if current is None:
+            return
+        started, queries, db_seconds, external_seconds = current
+        elapsed = time.perf_counter() - started
+        labels = (('kind', kind), ('endpoint', endpoint))
+        self._histogram('sacco_request_duration_seconds', labels, SECONDS_BUCKETS).observe(elapsed)
+        self._histogram('sacco_request_db_queries', labels, QUERY_COUNT_BUCKETS).observe(queries)
+        self._histogram('sacco_request_db_duration_seconds', labels, SECONDS_BUCKETS).observe(db_seconds)
+        self._histogram('sacco_request_external_duration_seconds', labels, SECONDS_BUCKETS).observe(external_seconds)
+        self.profiler.finish(f'{kind} {endpoint}', elapsed, queries, db_seconds)
+
+    def _start_request(self):
+        self.start()
+
+    def _finish_request(self, exc=None):
+        # Unrouted URLs share one label so scans can't grow the series without bound
+        self.finish('http', request.endpoint or 'unmatched')
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if getattr(self._local, 'current', None) is not None:
+            conn.info.setdefault('metrics_query_start', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        current = getattr(self._local, 'current', None)
+        starts = conn.info.get('metrics_query_start')
+        if current is None or not starts:
+            return
+        current[1] += 1
+        current[2] += time.perf_counter() - starts.pop()
+
+    @contextmanager
+    def external_call(self, service):
+        """Time an outbound HTTP call; it counts towards the current request too, if there is one."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self._histogram(EXTERNAL_HISTOGRAM[0], (('service', service),), SECONDS_BUCKETS).observe(elapsed)
+            current = getattr(self._local, 'current', None)
+            if current is not None:
+                current[3] += elapsed
+
+    def timed_event(self, handler):
+        """Record a Socket.IO handler under ``<namespace>:<event>`` (use below ``@socketio.on``)."""
+        @wraps(handler)
+        def wrapper(*args, **kwargs):
+            if not self.start():
+                return handler(*args, **kwargs)
+            try:
+                return handler(*args, **kwargs)
+            finally:
+                self.finish('socketio', f"{request.namespace}:{request.event['message']}")
+        return wrapper
+
+    # Export --------------------------------------------------------------
+
+    def snapshot(self):
+        """Merge every thread's buffer into ``{(name, labels): Histogram}``."""
+        merged = {}
+
+        def fold(source):
+            for key, histogram in list(source.items()):
+                target = merged.get(key)
+                if target is None:
+                    target = merged[key] = Histogram(histogram.bounds)
+                target.merge(histogram)
+
+        with self._lock:
+            self._retire_dead_threads()
+            fold(self._retired)
+            for _, buffer in self._buffers:
+                fold(buffer)
+        return merged
+
+    def _retire_dead_threads(self):
+        # Called with the lock held: fold the buffers of exited threads into _retired
+        alive = []
+        for thread, buffer in self._buffers:
+            if thread.is_alive():
+                alive.append((thread, buffer))
+                continue
+            for key, histogram in buffer.items():
+                self._retired.setdefault(key, Histogram(histogram.bounds)).merge(histogram)
+        self._buffers = alive
+
+    def render(self):
+        """Return all histograms in the Prometheus text exposition format."""
+        helps = {name: text for name, (text, _) in REQUEST_HISTOGRAMS.items()}
+        helps[EXTERNAL_HISTOGRAM[0]] = EXTERNAL_HISTOGRAM[1]
+        families = {}
+        for (name, labels), histogram in self.snapshot().items():
+            families.setdefault(name, []).append((labels, histogram))
+        lines = []
+        for name in sorted(families):
+            lines.append(f'# HELP {name} {helps.get(name, name)}')
+            lines.append(f'# TYPE {name} histogram')
+            for labels, histogram in sorted(families[name], key=lambda item: item[0]):
+                label_text = ','.join(f'{key}="{_escape_label(value)}"' for key, value in labels)
+                cumulative = 0
+                for bound, count in zip(histogram.bounds + (float('inf'),), histogram.counts):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else repr(float(bound))
+                    lines.append(f'{name}_bucket{{{label_text},le="{le}"}} {cumulative}')
+                lines.append(f'{name}_sum{{{label_text}}} {histogram.sum!r}')
+                lines.append(f'{name}_count{{{label_text}}} {cumulative}')
+        lines.append('# HELP sacco_slow_request_profiles_total Slow requests profiled since start-up.')
+        lines.append('# TYPE sacco_slow_request_profiles_total counter')
+        lines.append(f'sacco_slow_request_profiles_total {self.profiler.profiled}')
+        return '\n'.join(lines) + '\n'
+
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class SlowRequestProfiler:
+    """Sampling profiler for requests slower than ``SLOW_REQUEST_THRESHOLD``.
+
+    While enabled (``PROFILE_SLOW_REQUESTS`` or ``enabled = True`` at runtime) a
+    daemon thread samples the stacks of threads that are inside a request every
+    ``PROFILER_INTERVAL`` seconds. Requests that end up slow keep their most
+    frequent stacks in ``recent`` (the last ``PROFILER_KEEP``) and are logged;
+    fast ones are discarded. Nothing is sampled while it is off.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.threshold = 1.0
+        self.interval = 0.005
+        self.recent = deque(maxlen=20)
+        self.profiled = 0
+        self._active = {}  # thread id -> Counter of sampled stacks
+        self._sampler = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        config = app.config
+        config.setdefault('PROFILE_SLOW_REQUESTS', False)
+        config.setdefault('SLOW_REQUEST_THRESHOLD', 1.0)
+        config.setdefault('PROFILER_INTERVAL', 0.005)
+        config.setdefault('PROFILER_KEEP', 20)
+        self.enabled = config['PROFILE_SLOW_REQUESTS']
+        self.threshold = config['SLOW_REQUEST_THRESHOLD']
+        self.interval = config['PROFILER_INTERVAL']
+        self.recent = deque(self.recent, maxlen=config['PROFILER_KEEP'])
+
+    def start(self):
+        if not self.enabled:
+            return
+        self._ensure_sampler()
+        self._active[threading.get_ident()] = Counter()
+
+    def finish(self, name, elapsed, queries, db_seconds):
+        samples = self._active.pop(threading.get_ident(), None)
+        if samples is None or elapsed < self.threshold:
+            return
+        self.profiled += 1
+        total = sum(samples.values())
+        profile = {
+            'request': name, 'seconds': round(elapsed, 4), 'db_queries': queries, 'db_seconds': round(db_seconds, 4),
+            'samples': total,
+            # Collapsed stacks (outermost first), the input format of most flame graph tools
+            'stacks': [{'stack': ';'.join(stack), 'samples': count} for stack, count in samples.most_common(10)],
+        }
+        self.recent.append(profile)
+        top = profile['stacks'][0]['stack'].rsplit(';', 1)[-1] if profile['stacks'] else '-'
+        logger.warning('Slow request %s took %.3f s (%d queries, %.3f s SQL, %d samples, hottest frame %s)',
+                       name, elapsed, queries, db_seconds, total, top)
+
+    def _ensure_sampler(self):
+        if self._sampler is not None and self._sampler.is_alive():
+            return
+        with self._lock:
+            if self._sampler is None or not self._sampler.is_alive():
+                self._sampler = threading.Thread(target=self._sample_loop, name='slow-request-profiler', daemon=True)
+                self._sampler.start()
+
+    def _sample_loop(self):
+        while self.enabled:
+            time.sleep(self.interval)
+            if not self._active:
+                continue
+            frames = sys._current_frames()
+            for ident, samples in list(self._active.items()):
+                frame = frames.get(ident)
+                if frame is not None:
+                    samples[_stack_key(frame)] += 1
+
+
+def _stack_key(frame, limit=40):
+    stack = []
+    while frame is not None and len(stack) < limit:
+        code = frame.f_code
+        stack.append(f'{code.co_name} ({code.co_filename.rsplit("/", 1)[-1]}:{frame.f_lineno})')
+        frame = frame.f_back
+    return tuple(reversed(stack))
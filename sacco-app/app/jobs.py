@@ -0,0 +1,283 @@
+# jobs.py
+"""Scheduled batch jobs: monthly loan interest accrual and dividend distribution.
+
+Each job walks members in ``BATCH_CHUNK_SIZE`` slices of ``member_id`` and
+handles a slice with a few set-based statements (``INSERT ... SELECT`` into
+the ledger plus one ``UPDATE``), committing the slice together with the
+run's checkpoint in ``JobRun``. A run that dies part-way resumes from the
+last committed slice, and a completed run is never applied twice.
+
+Slices are short transactions, so live deposits, withdrawals and repayments
+keep flowing while a job runs. Two runners of the same job and period cannot
+both apply a slice: claiming one is a conditional UPDATE of the checkpoint.
+
+Runs belong to the current tenant (see ``app/tenancy.py``): a run only
+touches that tenant's members, is checkpointed separately from other
+tenants' runs of the same period, and sleeps ``BATCH_SLICE_PAUSE`` seconds
+between slices so that a large tenant's job leaves room for everyone else's
+writes to a shared database.
+"""
+import logging
+import time
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import BigInteger, Integer, and_, cast, extract, func, insert, literal, select, update
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.models import JobRun, LedgerEntry, Loan, MemberBalance, User
+from app.money import to_cents
+from app.tenancy import tenant_criteria
+
+logger = logging.getLogger(__name__)
+
+
+class JobConflict(RuntimeError):
+    """Raised when another runner has advanced the same job run."""
+
+
+def _start_run(job, period, params):
+    """Return the run for ``job``/``period``, creating it with ``params()`` if needed."""
+    run = JobRun.query.filter_by(job=job, period=period).first()
+    if run is not None:
+        if run.status == 'failed':
+            run.status = 'running'
+            db.session.commit()
+        return run
+    run = JobRun(job=job, period=period, status='running', cursor=0, rows_processed=0, amount_cents=0,
+                 params=params())
+    db.session.add(run)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Another runner created it first; resume that one
+        db.session.rollback()
+        run = JobRun.query.filter_by(job=job, period=period).one()
+    return run
+
+
+def _next_slice(run, driver, chunk_size):
+    """Upper member_id bound of the next slice after the checkpoint, or None when done."""
+    ids = db.session.execute(
+        driver.where(MemberBalance.member_id > run.cursor).order_by(MemberBalance.member_id).limit(chunk_size)
+    ).scalars().all()
+    return ids[-1] if ids else None
+
+
+def _claim_slice(run, after, upper):
+    """Move the checkpoint from ``after`` to ``upper`` inside the slice's transaction."""
+    claimed = db.session.execute(
+        update(JobRun).where(JobRun.id == run.id, JobRun.cursor == after, JobRun.status == 'running')
+        .values(cursor=upper, updated_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if claimed != 1:
+        raise JobConflict(f'{run.job} {run.period} was advanced by another runner.')
+
+
+def _record_slice(run, after, upper):
+    """Add the slice's ledger rows to the run totals; returns (rows, cents)."""
+    rows, cents = db.session.execute(
+        select(func.count(LedgerEntry.id), func.coalesce(func.sum(LedgerEntry.amount_cents), 0))
+        .where(LedgerEntry.member_id > after, LedgerEntry.member_id <= upper,
+               LedgerEntry.entry_type == run.job, LedgerEntry.reference == run.reference)
+    ).one()
+    db.session.execute(
+        update(JobRun).where(JobRun.id == run.id)
+        .values(rows_processed=JobRun.rows_processed + rows, amount_cents=JobRun.amount_cents + cents)
+        .execution_options(synchronize_session=False)
+    )
+    return rows, cents
+
+
+def _run_slices(run, driver, apply_slice, chunk_size=None, progress=None):
+    """Apply ``apply_slice(after, upper)`` to every remaining slice, one transaction each.
+
+    Returns a summary with the rows handled by this invocation and its rows/sec.
+    """
+    chunk_size = chunk_size or current_app.config['BATCH_CHUNK_SIZE']
+    pause = current_app.config['BATCH_SLICE_PAUSE']
+    started = time.perf_counter()
+    rows = cents = 0
+    try:
+        while run.status == 'running':
+            upper = _next_slice(run, driver, chunk_size)
+            if upper is None:
+                run.status = 'completed'
+                run.finished_at = datetime.utcnow()
+                db.session.commit()
+                break
+            after = run.cursor
+            _claim_slice(run, after, upper)
+            apply_slice(after, upper)
+            slice_rows, slice_cents = _record_slice(run, after, upper)
+            db.session.commit()
+            db.session.refresh(run)
+            rows += slice_rows
+            cents += slice_cents
+            if progress is not None:
+                progress(run, rows, time.perf_counter() - started)
+            if pause:
+                time.sleep(pause)
+    except Exception as exc:
+        db.session.rollback()
+        if not isinstance(exc, JobConflict):
+            db.session.execute(update(JobRun).where(JobRun.id == run.id, JobRun.status == 'running')
+                               .values(status='failed', updated_at=datetime.utcnow()))
+            db.session.commit()
+        logger.exception('Batch job %s %s stopped at member %s', run.job, run.period, run.cursor)
+        raise
+    elapsed = time.perf_counter() - started
+    return {
+        'job': run.job,
+        'period': run.period,
+        'status': run.status,
+        'rows': rows,
+        'amount_cents': cents,
+        'total_rows': run.rows_processed,
+        'total_amount_cents': run.amount_cents,
+        'elapsed': elapsed,
+        'rows_per_second': rows / elapsed if elapsed > 0 else 0.0,
+    }
+
+
+def accrue_interest(period=None, chunk_size=None, progress=None):
+    """Charge one month's interest on every approved loan, at the loan's own rate.
+
+    Loans are flat-rate: a loan's interest is ``amount * interest_rate / 100``
+    (what ``Loan.calculate_total_due`` adds to the amount), charged in
+    ``repayment_period`` equal monthly parts. Disbursement posts the principal
+    only (``LoanService.approve_loan``); part ``k`` is charged in the ``k``-th
+    month after the loan was approved, so over its term a loan is charged its
+    interest exactly once. Parts are taken on the amount lent, never on
+    interest already charged, and rounded so that they add up to the total to
+    the cent. A member's parts for the month are posted as one
+    ``interest_accrual`` ledger entry and added to their loan balance; loans no
+    longer ``approved`` (repaid, rejected) are not charged.
+
+    ``period`` ('YYYY-MM', default this month) makes the run idempotent; a
+    month that was missed is charged by running it for that period.
+    """
+    period = period or datetime.utcnow().strftime('%Y-%m')
+    year, month = (int(part) for part in period.split('-'))
+    run = _start_run('interest_accrual', period, lambda: {'month': year * 12 + month})
+    balance = MemberBalance.__table__
+    loan = Loan.__table__
+    # Month k of the loan's term; part k is floor(total * k / n) - floor(total * (k - 1) / n)
+    k = cast(literal(run.params['month']) - (extract('year', loan.c.approved_at) * 12
+                                             + extract('month', loan.c.approved_at)), Integer)
+    n = loan.c.repayment_period
+    total = cast(func.round(loan.c.amount * loan.c.interest_rate), BigInteger)  # Cents of amount * rate / 100
+    part = total * k // n - total * (k - 1) // n
+
+    def apply_slice(after, upper):
+        owed = (
+            select(loan.c.borrower_id.label('member_id'), func.sum(part).label('interest'))
+            .where(loan.c.borrower_id > after, loan.c.borrower_id <= upper, loan.c.status == 'approved',
+                   loan.c.approved_at.is_not(None), k >= 1, k <= n, *tenant_criteria(loan))
+            .group_by(loan.c.borrower_id)
+            .subquery()
+        )
+        due = and_(balance.c.member_id == owed.c.member_id, owed.c.interest > 0, *tenant_criteria(balance))
+        now = datetime.utcnow()
+        # Lock the slice's balances so the ledger and the snapshot see the same loan_cents
+        db.session.execute(select(balance.c.member_id).where(due).with_for_update(of=balance))
+        db.session.execute(insert(LedgerEntry.__table__).from_select(
+            ['member_id', 'entry_type', 'amount_cents', 'savings_after_cents', 'loan_after_cents',
+             'reference', 'created_at'],
+            select(balance.c.member_id, literal('interest_accrual'), owed.c.interest, balance.c.savings_cents,
+                   balance.c.loan_cents + owed.c.interest, literal(run.reference), literal(now)).where(due)
+        ))
+        charged = (
+            select(LedgerEntry.amount_cents)
+            .where(LedgerEntry.member_id == balance.c.member_id, LedgerEntry.entry_type == 'interest_accrual',
+                   LedgerEntry.reference == run.reference)
+            .scalar_subquery()
+        )
+        db.session.execute(
+            update(balance)
+            .where(balance.c.member_id > after, balance.c.member_id <= upper, charged.is_not(None),
+                   *tenant_criteria(balance))
+            .values(loan_cents=balance.c.loan_cents + charged, updated_at=now)
+        )
+
+    driver = select(MemberBalance.member_id).where(
+        MemberBalance.member_id.in_(select(Loan.borrower_id).where(Loan.status == 'approved')))
+    return _run_slices(run, driver, apply_slice, chunk_size, progress)
+
+
+def _savings_as_of(cutoff_id, after=None, upper=None):
+    """Subquery of (member_id, savings_cents) as of ledger entry ``cutoff_id``.
+
+    Balances come from each member's last ledger entry at or before the cut-off,
+    so deposits made while the job runs do not change anyone's share.
+    """
+    latest = select(func.max(LedgerEntry.id).label('id')).where(LedgerEntry.id <= cutoff_id)
+    if after is not None:
+        latest = latest.where(LedgerEntry.member_id > after, LedgerEntry.member_id <= upper)
+    latest = latest.group_by(LedgerEntry.member_id).subquery()
+    return (
+        select(LedgerEntry.member_id, LedgerEntry.savings_after_cents.label('savings_cents'))
+        .join(latest, LedgerEntry.id == latest.c.id)
+        .subquery()
+    )
+
+
+def _dividend_params(pool):
+    pool_cents = to_cents(pool)
+    if pool_cents <= 0:
+        raise ValueError('Dividend pool must be positive.')
+    cutoff_id = db.session.execute(select(func.coalesce(func.max(LedgerEntry.id), 0))).scalar()
+    as_of = _savings_as_of(cutoff_id)
+    total_cents = db.session.execute(select(func.coalesce(func.sum(as_of.c.savings_cents), 0))
+                                     .where(as_of.c.savings_cents > 0)).scalar()
+    if total_cents <= 0:
+        raise ValueError('No member has savings to distribute dividends against.')
+    # Share per cent saved as an integer fraction of `scale`; keep savings * rate within 64 bits
+    scale = 10 ** 12
+    while pool_cents * scale > 2 ** 62 and scale > 1:
+        scale //= 10
+    return {'pool_cents': pool_cents, 'cutoff_id': cutoff_id, 'total_savings_cents': int(total_cents),
+            'rate': pool_cents * scale // int(total_cents), 'scale': scale}
+
+
+def distribute_dividends(pool, period=None, chunk_size=None, progress=None):
+    """Share ``pool`` among members pro rata to their savings and credit it to ``User.earnings``.
+
+    Savings are taken as of the ledger when the run starts (see ``_savings_as_of``).
+    Shares are rounded down to the cent, so at most one cent per member of the
+    pool stays undistributed. Each share is a ``dividend`` ledger entry.
+    ``period`` ('YYYY', default this year) makes the run idempotent.
+    """
+    period = period or str(datetime.utcnow().year)
+    run = _start_run('dividend', period, lambda: _dividend_params(pool))
+    rate, scale, cutoff_id = run.params['rate'], run.params['scale'], run.params['cutoff_id']
+    balance = MemberBalance.__table__
+    user = User.__table__
+
+    def apply_slice(after, upper):
+        as_of = _savings_as_of(cutoff_id, after, upper)
+        share = (as_of.c.savings_cents * rate) // scale
+        now = datetime.utcnow()
+        db.session.execute(insert(LedgerEntry.__table__).from_select(
+            ['member_id', 'entry_type', 'amount_cents', 'savings_after_cents', 'loan_after_cents',
+             'reference', 'created_at'],
+            select(as_of.c.member_id, literal('dividend'), share, balance.c.savings_cents, balance.c.loan_cents,
+                   literal(run.reference), literal(now))
+            .join(balance, balance.c.member_id == as_of.c.member_id)
+            .where(as_of.c.savings_cents > 0, share > 0)
+        ))
+        paid = (
+            select(LedgerEntry.amount_cents)
+            .where(LedgerEntry.member_id == user.c.id, LedgerEntry.entry_type == 'dividend',
+                   LedgerEntry.reference == run.reference)
+            .scalar_subquery()
+        )
+        db.session.execute(
+            update(user)
+            .where(user.c.id > after, user.c.id <= upper, paid.is_not(None), *tenant_criteria(user))
+            .values(earnings=func.coalesce(user.c.earnings, 0.0) + paid / 100.0)
+        )
+
+    return _run_slices(run, select(MemberBalance.member_id), apply_slice, chunk_size, progress)
@@ -0,0 +1,237 @@
+# limits.py
+"""Sliding-window withdrawal limits.
+
+A member may withdraw at most their tier's limit within any rolling
+``WITHDRAWAL_WINDOW`` (24 hours by default). The withdrawals inside each
+member's window are kept in a shared store, so a check is a dictionary (or one
+Redis script) call rather than a ledger scan:
+
+* ``MemoryWindowStore`` - in-process, for a single worker on a single node;
+  the app refuses to start with it when ``WEB_CONCURRENCY`` is above 1, as
+  each worker would allow the full limit;
+* ``RedisWindowStore`` - set ``WITHDRAWAL_LIMIT_STORE=redis://...`` so every
+  worker and node draws on the same budget.
+
+Stores start empty. The first withdrawal a member makes after a restart (or
+after their Redis keys expire) seeds their window from the ledger, reading
+only the newest entries.
+"""
+import itertools
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime
+
+EPOCH = datetime(1970, 1, 1)
+
+
+class _Window:
+    """Withdrawals ``(timestamp, cents, token)`` in one member's window, oldest first."""
+
+    __slots__ = ('entries', 'total')
+
+    def __init__(self, history):
+        self.entries = deque(sorted((ts, cents, None) for ts, cents in history))
+        self.total = sum(cents for _, cents, _ in self.entries)
+
+    def prune(self, cutoff):
+        entries = self.entries
+        while entries and entries[0][0] <= cutoff:
+            self.total -= entries.popleft()[1]
+
+
+class MemoryWindowStore:
+    """Per-process store; one lock makes check-and-add atomic across threads.
+
+    Windows left empty are dropped (on release, and by a sweep of every window
+    once per window length), so idle members cost nothing; their next
+    withdrawal seeds the window from the ledger again.
+    """
+
+    def __init__(self):
+        self._windows = {}
+        self._lock = threading.Lock()
+        self._tokens = itertools.count(1)
+        self._swept = None
+
+    def reserve(self, key, cents, limit, now, window, history=None):
+        """Add ``cents`` to the window if it stays within ``limit``.
+
+        Returns ``(token, used)``; the token is ``None`` when refused. Returns
+        ``None`` if the store has no window for ``key`` and no ``history`` was
+        given to seed it from.
+        """
+        with self._lock:
+            self._sweep(now, window)
+            entries = self._windows.get(key)
+            if entries is None:
+                if history is None:
+                    return None
+                entries = self._windows[key] = _Window(history)
+            entries.prune(now - window)
+            if entries.total + cents > limit:
+                return None, entries.total
+            token = next(self._tokens)
+            entries.entries.append((now, cents, token))
+            entries.total += cents
+            return token, entries.total
+
+    def release(self, key, token):
+        """Give back a reservation whose withdrawal did not go through."""
+        with self._lock:
+            entries = self._windows.get(key)
+            if entries is None:
+                return
+            for item in entries.entries:
+                if item[2] == token:
+                    entries.entries.remove(item)
+                    entries.total -= item[1]
+                    if not entries.entries:
+                        del self._windows[key]
+                    return
+
+    def _sweep(self, now, window):
+        """Drop the windows that have emptied, at most once per ``window``; called with the lock held."""
+        if self._swept is None:
+            self._swept = now
+        if now - self._swept < window:
+            return
+        self._swept = now
+        for key, entries in list(self._windows.items()):
+            entries.prune(now - window)
+            if not entries.entries:
+                del self._windows[key]
+
+
+# KEYS: window sorted set, "seeded" marker. ARGV: now, window, cents, limit, token, seeding flag, then
+# (timestamp, cents) pairs. Members are "<token>:<cents>" scored by timestamp.
+_RESERVE_SCRIPT = """
+local now, window = tonumber(ARGV[1]), tonumber(ARGV[2])
+local cents, limit = tonumber(ARGV[3]), tonumber(ARGV[4])
+local ttl = math.ceil(window)
+if redis.call('EXISTS', KEYS[2]) == 0 then
+    if ARGV[6] == '0' then
+        return {-1, 0}
+    end
+    redis.call('DEL', KEYS[1])
+    for i = 7, #ARGV, 2 do
+        redis.call('ZADD', KEYS[1], ARGV[i], 'ledger' .. i .. ':' .. ARGV[i + 1])
+    end
+end
+redis.call('SET', KEYS[2], 1, 'EX', ttl)
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now - window)
+local used = 0
+for _, member in ipairs(redis.call('ZRANGE', KEYS[1], 0, -1)) do
+    used = used + tonumber(string.match(member, ':(%d+)$'))
+end
+if used + cents > limit then
+    return {0, used}
+end
+redis.call('ZADD', KEYS[1], now, ARGV[5])
+redis.call('EXPIRE', KEYS[1], ttl)
+return {1, used + cents}
+"""
+
+
+class RedisWindowStore:
+    """Store shared by every process through Redis; a Lua script keeps check-and-add atomic."""
+
+    def __init__(self, url, prefix='sacco:withdrawals:'):
+        import redis  # Only needed when a Redis store is configured
+        self._redis = redis.Redis.from_url(url)
+        self._reserve = self._redis.register_script(_RESERVE_SCRIPT)
+        self._prefix = prefix
+
+    def _keys(self, key):
+        return [f'{self._prefix}{key}', f'{self._prefix}{key}:seeded']
+
+    def reserve(self, key, cents, limit, now, window, history=None):
+        token = f'{uuid.uuid4().hex}:{cents}'
+        args = [repr(now), repr(window), cents, limit, token, '0' if history is None else '1']
+        for ts, amount in history or ():
+            args += [repr(ts), amount]
+        allowed, used = self._reserve(keys=self._keys(key), args=args)
+        if allowed == -1:
+            return None
+        return (token if allowed else None), used
+
+    def release(self, key, token):
+        self._redis.zrem(self._keys(key)[0], token)
+
+
+class WithdrawalLimiter:
+    """Checks withdrawals against per-tier sliding-window limits before they reach the ledger."""
+
+    def __init__(self, app=None):
+        self.app = None
+        self.store = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        config = app.config
+        config.setdefault('DAILY_WITHDRAWAL_LIMIT', 1000.0)
+        config.setdefault('WITHDRAWAL_TIER_LIMITS', {})
+        config.setdefault('WITHDRAWAL_WINDOW', 24 * 3600)
+        store = config.setdefault('WITHDRAWAL_LIMIT_STORE', 'memory')
+        if store == 'memory' and config.get('WEB_CONCURRENCY', 1) > 1:
+            raise RuntimeError(f"WEB_CONCURRENCY={config['WEB_CONCURRENCY']} needs a shared withdrawal limit store: "
+                               'set WITHDRAWAL_LIMIT_STORE to a redis:// URL')
+        self.store = MemoryWindowStore() if store == 'memory' else RedisWindowStore(store)
+        app.extensions['withdrawal_limiter'] = self
+
+    def limit_for(self, tier=None):
+        """Limit in cents for a member tier; tiers without their own limit get DAILY_WITHDRAWAL_LIMIT.
+
+        Both come from the current tenant's settings when it overrides them.
+        """
+        from app.money import to_cents
+        from app.tenancy import setting
+        return to_cents(setting('WITHDRAWAL_TIER_LIMITS').get(tier, setting('DAILY_WITHDRAWAL_LIMIT')))
+
+    def reserve(self, member_id, cents, tier=None):
+        """Reserve ``cents`` of the member's window; returns a token, or ``None`` if over the limit.
+
+        Pass the token to ``release`` if the withdrawal is then refused or rolled back.
+        """
+        limit = self.limit_for(tier)
+        window = self.app.config['WITHDRAWAL_WINDOW']
+        now = time.time()
+        key = self._key(member_id)
+        result = self.store.reserve(key, cents, limit, now, window)
+        if result is None:
+            result = self.store.reserve(key, cents, limit, now, window,
+                                        history=self._history(member_id, now - window))
+        return result[0]
+
+    def release(self, member_id, token):
+        self.store.release(self._key(member_id), token)
+
+    @staticmethod
+    def _key(member_id):
+        from app.tenancy import scope_prefix
+        return f'{scope_prefix()}{member_id}'  # Tenants with their own database reuse member ids
+
+    @staticmethod
+    def _history(member_id, since):
+        """Withdrawals the member made after ``since``, read newest first until the window is passed."""
+        from sqlalchemy import select
+        from app import db
+        from app.models import LedgerEntry
+        result = db.session.execute(
+            select(LedgerEntry.entry_type, LedgerEntry.amount_cents, LedgerEntry.created_at)
+            .where(LedgerEntry.member_id == member_id)
+            .order_by(LedgerEntry.id.desc())
+            .execution_options(yield_per=100)
+        )
+        history = []
+        for entry_type, cents, created_at in result:
+            ts = (created_at - EPOCH).total_seconds()
+            if ts <= since:
+                break
+            if entry_type == 'withdrawal':
+                history.append((ts, cents))
+        result.close()
+        return history
@@ -0,0 +1,189 @@
+# mailer.py
+import logging
+import smtplib
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, bindparam, or_, select, update
+
+logger = logging.getLogger(__name__)
+
+
+class MailDispatcher:
+    """Send queued ``OutboundEmail`` rows in batches over one reused SMTP connection.
+
+    Web requests only insert outbox rows (see ``EmailService.queue_email``). The
+    dispatcher claims up to ``MAIL_BATCH_SIZE`` due rows with a conditional
+    UPDATE, so several dispatchers (threads or processes) never send the same
+    message twice, sends them over a single SMTP session and records the
+    outcome. Temporary failures are retried with exponential backoff; permanent
+    (5xx) rejections and messages out of attempts are marked failed.
+
+    It runs on a background thread started on first use (``MAIL_OUTBOX_WORKER``)
+    or in the foreground with ``python batch.py mail``. With ``TASK_QUEUE_EAGER``
+    queued mail is sent inline.
+    """
+
+    def __init__(self, app=None, db=None):
+        self.app = None
+        self.db = None
+        self._mail = None
+        self.connections = 0  # SMTP sessions opened, for benchmarks and logs
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._worker = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        self.app = app
+        self.db = db
+        config = app.config
+        config.setdefault('MAIL_OUTBOX_WORKER', True)
+        config.setdefault('MAIL_BATCH_SIZE', 50)
+        config.setdefault('MAIL_POLL_INTERVAL', 2.0)
+        config.setdefault('MAIL_MAX_ATTEMPTS', 6)
+        config.setdefault('MAIL_RETRY_BACKOFF', 30.0)
+        config.setdefault('MAIL_CLAIM_TIMEOUT', 300)
+        app.extensions['mail_dispatcher'] = self
+
+    @property
+    def mail(self):
+        """The Flask-Mail extension, set up on first send: web workers only insert outbox rows."""
+        if self._mail is None:
+            from flask_mail import Mail
+            with self._lock:
+                if self._mail is None:
+                    self._mail = Mail(self.app)
+        return self._mail
+
+    def wake(self):
+        """Signal that mail was queued; starts the in-process worker on first use."""
+        if self.app.config.get('TASK_QUEUE_EAGER'):
+            # Called from after_commit, where the request's session can no longer run SQL; a fresh
+            # app context gets its own scoped session
+            with self.app.app_context():
+                self.dispatch_pending()
+            return
+        if not self.app.config['MAIL_OUTBOX_WORKER']:
+            return  # A separate dispatcher process polls the outbox
+        self._ensure_worker()
+        self._wake.set()
+
+    def run_forever(self):
+        """Dispatch until ``stop()``; used by the dedicated ``batch.py mail`` process."""
+        with self.app.app_context():
+            self._loop()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def _ensure_worker(self):
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._stop.clear()
+                self._worker = threading.Thread(target=self.run_forever, name='mail-dispatcher', daemon=True)
+                self._worker.start()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            self._wake.clear()
+            try:
+                handled = self.dispatch_pending()
+            except Exception:
+                logger.exception('Mail dispatch failed')
+                self.db.session.rollback()
+                handled = 0
+            if not handled:
+                self._wake.wait(self.app.config['MAIL_POLL_INTERVAL'])
+        self.db.session.remove()
+
+    def dispatch_pending(self):
+        """Send every due message, one batch (and SMTP session) at a time. Returns how many were handled."""
+        handled = 0
+        while True:
+            batch = self._claim_batch(self.app.config['MAIL_BATCH_SIZE'])
+            if not batch:
+                return handled
+            self._record(*self._send_batch(batch))
+            handled += len(batch)
+
+    def _claim_batch(self, size):
+        from app.models import OutboundEmail  # Models import the app package, which imports this module
+        now = datetime.utcnow()
+        stale = now - timedelta(seconds=self.app.config['MAIL_CLAIM_TIMEOUT'])
+        due = or_(
+            and_(OutboundEmail.status == 'queued', OutboundEmail.next_attempt_at <= now),
+            and_(OutboundEmail.status == 'sending', OutboundEmail.claimed_at < stale),  # Dispatcher died mid-batch
+        )
+        ids = select(OutboundEmail.id).where(due).order_by(OutboundEmail.id).limit(size).scalar_subquery()
+        # Re-checking `due` makes the claim conditional: a row another dispatcher took is skipped
+        rows = self.db.session.execute(
+            update(OutboundEmail).where(OutboundEmail.id.in_(ids), due)
+            .values(status='sending', claimed_at=now, attempts=OutboundEmail.attempts + 1)
+            .returning(OutboundEmail.id, OutboundEmail.recipient, OutboundEmail.subject, OutboundEmail.body,
+                       OutboundEmail.attempts)
+            .execution_options(synchronize_session=False)
+        ).all()
+        self.db.session.commit()
+        return rows
+
+    def _send_batch(self, batch):
+        """Send ``batch`` over one SMTP session; returns (sent ids, [(row, error, permanent)])."""
+        from flask_mail import Message
+        sent, failures = [], []
+        pending = list(batch)
+        try:
+            with self.mail.connect() as connection:
+                self.connections += 1
+                while pending:
+                    row = pending[0]
+                    message = Message(row.subject, recipients=[row.recipient], body=row.body,
+                                      sender=self.app.config.get('MAIL_DEFAULT_SENDER'))
+                    try:
+                        connection.send(message)
+                        sent.append(row.id)
+                    except (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError) as exc:
+                        # Refused message: the session is still usable for the rest of the batch
+                        failures.append((row, exc, self._is_permanent(exc)))
+                    pending.pop(0)
+        except (smtplib.SMTPException, OSError) as exc:
+            # The connection failed; whatever was not sent yet is retried later
+            failures.extend((row, exc, False) for row in pending)
+            logger.warning('SMTP session failed after %d of %d messages: %s', len(sent), len(batch), exc)
+        return sent, failures
+
+    @staticmethod
+    def _is_permanent(exc):
+        if isinstance(exc, smtplib.SMTPRecipientsRefused):
+            return all(code >= 500 for code, _ in exc.recipients.values())
+        return getattr(exc, 'smtp_code', 0) >= 500
+
+    def _record(self, sent, failures):
+        from app.models import OutboundEmail
+        now = datetime.utcnow()
+        if sent:
+            self.db.session.execute(
+                update(OutboundEmail).where(OutboundEmail.id.in_(sent))
+                .values(status='sent', sent_at=now, last_error=None)
+                .execution_options(synchronize_session=False)
+            )
+        if failures:
+            max_attempts = self.app.config['MAIL_MAX_ATTEMPTS']
+            backoff = self.app.config['MAIL_RETRY_BACKOFF']
+            table = OutboundEmail.__table__
+            self.db.session.execute(
+                table.update().where(table.c.id == bindparam('e_id'))
+                .values(status=bindparam('e_status'), next_attempt_at=bindparam('e_next'),
+                        last_error=bindparam('e_error')),
+                [{'e_id': row.id,
+                  'e_status': 'failed' if permanent or row.attempts >= max_attempts else 'queued',
+                  'e_next': now + timedelta(seconds=backoff * 2 ** (row.attempts - 1)),
+                  'e_error': str(exc)[:255]}
+                 for row, exc, permanent in failures]
+            )
+        self.db.session.commit()
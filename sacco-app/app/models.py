@@ -1,51 +1,85 @@
 from datetime import datetime
-from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
+from app import db
+from app.money import from_cents
+from app.tenancy import current_tenant_id
 
-db = SQLAlchemy()
+
+# Tenant Model (A SACCO hosted on this deployment; see app.tenancy)
+class Tenant(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    slug = db.Column(db.String(50), unique=True, nullable=False)
+    name = db.Column(db.String(150), nullable=False)
+    hostname = db.Column(db.String(255), unique=True, nullable=True)  # Host its members use, e.g. 'acme.sacco.co.ke'
+    database_uri = db.Column(db.String(500), nullable=True)  # Its own database; None shares the main one
+    settings = db.Column(db.JSON, nullable=False, default=dict)  # Overrides of app.tenancy.TENANT_SETTINGS
+    active = db.Column(db.Boolean, nullable=False, default=True)
+    version = db.Column(db.Integer, nullable=False, default=1)  # Bumped on every change; caches compare it
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<Tenant {self.slug}>'
+
+
+class TenantScoped:
+    """Rows owned by one tenant: stamped with the current tenant and filtered to it (see app.tenancy)."""
+
+    # No foreign key: a tenant with its own database has no tenant table there
+    tenant_id = db.Column(db.Integer, nullable=False, default=current_tenant_id, server_default='1')
 
 # User Model
-class User(db.Model, UserMixin):
+class User(TenantScoped, db.Model, UserMixin):
+    # Usernames and emails are unique within a SACCO; the same person may belong to several
+    __table_args__ = (db.UniqueConstraint('tenant_id', 'username', name='uq_user_tenant_id_username'),
+                      db.UniqueConstraint('tenant_id', 'email', name='uq_user_tenant_id_email'))
+
     id = db.Column(db.Integer, primary_key=True)
-    username = db.Column(db.String(150), unique=True, nullable=False)
-    email = db.Column(db.String(150), unique=True, nullable=False)
+    username = db.Column(db.String(150), nullable=False)
+    email = db.Column(db.String(150), nullable=False)
+    phone_number = db.Column(db.String(20), nullable=True, index=True)  # M-Pesa number; statement imports match on it
     password = db.Column(db.String(150), nullable=False)
     role = db.Column(db.String(50), default='member')  # 'admin' or 'member'
+    tier = db.Column(db.String(20), nullable=False, default='standard', server_default='standard')  # Withdrawal limit tier
     two_factor_secret = db.Column(db.String(32), nullable=True)  # Secret for MFA
     is_mfa_enabled = db.Column(db.Boolean, default=False)  # Flag for MFA
 
     # Financial fields
     savings = db.Column(db.Float, default=0.0)  # Total savings by the user
     earnings = db.Column(db.Float, default=0.0)  # Total earnings from interest distributions
+    # Maintained with each notification insert/mark-read, so the inbox badge needs no COUNT query
+    unread_notifications = db.Column(db.Integer, nullable=False, default=0, server_default='0')
 
-    # Relationships
-    groups = db.relationship('Group', backref='creator', lazy=True)
-    notifications = db.relationship('Notification', backref='user', lazy=True)
-    messages = db.relationship('Message', backref='sender', lazy=True)
-    membership_requests = db.relationship('MembershipRequest', backref='user', lazy=True)
-    loan_requests = db.relationship('LoanRequest', backref='member', lazy=True)
-    savings_transactions = db.relationship('Savings', backref='member', lazy=True)
+    # Relationships. Unbounded histories are 'dynamic' (a query to filter/paginate, never
+    # loaded whole); small collections load lazily and call sites eager-load what they render.
+    groups = db.relationship('Group', backref='creator', lazy='select')
+    notifications = db.relationship('Notification', backref='user', lazy='dynamic')
+    messages = db.relationship('Message', backref='sender', lazy='dynamic')
+    membership_requests = db.relationship('MembershipRequest', backref='user', lazy='select')
+    loan_requests = db.relationship('LoanRequest', backref='member', lazy='select')
+    savings_transactions = db.relationship('Savings', backref='member', lazy='dynamic')
 
     def __repr__(self):
         return f'<User {self.username}>'
 
 
 # MembershipRequest Model
-class MembershipRequest(db.Model):
+class MembershipRequest(TenantScoped, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    status = db.Column(db.String(20), default='pending')  # 'pending', 'admitted', 'rejected'
+    status = db.Column(db.String(20), default='pending', index=True)  # 'pending', 'admitted', 'rejected'
     created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
 
 
 # LoanRequest Model
-class LoanRequest(db.Model):
+class LoanRequest(TenantScoped, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     member_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     amount = db.Column(db.Float, nullable=False)  # Principal loan amount
     interest_rate = db.Column(db.Float, nullable=False, default=0.05)  # Interest rate on the loan (5% default)
-    status = db.Column(db.String(20), default='pending')  # 'pending', 'approved', 'rejected', 'paid'
+    status = db.Column(db.String(20), default='pending', index=True)  # 'pending', 'approved', 'rejected', 'paid'
     total_repayment = db.Column(db.Float, nullable=False)  # Principal + interest
+    purpose = db.Column(db.String(500), nullable=True)
     created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
 
     def calculate_repayment(self):
@@ -56,30 +90,136 @@ class LoanRequest(db.Model):
 
 
 # Savings Model (Tracking individual savings transactions)
-class Savings(db.Model):
+class Savings(TenantScoped, db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    member_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    member_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
     amount = db.Column(db.Float, nullable=False)  # Amount saved
+    transaction_id = db.Column(db.String(64), nullable=True, unique=True, index=True)  # M-Pesa transaction reference
+    payment_status = db.Column(db.String(20), default='pending')  # 'pending', 'completed', 'failed'
     created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
 
     def __repr__(self):
         return f'<Savings {self.amount}>'
 
 
+# PaymentCallback Model (Inbox of M-Pesa payment callbacks, stored before they are acknowledged)
+class PaymentCallback(TenantScoped, db.Model):
+    # M-Pesa retries a callback until it is acknowledged; a repeat of a stored one is dropped
+    __table_args__ = (db.UniqueConstraint('tenant_id', 'transaction_id', 'status',
+                                          name='uq_payment_callback_tenant_id_transaction_id_status'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    transaction_id = db.Column(db.String(64), nullable=False, index=True)  # Savings.transaction_id it reports on
+    status = db.Column(db.String(20), nullable=False)  # 'completed' or a failure
+    received_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    # Set once the deposit is on file and settled; until then (e.g. the callback beat
+    # SavingsService.attach_transaction) the callback waits here
+    applied_at = db.Column(db.DateTime, nullable=True, index=True)
+
+    def __repr__(self):
+        return f'<PaymentCallback {self.transaction_id} {self.status}>'
+
+
+# LedgerEntry Model (Append-only record of every money movement for a member)
+class LedgerEntry(TenantScoped, db.Model):
+    __table_args__ = (db.Index('ix_ledger_entry_member_id_id', 'member_id', 'id'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    member_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    entry_type = db.Column(db.String(20), nullable=False)  # See LedgerService.ENTRY_EFFECTS
+    amount_cents = db.Column(db.BigInteger, nullable=False)  # Always positive; entry_type gives the direction
+    savings_after_cents = db.Column(db.BigInteger, nullable=False)  # Savings balance after this entry
+    loan_after_cents = db.Column(db.BigInteger, nullable=False)  # Outstanding loan balance after this entry
+    reference = db.Column(db.String(64), nullable=True)  # Savings/loan id or M-Pesa transaction id
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<LedgerEntry {self.entry_type} {self.amount_cents}>'
+
+
+# MemberBalance Model (Balance snapshot maintained alongside every ledger entry)
+class MemberBalance(TenantScoped, db.Model):
+    member_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    savings_cents = db.Column(db.BigInteger, nullable=False, default=0)
+    loan_cents = db.Column(db.BigInteger, nullable=False, default=0)  # Outstanding loan principal + interest
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    @property
+    def savings(self):
+        return from_cents(self.savings_cents)
+
+    @property
+    def loans(self):
+        return from_cents(self.loan_cents)
+
+    def __repr__(self):
+        return f'<MemberBalance {self.member_id} {self.savings_cents}>'
+
+
+# CreditProfile Model (Repayment record behind loan eligibility, maintained with each repayment; see app.eligibility)
+class CreditProfile(db.Model):
+    member_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    repayments = db.Column(db.Integer, nullable=False, default=0)
+    on_time_repayments = db.Column(db.Integer, nullable=False, default=0)
+    last_repayment_at = db.Column(db.DateTime, nullable=True)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<CreditProfile {self.member_id} {self.on_time_repayments}/{self.repayments}>'
+
+
+# JobRun Model (Checkpoint for a scheduled batch job run, one row per tenant, job and period)
+class JobRun(TenantScoped, db.Model):
+    __table_args__ = (db.UniqueConstraint('tenant_id', 'job', 'period', name='uq_job_run_tenant_id_job_period'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    job = db.Column(db.String(50), nullable=False)  # 'interest_accrual', 'dividend', 'contribution_import'
+    period = db.Column(db.String(20), nullable=False)  # '2026-10' (interest), '2026' (dividends), file digest (imports)
+    status = db.Column(db.String(20), nullable=False, default='running')  # 'running', 'completed', 'failed'
+    cursor = db.Column(db.Integer, nullable=False, default=0)  # Last member_id (imports: statement row) processed
+    rows_processed = db.Column(db.Integer, nullable=False, default=0)
+    amount_cents = db.Column(db.BigInteger, nullable=False, default=0)  # Total posted so far
+    params = db.Column(db.JSON, nullable=False, default=dict)  # Rate, pool, cut-off: fixed when the run starts
+    started_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    @property
+    def reference(self):
+        """Ledger reference shared by every entry this run posts."""
+        return f'{self.job}:{self.period}'
+
+    def __repr__(self):
+        return f'<JobRun {self.job} {self.period} {self.status}>'
+
+
+# SearchIndexState Model (High-water mark of rows copied into the full-text index, one row per source)
+class SearchIndexState(db.Model):
+    source = db.Column(db.String(20), primary_key=True)  # 'groups', 'members', 'messages'
+    last_id = db.Column(db.BigInteger, nullable=False, default=0)  # Highest id indexed so far
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<SearchIndexState {self.source} {self.last_id}>'
+
+
 # Group Model
-class Group(db.Model):
+class Group(TenantScoped, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(150), nullable=False)
     description = db.Column(db.Text, nullable=True)
     admin = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    members = db.relationship('User', secondary='group_members', lazy='subquery',
-        backref=db.backref('member_groups', lazy=True))
+    # A group can have thousands of members: 'dynamic' returns a query, so counts and
+    # membership checks run in SQL (see GroupService) instead of loading every User
+    members = db.relationship('User', secondary='group_members', lazy='dynamic',
+        backref=db.backref('member_groups', lazy='select'))
 
 
 # Association Table for Group Members
 group_members = db.Table('group_members',
     db.Column('user_id', db.Integer, db.ForeignKey('user.id'), primary_key=True),
-    db.Column('group_id', db.Integer, db.ForeignKey('group.id'), primary_key=True)
+    db.Column('group_id', db.Integer, db.ForeignKey('group.id'), primary_key=True),
+    db.Index('ix_group_members_group_id_user_id', 'group_id', 'user_id')  # Member lists/counts by group
 )
 
 
@@ -96,6 +236,9 @@ class Meeting(db.Model):
 
 # Notification Model
 class Notification(db.Model):
+    # Inbox pages are keyset scans of one user's rows, newest first
+    __table_args__ = (db.Index('ix_notification_user_id_timestamp_id', 'user_id', 'timestamp', 'id'),)
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     message = db.Column(db.String(255), nullable=False)
@@ -103,8 +246,42 @@ class Notification(db.Model):
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
 
 
+# ArchivedNotification Model (Read notifications moved out of `notification` by app.archive, same ids)
+class ArchivedNotification(db.Model):
+    __tablename__ = 'notification_archive'
+    __table_args__ = (db.Index('ix_notification_archive_user_id_timestamp_id', 'user_id', 'timestamp', 'id'),)
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    message = db.Column(db.String(255), nullable=False)
+    timestamp = db.Column(db.DateTime, nullable=False)
+    is_read = True  # Only read notifications are archived
+
+
+# OutboundEmail Model (Mail outbox; sent in batches by app.mailer.MailDispatcher)
+class OutboundEmail(db.Model):
+    __table_args__ = (db.Index('ix_outbound_email_status_next_attempt_at', 'status', 'next_attempt_at'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    recipient = db.Column(db.String(254), nullable=False)
+    subject = db.Column(db.String(255), nullable=False)
+    body = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='queued')  # 'queued', 'sending', 'sent', 'failed'
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)  # Backoff after a failure
+    claimed_at = db.Column(db.DateTime, nullable=True)  # When a dispatcher took it; stale claims are retried
+    last_error = db.Column(db.String(255), nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime, nullable=True)
+
+    def __repr__(self):
+        return f'<OutboundEmail {self.recipient} {self.status}>'
+
+
 # Message Model for Group Chat
 class Message(db.Model):
+    __table_args__ = (db.Index('ix_message_group_id_id', 'group_id', 'id'),)  # Backlog pages and group_id lookups
+
     id = db.Column(db.Integer, primary_key=True)
     content = db.Column(db.Text, nullable=False)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
@@ -112,10 +289,24 @@ class Message(db.Model):
     group_id = db.Column(db.Integer, db.ForeignKey('group.id'), nullable=False)
 
 
-class Loan(db.Model):
+# ArchivedMessage Model (Chat messages moved out of `message` by app.archive, same ids)
+class ArchivedMessage(db.Model):
+    __tablename__ = 'message_archive'
+    __table_args__ = (db.Index('ix_message_archive_group_id_id', 'group_id', 'id'),)
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    content = db.Column(db.Text, nullable=False)
+    timestamp = db.Column(db.DateTime, nullable=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    group_id = db.Column(db.Integer, db.ForeignKey('group.id'), nullable=False)
+
+    sender = db.relationship('User')
+
+
+class Loan(TenantScoped, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     borrower_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)  # User requesting the loan
-    group_id = db.Column(db.Integer, db.ForeignKey('bulkgroup.id'), nullable=False)  # Group associated with the loan
+    group_id = db.Column(db.Integer, db.ForeignKey('group.id'), nullable=False)  # Group associated with the loan
     amount = db.Column(db.Float, nullable=False)  # Loan amount requested
     interest_rate = db.Column(db.Float, nullable=False, default=10.0)  # Default interest rate (can be modified)
     repayment_period = db.Column(db.Integer, nullable=False)  # Repayment period in months
@@ -127,13 +318,19 @@ class Loan(db.Model):
     admin_id = db.Column(db.Integer, db.ForeignKey('user.id'))  # Administrator who approves/rejects the loan
     
     borrower = db.relationship('User', foreign_keys=[borrower_id], backref='loans')
-    group = db.relationship('BulkGroup', backref='loans')
+    group = db.relationship('Group', backref='loans')
     admin = db.relationship('User', foreign_keys=[admin_id], backref='administered_loans')
 
     def calculate_total_due(self):
         """Calculate the total amount due with interest."""
         return self.amount * (1 + self.interest_rate / 100)
 
+    def amortization_schedule(self, method='flat'):
+        """Month-by-month repayment schedule ('flat' or 'reducing' balance)."""
+        from app.loan_engine import amortization_schedule  # NumPy is only loaded when needed
+        return amortization_schedule(self.amount, self.interest_rate, self.repayment_period, method,
+                                     start=(self.approved_at or self.requested_at or datetime.utcnow()).date())
+
     def is_fully_paid(self):
         """Check if the loan has been fully paid."""
         return self.total_paid >= self.calculate_total_due()
@@ -0,0 +1,16 @@
+# money.py
+from decimal import Decimal, ROUND_HALF_UP
+
+CENT = Decimal('0.01')
+
+
+def to_cents(amount):
+    """Convert an amount (Decimal, float, int or str) to integer cents."""
+    if not isinstance(amount, Decimal):
+        amount = Decimal(str(amount))
+    return int((amount.quantize(CENT, rounding=ROUND_HALF_UP) * 100).to_integral_value())
+
+
+def from_cents(cents):
+    """Convert integer cents back to a two-place Decimal."""
+    return (Decimal(cents or 0) / 100).quantize(CENT)
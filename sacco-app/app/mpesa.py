@@ -0,0 +1,189 @@
+# mpesa.py
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+
+from app.tenancy import bind_tenant, setting
+
+logger = logging.getLogger(__name__)
+
+
+class MpesaError(Exception):
+    """Raised when the M-Pesa API cannot be reached or rejects a request."""
+
+
+class MpesaClient:
+    """M-Pesa API client shared by every request in the process.
+
+    Keeps one pooled HTTP session (built on first use, so processes that never
+    pay anyone don't import ``requests``), caches the OAuth token until shortly before
+    it expires (only one thread refreshes it at a time), applies timeouts and
+    bounded retries, and can submit payments on a small thread pool so web
+    workers don't wait on Safaricom. The shortcode and credentials are the
+    current tenant's, with one cached token per set of credentials.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._session = None
+        self._executor = None
+        self._tokens = {}  # consumer key -> (token, expires at)
+        self._token_lock = threading.Lock()
+        self._executor_lock = threading.Lock()
+        self._session_lock = threading.Lock()
+        self.token_fetches = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        config = app.config
+        config.setdefault('MPESA_TIMEOUT', (3.05, 15))
+        config.setdefault('MPESA_MAX_RETRIES', 2)
+        config.setdefault('MPESA_POOL_SIZE', 20)
+        config.setdefault('MPESA_TOKEN_REFRESH_MARGIN', 60)
+        config.setdefault('MPESA_ASYNC_WORKERS', 8)
+        config.setdefault('MPESA_ASYNC_PAYMENTS', True)
+        app.extensions['mpesa'] = self
+
+    def after_fork(self):
+        """Drop the connection and thread pools inherited from a parent process; both are rebuilt on use."""
+        self._session = None
+        self._executor = None
+
+    def _get_session(self):
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    config = self.app.config
+                    self._session = self._build_session(config['MPESA_POOL_SIZE'], config['MPESA_MAX_RETRIES'])
+        return self._session
+
+    @staticmethod
+    def _build_session(pool_size, max_retries):
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+        # Payments are not idempotent: a POST is only retried when it never
+        # reached the server (connect errors). A 502/503/504 from the gateway may
+        # come after the payment went through, so only the token GET retries those.
+        retry = Retry(total=max_retries, connect=max_retries, read=0, status=max_retries,
+                      status_forcelist=(502, 503, 504), allowed_methods=frozenset(['GET']),
+                      backoff_factor=0.2, raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        session = requests.Session()
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+    def _timed(self):
+        # Counted in the external-call histograms (and the current request's external time)
+        metrics = self.app.extensions.get('request_metrics')
+        return metrics.external_call('mpesa') if metrics is not None else nullcontext()
+
+    def get_token(self):
+        """Return a cached access token, refreshing it once when it is about to expire."""
+        key = setting('MPESA_CONSUMER_KEY') or ''
+        token, expires_at = self._tokens.get(key, (None, 0.0))
+        if token and time.monotonic() < expires_at:
+            return token
+        with self._token_lock:
+            # Another thread may have refreshed while we waited for the lock
+            token, expires_at = self._tokens.get(key, (None, 0.0))
+            if token and time.monotonic() < expires_at:
+                return token
+            return self._refresh_token(key)
+
+    def invalidate_token(self):
+        with self._token_lock:
+            self._tokens.pop(setting('MPESA_CONSUMER_KEY') or '', None)
+
+    def _refresh_token(self, key):
+        import requests
+        config = self.app.config
+        try:
+            with self._timed():
+                response = self._get_session().get(
+                    config['MPESA_TOKEN_URL'],
+                    auth=(key, setting('MPESA_CONSUMER_SECRET') or ''),
+                    timeout=config['MPESA_TIMEOUT'],
+                )
+            response.raise_for_status()
+            data = response.json()
+        except (requests.RequestException, ValueError) as exc:
+            raise MpesaError(f'Could not obtain M-Pesa access token: {exc}') from exc
+        self.token_fetches += 1
+        expires_in = int(data.get('expires_in', 3599))
+        token = data['access_token']
+        self._tokens[key] = (token, time.monotonic() + max(expires_in - config['MPESA_TOKEN_REFRESH_MARGIN'], 0))
+        return token
+
+    def initiate_payment(self, phone_number, amount):
+        """Submit a paybill payment and return the M-Pesa transaction id (None on failure)."""
+        import requests
+        config = self.app.config
+        payload = {
+            'amount': float(amount),
+            'phone_number': phone_number,
+            'shortcode': setting('MPESA_SHORTCODE'),
+            'transaction_type': 'CustomerPayBillOnline'
+        }
+        for attempt in range(2):
+            try:
+                headers = {'Authorization': f'Bearer {self.get_token()}'}
+                with self._timed():
+                    response = self._get_session().post(
+                        config['MPESA_PAYBILL_URL'],
+                        json=payload,
+                        headers=headers,
+                        timeout=config['MPESA_TIMEOUT'],
+                    )
+            except (requests.RequestException, MpesaError) as exc:
+                logger.warning("M-Pesa payment request failed: %s", exc)
+                return None
+            if response.status_code == 401 and attempt == 0:
+                # Token revoked or expired early: fetch a new one and try once more
+                self.invalidate_token()
+                continue
+            if response.status_code == 200:
+                return response.json().get('transaction_id')
+            logger.warning("M-Pesa payment rejected with status %s", response.status_code)
+            return None
+        return None
+
+    def submit_payment(self, phone_number, amount, on_complete=None):
+        """Initiate a payment without blocking the caller.
+
+        ``on_complete(transaction_id)`` runs inside an application context once
+        M-Pesa answers. With ``MPESA_ASYNC_PAYMENTS`` off the call is synchronous.
+        """
+        if not self.app.config['MPESA_ASYNC_PAYMENTS']:
+            transaction_id = self.initiate_payment(phone_number, amount)
+            if on_complete is not None:
+                on_complete(transaction_id)
+            return transaction_id
+        # Runs as the caller's tenant: its shortcode, credentials and database
+        return self._get_executor().submit(bind_tenant(self._submit_in_background), phone_number, amount,
+                                           on_complete)
+
+    def _submit_in_background(self, phone_number, amount, on_complete):
+        # The worker thread has no app context of its own; settings and the handler both need one
+        with self.app.app_context():
+            transaction_id = self.initiate_payment(phone_number, amount)
+            if on_complete is not None:
+                try:
+                    on_complete(transaction_id)
+                except Exception:
+                    logger.exception("M-Pesa completion handler failed")
+                    self.app.extensions['sqlalchemy'].session.rollback()
+        return transaction_id
+
+    def _get_executor(self):
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.app.config['MPESA_ASYNC_WORKERS'],
+                                                        thread_name_prefix='mpesa')
+        return self._executor
@@ -0,0 +1,394 @@
+# reconcile.py
+"""Reconcile an M-Pesa settlement statement against the ``Savings`` records.
+
+M-Pesa callbacks get lost or arrive twice, so the deposits on file drift from
+what was actually settled. ``reconcile_statement`` reads a settlement export
+(CSV or XLSX, same readers and column detection as ``app/imports.py``) and
+classifies every line and every deposit in the period it covers:
+
+* ``matched``: the receipt is on file with the same amount and member. If
+  the deposit is still pending (or was marked failed) it is completed;
+* ``amount_mismatch`` / ``member_mismatch``: the receipt is on file but the
+  amount, or the member (phone, email or id), differs. Left for finance;
+* ``duplicated``: the receipt appears more than once in the statement;
+* ``missing``: settled, but no deposit has that receipt. A pending deposit
+  by the same member for the same amount within ``RECONCILE_WINDOW`` seconds
+  is taken to be it (its callback never came): the receipt is attached and
+  the deposit completed. Otherwise the line is left for finance;
+* ``unsettled``: a deposit in the period that the statement does not settle.
+  Pending ones older than the window are marked failed.
+
+Repairs are only applied with ``repair=True``; they go through
+``SavingsService.settle_deposits``, a conditional UPDATE, so a callback
+arriving at the same time is never applied twice.
+
+Nothing is looked up a line at a time. The statement is parsed and sorted
+``RECONCILE_RUN_SIZE`` lines at a time into runs spilled to temporary files,
+then the runs are merged and walked in step with the deposits of the period
+streamed in ``transaction_id`` order (a sort-merge join). Receipts outside the
+period are fetched in batches, and the leftovers are hash-joined to the
+pending deposits on ``(member, amount)``. Memory is bounded by the run size
+plus the pending deposits of the period, however long the statement is.
+
+Every line that is not a plain match, and every repair, goes to a CSV report.
+"""
+import csv
+import heapq
+import logging
+import os
+import pickle
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from itertools import groupby
+from operator import itemgetter
+
+from flask import current_app
+from sqlalchemy import and_, bindparam, select, update
+
+from app import db
+from app.exports import iter_rows
+from app.imports import StatementError, _lookup, _resolve_members, member_key, parse_amount, parse_date, read_statement
+from app.models import Savings, User
+from app.money import from_cents, to_cents
+from app.services import SavingsService
+
+logger = logging.getLogger(__name__)
+
+CLASSES = ('matched', 'amount_mismatch', 'member_mismatch', 'duplicated', 'missing', 'unsettled', 'invalid')
+REPORT_HEADERS = ('class', 'action', 'reference', 'statement_row', 'statement_time', 'statement_amount',
+                  'statement_member', 'savings_id', 'member_id', 'recorded_amount', 'recorded_status',
+                  'recorded_at')
+_SPILL_BATCH = 1000  # Records pickled together in a spill file
+_REPAIR_BATCH = 1000  # Deposits repaired per transaction
+_FETCH_SIZE = 5000  # Deposits fetched per round trip while streaming
+
+
+def _binary_order(column):
+    """``column`` collated byte-wise, so the database sorts receipts the way Python compares them."""
+    dialect = db.session.get_bind(mapper=Savings).dialect.name
+    if dialect == 'postgresql':
+        return column.collate('C')
+    if dialect == 'mysql':
+        return column.collate('utf8mb4_bin')
+    return column  # SQLite's default BINARY collation already is
+
+
+class _Spill:
+    """An append-only sequence of records kept in a temporary file, read back in order."""
+
+    def __init__(self, directory):
+        self._file = tempfile.TemporaryFile(dir=directory)
+        self._buffer = []
+        self.count = 0
+
+    def append(self, record):
+        self._buffer.append(record)
+        self.count += 1
+        if len(self._buffer) >= _SPILL_BATCH:
+            self._flush()
+
+    def _flush(self):
+        if self._buffer:
+            pickle.dump(self._buffer, self._file, pickle.HIGHEST_PROTOCOL)
+            self._buffer = []
+
+    def batches(self):
+        """Yield the records in lists of about ``_SPILL_BATCH``; the spill can not be appended to afterwards."""
+        self._flush()
+        self._file.seek(0)
+        while True:
+            try:
+                yield pickle.load(self._file)
+            except EOFError:
+                break
+        self._file.close()
+
+    def __iter__(self):
+        for batch in self.batches():
+            yield from batch
+
+
+class _Report:
+    """Counts by class and the CSV report of everything that is not a plain match."""
+
+    def __init__(self, handle):
+        self.counts = dict.fromkeys(CLASSES, 0)
+        self.actions = {}
+        self.lines = self.skipped = 0
+        self._writer = csv.writer(handle)
+        self._writer.writerow(REPORT_HEADERS)
+
+    def add(self, kind, line=None, recorded=None, action=''):
+        self.counts[kind] += 1
+        if action:
+            self.actions[action] = self.actions.get(action, 0) + 1
+        elif kind == 'matched':
+            return
+        reference, number, cents, key, when = line if line is not None else (None,) * 5
+        self._writer.writerow([
+            kind, action, reference if line is not None else recorded.transaction_id, number,
+            when, from_cents(cents) if cents is not None else '', ':'.join(map(str, key)) if key else '',
+            *((recorded.id, recorded.member_id, recorded.amount, recorded.payment_status, recorded.created_at)
+              if recorded is not None else ('',) * 5),
+        ])
+
+    def invalid(self, number, reason):
+        self.counts['invalid'] += 1
+        self._writer.writerow(['invalid', reason, '', number] + [''] * 8)
+
+
+def _lines(rows, columns, report, utc_offset):
+    """Parse statement rows into ``(reference, row number, cents, member key, UTC time)`` credit lines."""
+    amount_at, reference_at, member_at, date_at = (columns['amount'], columns['reference'], columns['member'],
+                                                   columns['date'])
+    member_kind = columns.get('member_kind')
+    for number, row in rows:
+        report.lines += 1
+        width = len(row)
+        try:
+            amount = parse_amount(row[amount_at] if amount_at < width else None)
+            if amount is None or amount <= 0:
+                report.skipped += 1  # Withdrawals, charges and reversals
+                continue
+            reference = row[reference_at] if reference_at < width else None
+            if isinstance(reference, float) and reference.is_integer():
+                reference = int(reference)
+            reference = str(reference).strip() if reference is not None else ''
+            if not reference:
+                raise ValueError('missing reference')
+            when = parse_date(row[date_at] if date_at < width else None)
+        except ValueError as exc:
+            report.invalid(number, str(exc))
+            continue
+        if when.tzinfo is not None:
+            when = when.astimezone(timezone.utc).replace(tzinfo=None)
+        else:
+            when -= utc_offset
+        key = member_key(row[member_at] if member_at < width else None, member_kind)
+        yield reference, number, to_cents(amount), key, when
+
+
+def _sorted_runs(lines, run_size, directory):
+    """Sort ``lines`` by reference ``run_size`` at a time; returns the runs and the time span they cover."""
+    runs = []
+    earliest = latest = None
+    run = []
+    for line in lines:
+        when = line[4]
+        if earliest is None or when < earliest:
+            earliest = when
+        if latest is None or when > latest:
+            latest = when
+        run.append(line)
+        if len(run) >= run_size:
+            runs.append(_spill_run(run, directory))
+            run = []
+    if run:
+        run.sort()
+        runs.append(run if not runs else _spill_run(run, directory))
+    return runs, earliest, latest
+
+
+def _spill_run(run, directory):
+    run.sort()
+    spill = _Spill(directory)
+    for line in run:
+        spill.append(line)
+    return spill
+
+
+def _recorded_columns():
+    return (Savings.id, Savings.transaction_id, Savings.member_id, Savings.amount, Savings.payment_status,
+            Savings.created_at, User.phone_number, User.email)
+
+
+def _same_member(key, recorded):
+    """Whether the statement's member key names the member the deposit belongs to (unknown keys pass)."""
+    if key is None:
+        return True
+    kind, value = key
+    if kind == 'id':
+        return value == recorded.member_id
+    if kind == 'email':
+        return recorded.email is None or value == recorded.email.lower()
+    phone = member_key(recorded.phone_number, 'phone')
+    return phone is None or phone[1] == value
+
+
+def _compare(line, recorded, report, repairs):
+    if line[2] != to_cents(recorded.amount):
+        report.add('amount_mismatch', line, recorded)
+    elif not _same_member(line[3], recorded):
+        report.add('member_mismatch', line, recorded)
+    elif recorded.payment_status != 'completed':
+        repairs.append(('complete', recorded.id, None))
+        report.add('matched', line, recorded, 'complete')
+    else:
+        report.add('matched', line, recorded)
+
+
+def _merge(statement, recorded, report, repairs, leftovers, pending):
+    """Walk the sorted statement and the deposits of the period in step (both ordered by receipt)."""
+    row = next(recorded, None)
+    for reference, lines in groupby(statement, key=itemgetter(0)):
+        while row is not None and row.transaction_id < reference:
+            _unsettled(row, report, pending)
+            row = next(recorded, None)
+        line = next(lines)
+        for repeat in lines:
+            report.add('duplicated', repeat)
+        if row is not None and row.transaction_id == reference:
+            _compare(line, row, report, repairs)
+            row = next(recorded, None)
+        else:
+            leftovers.append(line)
+    while row is not None:
+        _unsettled(row, report, pending)
+        row = next(recorded, None)
+
+
+def _unsettled(recorded, report, pending):
+    if recorded.payment_status == 'pending':
+        pending.append(recorded)  # Maybe settled under another receipt; see _match_pending
+    elif recorded.payment_status == 'completed':
+        report.add('unsettled', recorded=recorded)
+
+
+def _match_pending(leftovers, pending, window, report, repairs):
+    """Hash-join the lines with no deposit to pending deposits on (member, amount), within ``window``."""
+    candidates = {}
+    for recorded in pending:
+        candidates.setdefault((recorded.member_id, to_cents(recorded.amount)), []).append(recorded)
+    members = {}
+    for batch in leftovers.batches():
+        unknown = {line[3] for line in batch if line[3] is not None and line[3] not in members}
+        if unknown:
+            found = _resolve_members(unknown)
+            members.update((key, found.get(key)) for key in unknown)
+        for line in batch:
+            rows = candidates.get((members.get(line[3]), line[2])) if line[3] is not None else None
+            best = None
+            if rows:
+                best = min(rows, key=lambda recorded: abs(recorded.created_at - line[4]))
+                if abs(best.created_at - line[4]) > window:
+                    best = None
+            if best is None:
+                report.add('missing', line)
+                continue
+            rows.remove(best)
+            repairs.append(('attach', best.id, line[0]))
+            report.add('matched', line, best, 'attach')
+    return [recorded for rows in candidates.values() for recorded in rows]
+
+
+def _apply(repairs):
+    """Apply the queued repairs, ``_REPAIR_BATCH`` deposits per transaction; returns how many changed."""
+    changed = 0
+    table = Savings.__table__
+    for batch in repairs.batches():
+        attach = [{'s_id': savings_id, 's_ref': reference} for action, savings_id, reference in batch
+                  if action == 'attach']
+        if attach:
+            db.session.execute(
+                update(table).where(table.c.id == bindparam('s_id'), table.c.payment_status == 'pending')
+                .values(transaction_id=bindparam('s_ref')),
+                attach,
+            )
+            # Only where the receipt went on: a deposit settled meanwhile keeps its own
+            changed += SavingsService.settle_deposits(
+                and_(Savings.id.in_([row['s_id'] for row in attach]),
+                     Savings.transaction_id.in_([row['s_ref'] for row in attach])),
+                'completed', commit=False)
+        complete = [savings_id for action, savings_id, _ in batch if action == 'complete']
+        failed = [savings_id for action, savings_id, _ in batch if action == 'fail']
+        if complete:
+            changed += SavingsService.settle_deposits(Savings.id.in_(complete), 'completed',
+                                                      ('pending', 'failed'), commit=False)
+        if failed:
+            changed += SavingsService.settle_deposits(Savings.id.in_(failed), 'failed', commit=False)
+        db.session.commit()
+    return changed
+
+
+def report_path():
+    """Where a new report goes by default: ``RECONCILE_DIR`` (or <instance>/reconciliation)."""
+    directory = current_app.config['RECONCILE_DIR'] or os.path.join(current_app.instance_path, 'reconciliation')
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, f"reconciliation-{datetime.utcnow():%Y%m%d-%H%M%S}.csv")
+
+
+def reconcile_statement(path, fmt=None, repair=False, report=None, window=None, run_size=None):
+    """Reconcile a settlement statement with the deposits on file; see the module docstring.
+
+    ``report`` is the CSV report's path (default: ``report_path()``).
+    ``window`` (seconds, default ``RECONCILE_WINDOW``) bounds how far a
+    pending deposit's time may be from the settlement it is matched to.
+    Returns a summary dict: counts by class, repairs, the report's path and
+    lines/sec.
+    """
+    config = current_app.config
+    window = timedelta(seconds=window if window is not None else config['RECONCILE_WINDOW'])
+    run_size = run_size or config['RECONCILE_RUN_SIZE']
+    utc_offset = timedelta(hours=config['RECONCILE_STATEMENT_UTC_OFFSET'])
+    report = report or report_path()
+    started = time.perf_counter()
+    columns, rows = read_statement(path, fmt)
+    if 'date' not in columns:
+        rows.close()
+        raise StatementError('Settlement statements need a date or completion time column.')
+    with tempfile.TemporaryDirectory(prefix='reconcile-') as spill_dir, \
+            open(report, 'w', newline='') as handle:
+        summary = _Report(handle)
+        try:
+            runs, earliest, latest = _sorted_runs(_lines(rows, columns, summary, utc_offset), run_size, spill_dir)
+        finally:
+            rows.close()
+        repairs, leftovers = _Spill(spill_dir), _Spill(spill_dir)
+        pending = []
+        if earliest is not None:
+            lower, upper = earliest - window, latest + window
+            recorded = iter_rows(db.session, select(*_recorded_columns())
+                                 .join(User, User.id == Savings.member_id)
+                                 .where(Savings.transaction_id.isnot(None), Savings.created_at >= lower,
+                                        Savings.created_at <= upper)
+                                 .order_by(_binary_order(Savings.transaction_id)), _FETCH_SIZE)
+            _merge(heapq.merge(*runs), recorded, summary, repairs, leftovers, pending)
+
+            # Receipts on file from outside the period (settled late, or recorded early)
+            unmatched = _Spill(spill_dir)
+            for batch in leftovers.batches():
+                lines = {line[0]: line for line in batch}
+                for recorded in _lookup(select(*_recorded_columns()).join(User, User.id == Savings.member_id),
+                                        Savings.transaction_id, lines):
+                    _compare(lines.pop(recorded.transaction_id), recorded, summary, repairs)
+                for line in lines.values():
+                    unmatched.append(line)
+
+            # Deposits whose callback never came, so they have no receipt yet
+            pending.extend(iter_rows(db.session, select(*_recorded_columns())
+                                     .join(User, User.id == Savings.member_id)
+                                     .where(Savings.transaction_id.is_(None), Savings.payment_status == 'pending',
+                                            Savings.created_at >= lower, Savings.created_at <= upper),
+                                     _FETCH_SIZE))
+            for recorded in _match_pending(unmatched, pending, window, summary, repairs):
+                stale = recorded.created_at < latest - window
+                if stale:
+                    repairs.append(('fail', recorded.id, None))
+                summary.add('unsettled', recorded=recorded, action='fail' if stale else '')
+            pending = None
+        repaired = _apply(repairs) if repair else 0
+    elapsed = time.perf_counter() - started
+    logger.info('Reconciled %s: %s, %s repaired', path, summary.counts, repaired)
+    return {
+        'lines': summary.lines,
+        'skipped': summary.skipped,
+        'counts': summary.counts,
+        'actions': summary.actions,
+        'repaired': repaired,
+        'repair': repair,
+        'report': report,
+        'period': (earliest, latest) if earliest is not None else None,
+        'elapsed': elapsed,
+        'lines_per_second': summary.lines / elapsed if elapsed > 0 else 0.0,
+    }
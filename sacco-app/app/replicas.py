@@ -0,0 +1,269 @@
+# replicas.py
+"""Read replicas: reports, exports and admin listings read from a replica engine, everything else from the primary.
+
+Work opts in: ``read_replica`` on a view or service function,
+``replica_reads()`` around a block, or ``replica_iter`` around a streamed
+row source (each step of the iteration runs as replica reads, so it works for
+responses that are streamed after the view has returned). Inside it,
+``RoutingSession`` sends a SELECT to one of the ``DATABASE_REPLICA_URLS``
+(round-robin) unless reading from the primary is needed to see a write:
+
+* the session has written in its current transaction (or is flushing), or the
+  SELECT locks rows (``FOR UPDATE``);
+* the signed-in member committed a write less than ``REPLICA_MAX_LAG`` seconds
+  ago (kept in their session), so a page after a POST shows its result;
+* the tenant has a database of its own, which has no replicas.
+
+Replicas are checked at most every ``REPLICA_CHECK_INTERVAL`` seconds. One
+that can't be reached, or is more than ``REPLICA_MAX_LAG`` seconds behind, is
+skipped until a later check finds it healthy; with none healthy, reads stay
+on the primary. A replica that fails a query is skipped from then on (that
+query still fails). Lag is ``pg_last_xact_replay_timestamp()`` on
+PostgreSQL (zero when the replica has replayed everything it received) and,
+for the SQLite stand-in, the age of the copy made by
+``batch.py replicas --sync``, which copies the primary into each SQLite replica
+every ``REPLICA_SYNC_INTERVAL`` seconds with the backup API and stamps the
+copy time in its ``replica_sync`` table. Point SQLite replica URLs at the
+copies read-only: ``sqlite:///file:/path/replica.db?mode=ro&uri=true``.
+"""
+import contextvars
+import logging
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import current_app, has_request_context, session as cookie_session
+from sqlalchemy import event, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.sql import Select
+
+from app.database import create_engine_like
+from app.tenancy import TenantSession, current_tenant
+
+logger = logging.getLogger(__name__)
+
+_reading = contextvars.ContextVar('replica_reads', default=False)
+
+_LAG_SQL = {
+    'postgresql': ("SELECT CASE WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() "
+                   "THEN 0 ELSE extract(epoch FROM now() - pg_last_xact_replay_timestamp()) END"),
+    'sqlite': "SELECT (julianday('now') - julianday(copied_at)) * 86400 FROM replica_sync",
+}
+
+
+@contextmanager
+def replica_reads():
+    """Let the SELECTs of the block run on a replica."""
+    token = _reading.set(True)
+    try:
+        yield
+    finally:
+        _reading.reset(token)
+
+
+def read_replica(func):
+    """Run ``func`` with ``replica_reads()``: for views and services whose reads may be a little stale."""
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        with replica_reads():
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def replica_iter(rows):
+    """Iterate ``rows`` (e.g. a streamed export's row source) with every step run as replica reads."""
+    iterator = iter(rows)
+    while True:
+        token = _reading.set(True)
+        try:
+            row = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            _reading.reset(token)
+        yield row
+
+
+def _wrote_recently(max_lag):
+    if not has_request_context():
+        return False
+    return cookie_session.get('_wrote_at', 0) > time.time() - max_lag
+
+
+class RoutingSession(TenantSession):
+    """Session that sends the SELECTs of replica reads to a healthy replica."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and _reading.get() and self._replica_safe(clause):
+            replicas = current_app.extensions.get('replicas')
+            engine = replicas.engine() if replicas is not None else None
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _replica_safe(self, clause):
+        if not isinstance(clause, Select) or clause._for_update_arg is not None:
+            return False
+        if self._flushing or self.info.get('wrote'):
+            return False
+        tenant = current_tenant()
+        if tenant is not None and tenant.database_uri:
+            return False
+        return not _wrote_recently(current_app.config['REPLICA_MAX_LAG'])
+
+
+@event.listens_for(RoutingSession, 'do_orm_execute')
+def _note_write(state):
+    if state.is_insert or state.is_update or state.is_delete:
+        state.session.info['wrote'] = True
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _note_flush(session, flush_context):
+    session.info['wrote'] = True
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _remember_write(session):
+    # Keep the member's next pages on the primary until the replicas have caught up with this write
+    if session.info.pop('wrote', False) and has_request_context() and '_user_id' in cookie_session:
+        cookie_session['_wrote_at'] = time.time()
+
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def _forget_write(session):
+    session.info.pop('wrote', None)
+
+
+class _Replica:
+    __slots__ = ('url', 'engine', 'lag', 'healthy')
+
+    def __init__(self, url, engine):
+        self.url = url
+        self.engine = engine
+        self.lag = None
+        self.healthy = False
+
+
+class ReplicaSet:
+    """The replica engines, their last known lag, and the round-robin choice among the healthy ones."""
+
+    def __init__(self, app=None):
+        self.app = None
+        self._replicas = []
+        self._healthy = []
+        self._next = 0
+        self._checked_at = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        config = app.config
+        config.setdefault('DATABASE_REPLICA_URLS', [])
+        config.setdefault('REPLICA_MAX_LAG', 30.0)
+        config.setdefault('REPLICA_CHECK_INTERVAL', 5.0)
+        config.setdefault('REPLICA_SYNC_INTERVAL', 10.0)
+        self._replicas = [_Replica(url, self._create_engine(url)) for url in config['DATABASE_REPLICA_URLS']]
+        app.extensions['replicas'] = self
+
+    def _create_engine(self, url):
+        engine = create_engine_like(self.app.config, url)
+
+        @event.listens_for(engine, 'handle_error')
+        def _skip_failed(context):
+            # Connection-level failures take the replica out until the next check finds it healthy
+            if context.is_disconnect or context.connection is None:
+                self._mark_down(engine)
+        return engine
+
+    def after_fork(self):
+        for replica in self._replicas:
+            replica.engine.dispose(close=False)
+
+    def engine(self):
+        """A healthy replica's engine, or None to read from the primary."""
+        if not self._replicas:
+            return None
+        now = time.monotonic()
+        if self._checked_at is None or now - self._checked_at >= self.app.config['REPLICA_CHECK_INTERVAL']:
+            # One thread re-checks; the others keep using the last result meanwhile
+            if self._lock.acquire(blocking=self._checked_at is None):
+                try:
+                    self.check()
+                finally:
+                    self._lock.release()
+        healthy = self._healthy
+        if not healthy:
+            return None
+        self._next = (self._next + 1) % len(healthy)
+        return healthy[self._next % len(healthy)].engine
+
+    def check(self):
+        """Measure every replica's lag and keep those within ``REPLICA_MAX_LAG``; returns their status."""
+        max_lag = self.app.config['REPLICA_MAX_LAG']
+        for replica in self._replicas:
+            try:
+                with replica.engine.connect() as connection:
+                    sql = _LAG_SQL.get(connection.dialect.name)
+                    replica.lag = float(connection.execute(text(sql)).scalar() or 0) if sql else 0.0
+            except Exception as exc:
+                if replica.healthy or replica.lag is None:
+                    logger.warning("Replica %s unavailable, reading from the primary: %s", self._name(replica), exc)
+                replica.lag, replica.healthy = None, False
+                continue
+            if replica.healthy and replica.lag > max_lag:
+                logger.warning("Replica %s is %.0f s behind, reading from the primary", self._name(replica),
+                               replica.lag)
+            replica.healthy = replica.lag <= max_lag
+        self._healthy = [replica for replica in self._replicas if replica.healthy]
+        self._checked_at = time.monotonic()
+        return self.status()
+
+    def status(self):
+        return [{'replica': self._name(replica), 'lag': replica.lag, 'healthy': replica.healthy}
+                for replica in self._replicas]
+
+    def _mark_down(self, engine):
+        for replica in self._replicas:
+            if replica.engine is engine and replica.healthy:
+                logger.warning("Replica %s failed a query, reading from the primary", self._name(replica))
+                replica.healthy = False
+        self._healthy = [replica for replica in self._healthy if replica.engine is not engine]
+
+    @staticmethod
+    def _name(replica):
+        return make_url(replica.url).render_as_string(hide_password=True)
+
+    # SQLite stand-in -----------------------------------------------------
+
+    def sync(self, primary_engine):
+        """Copy an SQLite primary into every SQLite replica and stamp the copy time; returns seconds taken."""
+        started = time.perf_counter()
+        source = sqlite3.connect(primary_engine.url.database)
+        try:
+            for replica in self._replicas:
+                if replica.engine.dialect.name != 'sqlite':
+                    continue
+                target = sqlite3.connect(_sqlite_path(replica.url))
+                try:
+                    copied_at = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime())
+                    source.backup(target)
+                    target.execute('CREATE TABLE IF NOT EXISTS replica_sync (copied_at TEXT NOT NULL)')
+                    target.execute('DELETE FROM replica_sync')
+                    target.execute('INSERT INTO replica_sync VALUES (?)', (copied_at,))
+                    target.commit()
+                finally:
+                    target.close()
+        finally:
+            source.close()
+        return time.perf_counter() - started
+
+
+def _sqlite_path(url):
+    """The file behind an SQLite URL, including ``sqlite:///file:<path>?mode=ro&uri=true`` ones."""
+    database = make_url(url).database
+    return database[len('file:'):] if database.startswith('file:') else database
@@ -0,0 +1,434 @@
+# search.py
+"""Full-text search over groups, members and chat messages.
+
+Each source has its own index table, kept outside the models and built per
+database: FTS5 virtual tables on SQLite, ``tsvector`` tables with GIN indexes
+on PostgreSQL. Queries match every term as a prefix. Groups and members are
+ranked by relevance (BM25 on SQLite, ``ts_rank`` on PostgreSQL); chat messages
+come newest first, which the index can return without scoring every match of a
+common word.
+
+Indexing never runs in a request. ``SearchIndexer`` catches up on new rows in
+batches past a per-source high-water mark (``SearchIndexState``). It re-indexes
+edited or deleted groups and members that the session hooks in
+``services.py`` report. It runs on a background thread woken after commits
+(``SEARCH_INDEX_WORKER``), or in the foreground with ``python batch.py search``.
+The high-water mark assumes ids become visible in order, which holds for
+SQLite's single writer. On PostgreSQL, schedule ``batch.py search --rebuild``
+to pick up stragglers. Archiving a message (``app/archive.py``) leaves its
+index entry in place.
+
+A message's index entry carries its group as a ``g<id>`` token, so a member's
+search intersects their groups' postings inside the index instead of filtering
+every match afterwards. Message prefixes of up to four letters are served by
+FTS5 prefix indexes. Longer ones are expanded to whole words through a
+vocabulary table (``search_term``), because FTS5 would otherwise merge the
+postings of every word with that prefix before returning the first row.
+"""
+import logging
+import re
+import threading
+import unicodedata
+from datetime import datetime
+
+from sqlalchemy import bindparam, event, select, text, update
+
+logger = logging.getLogger(__name__)
+
+SOURCES = ('groups', 'members', 'messages')
+INDEX_TABLES = ('search_group', 'search_member', 'search_message', 'search_term')
+MAX_TERMS = 8
+PREFIX_INDEX_LENGTH = 4  # Longest message prefix with its own FTS5 prefix index
+MAX_EXPANSION = 256  # Words a longer prefix may expand to before falling back to an FTS5 prefix query
+
+
+def is_index_table(name):
+    """True for the index tables and their shadow tables (kept out of autogenerated migrations)."""
+    return any(name == table or name.startswith(table + '_') for table in INDEX_TABLES)
+
+
+def words(value):
+    """Lower-cased words without diacritics, split the way the ``unicode61`` tokenizer splits them."""
+    folded = unicodedata.normalize('NFKD', (value or '').lower())
+    return re.findall(r'[^\W_]+', ''.join(ch for ch in folded if not unicodedata.combining(ch)))
+
+
+def parse_terms(query):
+    """Word terms of a search box query (punctuation and operators are dropped)."""
+    return words(query)[:MAX_TERMS]
+
+
+class SqliteFtsBackend:
+    """FTS5 virtual tables. Messages are contentless: their text is already in the message table.
+
+    ``search_term`` holds every message word longer than ``PREFIX_INDEX_LENGTH``
+    so that long prefixes can be expanded to an OR of exact words.
+    """
+
+    SCHEMA = (
+        "CREATE VIRTUAL TABLE IF NOT EXISTS search_group USING fts5("
+        "name, description, tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+        "CREATE VIRTUAL TABLE IF NOT EXISTS search_member USING fts5("
+        "username, tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+        "CREATE VIRTUAL TABLE IF NOT EXISTS search_message USING fts5("
+        "content, grp, content='', tokenize='unicode61 remove_diacritics 2', prefix='2 3 4')",
+        "CREATE TABLE IF NOT EXISTS search_term (term TEXT PRIMARY KEY) WITHOUT ROWID",
+    )
+
+    def create_schema(self, connection):
+        for statement in self.SCHEMA:
+            connection.execute(text(statement))
+
+    def drop_schema(self, connection):
+        for table in INDEX_TABLES:
+            connection.execute(text(f'DROP TABLE IF EXISTS {table}'))
+
+    def add(self, connection, source, rows):
+        """Index new rows (dicts with ``id`` and the source's fields)."""
+        if not rows:
+            return
+        if source == 'groups':
+            statement = ("INSERT OR REPLACE INTO search_group (rowid, name, description) "
+                         "VALUES (:id, :name, coalesce(:description, ''))")
+        elif source == 'members':
+            statement = "INSERT OR REPLACE INTO search_member (rowid, username) VALUES (:id, :username)"
+        else:
+            statement = "INSERT INTO search_message (rowid, content, grp) VALUES (:id, :content, 'g' || :group_id)"
+            terms = {word for row in rows for word in words(row['content']) if len(word) > PREFIX_INDEX_LENGTH}
+            if terms:
+                connection.execute(text("INSERT OR IGNORE INTO search_term (term) VALUES (:term)"),
+                                   [{'term': term} for term in terms])
+        connection.execute(text(statement), rows)
+
+    def remove(self, connection, source, rows):
+        """Drop index entries; messages need their original content and group."""
+        if not rows:
+            return
+        if source == 'messages':
+            connection.execute(text("INSERT INTO search_message (search_message, rowid, content, grp) "
+                                    "VALUES ('delete', :id, :content, 'g' || :group_id)"), rows)
+        else:
+            table = 'search_group' if source == 'groups' else 'search_member'
+            connection.execute(text(f'DELETE FROM {table} WHERE rowid = :id'), [{'id': row['id']} for row in rows])
+
+    @staticmethod
+    def _message_phrases(connection, terms):
+        """FTS5 query for each message term as a prefix; None for a term no indexed word starts with.
+
+        Every long term is expanded in the same statement.
+        """
+        long_terms = [term for term in terms if len(term) > PREFIX_INDEX_LENGTH]
+        expansions = {term: [] for term in long_terms}
+        if long_terms:
+            selects, params = [], {'limit': MAX_EXPANSION + 1}
+            for n, term in enumerate(long_terms):
+                selects.append(f"SELECT * FROM (SELECT {n} AS n, term FROM search_term "
+                               f"WHERE term >= :low{n} AND term < :high{n} ORDER BY term LIMIT :limit)")
+                params[f'low{n}'] = term
+                params[f'high{n}'] = term[:-1] + chr(ord(term[-1]) + 1)
+            for n, word in connection.execute(text(' UNION ALL '.join(selects)), params):
+                expansions[long_terms[n]].append(word)
+        phrases = []
+        for term in terms:
+            expansion = expansions.get(term)
+            if expansion is None or len(expansion) > MAX_EXPANSION:
+                phrases.append(f'"{term}"*')
+            elif not expansion:
+                phrases.append(None)
+            else:
+                phrases.append('(' + ' OR '.join(f'"{word}"' for word in expansion) + ')')
+        return phrases
+
+    def search(self, connection, source, terms, group_ids=None, limit=20, offset=0):
+        """Ids of one page of matches: groups and members best first, messages newest first.
+
+        ``group_ids`` (if not None) limits members and messages to those groups.
+        """
+        match = ' '.join(f'"{term}"*' for term in terms)
+        params = {'limit': limit, 'offset': offset}
+        if source == 'groups':
+            sql = ("SELECT rowid FROM search_group WHERE search_group MATCH :match "
+                   "ORDER BY bm25(search_group, 10.0, 1.0)")
+        elif source == 'members':
+            sql = "SELECT rowid FROM search_member WHERE search_member MATCH :match"
+            if group_ids is not None:
+                sql += (" AND rowid IN (SELECT user_id FROM group_members WHERE group_id IN :group_ids)")
+                params['group_ids'] = list(group_ids)
+            sql += " ORDER BY rank"
+        else:
+            phrases = self._message_phrases(connection, terms)
+            if None in phrases:
+                return []
+            match = f"content : ({' AND '.join(phrases)})"
+            if group_ids is not None:
+                match += f" AND grp : ({' OR '.join(f'g{int(g)}' for g in group_ids)})"
+            sql = "SELECT rowid FROM search_message WHERE search_message MATCH :match ORDER BY rowid DESC"
+        statement = text(sql + " LIMIT :limit OFFSET :offset")
+        if 'group_ids' in params:
+            statement = statement.bindparams(bindparam('group_ids', expanding=True))
+        params['match'] = match
+        return list(connection.execute(statement, params).scalars())
+
+
+class PostgresSearchBackend:
+    """``tsvector`` documents with GIN indexes, maintained by upserts."""
+
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS search_group (id integer PRIMARY KEY, document tsvector NOT NULL)",
+        "CREATE TABLE IF NOT EXISTS search_member (id integer PRIMARY KEY, document tsvector NOT NULL)",
+        "CREATE TABLE IF NOT EXISTS search_message "
+        "(id bigint PRIMARY KEY, group_id integer NOT NULL, document tsvector NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS search_group_document ON search_group USING gin (document)",
+        "CREATE INDEX IF NOT EXISTS search_member_document ON search_member USING gin (document)",
+        "CREATE INDEX IF NOT EXISTS search_message_document ON search_message USING gin (document)",
+        "CREATE INDEX IF NOT EXISTS search_message_group_id ON search_message (group_id)",
+    )
+    DOCUMENTS = {
+        'groups': ("search_group (id, document)",
+                   "setweight(to_tsvector('simple', :name), 'A') || "
+                   "setweight(to_tsvector('simple', coalesce(:description, '')), 'B')"),
+        'members': ("search_member (id, document)", "to_tsvector('simple', :username)"),
+        'messages': ("search_message (id, group_id, document)", ":group_id, to_tsvector('simple', :content)"),
+    }
+    TABLES = dict(zip(SOURCES, INDEX_TABLES))
+
+    def create_schema(self, connection):
+        for statement in self.SCHEMA:
+            connection.execute(text(statement))
+
+    def drop_schema(self, connection):
+        for table in INDEX_TABLES:
+            connection.execute(text(f'DROP TABLE IF EXISTS {table}'))
+
+    def add(self, connection, source, rows):
+        if not rows:
+            return
+        target, values = self.DOCUMENTS[source]
+        connection.execute(text(f"INSERT INTO {target} VALUES (:id, {values}) "
+                                "ON CONFLICT (id) DO UPDATE SET document = EXCLUDED.document"), rows)
+
+    def remove(self, connection, source, rows):
+        if rows:
+            connection.execute(text(f'DELETE FROM {self.TABLES[source]} WHERE id = :id'),
+                               [{'id': row['id']} for row in rows])
+
+    def search(self, connection, source, terms, group_ids=None, limit=20, offset=0):
+        table = self.TABLES[source]
+        sql = (f"SELECT id FROM {table}, to_tsquery('simple', :query) AS query "
+               "WHERE document @@ query")
+        params = {'query': ' & '.join(f'{term}:*' for term in terms), 'limit': limit, 'offset': offset}
+        if group_ids is not None and source == 'messages':
+            sql += " AND group_id = ANY(:group_ids)"
+        elif group_ids is not None and source == 'members':
+            sql += " AND id IN (SELECT user_id FROM group_members WHERE group_id = ANY(:group_ids))"
+        if group_ids is not None and source != 'groups':
+            params['group_ids'] = list(group_ids)
+        if source == 'messages':
+            sql += " ORDER BY id DESC LIMIT :limit OFFSET :offset"
+        else:
+            sql += " ORDER BY ts_rank(document, query) DESC, id DESC LIMIT :limit OFFSET :offset"
+        return list(connection.execute(text(sql), params).scalars())
+
+
+BACKENDS = {'sqlite': SqliteFtsBackend, 'postgresql': PostgresSearchBackend}
+
+
+def backend_for(dialect_name):
+    try:
+        return BACKENDS[dialect_name]()
+    except KeyError:
+        raise RuntimeError(f'Full-text search is not available on {dialect_name}') from None
+
+
+class SearchIndexer:
+    """Keeps the index tables in step with groups, users and messages, in batches and off the request path."""
+
+    def __init__(self, app=None, db=None):
+        self.app = None
+        self.db = None
+        self._pending = set()  # (source, id) of edited or deleted rows awaiting re-indexing
+        self._pending_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._worker = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        self.app = app
+        self.db = db
+        config = app.config
+        config.setdefault('SEARCH_INDEX_WORKER', True)
+        config.setdefault('SEARCH_INDEX_BATCH_SIZE', 5000)
+        config.setdefault('SEARCH_INDEX_INTERVAL', 5.0)
+        config.setdefault('SEARCH_PAGE_SIZE', 20)
+        # db.create_all() (tests, benchmarks) builds the index tables too; migrations create them otherwise
+        event.listen(db.metadata, 'after_create', self._create_schema)
+        event.listen(db.metadata, 'before_drop', self._drop_schema)
+        app.extensions['search_indexer'] = self
+
+    def backend(self, connection=None):
+        connection = connection or self.db.session.connection()
+        return backend_for(connection.dialect.name)
+
+    def _create_schema(self, target, connection, **kw):
+        if connection.dialect.name in BACKENDS:
+            backend_for(connection.dialect.name).create_schema(connection)
+
+    def _drop_schema(self, target, connection, **kw):
+        if connection.dialect.name in BACKENDS:
+            backend_for(connection.dialect.name).drop_schema(connection)
+
+    def mark_changed(self, changes):
+        """Queue ``(source, id)`` pairs for re-indexing (called once their transaction commits)."""
+        with self._pending_lock:
+            self._pending.update(changes)
+
+    def wake(self):
+        """Signal that indexed rows changed; starts the in-process worker on first use."""
+        if self.app.config.get('TASK_QUEUE_EAGER'):
+            # Called from after_commit, where the request's session can no longer run SQL
+            with self.db.session.session_factory() as session:
+                self.sync(session=session)
+            return
+        if not self.app.config['SEARCH_INDEX_WORKER']:
+            return  # A separate ``batch.py search`` process keeps the index up to date
+        self._ensure_worker()
+        self._wake.set()
+
+    def run_forever(self):
+        with self.app.app_context():
+            self._loop()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def _ensure_worker(self):
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._stop.clear()
+                self._worker = threading.Thread(target=self.run_forever, name='search-indexer', daemon=True)
+                self._worker.start()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            self._wake.clear()
+            try:
+                self.sync()
+            except Exception:
+                logger.exception('Search indexing failed')
+                self.db.session.rollback()
+            self._wake.wait(self.app.config['SEARCH_INDEX_INTERVAL'])
+        self.db.session.remove()
+
+    def sync(self, progress=None, session=None):
+        """Index everything new and re-index queued changes. Returns the number of rows handled."""
+        session = session or self.db.session
+        handled = sum(self._catch_up(session, source, progress) for source in SOURCES)
+        return handled + self._reindex_pending(session)
+
+    def rebuild(self, progress=None):
+        """Drop and rebuild every index table from scratch, archived messages included."""
+        from app.models import ArchivedMessage, SearchIndexState
+        session = self.db.session
+        connection = session.connection()
+        backend = self.backend(connection)
+        backend.drop_schema(connection)
+        backend.create_schema(connection)
+        session.execute(update(SearchIndexState).values(last_id=0, updated_at=datetime.utcnow()))
+        session.commit()
+        # Archived messages (app/archive.py) stay searchable. Their ids are all below the live table's,
+        # which the high-water mark then walks as usual.
+        batch_size = self.app.config['SEARCH_INDEX_BATCH_SIZE']
+        query = select(ArchivedMessage.id, ArchivedMessage.group_id, ArchivedMessage.content)
+        handled, last_id = 0, 0
+        while True:
+            rows = [row._asdict() for row in session.execute(
+                query.where(ArchivedMessage.id > last_id).order_by(ArchivedMessage.id).limit(batch_size))]
+            if not rows:
+                break
+            backend.add(session.connection(), 'messages', rows)
+            session.commit()
+            handled += len(rows)
+            last_id = rows[-1]['id']
+            if progress:
+                progress('archived messages', last_id, handled)
+        return handled + self.sync(progress, session)
+
+    @staticmethod
+    def _source_query(source):
+        from app.models import Group, Message, User
+        if source == 'groups':
+            return Group.id, select(Group.id, Group.name, Group.description)
+        if source == 'members':
+            return User.id, select(User.id, User.username)
+        return Message.id, select(Message.id, Message.group_id, Message.content)
+
+    def _catch_up(self, session, source, progress=None):
+        """Index rows past the source's high-water mark, one batch per transaction."""
+        from app.models import SearchIndexState
+        batch_size = self.app.config['SEARCH_INDEX_BATCH_SIZE']
+        id_column, query = self._source_query(source)
+        handled = 0
+        while True:
+            state = session.get(SearchIndexState, source, populate_existing=True)
+            if state is None:
+                session.add(SearchIndexState(source=source, last_id=0))
+                session.flush()
+                state = session.get(SearchIndexState, source)
+            last_id = state.last_id
+            rows = [row._asdict() for row in session.execute(
+                query.where(id_column > last_id).order_by(id_column).limit(batch_size))]
+            if not rows:
+                session.commit()
+                return handled
+            connection = session.connection()
+            backend_for(connection.dialect.name).add(connection, source, rows)
+            # Moving the mark is conditional, so two indexers never both index a batch
+            moved = session.execute(
+                update(SearchIndexState)
+                .where(SearchIndexState.source == source, SearchIndexState.last_id == last_id)
+                .values(last_id=rows[-1]['id'], updated_at=datetime.utcnow())
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            if not moved:
+                session.rollback()
+                continue
+            session.commit()
+            handled += len(rows)
+            if progress:
+                progress(source, rows[-1]['id'], handled)
+
+    def _reindex_pending(self, session):
+        """Re-index (or drop) groups and members edited or deleted since the last pass."""
+        with self._pending_lock:
+            pending, self._pending = self._pending, set()
+        if not pending:
+            return 0
+        connection = session.connection()
+        backend = backend_for(connection.dialect.name)
+        for source in ('groups', 'members'):
+            ids = [row_id for kind, row_id in pending if kind == source]
+            if not ids:
+                continue
+            id_column, query = self._source_query(source)
+            rows = [row._asdict() for row in session.execute(query.where(id_column.in_(ids)))]
+            backend.remove(connection, source, [{'id': row_id} for row_id in ids])
+            backend.add(connection, source, rows)
+        session.commit()
+        return len(pending)
+
+    def search(self, source, query, group_ids=None, page=1, per_page=None):
+        """Ids of one page of matches and whether there is a next page."""
+        terms = parse_terms(query)
+        if not terms or (group_ids is not None and not group_ids and source != 'groups'):
+            return [], False
+        per_page = per_page or self.app.config['SEARCH_PAGE_SIZE']
+        connection = self.db.session.connection()
+        ids = self.backend(connection).search(connection, source, terms, group_ids,
+                                              limit=per_page + 1, offset=(page - 1) * per_page)
+        return ids[:per_page], len(ids) > per_page
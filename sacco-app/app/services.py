@@ -1,8 +1,64 @@
 # services.py
-from app.models import Group, User, Notification, Meeting, Message, Savings, LoanRequest, MembershipRequest, Loan
-from app import db
+from app.models import (Group, User, Notification, Meeting, Message, Savings, LoanRequest, MembershipRequest, Loan,
+                        group_members, LedgerEntry, MemberBalance, OutboundEmail, ArchivedMessage,
+                        ArchivedNotification, Tenant, PaymentCallback)
+from app import db, mail_dispatcher, response_cache, search_indexer, socketio, task_queue
+from app import eligibility
+from app.cache import group_scope, user_scope
+from app.money import to_cents, from_cents
+from app.tenancy import TENANT_SETTINGS, current_tenant, scope_prefix, setting
+from app.exports import iter_rows
+from app.replicas import replica_iter
+from flask import current_app
 from flask_login import current_user
-from datetime import datetime
+from datetime import datetime, timedelta
+from sqlalchemy import insert, select, update, case, bindparam, func, event, tuple_
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session, joinedload
+
+
+def _pending_page(model, loader, after_id=None, limit=None):
+    """Return one page of pending ``model`` rows (oldest first), the next-page cursor and the pending total."""
+    limit = limit or current_app.config['POSTS_PER_PAGE']
+    query = model.query.options(joinedload(loader)).filter(model.status == 'pending')
+    if after_id is not None:
+        query = query.filter(model.id > after_id)
+    rows = query.order_by(model.id).limit(limit + 1).all()
+    next_after_id = rows[limit - 1].id if len(rows) > limit else None
+    total = db.session.execute(select(func.count(model.id)).where(model.status == 'pending')).scalar()
+    return rows[:limit], next_after_id, total
+
+
+def _decide_pending(model, owner, new_status, ids=None, conditions=(), message=None):
+    """Move pending ``model`` rows to ``new_status`` with one conditional UPDATE.
+
+    ``ids`` selects rows by primary key; ``None`` means every pending row that
+    matches ``conditions``. Returns ``{id: result}`` where result is the new
+    status, ``'not_found'`` or ``'already_<status>'``. ``message(row)`` builds
+    the owner's notification from the updated row; they are queued on the task
+    queue in one batch once the change has committed.
+    """
+    criteria = [model.status == 'pending', *conditions]
+    if ids is not None:
+        ids = list(dict.fromkeys(int(i) for i in ids))
+        if not ids:
+            return {}
+        criteria.append(model.id.in_(ids))
+    decided = db.session.execute(
+        update(model).where(*criteria).values(status=new_status)
+        .returning(*model.__table__.c)
+        .execution_options(synchronize_session=False)
+    ).all()
+    results = {row.id: new_status for row in decided}
+    skipped = [i for i in ids if i not in results] if ids is not None else []
+    if skipped:
+        current = dict(db.session.execute(select(model.id, model.status).where(model.id.in_(skipped))).all())
+        results.update((i, f'already_{current[i]}' if i in current else 'not_found') for i in skipped)
+    db.session.commit()
+    if decided and message:
+        task_queue.enqueue(NotificationService.notify_each, [(getattr(row, owner.key), message(row)) for row in decided])
+    return results
+
 
 class GroupService:
     @staticmethod
@@ -14,15 +70,92 @@ class GroupService:
 
     @staticmethod
     def add_member(group_id, user):
-        group = Group.query.get(group_id)
-        if user not in group.members:
-            group.members.append(user)
-            db.session.commit()
-            return True
-        return False
+        user_id = getattr(user, 'id', user)
+        if not GroupService._insert_membership(group_id, user_id):
+            return False
+        db.session.commit()
+        return True
+
+    @staticmethod
+    def _insert_membership(group_id, user_id):
+        """Add a group_members row unless it already exists; no Group/User objects are loaded."""
+        if GroupService.is_member(group_id, user_id):
+            return False
+        db.session.execute(insert(group_members).values(group_id=group_id, user_id=user_id))
+        _touch_cache(group_scope(group_id), user_scope(user_id))
+        return True
+
+    @staticmethod
+    def is_member(group_id, user_id):
+        """Check membership with an EXISTS on the group_members primary key."""
+        return db.session.execute(
+            select(select(group_members).where(group_members.c.group_id == group_id,
+                                               group_members.c.user_id == user_id).exists())
+        ).scalar()
+
+    @staticmethod
+    def member_count(group_id):
+        """Count a group's members from the (group_id, user_id) index."""
+        return db.session.execute(
+            select(func.count()).select_from(group_members).where(group_members.c.group_id == group_id)
+        ).scalar()
 
     @staticmethod
-    def schedule_meeting(group_id, title, date, time, description):
+    def member_counts(group_ids):
+        """Return ``{group_id: member count}`` for many groups in one grouped query."""
+        counts = dict.fromkeys(group_ids, 0)
+        counts.update(db.session.execute(
+            select(group_members.c.group_id, func.count())
+            .where(group_members.c.group_id.in_(list(group_ids)))
+            .group_by(group_members.c.group_id)
+        ).all())
+        return counts
+
+    @staticmethod
+    def summary(group_id):
+        """The group's id, name, description and admin as a plain dict (cacheable), or None."""
+        row = db.session.execute(
+            select(Group.id, Group.name, Group.description, Group.admin).where(Group.id == group_id)
+        ).first()
+        return row._asdict() if row else None
+
+    @staticmethod
+    def get_meetings(group_id, since=None, limit=None):
+        """A group's meetings from ``since`` (a date) on, soonest first, as plain dicts."""
+        query = select(Meeting.id, Meeting.title, Meeting.date, Meeting.time, Meeting.description,
+                       Meeting.created_at).where(Meeting.group_id == group_id)
+        if since is not None:
+            query = query.where(Meeting.date >= since)
+        query = query.order_by(Meeting.date, Meeting.time, Meeting.id)
+        if limit is not None:
+            query = query.limit(limit)
+        return [row._asdict() for row in db.session.execute(query)]
+
+    @staticmethod
+    def get_members(group_id, page=1, per_page=None):
+        """Return one page of a group's members, ordered by username."""
+        per_page = per_page or current_app.config['POSTS_PER_PAGE']
+        return (User.query.join(group_members, group_members.c.user_id == User.id)
+                .filter(group_members.c.group_id == group_id)
+                .order_by(User.username)
+                .paginate(page=page, per_page=per_page, error_out=False))
+
+    @staticmethod
+    def get_user_group_ids(user_id):
+        """Ids of the groups a user belongs to."""
+        return db.session.execute(
+            select(group_members.c.group_id).where(group_members.c.user_id == user_id)
+        ).scalars().all()
+
+    @staticmethod
+    def get_member_ids(group_id):
+        """Return the ids of a group's members without loading User objects."""
+        return db.session.execute(
+            select(group_members.c.user_id).where(group_members.c.group_id == group_id)
+        ).scalars().all()
+
+    @staticmethod
+    def schedule_meeting(group_id, title, date, time, description, defer_notifications=False):
         meeting = Meeting(
             title=title,
             date=date,
@@ -31,7 +164,15 @@ class GroupService:
             group_id=group_id
         )
         db.session.add(meeting)
-        db.session.commit()
+        message = f"Meeting scheduled: {title} on {date} at {time}"
+        member_ids = GroupService.get_member_ids(group_id)
+        if defer_notifications:
+            db.session.commit()
+            NotificationService.notify_many(member_ids, message, defer=True)
+        else:
+            # Meeting and its notifications go out in a single transaction
+            NotificationService.notify_many(member_ids, message, commit=False)
+            db.session.commit()
         return meeting
 
     @staticmethod
@@ -42,22 +183,225 @@ class GroupService:
 
     @staticmethod
     def approve_membership_request(group_id, user_id, approve=True):
-        group = Group.query.get(group_id)
-        user = User.query.get(user_id)
         if approve:
-            if user not in group.members:
-                group.members.append(user)
+            GroupService._insert_membership(group_id, user_id)
             MembershipRequest.query.filter_by(group_id=group_id, user_id=user_id).delete()
         else:
             MembershipRequest.query.filter_by(group_id=group_id, user_id=user_id).delete()
         db.session.commit()
 
+    @staticmethod
+    def get_pending_membership_requests(after_id=None, limit=None):
+        """One page of the pending membership queue, oldest first; see ``_pending_page``."""
+        return _pending_page(MembershipRequest, MembershipRequest.user, after_id, limit)
+
+    @staticmethod
+    def decide_membership_requests(request_ids=None, admit=True, created_before=None):
+        """Admit or reject the given pending membership requests, or all of them created before a date.
+
+        One UPDATE covers the whole selection; returns ``{request_id: result}``.
+        """
+        status = 'admitted' if admit else 'rejected'
+        conditions = [MembershipRequest.created_at < created_before] if created_before else []
+        message = (lambda row: 'Your membership request has been approved. Welcome!') if admit else \
+            (lambda row: 'Your membership request has been declined.')
+        return _decide_pending(MembershipRequest, MembershipRequest.user_id, status, request_ids, conditions, message)
+
 class NotificationService:
+    @staticmethod
+    def user_room(user_id):
+        return f'{scope_prefix()}user-{user_id}'
+
     @staticmethod
     def create_notification(user_id, message):
-        notification = Notification(user_id=user_id, message=message)
-        db.session.add(notification)
+        NotificationService.notify_many([user_id], message)
+
+    @staticmethod
+    def notify_many(user_ids, message, defer=False, commit=True):
+        """Send the same notification to many users with one bulk insert.
+
+        With ``defer=True`` the insert is handed to the background task queue and
+        the caller returns immediately. With ``commit=False`` the rows join the
+        caller's transaction instead of committing on their own.
+        Returns the number of notifications created (or queued).
+        """
+        user_ids = list(dict.fromkeys(user_ids))  # drop duplicates, keep order
+        if not user_ids:
+            return 0
+        if defer:
+            task_queue.enqueue(NotificationService.notify_many, user_ids, message)
+            return len(user_ids)
+
+        return NotificationService.notify_each([(user_id, message) for user_id in user_ids], commit=commit)
+
+    @staticmethod
+    def notify_each(notifications, commit=True):
+        """Insert many ``(user_id, message)`` notifications with one bulk insert.
+
+        Each recipient's unread counter moves in the same transaction, and when
+        ``NOTIFICATION_PUSH`` is on the new rows are pushed to the recipients'
+        open pages once that transaction commits.
+        """
+        if not notifications:
+            return 0
+        timestamp = datetime.utcnow()
+        rows = [{'user_id': user_id, 'message': message, 'is_read': False, 'timestamp': timestamp}
+                for user_id, message in notifications]
+        # Core inserts of the table: the ORM bulk path costs more than the insert itself at import volumes
+        table = Notification.__table__
+        if current_app.config['NOTIFICATION_PUSH']:
+            inserted = db.session.execute(
+                insert(table).returning(table.c.id, table.c.user_id, table.c.message), rows
+            ).all()
+            pending = db.session.info.setdefault('pending_notification_pushes', [])
+            pending.extend(NotificationService.to_payload(row.id, row.user_id, row.message, timestamp)
+                           for row in inserted)
+        else:
+            db.session.execute(insert(table), rows)
+
+        per_user = {}
+        for user_id, _ in notifications:
+            per_user[user_id] = per_user.get(user_id, 0) + 1
+        # One UPDATE per distinct increment; a fan-out (one row per user) is a single statement
+        by_increment = {}
+        for user_id, n in per_user.items():
+            by_increment.setdefault(n, []).append(user_id)
+        _touch_cache(*(user_scope(user_id) for user_id in per_user))
+        for n, user_ids in by_increment.items():
+            db.session.execute(
+                update(User).where(User.id.in_(user_ids))
+                .values(unread_notifications=User.unread_notifications + n)
+                .execution_options(synchronize_session=False)
+            )
+        if commit:
+            db.session.commit()
+        return len(notifications)
+
+    @staticmethod
+    def to_payload(notification_id, user_id, message, timestamp):
+        return {'id': notification_id, 'user_id': user_id, 'message': message,
+                'timestamp': timestamp.strftime('%Y-%m-%d %H:%M'),
+                'cursor': NotificationService.encode_cursor(timestamp, notification_id)}
+
+    @staticmethod
+    def encode_cursor(timestamp, notification_id):
+        return f'{timestamp.isoformat()}_{notification_id}'
+
+    @staticmethod
+    def decode_cursor(cursor):
+        """Parse a ``before`` cursor; returns None for a missing or malformed one."""
+        try:
+            timestamp, notification_id = cursor.rsplit('_', 1)
+            return datetime.fromisoformat(timestamp), int(notification_id)
+        except (AttributeError, ValueError):
+            return None
+
+    @staticmethod
+    def get_inbox(user_id, before=None, limit=None):
+        """Return one page of notifications (newest first) and the cursor for the next page.
+
+        Pages are keyset scans of ``ix_notification_user_id_timestamp_id`` starting
+        after ``before`` (a cursor from the previous page), so every page costs the
+        same however many notifications the member has. Pages that reach back past
+        the archive cut-off merge in archived notifications the same way.
+        """
+        limit = limit or current_app.config['POSTS_PER_PAGE']
+        position = NotificationService.decode_cursor(before) if before else None
+        notifications = NotificationService._inbox_page(Notification, user_id, position, limit + 1)
+        cutoff = datetime.utcnow() - timedelta(days=current_app.config['ARCHIVE_NOTIFICATIONS_AFTER_DAYS'])
+        if len(notifications) <= limit or notifications[-1].timestamp < cutoff:
+            # Only notifications older than the cut-off are archived, so a full page of newer ones needs none
+            archived = NotificationService._inbox_page(ArchivedNotification, user_id, position, limit + 1)
+            if archived:
+                notifications = sorted(notifications + archived, key=lambda n: (n.timestamp, n.id),
+                                       reverse=True)[:limit + 1]
+        next_before = None
+        if len(notifications) > limit:
+            last = notifications[limit - 1]
+            next_before = NotificationService.encode_cursor(last.timestamp, last.id)
+        return notifications[:limit], next_before
+
+    @staticmethod
+    def _inbox_page(model, user_id, position, limit):
+        query = model.query.filter(model.user_id == user_id)
+        if position is not None:
+            query = query.filter(tuple_(model.timestamp, model.id) < position)
+        return query.order_by(model.timestamp.desc(), model.id.desc()).limit(limit).all()
+
+    @staticmethod
+    def mark_read(user_id, notification_ids=None):
+        """Mark the given notifications (or all of them) read; returns how many changed.
+
+        Only rows still unread are updated and the counter drops by exactly that
+        rowcount, so concurrent mark-reads and new notifications keep it correct.
+        """
+        stmt = update(Notification).where(Notification.user_id == user_id, Notification.is_read.is_(False))
+        if notification_ids is not None:
+            notification_ids = [int(i) for i in notification_ids]
+            if not notification_ids:
+                return 0
+            stmt = stmt.where(Notification.id.in_(notification_ids))
+        changed = db.session.execute(
+            stmt.values(is_read=True).execution_options(synchronize_session=False)
+        ).rowcount
+        if changed:
+            db.session.execute(
+                update(User).where(User.id == user_id)
+                .values(unread_notifications=case((User.unread_notifications > changed,
+                                                   User.unread_notifications - changed), else_=0))
+                .execution_options(synchronize_session=False)
+            )
+            _touch_cache(user_scope(user_id))
         db.session.commit()
+        return changed
+
+    @staticmethod
+    def unread_count(user_id):
+        return db.session.execute(select(User.unread_notifications).where(User.id == user_id)).scalar() or 0
+
+
+@event.listens_for(Session, 'after_commit')
+def _push_notifications(session):
+    pending = session.info.pop('pending_notification_pushes', None)
+    for payload in pending or ():
+        socketio.emit('notification', payload, to=NotificationService.user_room(payload['user_id']),
+                      namespace='/notifications')
+
+
+@event.listens_for(Session, 'after_rollback')
+def _drop_notification_pushes(session):
+    session.info.pop('pending_notification_pushes', None)
+    session.info.pop('email_queued', None)
+
+
+class EmailService:
+    @staticmethod
+    def queue_email(recipients, subject, body, commit=True):
+        """Add a message to the outbox (one row per recipient) instead of sending it now.
+
+        With ``commit=False`` the rows join the caller's transaction. The mail
+        dispatcher is woken once the transaction commits. Returns the number of
+        rows queued.
+        """
+        if isinstance(recipients, str):
+            recipients = [recipients]
+        now = datetime.utcnow()
+        rows = [{'recipient': recipient, 'subject': subject, 'body': body, 'status': 'queued', 'attempts': 0,
+                 'next_attempt_at': now, 'created_at': now} for recipient in recipients]
+        if not rows:
+            return 0
+        db.session.execute(insert(OutboundEmail), rows)
+        db.session.info['email_queued'] = True
+        if commit:
+            db.session.commit()
+        return len(rows)
+
+
+@event.listens_for(Session, 'after_commit')
+def _wake_mail_dispatcher(session):
+    if session.info.pop('email_queued', False):
+        mail_dispatcher.wake()
+
 
 class MessageService:
     @staticmethod
@@ -67,34 +411,734 @@ class MessageService:
         db.session.commit()
         return message
 
+    @staticmethod
+    def save_messages(messages):
+        """Persist a batch of (not yet saved) chat messages with one bulk insert."""
+        if not messages:
+            return 0
+        db.session.execute(insert(Message), [
+            {'user_id': m.user_id, 'group_id': m.group_id, 'content': m.content,
+             'timestamp': m.timestamp or datetime.utcnow()}
+            for m in messages
+        ])
+        db.session.info.setdefault('search_changes', set())  # New rows: the indexer catches up after commit
+        db.session.commit()
+        return len(messages)
+
+    @staticmethod
+    def get_backlog(group_id, before_id=None, limit=None):
+        """Return one page of a group's messages (oldest first) and the cursor for older ones.
+
+        Scrolling past the oldest hot message continues in the archive, whose ids
+        are all lower.
+        """
+        limit = limit or current_app.config['CHAT_BACKLOG_PAGE_SIZE']
+        messages = MessageService._backlog_page(Message, group_id, before_id, limit + 1)
+        if len(messages) <= limit:
+            older_than = messages[-1].id if messages else before_id
+            messages += MessageService._backlog_page(ArchivedMessage, group_id, older_than, limit + 1 - len(messages))
+        next_before_id = messages[limit - 1].id if len(messages) > limit else None
+        return list(reversed(messages[:limit])), next_before_id
+
+    @staticmethod
+    def _backlog_page(model, group_id, before_id, limit):
+        query = model.query.options(joinedload(model.sender)).filter(model.group_id == group_id)
+        if before_id is not None:
+            query = query.filter(model.id < before_id)
+        return query.order_by(model.id.desc()).limit(limit).all()
+
+    @staticmethod
+    def to_payload(message, username):
+        return {
+            'id': message.id,
+            'group_id': message.group_id,
+            'user_id': message.user_id,
+            'username': username,
+            'content': message.content,
+            'timestamp': message.timestamp.isoformat() if message.timestamp else None,
+        }
+
+class SearchService:
+    SOURCES = ('messages', 'groups', 'members')
+
+    @staticmethod
+    def search(user, source, query, page=1, group_id=None):
+        """One page of results ``user`` may see and whether there is a next page.
+
+        Groups and members come best match first, messages newest first. Groups
+        are public. Members and messages are limited to the user's own groups
+        (or to ``group_id`` if given), except for SACCO admins.
+        """
+        if user.role != 'admin':
+            group_ids = GroupService.get_user_group_ids(user.id)
+        elif current_tenant() is not None:
+            # The index is shared by the tenants of a database: an admin sees their own SACCO's groups
+            group_ids = db.session.execute(select(Group.id)).scalars().all()
+        else:
+            group_ids = None
+        if group_id is not None:
+            group_ids = [group_id] if group_ids is None or group_id in group_ids else []
+        ids, has_next = search_indexer.search(source, query, group_ids, page)
+        if not ids:
+            return [], has_next
+        if source == 'groups':
+            rows = Group.query.filter(Group.id.in_(ids)).all()
+        elif source == 'members':
+            rows = User.query.filter(User.id.in_(ids)).all()
+        else:
+            rows = Message.query.options(joinedload(Message.sender)).filter(Message.id.in_(ids)).all()
+            if len(rows) < len(ids):
+                # Archived messages keep their index entries; load them from the archive
+                found = {row.id for row in rows}
+                rows += (ArchivedMessage.query.options(joinedload(ArchivedMessage.sender))
+                         .filter(ArchivedMessage.id.in_([i for i in ids if i not in found])).all())
+        by_id = {row.id: row for row in rows}
+        return [by_id[row_id] for row_id in ids if row_id in by_id], has_next
+
+    @staticmethod
+    def group_names(group_ids):
+        return dict(db.session.execute(select(Group.id, Group.name).where(Group.id.in_(set(group_ids)))).all())
+
+
+# Session hooks that keep the search index current: fields each indexed model contributes
+_SEARCH_FIELDS = {Group: ('groups', ('name', 'description')), User: ('members', ('username',))}
+
+
+@event.listens_for(Session, 'after_flush')
+def _track_search_changes(session, flush_context):
+    # New rows only need the indexer woken: they are past its high-water mark
+    added = any(type(obj) in _SEARCH_FIELDS or type(obj) is Message for obj in session.new)
+    changes = set()
+    for obj in session.dirty | session.deleted:
+        indexed = _SEARCH_FIELDS.get(type(obj))
+        if indexed is None:
+            continue
+        source, fields = indexed
+        state = db.inspect(obj)
+        if obj in session.deleted or any(state.attrs[field].history.has_changes() for field in fields):
+            changes.add((source, obj.id))
+    if added or changes:
+        session.info.setdefault('search_changes', set()).update(changes)
+
+
+@event.listens_for(Session, 'after_commit')
+def _wake_search_indexer(session):
+    changes = session.info.pop('search_changes', None)
+    if changes is not None:
+        search_indexer.mark_changed(changes)
+        search_indexer.wake()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _drop_search_changes(session):
+    session.info.pop('search_changes', None)
+
+
+# Session hooks that bump the response cache (app/cache.py) for what a transaction changed: ORM
+# objects are picked up at flush, bulk statements call _touch_cache with the scopes they touch
+_CACHE_SCOPES = {
+    User: lambda obj: user_scope(obj.id),
+    Group: lambda obj: group_scope(obj.id),
+    Meeting: lambda obj: group_scope(obj.group_id),
+    Notification: lambda obj: user_scope(obj.user_id),
+    LedgerEntry: lambda obj: user_scope(obj.member_id),
+    MemberBalance: lambda obj: user_scope(obj.member_id),
+}
+
+
+def _touch_cache(*scopes):
+    db.session.info.setdefault('cache_scopes', set()).update(scopes)
+
+
+@event.listens_for(Session, 'after_flush')
+def _track_cache_scopes(session, flush_context):
+    scopes = {_CACHE_SCOPES[type(obj)](obj) for obj in session.new | session.dirty | session.deleted
+              if type(obj) in _CACHE_SCOPES}
+    if scopes:
+        session.info.setdefault('cache_scopes', set()).update(scopes)
+
+
+@event.listens_for(Session, 'after_commit')
+def _bump_cache_versions(session):
+    scopes = session.info.pop('cache_scopes', None)
+    if scopes:
+        response_cache.bump(scopes)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _drop_cache_scopes(session):
+    session.info.pop('cache_scopes', None)
+
+
+class LedgerError(ValueError):
+    """Raised when a ledger posting would break a balance rule."""
+
+
+class LedgerService:
+    # entry_type -> (effect on savings balance, effect on loan balance)
+    ENTRY_EFFECTS = {
+        'deposit': (1, 0),
+        'withdrawal': (-1, 0),
+        'loan_disbursement': (0, 1),
+        'loan_repayment': (0, -1),
+        'interest_accrual': (0, 1),
+        'dividend': (0, 0),  # Paid into User.earnings; savings and loan balances are unchanged
+    }
+
+    @staticmethod
+    def _ensure_balance_rows(member_ids):
+        """Create missing snapshot rows for the given members (race-safe)."""
+        dialect = db.session.get_bind(mapper=MemberBalance).dialect.name
+        now = datetime.utcnow()
+        rows = [{'member_id': member_id, 'savings_cents': 0, 'loan_cents': 0, 'updated_at': now}
+                for member_id in member_ids]
+        if dialect == 'sqlite':
+            db.session.execute(sqlite.insert(MemberBalance).on_conflict_do_nothing(), rows)
+        elif dialect == 'postgresql':
+            db.session.execute(postgresql.insert(MemberBalance).on_conflict_do_nothing(), rows)
+        else:
+            existing = set(db.session.execute(
+                select(MemberBalance.member_id).where(MemberBalance.member_id.in_(member_ids))
+            ).scalars())
+            missing = [row for row in rows if row['member_id'] not in existing]
+            if missing:
+                db.session.execute(insert(MemberBalance), missing)
+
+    @staticmethod
+    def post(member_id, entry_type, amount, reference=None, commit=True):
+        """Append a ledger entry and move the member's balance snapshot with it.
+
+        The snapshot is changed with a single conditional UPDATE, so concurrent
+        postings cannot overdraw savings or over-repay a loan. Raises
+        ``LedgerError`` when the posting is refused. Withdrawal limits are
+        checked before this, by ``SavingsService.withdraw_savings``.
+        """
+        savings_sign, loan_sign = LedgerService.ENTRY_EFFECTS[entry_type]
+        cents = to_cents(amount)
+        if cents <= 0:
+            raise LedgerError('Amount must be positive.')
+
+        LedgerService._ensure_balance_rows([member_id])
+        now = datetime.utcnow()
+        values = {
+            'savings_cents': MemberBalance.savings_cents + savings_sign * cents,
+            'loan_cents': MemberBalance.loan_cents + loan_sign * cents,
+            'updated_at': now,
+        }
+        stmt = update(MemberBalance).where(MemberBalance.member_id == member_id)
+        if savings_sign < 0:
+            stmt = stmt.where(MemberBalance.savings_cents >= cents)
+        if loan_sign < 0:
+            stmt = stmt.where(MemberBalance.loan_cents >= cents)
+
+        row = db.session.execute(
+            stmt.values(**values).returning(MemberBalance.savings_cents, MemberBalance.loan_cents)
+            .execution_options(synchronize_session=False)
+        ).first()
+        if row is None:
+            raise LedgerError(LedgerService._refusal_reason(entry_type))
+
+        entry = LedgerEntry(member_id=member_id, entry_type=entry_type, amount_cents=cents,
+                            savings_after_cents=row.savings_cents, loan_after_cents=row.loan_cents,
+                            reference=str(reference) if reference is not None else None, created_at=now)
+        db.session.add(entry)
+        if entry_type == 'loan_repayment' and reference is not None:
+            LoanService._apply_repayment(member_id, reference, float(from_cents(cents)), now)
+        if savings_sign:
+            # Keep the legacy float column in step for templates that still read it
+            db.session.execute(
+                update(User).where(User.id == member_id).values(savings=float(from_cents(row.savings_cents)))
+                .execution_options(synchronize_session=False)
+            )
+        if commit:
+            db.session.commit()
+        return entry
+
+    @staticmethod
+    def post_many(postings, commit=True):
+        """Post many credit entries (deposits, loan disbursements) set-wise.
+
+        ``postings`` is an iterable of ``(member_id, entry_type, amount, reference)``.
+        Snapshots are moved with one executemany UPDATE of per-member totals, the
+        new balances are read back in one SELECT, and the ledger rows go in with
+        one bulk insert. Debits need the per-entry checks in ``post`` and are
+        refused here. Returns the number of entries written.
+        """
+        now = datetime.utcnow()
+        entries = []
+        deltas = {}  # member_id -> [savings delta, loan delta]
+        for member_id, entry_type, amount, reference in postings:
+            if entry_type not in ('deposit', 'loan_disbursement'):
+                raise LedgerError(f'{entry_type} entries must be posted one at a time.')
+            savings_sign, loan_sign = LedgerService.ENTRY_EFFECTS[entry_type]
+            cents = to_cents(amount)
+            if cents <= 0:
+                raise LedgerError('Amount must be positive.')
+            entries.append({'member_id': member_id, 'entry_type': entry_type, 'amount_cents': cents,
+                            'reference': str(reference) if reference is not None else None, 'created_at': now})
+            delta = deltas.setdefault(member_id, [0, 0])
+            delta[0] += savings_sign * cents
+            delta[1] += loan_sign * cents
+        if not entries:
+            return 0
+
+        member_ids = list(deltas)
+        LedgerService._ensure_balance_rows(member_ids)
+        balance = MemberBalance.__table__
+        db.session.execute(
+            balance.update()
+            .where(balance.c.member_id == bindparam('m_id'))
+            .values(savings_cents=balance.c.savings_cents + bindparam('d_savings'),
+                    loan_cents=balance.c.loan_cents + bindparam('d_loan'),
+                    updated_at=now),
+            [{'m_id': m, 'd_savings': d[0], 'd_loan': d[1]} for m, d in deltas.items()]
+        )
+        totals = {row.member_id: row for row in db.session.execute(
+            select(MemberBalance.member_id, MemberBalance.savings_cents, MemberBalance.loan_cents)
+            .where(MemberBalance.member_id.in_(member_ids))
+        )}
+
+        # Walk forward from each member's opening balance to fill in the running totals
+        running = {m: [totals[m].savings_cents - d[0], totals[m].loan_cents - d[1]] for m, d in deltas.items()}
+        for entry in entries:
+            savings_sign, loan_sign = LedgerService.ENTRY_EFFECTS[entry['entry_type']]
+            current = running[entry['member_id']]
+            current[0] += savings_sign * entry['amount_cents']
+            current[1] += loan_sign * entry['amount_cents']
+            entry['savings_after_cents'], entry['loan_after_cents'] = current
+        db.session.execute(insert(LedgerEntry.__table__), entries)
+        _touch_cache(*(user_scope(member_id) for member_id in member_ids))
+        savings = [{'u_id': m, 'u_savings': float(from_cents(totals[m].savings_cents))}
+                   for m, d in deltas.items() if d[0]]
+        if savings:
+            user = User.__table__
+            db.session.execute(user.update().where(user.c.id == bindparam('u_id'))
+                               .values(savings=bindparam('u_savings')), savings)
+        if commit:
+            db.session.commit()
+        return len(entries)
+
+    @staticmethod
+    def _refusal_reason(entry_type):
+        if entry_type == 'withdrawal':
+            return 'Insufficient savings.'
+        return 'Repayment exceeds the outstanding loan balance.'
+
+    @staticmethod
+    def get_balance(member_id):
+        """Return the member's balance snapshot (a zero snapshot if they have none yet)."""
+        balance = db.session.get(MemberBalance, member_id, populate_existing=True)
+        if balance is None:
+            balance = MemberBalance(member_id=member_id, savings_cents=0, loan_cents=0)
+        return balance
+
+    @staticmethod
+    def get_history(member_id, before_id=None, limit=None):
+        """Return one page of ledger entries (newest first) and the cursor for the next page."""
+        limit = limit or current_app.config['POSTS_PER_PAGE']
+        query = LedgerEntry.query.filter(LedgerEntry.member_id == member_id)
+        if before_id is not None:
+            query = query.filter(LedgerEntry.id < before_id)
+        entries = query.order_by(LedgerEntry.id.desc()).limit(limit + 1).all()
+        next_before_id = entries[limit - 1].id if len(entries) > limit else None
+        return entries[:limit], next_before_id
+
+
 class SavingsService:
     @staticmethod
-    def deposit_savings(user_id, amount):
-        savings = Savings(user_id=user_id, amount=amount, date=datetime.utcnow())
+    def deposit_savings(user_id, amount, transaction_id=None):
+        """Record a completed deposit and credit the member's balance in one transaction."""
+        savings = Savings(member_id=user_id, amount=float(amount), transaction_id=transaction_id,
+                          payment_status='completed')
         db.session.add(savings)
+        db.session.flush()
+        LedgerService.post(user_id, 'deposit', amount, reference=savings.id, commit=False)
         db.session.commit()
         return savings
 
     @staticmethod
-    def get_user_savings(user_id):
-        savings = Savings.query.filter_by(user_id=user_id).all()
-        return savings
+    def receive_payment_callback(transaction_id, status):
+        """Store an M-Pesa callback in the inbox and commit, before it is acknowledged.
+
+        Returns False when the same callback (transaction and status) is already
+        stored: M-Pesa repeats callbacks it got no answer for.
+        """
+        table = PaymentCallback.__table__
+        row = {'transaction_id': transaction_id, 'status': status, 'received_at': datetime.utcnow()}
+        dialect = db.session.get_bind(mapper=PaymentCallback).dialect.name
+        if dialect == 'sqlite':
+            stored = db.session.execute(sqlite.insert(table).on_conflict_do_nothing(), row).rowcount
+        elif dialect == 'postgresql':
+            stored = db.session.execute(postgresql.insert(table).on_conflict_do_nothing(), row).rowcount
+        else:
+            stored = db.session.execute(
+                select(PaymentCallback.id).where(PaymentCallback.transaction_id == transaction_id,
+                                                 PaymentCallback.status == status)
+            ).first() is None
+            if stored:
+                db.session.execute(insert(table), row)
+        db.session.commit()
+        return bool(stored)
+
+    @staticmethod
+    def apply_payment_callbacks(transaction_ids=None):
+        """Apply the stored callbacks still waiting for ``transaction_ids`` (default: all) in one transaction.
+
+        Only deposits still marked pending are touched, and the status change is a
+        conditional UPDATE, so retried or duplicated callbacks (even when handled by
+        another process) are applied exactly once. Ledger credits, member
+        notifications and marking the callbacks applied commit together with the
+        status change. A callback for a transaction id no deposit has yet (it came
+        before ``attach_transaction`` stored it) stays in the inbox and is applied
+        when the id is attached. Returns the number of deposits whose status changed.
+        """
+        stmt = select(PaymentCallback.id, PaymentCallback.transaction_id, PaymentCallback.status).where(
+            PaymentCallback.applied_at.is_(None))
+        if transaction_ids is not None:
+            stmt = stmt.where(PaymentCallback.transaction_id.in_(list(transaction_ids)))
+        callbacks = db.session.execute(stmt.order_by(PaymentCallback.id)).all()
+        if not callbacks:
+            return 0
+        statuses = {}
+        for _, transaction_id, status in callbacks:
+            # A completed report wins over a failure for the same transaction
+            if statuses.get(transaction_id) != 'completed':
+                statuses[transaction_id] = status
+        on_file = set(db.session.execute(
+            select(Savings.transaction_id).where(Savings.transaction_id.in_(statuses))
+        ).scalars())
+
+        changed = 0
+        for status in set(statuses.values()):
+            transaction_ids = [tid for tid, s in statuses.items() if s == status and tid in on_file]
+            if transaction_ids:
+                changed += SavingsService.settle_deposits(Savings.transaction_id.in_(transaction_ids),
+                                                          'completed' if status == 'completed' else 'failed',
+                                                          commit=False)
+        applied = [callback_id for callback_id, transaction_id, _ in callbacks if transaction_id in on_file]
+        if applied:
+            db.session.execute(update(PaymentCallback).where(PaymentCallback.id.in_(applied))
+                               .values(applied_at=datetime.utcnow())
+                               .execution_options(synchronize_session=False))
+        db.session.commit()
+        return changed
+
+    @staticmethod
+    def settle_deposits(criterion, status, from_statuses=('pending',), commit=True):
+        """Move the deposits matching ``criterion`` from one of ``from_statuses`` to ``status``.
+
+        The change is a conditional UPDATE, so a deposit is settled once however
+        many callers race for it. Deposits that become completed are credited to
+        the ledger; every member whose deposit changed is notified.
+        Returns the number of deposits whose status changed.
+        """
+        changed = db.session.execute(
+            update(Savings)
+            .where(criterion, Savings.payment_status.in_(from_statuses))
+            .values(payment_status=status)
+            .returning(Savings.id, Savings.member_id, Savings.amount)
+            .execution_options(synchronize_session=False)
+        ).all()
+        postings = []
+        notifications = []
+        for savings_id, member_id, amount in changed:
+            if status == 'completed':
+                postings.append((member_id, 'deposit', amount, savings_id))
+                notifications.append((member_id, f"Your savings of {amount} has been successfully deposited."))
+            else:
+                notifications.append((member_id, f"Your savings payment of {amount} was not completed. Please try again."))
+        LedgerService.post_many(postings, commit=False)
+        NotificationService.notify_each(notifications, commit=False)
+        if commit:
+            db.session.commit()
+        return len(changed)
+
+    @staticmethod
+    def attach_transaction(savings_id, transaction_id):
+        """Store the M-Pesa transaction id for a submitted deposit, or mark it failed.
+
+        A callback M-Pesa sent before the id was stored is applied with it.
+        """
+        savings = db.session.get(Savings, savings_id)
+        if savings is None:
+            return
+        if transaction_id:
+            savings.transaction_id = transaction_id
+            db.session.flush()
+            # M-Pesa may have called back before the id was stored; apply_payment_callbacks commits
+            SavingsService.apply_payment_callbacks([transaction_id])
+        else:
+            savings.payment_status = 'failed'
+        db.session.commit()
+
+    @staticmethod
+    def withdraw_savings(user_id, amount, tier=None):
+        """Withdraw from savings within the member's sliding-window limit and balance.
+
+        The amount is reserved against the limit first (atomically, in the shared
+        limiter store) and given back if the ledger then refuses the withdrawal.
+        """
+        cents = to_cents(amount)
+        if cents <= 0:
+            raise LedgerError('Amount must be positive.')
+        limiter = current_app.extensions['withdrawal_limiter']
+        token = limiter.reserve(user_id, cents, tier)
+        if token is None:
+            limit = from_cents(limiter.limit_for(tier))
+            hours = current_app.config['WITHDRAWAL_WINDOW'] // 3600
+            raise LedgerError(f'Withdrawal limit exceeded: at most {limit} in any {hours} hours.')
+        try:
+            return LedgerService.post(user_id, 'withdrawal', amount)
+        except Exception:
+            db.session.rollback()
+            limiter.release(user_id, token)
+            raise
+
+    @staticmethod
+    def get_user_savings(user_id, before_id=None, limit=None):
+        """Return one page of savings transactions (newest first) and the next-page cursor."""
+        limit = limit or current_app.config['POSTS_PER_PAGE']
+        query = Savings.query.filter(Savings.member_id == user_id)
+        if before_id is not None:
+            query = query.filter(Savings.id < before_id)
+        savings = query.order_by(Savings.id.desc()).limit(limit + 1).all()
+        next_before_id = savings[limit - 1].id if len(savings) > limit else None
+        return savings[:limit], next_before_id
 
 class LoanService:
     @staticmethod
-    def request_loan(user_id, amount, purpose):
-        loan = Loan(user_id=user_id, amount=amount, purpose=purpose, status='pending', date_requested=datetime.utcnow())
-        db.session.add(loan)
+    def approve_loan(loan_id, approve=True, admin_id=None):
+        loan = db.session.get(Loan, loan_id)
+        if approve:
+            loan.approve(admin_id)
+            # Disbursement and status change commit together; interest is charged monthly by accrue_interest
+            LedgerService.post(loan.borrower_id, 'loan_disbursement', loan.amount,
+                               reference=loan.id, commit=False)
+        else:
+            loan.reject()
         db.session.commit()
         return loan
 
     @staticmethod
-    def approve_loan(loan_id, approve=True):
-        loan = Loan.query.get(loan_id)
+    def get_pending_loan_requests(after_id=None, limit=None):
+        """One page of the pending loan request queue, oldest first; see ``_pending_page``."""
+        return _pending_page(LoanRequest, LoanRequest.member, after_id, limit)
+
+    @staticmethod
+    def decide_loan_requests(request_ids=None, approve=True, max_amount=None, created_before=None):
+        """Approve or reject the given pending loan requests, or every one matching the filters.
+
+        One UPDATE covers the whole selection; returns ``{request_id: result}``.
+        Requests are approved oldest first while they fit the member's credit
+        (``approvable`` in ``app.eligibility``); the rest stay pending as
+        ``'over_limit'``.
+        """
+        status = 'approved' if approve else 'rejected'
+        conditions = []
+        if max_amount is not None:
+            conditions.append(LoanRequest.amount <= max_amount)
+        if created_before is not None:
+            conditions.append(LoanRequest.created_at < created_before)
+        over_limit = []
         if approve:
-            loan.status = 'approved'
+            request_ids, over_limit = LoanService._within_credit(request_ids, conditions)
+        results = _decide_pending(LoanRequest, LoanRequest.member_id, status, request_ids, conditions,
+                                  lambda row: f"Your loan request of {row.amount:,.2f} has been {status}.")
+        results.update((request_id, 'over_limit') for request_id in over_limit)
+        return results
+
+    @staticmethod
+    def _within_credit(request_ids, conditions):
+        """Split the pending requests selected by ``request_ids``/``conditions`` by whether they fit the credit.
+
+        Returns the ids to decide (the selected ids that are not pending are kept, for their
+        result) and the ids over the limit.
+        """
+        stmt = select(LoanRequest.id, LoanRequest.member_id, LoanRequest.amount).where(
+            LoanRequest.status == 'pending', *conditions)
+        if request_ids is not None:
+            request_ids = list(dict.fromkeys(int(i) for i in request_ids))
+            stmt = stmt.where(LoanRequest.id.in_(request_ids))
+        pending = db.session.execute(stmt.order_by(LoanRequest.id)).all()
+        credit = eligibility.available_credit_many(row.member_id for row in pending)
+        remaining = {member_id: profile['approvable_cents'] for member_id, profile in credit.items()}
+        within, over_limit = [], []
+        for request_id, member_id, amount in pending:
+            cents = to_cents(amount)
+            if cents <= remaining[member_id]:
+                remaining[member_id] -= cents
+                within.append(request_id)
+            else:
+                over_limit.append(request_id)
+        if request_ids is not None:
+            selected = {row.id for row in pending}
+            within += [i for i in request_ids if i not in selected]
+        return within, over_limit
+
+    @staticmethod
+    def portfolio_summary(as_of=None, method='flat', horizon=12):
+        """Outstanding balances, arrears buckets, cash flow and group exposure for all active loans."""
+        from app import loan_engine  # NumPy is only loaded when analytics are requested
+        summary = loan_engine.portfolio_summary(loan_engine.load_portfolio(db.session, Loan),
+                                                as_of=as_of, method=method, horizon=horizon)
+        names = dict(db.session.execute(
+            select(Group.id, Group.name).where(Group.id.in_([row['group_id'] for row in summary['group_exposure']]))
+        ).all())
+        for row in summary['group_exposure']:
+            row['group_name'] = names.get(row['group_id'], f"Group {row['group_id']}")
+        return summary
+
+    @staticmethod
+    def record_repayment(loan_id, amount):
+        """Repay ``amount`` of the loan from its borrower; ``LedgerService.post`` applies it to the loan."""
+        loan = db.session.get(Loan, loan_id)
+        LedgerService.post(loan.borrower_id, 'loan_repayment', amount, reference=loan.id)
+        return loan
+
+    @staticmethod
+    def _apply_repayment(member_id, reference, amount, at):
+        """Apply a repayment entry to the loan it references and count it in the borrower's credit profile.
+
+        Part of the posting's transaction. Entries whose reference is not one of
+        the member's loans move only the balance snapshot, as in
+        ``eligibility.rebuild_profiles``.
+        """
+        loan = db.session.get(Loan, int(reference)) if str(reference).isdigit() else None
+        if loan is None or loan.borrower_id != member_id:
+            return
+        loan.make_payment(amount)
+        eligibility.record_repayment(member_id, eligibility.loan_on_time(loan, at), at)
+
+    @staticmethod
+    def available_credit(member_id):
+        """How much the member can borrow now; see ``app.eligibility.credit_limit``."""
+        return eligibility.available_credit(member_id)
+
+    @staticmethod
+    def available_credit_many(member_ids):
+        """``available_credit`` for a page of members (e.g. the loan queue) in one query."""
+        return eligibility.available_credit_many(member_ids)
+
+    @staticmethod
+    def request_loan(user_id, amount, purpose=None, interest_rate=None):
+        """Queue a loan request for review if the member can borrow ``amount``; raises ``LedgerError`` if not."""
+        credit = eligibility.available_credit(user_id)
+        if to_cents(amount) > credit['available_cents']:
+            raise LedgerError(credit['reason'] or f"You can borrow at most {credit['available']} right now.")
+        rate = setting('LOAN_INTEREST_RATE') / 100 if interest_rate is None else interest_rate
+        loan_request = LoanRequest(member_id=user_id, amount=float(amount), interest_rate=rate,
+                                   purpose=purpose, status='pending')
+        loan_request.total_repayment = loan_request.calculate_repayment()
+        db.session.add(loan_request)
+        db.session.commit()
+        return loan_request
+
+class ExportService:
+    """Row sources for the CSV/XLSX/PDF exports; rows are streamed, never loaded whole (see app/exports.py)."""
+
+    STATEMENT_HEADERS = ('Date', 'Type', 'Amount', 'Savings balance', 'Loan balance', 'Reference')
+    CONTRIBUTION_HEADERS = ('Member ID', 'Member', 'Date', 'Amount', 'Reference')
+    LOAN_BOOK_HEADERS = ('Loan ID', 'Borrower', 'Group', 'Amount', 'Interest rate', 'Period (months)', 'Status',
+                         'Requested', 'Approved', 'Total due', 'Paid', 'Outstanding')
+
+    @staticmethod
+    def _rows(statement, chunk_size=None):
+        # Exports read from a replica (see app/replicas.py), a step at a time as the response streams
+        return replica_iter(iter_rows(db.session, statement, chunk_size or current_app.config['EXPORT_CHUNK_SIZE']))
+
+    @staticmethod
+    def member_statement(member_id, chunk_size=None):
+        """Every ledger entry of one member, oldest first, with the running balances."""
+        statement = (select(LedgerEntry.created_at, LedgerEntry.entry_type, LedgerEntry.amount_cents,
+                            LedgerEntry.savings_after_cents, LedgerEntry.loan_after_cents, LedgerEntry.reference)
+                     .where(LedgerEntry.member_id == member_id).order_by(LedgerEntry.id))
+        return ((row.created_at, row.entry_type, from_cents(row.amount_cents), from_cents(row.savings_after_cents),
+                 from_cents(row.loan_after_cents), row.reference)
+                for row in ExportService._rows(statement, chunk_size))
+
+    @staticmethod
+    def group_contributions(group_id, chunk_size=None):
+        """Every savings deposit of a group's members, grouped by member."""
+        statement = (select(LedgerEntry.member_id, User.username, LedgerEntry.created_at, LedgerEntry.amount_cents,
+                            LedgerEntry.reference)
+                     .join(group_members, group_members.c.user_id == LedgerEntry.member_id)
+                     .join(User, User.id == LedgerEntry.member_id)
+                     .where(group_members.c.group_id == group_id, LedgerEntry.entry_type == 'deposit')
+                     .order_by(LedgerEntry.member_id, LedgerEntry.id))
+        return ((row.member_id, row.username, row.created_at, from_cents(row.amount_cents), row.reference)
+                for row in ExportService._rows(statement, chunk_size))
+
+    @staticmethod
+    def loan_book(chunk_size=None):
+        """Every loan with its borrower, group and amounts due and paid."""
+        statement = (select(Loan.id, User.username, Group.name, Loan.amount, Loan.interest_rate,
+                            Loan.repayment_period, Loan.status, Loan.requested_at, Loan.approved_at, Loan.total_paid)
+                     .join(User, User.id == Loan.borrower_id)
+                     .join(Group, Group.id == Loan.group_id)
+                     .order_by(Loan.id))
+        for row in ExportService._rows(statement, chunk_size):
+            due = to_cents(row.amount * (1 + row.interest_rate / 100))
+            paid = to_cents(row.total_paid or 0)
+            yield (row.id, row.username, row.name, from_cents(to_cents(row.amount)), row.interest_rate,
+                   row.repayment_period, row.status, row.requested_at, row.approved_at, from_cents(due),
+                   from_cents(paid), from_cents(due - paid))
+
+    @staticmethod
+    def statement_lines(member_id):
+        """Title and fixed-width text lines of a member's statement, for the PDF renderer."""
+        user = db.session.get(User, member_id)
+        title = f'SACCO statement: {user.username} <{user.email}>' if user else f'SACCO statement: member {member_id}'
+        lines = [f"{'Date':<19}  {'Type':<17} {'Amount':>14} {'Savings':>14} {'Loan':>14}  Reference", '-' * 100]
+        last = None
+        for last in ExportService.member_statement(member_id):
+            created_at, entry_type, amount, savings, loan, reference = last
+            lines.append(f"{created_at:%Y-%m-%d %H:%M:%S}  {entry_type:<17} {amount:>14,} {savings:>14,} "
+                         f"{loan:>14,}  {reference or ''}")
+        lines.append('-' * 100)
+        if last is None:
+            lines.append('No transactions.')
         else:
-            loan.status = 'rejected'
-        loan.date_approved = datetime.utcnow()
+            lines.append(f"Closing balances: savings {last[3]:,}, outstanding loan {last[4]:,}")
+        lines.append(f"Generated {datetime.utcnow():%Y-%m-%d %H:%M} UTC")
+        return title, lines
+
+
+class TenantService:
+    @staticmethod
+    def create_tenant(slug, name, hostname=None, database_uri=None, settings=None):
+        tenant = Tenant(slug=slug, name=name, hostname=hostname or None, database_uri=database_uri or None,
+                        settings=TenantService._checked(settings or {}))
+        db.session.add(tenant)
         db.session.commit()
-        return loan
+        current_app.extensions['tenants'].invalidate()
+        return tenant
+
+    @staticmethod
+    def exists(slug):
+        """Whether a tenant has the slug, active or not."""
+        return db.session.execute(select(select(Tenant.id).where(Tenant.slug == slug).exists())).scalar()
+
+    @staticmethod
+    def update_tenant(slug, settings=None, **fields):
+        """Change a tenant's fields and merge ``settings`` into its overrides (a value of None removes one).
+
+        Bumps its ``version``, which is how every process notices the change.
+        """
+        tenant = db.session.execute(select(Tenant).where(Tenant.slug == slug)).scalar_one()
+        for name, value in fields.items():
+            setattr(tenant, name, value)
+        if settings:
+            merged = {**tenant.settings, **TenantService._checked(settings)}
+            tenant.settings = {key: value for key, value in merged.items() if value is not None}
+        tenant.version += 1
+        tenant.updated_at = datetime.utcnow()
+        db.session.commit()
+        current_app.extensions['tenants'].invalidate()
+        return tenant
+
+    @staticmethod
+    def _checked(settings):
+        unknown = set(settings) - set(TENANT_SETTINGS)
+        if unknown:
+            raise ValueError(f"Not a tenant setting: {', '.join(sorted(unknown))}")
+        return settings
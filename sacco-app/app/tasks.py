@@ -0,0 +1,206 @@
+# tasks.py
+import logging
+import queue
+import threading
+from itertools import groupby
+
+from app.tenancy import bind_tenant, current_tenant, tenant_context
+
+logger = logging.getLogger(__name__)
+
+
+class TaskQueue:
+    """Run deferred jobs on a background worker thread inside an app context.
+
+    Jobs are plain callables, run as the tenant that queued them. When
+    ``TASK_QUEUE_EAGER`` is set (tests, benchmarks that want deterministic
+    timings) jobs run inline in the caller instead.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._queue = queue.Queue()
+        self._worker = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.config.setdefault('TASK_QUEUE_EAGER', False)
+        app.extensions['task_queue'] = self
+
+    def enqueue(self, func, *args, **kwargs):
+        """Schedule ``func(*args, **kwargs)`` to run off the request path."""
+        if self.app.config['TASK_QUEUE_EAGER']:
+            func(*args, **kwargs)
+            return
+        self._ensure_worker()
+        self._queue.put((bind_tenant(func), args, kwargs))
+
+    def join(self):
+        """Block until every job queued so far has finished."""
+        self._queue.join()
+
+    def _ensure_worker(self):
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._work, name='task-queue', daemon=True)
+                self._worker.start()
+
+    def _work(self):
+        while True:
+            func, args, kwargs = self._queue.get()
+            try:
+                self._run(func, args, kwargs)
+            finally:
+                self._queue.task_done()
+
+    def _run(self, func, args, kwargs):
+        with self.app.app_context():
+            try:
+                func(*args, **kwargs)
+            except Exception:
+                logger.exception("Background task %s failed", getattr(func, '__name__', func))
+                self.app.extensions['sqlalchemy'].session.rollback()
+
+
+class BatchQueue:
+    """Collect items and hand them to ``handler`` in micro-batches.
+
+    ``put`` only appends to an in-memory buffer, so callers (e.g. webhook
+    endpoints) can acknowledge immediately. A worker thread calls
+    ``handler(items)`` inside an app context once ``batch_size`` items are
+    waiting or ``flush_interval`` seconds have passed. Items put with a ``key``
+    are de-duplicated while they wait. Each item is handled as the tenant that
+    put it: a batch mixing tenants reaches ``handler`` one tenant at a time.
+    When ``handler`` raises, the batch is rolled back and its items are put back
+    for at most ``retries`` more attempts. The buffer is only in memory: items
+    that must survive a restart are stored by the caller before ``put`` (as the
+    M-Pesa callback inbox is). Eager mode flushes on every ``put``.
+    """
+
+    def __init__(self, app=None, handler=None, batch_size=500, flush_interval=0.05, name='batch-queue', retries=0):
+        self.app = None
+        self.handler = handler
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.name = name
+        self.retries = retries
+        self._items = []
+        self._keys = set()
+        self._in_flight = 0
+        self._cond = threading.Condition()
+        self._worker = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app, batch_size=None, flush_interval=None, retries=None):
+        self.app = app
+        app.config.setdefault('TASK_QUEUE_EAGER', False)
+        if batch_size is not None:
+            self.batch_size = batch_size
+        if flush_interval is not None:
+            self.flush_interval = flush_interval
+        if retries is not None:
+            self.retries = retries
+
+    def put(self, item, key=None):
+        """Buffer ``item``; returns False if an item with the same key is already waiting."""
+        tenant = current_tenant()
+        if key is not None and tenant is not None:
+            key = (tenant.id, key)  # Ids repeat between tenants' databases
+        with self._cond:
+            if key is not None:
+                if key in self._keys:
+                    return False
+                self._keys.add(key)
+            self._items.append((key, tenant, item, 0))
+            if len(self._items) >= self.batch_size:
+                self._cond.notify()
+        if self.app.config['TASK_QUEUE_EAGER']:
+            self.flush()
+        else:
+            self._ensure_worker()
+        return True
+
+    def flush(self):
+        """Process everything buffered so far in the calling thread."""
+        while True:
+            batch = self._take()
+            if not batch:
+                return
+            self._process(batch)
+
+    def join(self, timeout=None):
+        """Wait until the buffer is empty and no batch is being processed."""
+        with self._cond:
+            self._cond.notify()
+            return self._cond.wait_for(lambda: not self._items and not self._in_flight, timeout)
+
+    def __len__(self):
+        return len(self._items)
+
+    def _take(self):
+        with self._cond:
+            batch, self._items = self._items[:self.batch_size], self._items[self.batch_size:]
+            for key, _, _, _ in batch:
+                self._keys.discard(key)
+            self._in_flight += bool(batch)
+            return batch
+
+    def _process(self, batch):
+        try:
+            batch.sort(key=lambda entry: entry[1].id if entry[1] is not None else 0)
+            for tenant, entries in groupby(batch, key=lambda entry: entry[1]):
+                entries = list(entries)
+                with tenant_context(tenant):
+                    if not self._handle([item for _, _, item, _ in entries]):
+                        self._retry(entries)
+        finally:
+            with self._cond:
+                self._in_flight -= 1
+                self._cond.notify_all()
+
+    def _handle(self, items):
+        """Run ``handler`` on ``items``; returns False if it failed (and was rolled back)."""
+        if self.app.config['TASK_QUEUE_EAGER']:
+            self.handler(items)
+            return True
+        with self.app.app_context():
+            try:
+                self.handler(items)
+            except Exception:
+                logger.exception("%s failed to process a batch of %d items", self.name, len(items))
+                self.app.extensions['sqlalchemy'].session.rollback()
+                return False
+        return True
+
+    def _retry(self, entries):
+        """Put the items of a failed batch back, unless they have had all their attempts."""
+        with self._cond:
+            for key, tenant, item, attempts in entries:
+                if attempts >= self.retries:
+                    logger.error("%s gave up on %r after %d attempts", self.name, item, attempts + 1)
+                elif key is None or key not in self._keys:  # Not already waiting again
+                    if key is not None:
+                        self._keys.add(key)
+                    self._items.append((key, tenant, item, attempts + 1))
+
+    def _ensure_worker(self):
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._cond:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._work, name=self.name, daemon=True)
+                self._worker.start()
+
+    def _work(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: len(self._items) >= self.batch_size, self.flush_interval)
+            batch = self._take()
+            if batch:
+                self._process(batch)
@@ -0,0 +1,301 @@
+# tenancy.py
+"""Several SACCOs on one deployment: tenant resolution, per-tenant settings and data isolation.
+
+A tenant is a row of ``Tenant``: a slug, the hostname its members use, an
+optional database of its own and a ``settings`` JSON of overrides for the
+settings in ``TENANT_SETTINGS`` (interest rate, withdrawal limits, M-Pesa
+shortcode and credentials). ``setting(name)`` returns the current tenant's
+value, or the app config's when it has none.
+
+Every request runs as one tenant, found by its ``Host`` (or the
+``TENANT_HEADER`` header, behind a proxy that sets it). ``TenantRegistry``
+keeps every tenant in memory, so resolving one is a dict lookup; the table
+is re-read when a tenant changes, which each process notices from the sum of
+the tenants' ``version`` counters, checked at most every ``TENANT_CACHE_TTL``
+seconds (immediately in the process that made the change). Socket.IO
+handlers run as their connection's tenant with ``TenantRegistry.socket_event``,
+and outside requests (batch jobs, scripts) ``tenant_context`` sets the
+tenant; background queues carry the tenant of whoever queued the work.
+
+Data isolation, for tenants sharing a database: the core models carry a
+``tenant_id`` (the ``TenantScoped`` mixin) that new rows take from the
+current tenant, and every ORM statement run while a tenant is current gets a
+``tenant_id = <tenant>`` criterion on those models, subqueries and UPDATEs
+included. Core statements against ``Model.__table__`` are not rewritten:
+they either work on ids that came from a scoped query or add
+``tenant_criteria(table)`` themselves. With no tenant current (no tenants
+defined, or maintenance scripts) nothing is filtered.
+
+A tenant with a ``database_uri`` has every model except ``Tenant`` routed to
+an engine of its own (and so its own connection pool): a large SACCO's batch
+jobs then compete with nobody else's requests. Its database is migrated like
+the main one (``DATABASE_URL=<uri> flask --app app db upgrade``), and its
+mail outbox and search index are served with ``batch.py --tenant <slug>``.
+"""
+import contextvars
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import abort, current_app, g, request, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, func, select
+from sqlalchemy.orm import with_loader_criteria
+
+from app.database import create_engine_like
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TENANT_ID = 1  # Rows written with no tenant current, and every row that predates tenants
+# Config keys a tenant may override in Tenant.settings
+TENANT_SETTINGS = ('LOAN_INTEREST_RATE', 'DAILY_WITHDRAWAL_LIMIT', 'WITHDRAWAL_TIER_LIMITS', 'MPESA_SHORTCODE',
+                   'MPESA_CONSUMER_KEY', 'MPESA_CONSUMER_SECRET')
+
+_current = contextvars.ContextVar('tenant', default=None)
+
+
+class TenantConfig:
+    """An immutable snapshot of a ``Tenant`` row, shared by every request of the tenant."""
+
+    __slots__ = ('id', 'slug', 'name', 'hostname', 'database_uri', 'settings', 'version')
+
+    def __init__(self, tenant):
+        self.id = tenant.id
+        self.slug = tenant.slug
+        self.name = tenant.name
+        self.hostname = tenant.hostname
+        self.database_uri = tenant.database_uri
+        self.settings = {key: value for key, value in (tenant.settings or {}).items() if key in TENANT_SETTINGS}
+        self.version = tenant.version
+
+    def __repr__(self):
+        return f'<TenantConfig {self.slug}>'
+
+
+def current_tenant():
+    """The ``TenantConfig`` this code runs as, or None."""
+    return _current.get()
+
+
+def current_tenant_id():
+    """Column default for ``tenant_id``: the current tenant, else the default one."""
+    tenant = _current.get()
+    return tenant.id if tenant is not None else DEFAULT_TENANT_ID
+
+
+@contextmanager
+def tenant_context(tenant):
+    """Run the block as ``tenant`` (a ``TenantConfig`` or None for no tenant)."""
+    token = _current.set(tenant)
+    try:
+        yield tenant
+    finally:
+        _current.reset(token)
+
+
+def bind_tenant(func):
+    """Wrap ``func`` to run as the current tenant, wherever (whichever thread) it is called."""
+    tenant = _current.get()
+    if tenant is None:
+        return func
+
+    def run_as_tenant(*args, **kwargs):
+        with tenant_context(tenant):
+            return func(*args, **kwargs)
+    return run_as_tenant
+
+
+def setting(name):
+    """``name`` for the current tenant: its override if it has one, else the app config."""
+    tenant = _current.get()
+    if tenant is not None and name in tenant.settings:
+        return tenant.settings[name]
+    return current_app.config[name]
+
+
+def scope_prefix():
+    """Prefix for keys shared across databases (cache scopes, limiter windows, socket rooms).
+
+    Ids are unique within a database but repeat between a tenant's own database and the main
+    one, so only tenants with a database of their own get a prefix.
+    """
+    tenant = _current.get()
+    return f't{tenant.id}:' if tenant is not None and tenant.database_uri else ''
+
+
+def tenant_criteria(table):
+    """``[table.c.tenant_id == <current tenant>]`` for Core statements, or ``[]`` with no tenant current."""
+    tenant = _current.get()
+    return [table.c.tenant_id == tenant.id] if tenant is not None else []
+
+
+class TenantSession(Session):
+    """Session that sends the statements of a tenant with its own database to that database's engine."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        tenant = _current.get()
+        if bind is None and tenant is not None and tenant.database_uri and not _is_shared(mapper, clause):
+            return current_app.extensions['tenants'].engine_for(tenant)
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def _is_shared(mapper, clause):
+    """Whether a statement is about the tenant registry itself, which only the main database has."""
+    if mapper is not None:
+        return mapper.local_table.name == 'tenant'
+    table = getattr(clause, 'table', None)
+    return table is not None and getattr(table, 'name', None) == 'tenant'
+
+
+@event.listens_for(TenantSession, 'do_orm_execute')
+def _scope_to_tenant(state):
+    tenant = _current.get()
+    if tenant is None or state.is_column_load or state.is_relationship_load:
+        return  # Lazy loads follow a row that was already scoped
+    from app.models import TenantScoped
+    tenant_id = tenant.id
+    state.statement = state.statement.options(
+        with_loader_criteria(TenantScoped, lambda cls: cls.tenant_id == tenant_id, include_aliases=True)
+    )
+
+
+class TenantRegistry:
+    """Every tenant, by id, slug and hostname, kept in memory and re-read when one changes."""
+
+    def __init__(self, app=None, db=None):
+        self.app = None
+        self.db = None
+        self._tenants = None  # (by id, by slug, by hostname, version)
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self._engines = {}
+        self._engines_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        self.app = app
+        self.db = db
+        config = app.config
+        config.setdefault('TENANT_HEADER', None)
+        config.setdefault('TENANT_DEFAULT', 'default')
+        config.setdefault('TENANT_CACHE_TTL', 5.0)
+        app.extensions['tenants'] = self
+        # Registered ahead of the other request hooks, so that they all run as the tenant
+        app.before_request(self._enter_request)
+        app.teardown_request(self._exit_request)
+
+    def after_fork(self):
+        """Drop the tenant engines' inherited connections; the parent keeps using them."""
+        for engine in self._engines.values():
+            engine.dispose(close=False)
+
+    def _load(self):
+        from app.models import Tenant
+        with self.db.engine.connect() as connection:
+            rows = connection.execute(select(Tenant).where(Tenant.active.is_(True))).all()
+        by_id = {}
+        for row in rows:
+            tenant = TenantConfig(row)
+            by_id[tenant.id] = tenant
+        by_slug = {tenant.slug: tenant for tenant in by_id.values()}
+        by_host = {tenant.hostname.lower(): tenant for tenant in by_id.values() if tenant.hostname}
+        return by_id, by_slug, by_host
+
+    def _version(self):
+        """Sum of every tenant's version (and their count): changes whenever a tenant is added or edited."""
+        from app.models import Tenant
+        with self.db.engine.connect() as connection:
+            return tuple(connection.execute(
+                select(func.coalesce(func.sum(Tenant.version), 0), func.count(Tenant.id))
+            ).one())
+
+    def _snapshot(self):
+        now = time.monotonic()
+        tenants = self._tenants
+        if tenants is not None and now - self._checked_at < self.app.config['TENANT_CACHE_TTL']:
+            return tenants
+        with self._lock:
+            if self._tenants is not None and now - self._checked_at < self.app.config['TENANT_CACHE_TTL']:
+                return self._tenants
+            version = self._version()
+            if self._tenants is None or self._tenants[3] != version:
+                self._tenants = (*self._load(), version)
+            self._checked_at = now
+            return self._tenants
+
+    def invalidate(self):
+        """Re-read the tenants on next use; called after a tenant has been changed in this process."""
+        with self._lock:
+            self._tenants = None
+
+    def all(self):
+        return sorted(self._snapshot()[0].values(), key=lambda tenant: tenant.id)
+
+    def get(self, slug):
+        return self._snapshot()[1].get(slug)
+
+    def resolve(self, host, header=None):
+        """The tenant a request is for: by header, then hostname, then ``TENANT_DEFAULT``.
+
+        Returns None when no tenants are defined (a single-SACCO deployment).
+        """
+        by_id, by_slug, by_host, _ = self._snapshot()
+        if not by_id:
+            return None
+        if header:
+            return by_slug.get(header)
+        hostname = (host or '').partition(':')[0].lower()
+        return by_host.get(hostname) or by_slug.get(self.app.config['TENANT_DEFAULT'])
+
+    def engine_for(self, tenant):
+        """The engine of a tenant with its own database, created on first use (with the same pool settings)."""
+        engine = self._engines.get(tenant.database_uri)
+        if engine is None:
+            with self._engines_lock:
+                engine = self._engines.get(tenant.database_uri)
+                if engine is None:
+                    engine = create_engine_like(self.app.config, tenant.database_uri)
+                    self._engines[tenant.database_uri] = engine
+        return engine
+
+    def socket_event(self, handler):
+        """Run a Socket.IO handler as the tenant of its connection (use below ``@socketio.on``).
+
+        Events skip ``before_request``; the tenant comes from the handshake request. Sockets of a
+        session signed in at another tenant are refused.
+        """
+        @wraps(handler)
+        def wrapper(*args, **kwargs):
+            tenant = self._request_tenant()
+            if tenant is None and self._snapshot()[0]:
+                return False
+            if tenant is not None and session.get('_tenant', tenant.id) != tenant.id:
+                return False
+            with tenant_context(tenant):
+                return handler(*args, **kwargs)
+        return wrapper
+
+    def _request_tenant(self):
+        header = self.app.config['TENANT_HEADER']
+        return self.resolve(request.host, request.headers.get(header) if header else None)
+
+    def _enter_request(self):
+        tenant = self._request_tenant()
+        if tenant is None and self._snapshot()[0]:
+            abort(404)  # Tenants are defined, but none is served here
+        if tenant is not None and session.get('_tenant') != tenant.id:
+            if '_tenant' in session:
+                # Signed in at another tenant (a shared parent domain, or a proxy's header): user ids repeat
+                # between tenant databases, so the login must not carry over
+                session.pop('_user_id', None)
+                session.pop('_fresh', None)
+            session['_tenant'] = tenant.id
+        g._tenant_token = _current.set(tenant)
+
+    def _exit_request(self, exc=None):
+        token = g.pop('_tenant_token', None)
+        if token is not None:
+            _current.reset(token)
@@ -1,14 +1,20 @@
 # utils.py
+import logging
 from datetime import datetime
 from flask import flash
 from app.models import Notification, Message, Savings, LoanRequest, MembershipRequest
 from app import db
+from app.services import NotificationService
+
+logger = logging.getLogger(__name__)
 
 def create_notification(user_id, message):
     """Create a notification for a user."""
-    notification = Notification(user_id=user_id, message=message)
-    db.session.add(notification)
-    db.session.commit()
+    NotificationService.notify_many([user_id], message)
+
+def create_bulk_notification(user_ids, message, defer=False):
+    """Create the same notification for many users in one insert."""
+    return NotificationService.notify_many(user_ids, message, defer=defer)
 
 def send_group_message(user_id, group_id, content):
     """Send a message to a group chat."""
@@ -17,20 +23,23 @@ def send_group_message(user_id, group_id, content):
     db.session.commit()
     return message
 
-def create_savings_notification(user_id, amount):
-    """Notify a user of successful savings deposit."""
+def _as_id_list(user_ids):
+    return [user_ids] if isinstance(user_ids, int) else list(user_ids)
+
+def create_savings_notification(user_ids, amount):
+    """Notify one user (or a list of users) of a successful savings deposit."""
     message = f"Your savings of {amount} has been successfully deposited."
-    create_notification(user_id, message)
+    create_bulk_notification(_as_id_list(user_ids), message)
 
-def create_loan_notification(user_id, loan_status):
-    """Notify a user of their loan request status."""
+def create_loan_notification(user_ids, loan_status):
+    """Notify one user (or a list of users) of their loan request status."""
     message = f"Your loan request has been {loan_status}."
-    create_notification(user_id, message)
+    create_bulk_notification(_as_id_list(user_ids), message)
 
-def create_membership_notification(user_id, group_name, status):
-    """Notify a user of their membership request status."""
+def create_membership_notification(user_ids, group_name, status):
+    """Notify one user (or a list of users) of their membership request status."""
     message = f"Your membership request to join {group_name} has been {status}."
-    create_notification(user_id, message)
+    create_bulk_notification(_as_id_list(user_ids), message)
 
 def flash_error(message):
     """Flash an error message."""
@@ -49,6 +58,48 @@ def format_time(time):
     return time.strftime('%H:%M')
 
 def log_action(action, user_id):
-    """Log user actions (for future implementation of logging)."""
-    # You could implement logging here if needed
-    print(f"{datetime.now()}: User {user_id} performed action: {action}")
+    """Log a user action; timing and query counts for the request are in /metrics."""
+    logger.info("User %s performed action: %s", user_id, action, extra={'user_id': user_id, 'action': action})
+
+def _ical_text(value):
+    """Escape a TEXT value for an iCalendar content line."""
+    return (value or '').replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,') \
+        .replace('\r\n', '\\n').replace('\n', '\\n')
+
+def _ical_fold(line):
+    """Split a content line into 75-octet pieces; continuation lines start with a space."""
+    pieces, current, size = [], '', 0
+    for char in line:
+        width = len(char.encode('utf-8'))
+        if size + width > 75:
+            pieces.append(current)
+            current, size = ' ', 1
+        current += char
+        size += width
+    pieces.append(current)
+    return '\r\n'.join(pieces)
+
+def meetings_to_ical(calendar_name, meetings, host, timezone='UTC'):
+    """Render meetings (dicts from GroupService.get_meetings) as an iCalendar feed.
+
+    Meetings have no end time, so each is published as one hour long. Times are
+    UTC when ``timezone`` is UTC, otherwise local times with an X-WR-TIMEZONE hint.
+    """
+    utc = timezone == 'UTC'
+    lines = ['BEGIN:VCALENDAR', 'VERSION:2.0', 'PRODID:-//SACCO Management System//Meetings//EN',
+             'CALSCALE:GREGORIAN', 'METHOD:PUBLISH', f'X-WR-CALNAME:{_ical_text(calendar_name)}']
+    if not utc:
+        lines.append(f'X-WR-TIMEZONE:{timezone}')
+    for meeting in meetings:
+        start = datetime.combine(meeting['date'], meeting['time'])
+        lines += ['BEGIN:VEVENT',
+                  f"UID:meeting-{meeting['id']}@{host}",
+                  f"DTSTAMP:{meeting['created_at'] or start:%Y%m%dT%H%M%SZ}",
+                  f"DTSTART:{start:%Y%m%dT%H%M%S}{'Z' if utc else ''}",
+                  'DURATION:PT1H',
+                  f"SUMMARY:{_ical_text(meeting['title'])}"]
+        if meeting['description']:
+            lines.append(f"DESCRIPTION:{_ical_text(meeting['description'])}")
+        lines.append('END:VEVENT')
+    lines.append('END:VCALENDAR')
+    return ''.join(_ical_fold(line) + '\r\n' for line in lines)
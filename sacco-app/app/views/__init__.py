@@ -0,0 +1,56 @@
+# views/__init__.py
+"""HTTP routes and Socket.IO handlers, one blueprint per domain.
+
+* ``main`` - home, dashboard, notifications and search;
+* ``auth`` - registration, login, MFA and account verification;
+* ``groups`` - groups, meetings, calendars and group exports;
+* ``chat`` - the group chat page and its Socket.IO namespace;
+* ``savings`` - savings, withdrawals, M-Pesa callbacks and statements;
+* ``loans`` - the loan queue, decisions and the portfolio report;
+* ``admin`` - the group admin dashboard, the membership queue and metrics.
+
+Blueprints have no URL prefix, so every URL is what it was when the routes
+lived in one module; endpoint names carry the blueprint (``url_for('groups.group', ...)``).
+The modules are imported when ``create_app`` registers them, not when the
+``app`` package is imported.
+"""
+from datetime import datetime
+
+from flask import flash, jsonify, redirect, request, url_for
+
+
+def register_blueprints(app):
+    from app.views import admin, auth, chat, groups, loans, main, savings
+    for module in (main, auth, groups, chat, savings, loans, admin):
+        app.register_blueprint(module.bp)
+
+
+def bulk_selection():
+    """Read a bulk decision from JSON {"ids": [...]} / {"all": true, filters} or the queue page's form."""
+    data = request.get_json(silent=True) if request.is_json else request.form
+    data = data or {}
+    if request.is_json:
+        ids = None if data.get('all') else data.get('ids', [])
+    else:
+        ids = None if data.get('all') else data.getlist('ids')
+    filters = {}
+    if data.get('created_before'):
+        filters['created_before'] = datetime.fromisoformat(str(data['created_before']))
+    if data.get('max_amount') not in (None, ''):
+        filters['max_amount'] = float(data['max_amount'])
+    if ids is not None:
+        ids = [int(i) for i in ids]
+    return ids, filters
+
+
+def bulk_response(results, endpoint, noun):
+    """JSON callers get the per-item results; the queue pages get a summary flash and a redirect."""
+    decided = sum(1 for result in results.values() if not result.startswith(('already_', 'not_found', 'over_limit')))
+    if request.is_json:
+        return jsonify({"updated": decided, "results": {str(i): result for i, result in results.items()}})
+    over_limit = sum(1 for result in results.values() if result == 'over_limit')
+    skipped = len(results) - decided - over_limit
+    flash(f"{decided} {noun} updated" + (f", {skipped} skipped (no longer pending)" if skipped else "")
+          + (f", {over_limit} left pending (over the member's credit limit)" if over_limit else "") + ".",
+          'success' if decided else 'warning')
+    return redirect(url_for(endpoint))
@@ -0,0 +1,120 @@
+# views/admin.py
+from functools import partial
+
+from flask import Blueprint, Response, abort, current_app, flash, jsonify, redirect, render_template, request, url_for
+from flask_login import current_user, login_required
+
+from app import metrics, response_cache
+from app.cache import group_scope, user_scope
+from app.instrumentation import query_budget
+from app.replicas import read_replica
+from app.services import GroupService, NotificationService
+from app.views import bulk_response, bulk_selection
+from app.views.groups import group_summary
+
+bp = Blueprint('admin', __name__)
+
+
+# Admin dashboard
+@bp.route('/admin/dashboard/<int:group_id>', methods=['GET'])
+@login_required
+@query_budget(4)
+def admin_dashboard(group_id):
+    group = group_summary(group_id)
+    if group['admin'] != current_user.id:
+        flash('You do not have permission to access this page.', 'danger')
+        return redirect(url_for('groups.group', group_id=group_id))
+
+    return response_cache.conditional(
+        f'admin-dashboard:{group_id}', [user_scope(current_user.id), group_scope(group_id)],
+        lambda: render_template('admin_dashboard.html', group=group,
+                                inbox=partial(NotificationService.get_inbox, current_user.id),
+                                unread=current_user.unread_notifications))
+
+# Admin Admit Members: one page of the pending queue, oldest first (from a replica, like the loan queue)
+@bp.route('/admin/admit_members', methods=['GET'])
+@login_required
+@query_budget(3)
+@read_replica
+def admit_members():
+    if current_user.role != 'admin':
+        flash('Access denied.', 'danger')
+        return redirect(url_for('main.dashboard'))
+
+    membership_requests, next_after_id, pending = GroupService.get_pending_membership_requests(
+        after_id=request.args.get('after', type=int))
+    return render_template('admit_members.html', membership_requests=membership_requests,
+                           next_after_id=next_after_id, pending=pending)
+
+@bp.route('/admin/admit_member/<int:request_id>', methods=['POST'])
+@login_required
+def admit_member(request_id):
+    if current_user.role != 'admin':
+        flash('Access denied.', 'danger')
+        return redirect(url_for('main.dashboard'))
+
+    result = GroupService.decide_membership_requests([request_id])[request_id]
+    if result == 'not_found':
+        abort(404)
+    if result == 'admitted':
+        flash('Member admitted successfully.', 'success')
+    else:
+        flash('That request was already decided.', 'warning')
+    return redirect(url_for('admin.admit_members'))
+
+@bp.route('/admin/reject_membership/<int:request_id>', methods=['POST'])
+@login_required
+def reject_membership(request_id):
+    if current_user.role != 'admin':
+        flash('Access denied.', 'danger')
+        return redirect(url_for('main.dashboard'))
+
+    result = GroupService.decide_membership_requests([request_id], admit=False)[request_id]
+    if result == 'not_found':
+        abort(404)
+    if result == 'rejected':
+        flash('Membership request rejected successfully.', 'danger')
+    else:
+        flash('That request was already decided.', 'warning')
+    return redirect(url_for('admin.admit_members'))
+
+# Admit or reject many membership requests at once: selected ids, or every pending request before a date
+@bp.route('/admin/membership_requests/<any(admit, reject):action>', methods=['POST'])
+@login_required
+@query_budget(6)
+def decide_membership_requests(action):
+    if current_user.role != 'admin':
+        flash('Access denied.', 'danger')
+        return redirect(url_for('main.dashboard'))
+
+    try:
+        ids, filters = bulk_selection()
+        filters.pop('max_amount', None)
+    except (TypeError, ValueError):
+        return jsonify({"error": "ids must be membership request ids; created_before an ISO date"}), 400
+    results = GroupService.decide_membership_requests(ids, admit=action == 'admit', **filters)
+    return bulk_response(results, 'admin.admit_members', 'membership requests')
+
+# Prometheus scrape endpoint; set METRICS_TOKEN to require "Authorization: Bearer <token>"
+@bp.route('/metrics')
+def prometheus_metrics():
+    token = current_app.config['METRICS_TOKEN']
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        abort(403)
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+# Slow-request profiles; admins (or the metrics token) can switch the sampling profiler on and off
+@bp.route('/metrics/slow_requests', methods=['GET', 'POST'])
+def slow_request_profiles():
+    token = current_app.config['METRICS_TOKEN']
+    is_admin = current_user.is_authenticated and current_user.role == 'admin'
+    if not is_admin and not (token and request.headers.get('Authorization') == f'Bearer {token}'):
+        abort(403)
+    profiler = metrics.profiler
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        profiler.enabled = bool(data.get('enabled', profiler.enabled))
+        if data.get('threshold') is not None:
+            profiler.threshold = float(data['threshold'])
+    return jsonify({"enabled": profiler.enabled, "threshold": profiler.threshold,
+                    "profiles": list(profiler.recent)})
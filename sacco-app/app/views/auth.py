@@ -0,0 +1,112 @@
+# views/auth.py
+import logging
+
+from flask import Blueprint, flash, redirect, render_template, request, url_for
+from flask_login import current_user, login_required, login_user, logout_user
+
+from app import db
+from app.forms import LoginForm, RegistrationForm
+from app.models import User
+from app.services import EmailService
+
+bp = Blueprint('auth', __name__)
+
+logger = logging.getLogger(__name__)
+
+
+# Queue the verification email; it is sent by the mail dispatcher once the caller commits
+def send_verification_email(user):
+    import pyotp  # Only the registration and MFA views need it
+    verification_code = pyotp.random_base32()  # Generate a random verification code
+    user.two_factor_secret = verification_code
+    EmailService.queue_email(user.email, 'Account Verification', f"Your verification code is: {verification_code}",
+                             commit=False)
+    logger.info(f"Queued verification email to {user.email}")
+
+# Registration Route
+@bp.route('/register', methods=['GET', 'POST'])
+def register():
+    if current_user.is_authenticated:
+        return redirect(url_for('main.dashboard'))
+
+    form = RegistrationForm()
+    if form.validate_on_submit():
+        hashed_password = form.password.data  # Ensure to hash the password
+        user = User(username=form.username.data, email=form.email.data, password=hashed_password)
+        db.session.add(user)
+        send_verification_email(user)  # Queue the verification code with the new user
+        db.session.commit()
+        logger.info(f"User {user.username} registered successfully.")
+
+        flash('Registration successful! A verification code has been sent to your email.', 'success')
+        return redirect(url_for('auth.login'))
+
+    return render_template('register.html', form=form)
+
+# Verify account with MFA
+@bp.route('/verify_account', methods=['GET', 'POST'])
+def verify_account():
+    if not current_user.is_authenticated:
+        return redirect(url_for('auth.login'))
+
+    if request.method == 'POST':
+        verification_code = request.form.get('verification_code')
+        if verification_code == current_user.two_factor_secret:
+            current_user.is_mfa_enabled = True  # Enable MFA
+            db.session.commit()
+            flash('Account verified successfully! You can now log in with MFA enabled.', 'success')
+            logger.info(f"User {current_user.username} verified their account.")
+            return redirect(url_for('auth.login'))
+        else:
+            flash('Invalid verification code. Please try again.', 'danger')
+            logger.warning(f"Failed verification attempt for user {current_user.username}.")
+
+    return render_template('verify_account.html')
+
+# Login Route
+@bp.route('/login', methods=['GET', 'POST'])
+def login():
+    if current_user.is_authenticated:
+        return redirect(url_for('main.dashboard'))
+
+    form = LoginForm()
+    if form.validate_on_submit():
+        user = User.query.filter_by(email=form.email.data).first()
+        if user and user.password == form.password.data:  # Use hashed password check
+            if user.is_mfa_enabled:
+                # MFA verification process here
+                return redirect(url_for('auth.mfa_verification'))  # Redirect to MFA page
+            login_user(user)
+            flash('Login successful!', 'success')
+            return redirect(url_for('main.dashboard'))
+        else:
+            flash('Login unsuccessful. Please check email and password.', 'danger')
+            logger.warning(f"Failed login attempt for email: {form.email.data}")
+
+    return render_template('login.html', form=form)
+
+# MFA Verification Route
+@bp.route('/mfa_verification', methods=['GET', 'POST'])
+@login_required
+def mfa_verification():
+    if request.method == 'POST':
+        import pyotp
+        mfa_code = request.form.get('mfa_code')
+        totp = pyotp.TOTP(current_user.two_factor_secret)
+        if totp.verify(mfa_code):
+            login_user(current_user)
+            flash('Login successful!', 'success')
+            return redirect(url_for('main.dashboard'))
+        else:
+            flash('Invalid MFA code. Please try again.', 'danger')
+            logger.warning(f"Failed MFA verification for user {current_user.username}.")
+
+    return render_template('mfa_verification.html')
+
+# Logout Route
+@bp.route('/logout')
+@login_required
+def logout():
+    logout_user()
+    flash('You have been logged out.', 'success')
+    return redirect(url_for('auth.login'))
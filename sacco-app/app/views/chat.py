@@ -0,0 +1,98 @@
+# views/chat.py
+from datetime import datetime
+
+from flask import Blueprint, render_template, session
+from flask_login import current_user, login_required
+from flask_socketio import emit, join_room, leave_room
+
+from app import metrics, socketio, tenants
+from app.instrumentation import query_budget
+from app.models import Group, Message
+from app.services import GroupService, MessageService
+from app.tasks import BatchQueue
+from app.tenancy import scope_prefix
+
+bp = Blueprint('chat', __name__)
+
+# Chat messages are written in micro-batches; sized from the config of the app the blueprint is registered on
+chat_messages = BatchQueue(handler=MessageService.save_messages, name='chat-messages')
+
+
+@bp.record
+def _bind_queue(state):
+    config = state.app.config
+    chat_messages.init_app(state.app, batch_size=config['CHAT_PERSIST_BATCH_SIZE'],
+                           flush_interval=config['CHAT_PERSIST_FLUSH_INTERVAL'])
+
+
+# Group chat
+@bp.route('/group/<int:group_id>/chat')
+@login_required
+@query_budget(2)
+def group_chat(group_id):
+    group = Group.query.get_or_404(group_id)
+    return render_template('group_chat.html', group=group)
+
+# WebSocket for chat: one Socket.IO room per group on the /chat namespace
+def group_room(group_id):
+    return f'{scope_prefix()}group-{group_id}'
+
+@socketio.on('connect', namespace='/chat')
+@tenants.socket_event
+@metrics.timed_event
+def handle_chat_connect(auth=None):
+    if not current_user.is_authenticated:
+        return False  # Reject anonymous sockets
+    # Remembered on the socket so message events don't reload the user from the database
+    session['chat_user'] = (current_user.id, current_user.username)
+    session['chat_groups'] = set()  # Rooms this socket joined; rooms() scans every room on the server
+
+@socketio.on('join', namespace='/chat')
+@tenants.socket_event
+@metrics.timed_event
+def handle_chat_join(data):
+    group_id = int(data.get('group_id', 0))
+    user_id, _ = session['chat_user']
+    if not GroupService.is_member(group_id, user_id):
+        emit('error', {'message': 'You are not a member of this group.'})
+        return
+    join_room(group_room(group_id))
+    session['chat_groups'].add(group_id)
+    handle_chat_history({'group_id': group_id})
+
+@socketio.on('history', namespace='/chat')
+@tenants.socket_event
+@metrics.timed_event
+def handle_chat_history(data):
+    # One page of older messages; clients pass back 'next_before_id' to scroll further
+    group_id = int(data.get('group_id', 0))
+    if group_id not in session['chat_groups']:
+        return
+    messages, next_before_id = MessageService.get_backlog(group_id, before_id=data.get('before_id'))
+    emit('backlog', {
+        'group_id': group_id,
+        'messages': [MessageService.to_payload(message, message.sender.username) for message in messages],
+        'next_before_id': next_before_id,
+    })
+
+@socketio.on('leave', namespace='/chat')
+@tenants.socket_event
+@metrics.timed_event
+def handle_chat_leave(data):
+    group_id = int(data.get('group_id', 0))
+    leave_room(group_room(group_id))
+    session['chat_groups'].discard(group_id)
+
+@socketio.on('message', namespace='/chat')
+@tenants.socket_event
+@metrics.timed_event
+def handle_chat_message(data):
+    group_id = int(data.get('group_id', 0))
+    content = (data.get('content') or '').strip()
+    if not content or group_id not in session['chat_groups']:
+        return
+    user_id, username = session['chat_user']
+    message = Message(user_id=user_id, group_id=group_id, content=content, timestamp=datetime.utcnow())
+    # Deliver to the room now; the row is written with the next persistence batch
+    emit('message', MessageService.to_payload(message, username), to=group_room(group_id))
+    chat_messages.put(message)
@@ -0,0 +1,164 @@
+# views/groups.py
+from datetime import date, timedelta
+from functools import partial
+
+from flask import (Blueprint, Response, abort, current_app, flash, jsonify, redirect, render_template, request,
+                   url_for)
+from flask_login import current_user, login_required
+from itsdangerous import BadSignature, URLSafeSerializer
+
+from app import db, response_cache
+from app.cache import group_scope, user_scope
+from app.exports import export_response
+from app.forms import GroupForm, MeetingForm
+from app.instrumentation import query_budget
+from app.models import Group
+from app.services import ExportService, GroupService
+from app.utils import meetings_to_ical
+
+bp = Blueprint('groups', __name__)
+
+
+# Create group
+@bp.route('/group/create', methods=['GET', 'POST'])
+@login_required
+def create_group():
+    form = GroupForm()
+    if form.validate_on_submit():
+        group = Group(name=form.name.data, description=form.description.data, admin=current_user.id)
+        db.session.add(group)
+        db.session.commit()
+        flash('Group created successfully!', 'success')
+        return redirect(url_for('main.dashboard'))
+    return render_template('create_group.html', form=form)
+
+# Schedule meeting
+@bp.route('/group/<int:group_id>/meeting', methods=['GET', 'POST'])
+@login_required
+@query_budget(5)
+def schedule_meeting(group_id):
+    form = MeetingForm()
+    if form.validate_on_submit():
+        # Creates the meeting and notifies all group members in one bulk insert
+        GroupService.schedule_meeting(
+            group_id,
+            form.title.data,
+            form.date.data,
+            form.time.data,
+            form.description.data,
+            defer_notifications=current_app.config['NOTIFY_IN_BACKGROUND']
+        )
+
+        flash('Meeting scheduled and notifications sent!', 'success')
+        return redirect(url_for('groups.group', group_id=group_id))
+    return render_template('schedule_meeting.html', form=form, group=group_summary(group_id))
+
+# Group pages are served through the response cache (app/cache.py): summaries, member lists and
+# meetings are cached per group version, and repeat views get 304s
+def group_summary(group_id):
+    group = response_cache.cached(f'group:{group_id}', [group_scope(group_id)],
+                                  partial(GroupService.summary, group_id))
+    if group is None:
+        abort(404)
+    return group
+
+def _viewable_group(group_id, user_id, sacco_admin=False):
+    """The group's summary if the user may see it: its members, its admin and SACCO admins."""
+    group = group_summary(group_id)
+    if not sacco_admin and group['admin'] != user_id:
+        member_of = response_cache.cached(f'member-groups:{user_id}', [user_scope(user_id)],
+                                          partial(GroupService.get_user_group_ids, user_id))
+        if group_id not in member_of:
+            abort(403)
+    return group
+
+def _group_meetings(group_id):
+    """Meetings from CALENDAR_HISTORY_DAYS ago on; the calendar page and the feed share the entry."""
+    since = date.today() - timedelta(days=current_app.config['CALENDAR_HISTORY_DAYS'])
+    return response_cache.cached(f'meetings:{group_id}:{since}', [group_scope(group_id)],
+                                 partial(GroupService.get_meetings, group_id, since))
+
+def _calendar_feed_tokens():
+    return URLSafeSerializer(current_app.secret_key, salt='calendar-feed')
+
+@bp.route('/group/<int:group_id>')
+@login_required
+@query_budget(6)
+def group(group_id):
+    summary = _viewable_group(group_id, current_user.id, current_user.role == 'admin')
+    page = max(request.args.get('page', 1, type=int), 1)
+    today = date.today()  # Upcoming meetings move on daily
+    return response_cache.conditional(
+        f'group:{group_id}:{page}:{today}', [user_scope(current_user.id), group_scope(group_id)],
+        lambda: render_template('group.html', group=summary, page=page, today=today,
+                                members=partial(GroupService.get_members, group_id, page),
+                                meetings=partial(GroupService.get_meetings, group_id, today, 10)))
+
+@bp.route('/group/<int:group_id>/calendar')
+@login_required
+@query_budget(4)
+def calendar(group_id):
+    summary = _viewable_group(group_id, current_user.id, current_user.role == 'admin')
+    feed_url = url_for('groups.group_calendar_feed', group_id=group_id,
+                       token=_calendar_feed_tokens().dumps([current_user.id, group_id]), _external=True)
+
+    def render():
+        events = [{'title': m['title'], 'start': f"{m['date']}T{m['time']:%H:%M:%S}",
+                   'description': m['description'] or ''} for m in _group_meetings(group_id)]
+        return render_template('calendar.html', group=summary, events=events, feed_url=feed_url)
+
+    return response_cache.conditional(f'calendar:{group_id}:{date.today()}',
+                                      [user_scope(current_user.id), group_scope(group_id)], render)
+
+# iCalendar feed of a group's meetings. Calendar apps subscribe without a session, so the link on
+# the calendar page carries a signed token naming the member it was issued to
+@bp.route('/group/<int:group_id>/calendar.ics')
+@query_budget(4)
+def group_calendar_feed(group_id):
+    token = request.args.get('token')
+    if token:
+        try:
+            user_id, token_group_id = _calendar_feed_tokens().loads(token)
+        except (BadSignature, TypeError, ValueError):
+            abort(404)
+        if token_group_id != group_id:
+            abort(404)
+        summary = _viewable_group(group_id, user_id)
+    elif current_user.is_authenticated:
+        summary = _viewable_group(group_id, current_user.id, current_user.role == 'admin')
+    else:
+        return current_app.login_manager.unauthorized()
+    today = date.today()
+    timezone = current_app.config['TIMEZONE']
+
+    def render():
+        body = response_cache.cached(
+            f'calendar.ics:{group_id}:{today}', [group_scope(group_id)],
+            lambda: meetings_to_ical(summary['name'], _group_meetings(group_id), request.host, timezone))
+        return Response(body, mimetype='text/calendar')
+
+    return response_cache.conditional(f'calendar.ics:{group_id}:{today}', [group_scope(group_id)], render)
+
+# Promote user to admin
+@bp.route('/group/<int:group_id>/promote_admin/<int:user_id>', methods=['POST'])
+@login_required
+@query_budget(4)
+def promote_admin(group_id, user_id):
+    group = Group.query.get_or_404(group_id)
+    if current_user.id == group.admin:  # Only current admin can promote
+        if not GroupService.is_member(group_id, user_id):
+            return jsonify({"error": "User not in group"}), 400
+        group.admin = user_id  # Update admin
+        db.session.commit()
+        flash('User promoted to admin!', 'success')
+        return jsonify({"success": True}), 200
+    return jsonify({"error": "Unauthorized"}), 403
+
+@bp.route('/exports/groups/<int:group_id>/contributions.<any(csv, xlsx):fmt>')
+@login_required
+def export_group_contributions(group_id, fmt):
+    group = Group.query.get_or_404(group_id)
+    if group.admin != current_user.id and current_user.role != 'admin':
+        abort(403)
+    return export_response(f'group-{group_id}-contributions', fmt, ExportService.CONTRIBUTION_HEADERS,
+                           ExportService.group_contributions(group_id))
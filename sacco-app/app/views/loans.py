@@ -0,0 +1,121 @@
+# views/loans.py
+from datetime import datetime
+
+from flask import Blueprint, abort, flash, jsonify, redirect, render_template, request, url_for
+from flask_login import current_user, login_required
+
+from app.exports import export_response
+from app.forms import LoanRequestForm
+from app.instrumentation import query_budget
+from app.replicas import read_replica
+from app.services import ExportService, LedgerError, LoanService
+from app.views import bulk_response, bulk_selection
+
+bp = Blueprint('loans', __name__)
+
+
+# Request a loan: the form shows what the member can borrow now and refuses more
+@bp.route('/loans/request', methods=['GET', 'POST'])
+@login_required
+@query_budget(4)
+def request_loan():
+    form = LoanRequestForm()
+    if form.validate_on_submit():
+        try:
+            LoanService.request_loan(current_user.id, form.amount.data, form.purpose.data)
+        except LedgerError as exc:
+            flash(str(exc), 'danger')
+        else:
+            flash('Loan request submitted for review.', 'success')
+            return redirect(url_for('main.dashboard'))
+    return render_template('loan_request.html', form=form, credit=LoanService.available_credit(current_user.id))
+
+# Admin Approve Loans: one page of the pending queue, oldest first, with each member's available credit
+# (from a replica: deciding a request is a conditional UPDATE on the primary, so a stale row is harmless)
+@bp.route('/admin/approve_loans', methods=['GET'])
+@login_required
+@query_budget(4)
+@read_replica
+def approve_loans():
+    if current_user.role != 'admin':
+        flash('Access denied.', 'danger')
+        return redirect(url_for('main.dashboard'))
+
+    loan_requests, next_after_id, pending = LoanService.get_pending_loan_requests(
+        after_id=request.args.get('after', type=int))
+    credit = LoanService.available_credit_many(r.member_id for r in loan_requests)
+    return render_template('approve_loans.html', loan_requests=loan_requests, next_after_id=next_after_id,
+                           pending=pending, credit=credit)
+
+@bp.route('/admin/loan_portfolio', methods=['GET'])
+@login_required
+@query_budget(3)
+@read_replica
+def loan_portfolio():
+    if current_user.role != 'admin':
+        flash('Access denied.', 'danger')
+        return redirect(url_for('main.dashboard'))
+
+    method = request.args.get('method', 'flat')
+    if method not in ('flat', 'reducing'):
+        method = 'flat'
+    summary = LoanService.portfolio_summary(method=method)
+    return render_template('loan_portfolio.html', summary=summary, method=method)
+
+@bp.route('/admin/approve_loan/<int:loan_id>', methods=['POST'])
+@login_required
+def approve_loan(loan_id):
+    if current_user.role != 'admin':
+        flash('Access denied.', 'danger')
+        return redirect(url_for('main.dashboard'))
+
+    result = LoanService.decide_loan_requests([loan_id])[loan_id]
+    if result == 'not_found':
+        abort(404)
+    if result == 'approved':
+        flash('Loan request approved successfully.', 'success')
+    elif result == 'over_limit':
+        flash("That request is over the member's credit limit.", 'warning')
+    else:
+        flash('That request was already decided.', 'warning')
+    return redirect(url_for('loans.approve_loans'))
+
+@bp.route('/admin/reject_loan/<int:loan_id>', methods=['POST'])
+@login_required
+def reject_loan(loan_id):
+    if current_user.role != 'admin':
+        flash('Access denied.', 'danger')
+        return redirect(url_for('main.dashboard'))
+
+    result = LoanService.decide_loan_requests([loan_id], approve=False)[loan_id]
+    if result == 'not_found':
+        abort(404)
+    if result == 'rejected':
+        flash('Loan request rejected successfully.', 'danger')
+    else:
+        flash('That request was already decided.', 'warning')
+    return redirect(url_for('loans.approve_loans'))
+
+# Approve or reject many loan requests at once: selected ids, or every pending request matching the filters
+@bp.route('/admin/loan_requests/<any(approve, reject):action>', methods=['POST'])
+@login_required
+@query_budget(6)
+def decide_loan_requests(action):
+    if current_user.role != 'admin':
+        flash('Access denied.', 'danger')
+        return redirect(url_for('main.dashboard'))
+
+    try:
+        ids, filters = bulk_selection()
+    except (TypeError, ValueError):
+        return jsonify({"error": "ids must be loan request ids; max_amount a number; created_before an ISO date"}), 400
+    results = LoanService.decide_loan_requests(ids, approve=action == 'approve', **filters)
+    return bulk_response(results, 'loans.approve_loans', 'loan requests')
+
+@bp.route('/admin/exports/loan_book.<any(csv, xlsx):fmt>')
+@login_required
+def export_loan_book(fmt):
+    if current_user.role != 'admin':
+        abort(403)
+    return export_response(f'loan-book-{datetime.utcnow():%Y%m%d}', fmt, ExportService.LOAN_BOOK_HEADERS,
+                           ExportService.loan_book())
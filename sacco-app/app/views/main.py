@@ -0,0 +1,82 @@
+# views/main.py
+from functools import partial
+
+from flask import Blueprint, abort, jsonify, redirect, render_template, request, url_for
+from flask_login import current_user, login_required
+from flask_socketio import join_room
+
+from app import metrics, response_cache, socketio, tenants
+from app.cache import user_scope
+from app.instrumentation import query_budget
+from app.services import LedgerService, NotificationService, SearchService
+
+bp = Blueprint('main', __name__)
+
+
+@bp.route('/')
+@bp.route('/home')
+def home():
+    return render_template('home.html')
+
+@bp.route('/dashboard')
+@query_budget(2)
+def dashboard():
+    if not current_user.is_authenticated:
+        return response_cache.conditional('dashboard', [], lambda: render_template('dashboard.html'))
+    # Balances are read from the per-member snapshot, not summed from history, and only on a cache miss
+    return response_cache.conditional(
+        'dashboard', [user_scope(current_user.id)],
+        lambda: render_template('dashboard.html', balance=partial(LedgerService.get_balance, current_user.id)))
+
+# Full-text search: ?q=...&type=messages|groups|members[&group_id=...][&page=N]
+@bp.route('/search')
+@login_required
+@query_budget(7)
+def search():
+    query = request.args.get('q', '').strip()
+    source = request.args.get('type', 'messages')
+    if source not in SearchService.SOURCES:
+        abort(404)
+    page = max(request.args.get('page', 1, type=int), 1)
+    group_id = request.args.get('group_id', type=int)
+    results, has_next = SearchService.search(current_user, source, query, page=page, group_id=group_id)
+    group_names = SearchService.group_names(m.group_id for m in results) if source == 'messages' and results else {}
+    return render_template('search.html', query=query, source=source, results=results, page=page,
+                           has_next=has_next, group_id=group_id, group_names=group_names)
+
+# View notifications
+@bp.route('/notifications', methods=['GET'])
+@login_required
+@query_budget(3)
+def view_notifications():
+    notifications, next_before = NotificationService.get_inbox(current_user.id, before=request.args.get('before'))
+    return render_template('notifications.html', notifications=notifications, next_before=next_before,
+                           unread=current_user.unread_notifications)
+
+# Mark notifications read: a form post from the inbox or JSON {"ids": [...]} / {"all": true}
+@bp.route('/notifications/mark_read', methods=['POST'])
+@login_required
+@query_budget(4)
+def mark_notifications_read():
+    data = request.get_json(silent=True) or {}
+    if request.is_json:
+        ids = None if data.get('all') else data.get('ids', [])
+    else:
+        ids = None if request.form.get('all') else request.form.getlist('ids')
+    user_id = current_user.id  # Read before mark_read commits, which expires the loaded user
+    try:
+        changed = NotificationService.mark_read(user_id, ids)
+    except (TypeError, ValueError):
+        return jsonify({"error": "ids must be a list of notification ids"}), 400
+    if request.is_json:
+        return jsonify({"updated": changed, "unread": NotificationService.unread_count(user_id)})
+    return redirect(url_for('main.view_notifications'))
+
+# Push channel for new notifications: each socket joins its member's room
+@socketio.on('connect', namespace='/notifications')
+@tenants.socket_event
+@metrics.timed_event
+def handle_notifications_connect(auth=None):
+    if not current_user.is_authenticated:
+        return False
+    join_room(NotificationService.user_room(current_user.id))
@@ -0,0 +1,158 @@
+# views/savings.py
+import os
+import uuid
+from functools import partial
+
+from flask import (Blueprint, abort, current_app, flash, jsonify, redirect, render_template, request, send_file,
+                   url_for)
+from flask_login import current_user, login_required
+from werkzeug.utils import secure_filename
+
+from app import db, mpesa, pdf_exporter, task_queue
+from app.exports import export_response
+from app.forms import SavingsForm, StatementImportForm, WithdrawalForm
+from app.imports import StatementError, import_statement, read_statement, recent_imports, statement_format
+from app.instrumentation import query_budget
+from app.models import Savings
+from app.services import ExportService, LedgerError, LedgerService, SavingsService
+from app.tasks import BatchQueue
+
+bp = Blueprint('savings', __name__)
+
+# M-Pesa callbacks are applied in micro-batches; sized from the config of the app the blueprint is registered on
+payment_callbacks = BatchQueue(handler=SavingsService.apply_payment_callbacks, name='mpesa-callbacks')
+
+
+@bp.record
+def _bind_queue(state):
+    config = state.app.config
+    payment_callbacks.init_app(state.app, batch_size=config['MPESA_CALLBACK_BATCH_SIZE'],
+                               flush_interval=config['MPESA_CALLBACK_FLUSH_INTERVAL'],
+                               retries=config['MPESA_CALLBACK_RETRIES'])
+
+
+# Savings Route
+@bp.route('/savings', methods=['GET', 'POST'])
+@login_required
+@query_budget(5)
+def savings():
+    form = SavingsForm()
+    if form.validate_on_submit():
+        amount = form.amount.data
+        phone_number = current_user.phone_number  # Read before the commit expires the loaded user
+
+        # Create savings record; the ledger is credited once M-Pesa confirms the payment
+        savings_record = Savings(member_id=current_user.id, amount=float(amount), payment_status='pending')
+        db.session.add(savings_record)
+        db.session.commit()
+
+        # The payment push runs in the background; its transaction id is attached when M-Pesa answers
+        mpesa.submit_payment(phone_number, amount,
+                             on_complete=partial(SavingsService.attach_transaction, savings_record.id))
+
+        flash('Savings transaction initiated! Please complete the payment.', 'info')
+        return redirect(url_for('savings.savings'))
+
+    # Balance comes from the snapshot; history is read one page at a time
+    balance = LedgerService.get_balance(current_user.id)
+    current_savings, next_before_id = SavingsService.get_user_savings(
+        current_user.id, before_id=request.args.get('before', type=int))
+    return render_template('savings.html', form=form, withdraw_form=WithdrawalForm(prefix='withdraw'),
+                           savings=current_savings, balance=balance, next_before_id=next_before_id)
+
+@bp.route('/savings/withdraw', methods=['POST'])
+@login_required
+@query_budget(6)
+def withdraw_savings():
+    form = WithdrawalForm(prefix='withdraw')
+    if not form.validate_on_submit():
+        flash('Enter a valid amount to withdraw.', 'danger')
+        return redirect(url_for('savings.savings'))
+    try:
+        SavingsService.withdraw_savings(current_user.id, form.amount.data, tier=current_user.tier)
+    except LedgerError as exc:
+        flash(str(exc), 'danger')
+    else:
+        flash(f'Withdrew {form.amount.data} from your savings.', 'success')
+    return redirect(url_for('savings.savings'))
+
+@bp.route('/mpesa/callback', methods=['POST'])
+def mpesa_callback():
+    data = request.get_json(silent=True) or {}
+    transaction_id = data.get('transaction_id')
+    status = data.get('status')
+    if not transaction_id or not status:
+        return jsonify({"status": "error", "message": "transaction_id and status are required"}), 400
+
+    # Stored before it is acknowledged, as M-Pesa does not resend a callback it got a 200 for;
+    # the status update is applied with the next micro-batch
+    SavingsService.receive_payment_callback(transaction_id, status)
+    payment_callbacks.put(transaction_id, key=transaction_id)
+    return jsonify({"status": "ok"})
+
+# Statements: CSV/XLSX are streamed from a server-side cursor, PDFs rendered on a process pool
+def _statement_member_id():
+    # Members export their own statement; admins may pass ?member_id=
+    if current_user.role == 'admin':
+        return request.args.get('member_id', current_user.id, type=int)
+    return current_user.id
+
+@bp.route('/exports/statement.<any(csv, xlsx):fmt>')
+@login_required
+def export_statement(fmt):
+    member_id = _statement_member_id()
+    return export_response(f'statement-{member_id}', fmt, ExportService.STATEMENT_HEADERS,
+                           ExportService.member_statement(member_id))
+
+# PDF statements: poll the job URL until the file is ready
+@bp.route('/exports/statement.pdf', methods=['POST'])
+@login_required
+def export_statement_pdf():
+    job_id = pdf_exporter.submit(current_user.id, _statement_member_id())
+    return jsonify({"job": job_id, "status": "pending",
+                    "url": url_for('savings.export_job', job_id=job_id)}), 202
+
+@bp.route('/exports/jobs/<job_id>')
+@login_required
+def export_job(job_id):
+    job = pdf_exporter.job(job_id)
+    if job is None or job['owner_id'] != current_user.id:
+        abort(404)
+    if job['status'] == 'done':
+        return send_file(job['path'], mimetype='application/pdf', as_attachment=True,
+                         download_name='statement.pdf')
+    return jsonify({"job": job_id, "status": job['status']}), 500 if job['status'] == 'failed' else 202
+
+# Import contributions from a bank or M-Pesa statement. Dry runs are answered here; imports run on the task
+# queue, checkpointed, and are listed below the form (uploading the same file again resumes a failed one)
+@bp.route('/admin/imports', methods=['GET', 'POST'])
+@login_required
+def import_contributions():
+    if current_user.role != 'admin':
+        flash('Access denied.', 'danger')
+        return redirect(url_for('main.dashboard'))
+
+    form = StatementImportForm()
+    result = None
+    if form.validate_on_submit():
+        upload = form.statement.data
+        filename = secure_filename(upload.filename) or 'statement'
+        import_dir = current_app.config['IMPORT_DIR'] or os.path.join(current_app.instance_path, 'imports')
+        os.makedirs(import_dir, exist_ok=True)
+        path = os.path.join(import_dir, f'{uuid.uuid4().hex}-{filename}')
+        upload.save(path)
+        fmt = statement_format(filename)
+        try:
+            read_statement(path, fmt)[1].close()  # Refuse files without a usable header before queueing them
+            if form.dry_run.data:
+                result = import_statement(path, fmt, form.group_id.data, dry_run=True)
+        except StatementError as exc:
+            flash(f'{filename}: {exc}', 'danger')
+            result = None
+        else:
+            if not form.dry_run.data:
+                task_queue.enqueue(import_statement, path, fmt, form.group_id.data, filename=filename)
+                flash(f'Import of {filename} started; its progress is shown below.', 'success')
+                return redirect(url_for('savings.import_contributions'))
+        os.remove(path)
+    return render_template('import_contributions.html', form=form, result=result, imports=recent_imports())
@@ -0,0 +1,373 @@
+"""Run the scheduled SACCO batch jobs.
+
+    python batch.py interest [--period 2026-10] [--chunk-size 1000]
+    python batch.py dividends --pool 250000.00 [--period 2026] [--chunk-size 1000]
+    python batch.py status
+    python batch.py mail
+    python batch.py search [--rebuild] [--once]
+    python batch.py archive [--batch-size 1000]
+    python batch.py eligibility [--chunk-size 1000]
+    python batch.py import statement.csv [--group 3] [--dry-run] [--rejects rejects.csv] [--chunk-size 5000]
+    python batch.py reconcile settlement.csv [--repair] [--report report.csv] [--window 900]
+    python batch.py callbacks
+    python batch.py tenants [slug [--name NAME] [--host HOST] [--database-uri URI] [--set KEY=VALUE ...]]
+    python batch.py replicas [--sync [--once]]
+
+Runs are checkpointed per job and period: re-running a job that was
+interrupted resumes where it stopped, and re-running a completed one is a
+no-op. Schedule ``interest`` monthly and ``dividends`` once the pool for the
+year is known. ``mail`` runs the outbox dispatcher in the foreground for
+deployments that set MAIL_OUTBOX_WORKER=false on the web workers, and
+``search`` does the same for the full-text indexer (SEARCH_INDEX_WORKER=false);
+``--rebuild`` re-creates the index from scratch and ``--once`` exits when it
+has caught up. ``archive`` moves old chat messages and read notifications to
+the archive tables (see app/archive.py); run it daily. ``eligibility``
+recomputes every member's credit profile from the ledger (see
+app/eligibility.py); profiles are kept up to date as repayments post, so run
+it after upgrading and whenever the ledger has been corrected by hand.
+``import`` records the contributions in a bank or M-Pesa statement (CSV or
+XLSX) as deposits (see app/imports.py); an interrupted import resumes when it
+is run again on the same file, and ``--dry-run`` only reports what it would do.
+``reconcile`` matches an M-Pesa settlement statement against the deposits on
+file and writes a report of the differences (see app/reconcile.py); with
+``--repair`` it also completes deposits the statement settles and fails stale
+pending ones. Run it for each settlement period. ``callbacks`` applies the
+M-Pesa callbacks still waiting in the inbox (a web worker stopped before
+applying them, or every retry of their batch failed); schedule it every few
+minutes.
+
+Deployments hosting several SACCOs (see app/tenancy.py) run each command as
+one of them with ``--tenant <slug>``. Without it, and with more than one
+tenant, ``interest`` and ``callbacks`` run for every tenant in turn,
+``dividends``, ``import`` and ``reconcile`` refuse to run, and the others run
+once on the main database and once on each tenant database (``mail`` and
+``search`` serve the main database only: run one per tenant database). ``tenants`` lists the tenants,
+or adds one or changes its fields and setting overrides (``--set KEY=``
+removes an override).
+
+``replicas`` shows each read replica's lag (see app/replicas.py). With
+``--sync`` it keeps SQLite replicas (the local stand-in for a streaming
+replica) in sync instead, copying the primary into them every
+REPLICA_SYNC_INTERVAL seconds; ``--once`` copies once and exits.
+"""
+import argparse
+import csv
+import json
+import sys
+import time
+
+from sqlalchemy.exc import IntegrityError
+
+from app import app, db, mail_dispatcher, replicas, search_indexer
+from app.archive import archive_all
+from app.eligibility import rebuild_profiles
+from app.imports import StatementError, import_statement
+from app.jobs import JobConflict, accrue_interest, distribute_dividends
+from app.models import JobRun
+from app.reconcile import reconcile_statement
+from app.money import from_cents
+from app.services import SavingsService, TenantService
+from app.tenancy import tenant_context
+
+# Commands about one SACCO's money or statement, and commands that read the tenant's settings
+NEEDS_TENANT = ('dividends', 'import', 'reconcile')
+PER_TENANT = ('interest', 'callbacks')
+FOREGROUND = ('mail', 'search')  # Run until interrupted, so on one database
+
+
+def print_progress(run, rows, elapsed):
+    rate = rows / elapsed if elapsed > 0 else 0.0
+    print(f"  {run.job} {run.period}: member {run.cursor}, {rows} rows ({rate:.0f} rows/s)", flush=True)
+
+
+def print_summary(result):
+    print(f"{result['job']} {result['period']}: {result['status']}")
+    print(f"  this run   {result['rows']} rows, {from_cents(result['amount_cents'])} "
+          f"in {result['elapsed']:.2f} s ({result['rows_per_second']:.0f} rows/s)")
+    print(f"  all runs   {result['total_rows']} rows, {from_cents(result['total_amount_cents'])}")
+
+
+def print_index_progress(source, last_id, rows):
+    print(f"  {source}: indexed up to id {last_id} ({rows} rows)", flush=True)
+
+
+def print_archive_progress(table, rows, elapsed):
+    rate = rows / elapsed if elapsed > 0 else 0.0
+    print(f"  {table}: {rows} rows archived ({rate:.0f} rows/s)", flush=True)
+
+
+def print_eligibility_progress(members, profiles, elapsed):
+    rate = members / elapsed if elapsed > 0 else 0.0
+    print(f"  {members} members, {profiles} profiles ({rate:.0f} members/s)", flush=True)
+
+
+def print_import_progress(summary, elapsed):
+    rate = summary.rows / elapsed if elapsed > 0 else 0.0
+    print(f"  {summary.rows} rows, {summary.imported} imported, {summary.rejected} rejected ({rate:.0f} rows/s)",
+          flush=True)
+
+
+def print_import_summary(result):
+    print(f"import: {result['status']}" + (f" (resumed after row {result['resumed_from']})"
+                                           if result['resumed_from'] else ''))
+    print(f"  rows       {result['rows']} in {result['elapsed']:.2f} s ({result['rows_per_second']:.0f} rows/s)")
+    print(f"  imported   {result['imported']} contributions, {from_cents(result['amount_cents'])}")
+    print(f"  duplicates {result['duplicates']}, not credits {result['skipped']}, rejected {result['rejected']}")
+    for reason, count in sorted(result['reasons'].items(), key=lambda item: -item[1]):
+        print(f"    {count:>8}  {reason}")
+    for number, reason in result['errors'][:10]:
+        print(f"    row {number}: {reason}")
+
+
+def print_reconcile_summary(result):
+    period = ' to '.join(f'{when:%Y-%m-%d %H:%M}' for when in result['period']) if result['period'] else 'empty'
+    print(f"reconcile: {result['lines']} lines ({period} UTC) in {result['elapsed']:.2f} s "
+          f"({result['lines_per_second']:.0f} lines/s), {result['skipped']} not credits")
+    for kind, count in result['counts'].items():
+        print(f"  {kind:<16} {count}")
+    for action, count in sorted(result['actions'].items()):
+        print(f"  to {action:<13} {count}")
+    print(f"  repaired         {result['repaired'] if result['repair'] else 'no (pass --repair)'}")
+    print(f"  report           {result['report']}")
+
+
+def print_status():
+    for run in JobRun.query.order_by(JobRun.started_at.desc()).limit(20):
+        print(f"{run.job:<18} {run.period:<8} {run.status:<10} rows={run.rows_processed:<8} "
+              f"amount={from_cents(run.amount_cents)} member={run.cursor} updated={run.updated_at:%Y-%m-%d %H:%M}")
+
+
+def print_tenants():
+    for tenant in app.extensions['tenants'].all():
+        print(f"{tenant.slug:<16} {tenant.name:<30} host={tenant.hostname or '-'} "
+              f"database={'own' if tenant.database_uri else 'main'} settings={json.dumps(tenant.settings)}")
+
+
+def parse_settings(pairs):
+    """``KEY=VALUE`` pairs as a dict; values are JSON when they parse as JSON, and empty ones are None."""
+    settings = {}
+    for pair in pairs or ():
+        key, _, value = pair.partition('=')
+        try:
+            settings[key] = json.loads(value) if value else None
+        except ValueError:
+            settings[key] = value
+    return settings
+
+
+def edit_tenant(args):
+    fields = {name: value for name, value in (('name', args.name), ('hostname', args.host),
+                                               ('database_uri', args.database_uri)) if value is not None}
+    settings = parse_settings(args.set)
+    try:
+        if TenantService.exists(args.slug):
+            TenantService.update_tenant(args.slug, settings, **fields)
+        elif 'name' not in fields:
+            raise ValueError(f"new tenant {args.slug}: --name is required")
+        else:
+            TenantService.create_tenant(args.slug, settings=settings, **fields)
+    except (ValueError, IntegrityError) as exc:
+        db.session.rollback()
+        print(f"error: {exc}", file=sys.stderr)
+        return 1
+    print_tenants()
+    return 0
+
+
+def print_replicas(status):
+    if not status:
+        print("no replicas configured (DATABASE_REPLICA_URLS)")
+    for replica in status:
+        lag = 'unreachable' if replica['lag'] is None else f"{replica['lag']:.1f} s behind"
+        print(f"{replica['replica']:<60} {lag:<20} {'in use' if replica['healthy'] else 'skipped'}")
+
+
+def sync_replicas(once):
+    if db.engine.dialect.name != 'sqlite':
+        print("error: --sync copies an SQLite primary; other databases replicate themselves", file=sys.stderr)
+        return 1
+    interval = app.config['REPLICA_SYNC_INTERVAL']
+    try:
+        while True:
+            started = time.monotonic()
+            print(f"replicas: copied the primary in {replicas.sync(db.engine):.2f} s", flush=True)
+            if once:
+                return 0
+            time.sleep(max(interval - (time.monotonic() - started), 0))
+    except KeyboardInterrupt:
+        return 0
+
+
+def tenants_for(command, slug):
+    """The tenants to run ``command`` as; [None] runs it as no tenant, on the main database."""
+    registry = app.extensions['tenants']
+    if slug:
+        tenant = registry.get(slug)
+        if tenant is None:
+            raise LookupError(f"no such tenant: {slug}")
+        return [tenant]
+    every = registry.all()
+    if not every or command in FOREGROUND:
+        return [None]
+    if len(every) == 1:
+        return every  # A single SACCO: its default tenant
+    if command in NEEDS_TENANT:
+        raise LookupError(f"{command} is run for one SACCO: pass --tenant "
+                          f"({', '.join(tenant.slug for tenant in every)})")
+    if command in PER_TENANT:
+        return every
+    return [None] + [tenant for tenant in every if tenant.database_uri]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--quiet', action='store_true', help='only print the final summary')
+    parser.add_argument('--tenant', help='run as this tenant (slug)')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    interest = commands.add_parser('interest', help="charge one month's interest on approved loans")
+    interest.add_argument('--period', help='YYYY-MM (default: this month)')
+    interest.add_argument('--chunk-size', type=int)
+
+    dividends = commands.add_parser('dividends', help='distribute a dividend pool pro rata to savings')
+    dividends.add_argument('--pool', required=True, help='amount to distribute')
+    dividends.add_argument('--period', help='YYYY (default: this year)')
+    dividends.add_argument('--chunk-size', type=int)
+
+    commands.add_parser('status', help='show recent job runs')
+    commands.add_parser('mail', help='send queued email until interrupted')
+    search = commands.add_parser('search', help='keep the full-text search index up to date until interrupted')
+    search.add_argument('--rebuild', action='store_true', help='drop and rebuild the index first')
+    search.add_argument('--once', action='store_true', help='exit once the index has caught up')
+    archive = commands.add_parser('archive', help='move old chat messages and read notifications to the archive')
+    archive.add_argument('--batch-size', type=int, help='rows moved per transaction (default: ARCHIVE_BATCH_SIZE)')
+    eligibility = commands.add_parser('eligibility', help='rebuild every credit profile from the ledger')
+    eligibility.add_argument('--chunk-size', type=int)
+    statement = commands.add_parser('import', help='import contributions from a bank or M-Pesa statement')
+    statement.add_argument('path', help='CSV or XLSX statement')
+    statement.add_argument('--format', choices=('csv', 'xlsx'), help='default: from the file extension')
+    statement.add_argument('--group', type=int, help='only accept members of this group')
+    statement.add_argument('--dry-run', action='store_true', help='validate and match rows without importing')
+    statement.add_argument('--rejects', help='write rejected rows, with the reason, to this CSV file')
+    statement.add_argument('--chunk-size', type=int, help='rows per transaction (default: IMPORT_CHUNK_SIZE)')
+    reconcile = commands.add_parser('reconcile', help='match an M-Pesa settlement statement against the deposits')
+    reconcile.add_argument('path', help='CSV or XLSX settlement statement')
+    reconcile.add_argument('--format', choices=('csv', 'xlsx'), help='default: from the file extension')
+    reconcile.add_argument('--repair', action='store_true', help='complete settled deposits, fail stale pending ones')
+    reconcile.add_argument('--report', help='CSV report path (default: under RECONCILE_DIR)')
+    reconcile.add_argument('--window', type=int, help='seconds between a deposit and its settlement '
+                                                      '(default: RECONCILE_WINDOW)')
+    commands.add_parser('callbacks', help='apply the M-Pesa callbacks still waiting in the inbox')
+    tenants = commands.add_parser('tenants', help='list the tenants, or add or change one')
+    tenants.add_argument('slug', nargs='?', help='tenant to add or change')
+    tenants.add_argument('--name')
+    tenants.add_argument('--host', help='hostname its members use')
+    tenants.add_argument('--database-uri', help='a database of its own (migrate it first)')
+    tenants.add_argument('--set', action='append', metavar='KEY=VALUE', help='override a setting for the tenant')
+    replica = commands.add_parser('replicas', help='show the read replicas\' lag, or keep SQLite replicas in sync')
+    replica.add_argument('--sync', action='store_true', help='copy the (SQLite) primary into the SQLite replicas')
+    replica.add_argument('--once', action='store_true', help='with --sync: copy once and exit')
+    args = parser.parse_args(argv)
+
+    with app.app_context():
+        if args.command == 'tenants':
+            if args.slug is None:
+                print_tenants()
+                return 0
+            return edit_tenant(args)
+        if args.command == 'replicas':
+            if args.sync:
+                return sync_replicas(args.once)
+            print_replicas(replicas.check())
+            return 0
+        try:
+            targets = tenants_for(args.command, args.tenant)
+        except LookupError as exc:
+            print(f"error: {exc}", file=sys.stderr)
+            return 1
+    code = 0
+    for tenant in targets:
+        if len(targets) > 1:
+            print(f"[{tenant.slug if tenant else 'main database'}]", flush=True)
+        with tenant_context(tenant):
+            code = max(code, run(args))
+    return code
+
+
+def run(args):
+    progress = None if args.quiet else print_progress
+
+    if args.command == 'mail':
+        try:
+            mail_dispatcher.run_forever()
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    if args.command == 'search':
+        with app.app_context():
+            index_progress = None if args.quiet else print_index_progress
+            rows = search_indexer.rebuild(index_progress) if args.rebuild else search_indexer.sync(index_progress)
+            print(f"search index: {rows} rows indexed")
+        if not args.once:
+            try:
+                search_indexer.run_forever()
+            except KeyboardInterrupt:
+                pass
+        return 0
+
+    with app.app_context():
+        if args.command == 'status':
+            print_status()
+            return 0
+        if args.command == 'archive':
+            started = time.perf_counter()
+            moved = archive_all(args.batch_size, None if args.quiet else print_archive_progress)
+            print(f"archive: {moved['messages']} messages, {moved['notifications']} notifications "
+                  f"in {time.perf_counter() - started:.2f} s")
+            return 0
+        if args.command == 'eligibility':
+            result = rebuild_profiles(args.chunk_size, None if args.quiet else print_eligibility_progress)
+            print(f"eligibility: {result['profiles']} profiles for {result['members']} members "
+                  f"in {result['elapsed']:.2f} s")
+            return 0
+        if args.command == 'import':
+            rejects = open(args.rejects, 'w', newline='') if args.rejects else None
+            try:
+                result = import_statement(args.path, args.format, args.group, args.dry_run, args.chunk_size,
+                                          csv.writer(rejects) if rejects else None,
+                                          progress=None if args.quiet else print_import_progress)
+            except (JobConflict, StatementError, OSError) as exc:
+                print(f"error: {exc}", file=sys.stderr)
+                return 1
+            finally:
+                if rejects:
+                    rejects.close()
+            print_import_summary(result)
+            return 0
+        if args.command == 'callbacks':
+            changed = SavingsService.apply_payment_callbacks()
+            print(f"callbacks: {changed} deposits settled")
+            return 0
+        if args.command == 'reconcile':
+            try:
+                result = reconcile_statement(args.path, args.format, args.repair, args.report, args.window)
+            except (StatementError, OSError) as exc:
+                print(f"error: {exc}", file=sys.stderr)
+                return 1
+            print_reconcile_summary(result)
+            return 0
+        try:
+            if args.command == 'interest':
+                result = accrue_interest(args.period, args.chunk_size, progress)
+            else:
+                result = distribute_dividends(args.pool, args.period, args.chunk_size, progress)
+        except (JobConflict, ValueError) as exc:
+            print(f"error: {exc}", file=sys.stderr)
+            return 1
+        print_summary(result)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
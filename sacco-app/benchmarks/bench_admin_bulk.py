@@ -0,0 +1,123 @@
+"""Benchmark clearing the admin approval queues one item at a time versus in bulk.
+
+Seeds ``--pending`` pending loan requests and membership requests, then:
+
+* per item: one POST to ``/admin/approve_loan/<id>`` per request (the old flow);
+* bulk: one POST of the selected ids to ``/admin/loan_requests/approve``;
+* filter: one POST approving every pending request under an amount.
+
+Reports requests cleared per second, the queue page time and checks that
+every decided request produced exactly one member notification.
+
+Usage (from the sacco-app directory):
+
+    python benchmarks/bench_admin_bulk.py --pending 2000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_tmpdir = tempfile.mkdtemp(prefix='sacco-bench-')
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(_tmpdir, 'bench.db')}")
+
+from sqlalchemy import delete, func, insert, select  # noqa: E402
+
+from app import app, db, task_queue  # noqa: E402
+from app.models import LoanRequest, MembershipRequest, Notification, User  # noqa: E402
+
+app.config['WTF_CSRF_ENABLED'] = False
+
+
+def seed(pending):
+    db.session.execute(insert(User), [{'username': 'admin', 'email': 'admin@example.com', 'password': 'x',
+                                       'role': 'admin'}] +
+                       [{'username': f'm{i}', 'email': f'm{i}@example.com', 'password': 'x'} for i in range(pending)])
+    reset(pending)
+
+
+def reset(pending):
+    db.session.execute(delete(LoanRequest))
+    db.session.execute(delete(MembershipRequest))
+    db.session.execute(delete(Notification))
+    db.session.execute(insert(LoanRequest), [
+        {'member_id': 2 + i, 'amount': 1000 + (i % 50) * 100, 'total_repayment': 1050 + (i % 50) * 105,
+         'status': 'pending'} for i in range(pending)])
+    db.session.execute(insert(MembershipRequest), [{'user_id': 2 + i, 'status': 'pending'} for i in range(pending)])
+    db.session.commit()
+
+
+def admin_client():
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = '1'
+        session['_fresh'] = True
+    return client
+
+
+def pending_ids(model):
+    with app.app_context():
+        return db.session.execute(select(model.id).where(model.status == 'pending').order_by(model.id)).scalars().all()
+
+
+def notification_count():
+    task_queue.join()
+    with app.app_context():
+        return db.session.execute(select(func.count(Notification.id))).scalar()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pending', type=int, default=2000)
+    args = parser.parse_args()
+
+    with app.app_context():
+        db.create_all()
+        seed(args.pending)
+    client = admin_client()
+
+    start = time.perf_counter()
+    for _ in range(20):
+        assert client.get('/admin/approve_loans').status_code == 200
+    print(f"queue page ({args.pending} pending): {(time.perf_counter() - start) / 20 * 1000:.1f} ms")
+
+    ids = pending_ids(LoanRequest)
+    start = time.perf_counter()
+    for loan_id in ids:
+        assert client.post(f'/admin/approve_loan/{loan_id}').status_code == 302
+    per_item = time.perf_counter() - start
+    print(f"per item  {len(ids) / per_item:8.0f} requests/s  ({per_item:.2f} s, {len(ids)} POSTs, "
+          f"{notification_count()} notifications)")
+
+    with app.app_context():
+        reset(args.pending)
+    ids = pending_ids(LoanRequest)
+    start = time.perf_counter()
+    response = client.post('/admin/loan_requests/approve', json={'ids': ids + [10 ** 9]})
+    bulk = time.perf_counter() - start
+    results = response.get_json()['results']
+    print(f"bulk ids  {len(ids) / bulk:8.0f} requests/s  ({bulk:.3f} s, 1 POST, {response.get_json()['updated']} "
+          f"approved, unknown id -> {results[str(10 ** 9)]}, {notification_count()} notifications)")
+    again = client.post('/admin/loan_requests/approve', json={'ids': ids[:3]}).get_json()['results']
+    print(f"  repeated decision -> {sorted(set(again.values()))}")
+
+    with app.app_context():
+        reset(args.pending)
+    start = time.perf_counter()
+    response = client.post('/admin/loan_requests/approve', json={'all': True, 'max_amount': 3000})
+    matching = time.perf_counter() - start
+    print(f"filter    {response.get_json()['updated']} requests <= 3000 approved in {matching:.3f} s, "
+          f"{len(pending_ids(LoanRequest))} left pending")
+
+    ids = pending_ids(MembershipRequest)
+    start = time.perf_counter()
+    response = client.post('/admin/membership_requests/admit', data={'ids': ids})
+    print(f"members   {len(ids)} admitted from the form in {time.perf_counter() - start:.3f} s "
+          f"(status {response.status_code}), {len(pending_ids(MembershipRequest))} left pending")
+
+
+if __name__ == '__main__':
+    main()
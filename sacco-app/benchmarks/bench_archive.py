@@ -0,0 +1,176 @@
+"""Benchmark archival of old chat messages and read notifications.
+
+Seeds ``--messages`` chat messages and ``--notifications`` notifications spread
+over the last ``--days`` days, then:
+
+* measures the hot tables and their indexes (pages from ``dbstat``) and the
+  latency of first inbox and chat backlog pages;
+* runs the archive job while a writer thread keeps saving chat messages and
+  marking notifications read, and reports the archive rate and the writer's
+  worst commit latency (how long a batch holds the write lock);
+* measures the hot tables and first pages again.
+
+Both times it also scrolls 20 pages back through inboxes and chats, which
+after archiving falls through to the archive tables.
+
+Usage (from the sacco-app directory):
+
+    python benchmarks/bench_archive.py --messages 2000000 --notifications 1000000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_tmpdir = tempfile.mkdtemp(prefix='sacco-bench-')
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(_tmpdir, 'bench.db')}")
+os.environ.setdefault('MAIL_OUTBOX_WORKER', 'false')
+os.environ.setdefault('SEARCH_INDEX_WORKER', 'false')
+
+from sqlalchemy import insert, text  # noqa: E402
+
+from app import app, db  # noqa: E402
+from app.archive import archive_messages, archive_notifications  # noqa: E402
+from app.models import Group, Message, Notification, User, group_members  # noqa: E402
+from app.services import MessageService, NotificationService  # noqa: E402
+
+
+def seed(members, groups, messages, notifications, days, rng):
+    db.session.execute(insert(User), [{'id': i, 'username': f'member{i}', 'email': f'member{i}@example.com',
+                                       'password': 'x'} for i in range(1, members + 1)])
+    db.session.execute(insert(Group), [{'id': g, 'name': f'Group {g}', 'admin': 1} for g in range(1, groups + 1)])
+    db.session.execute(insert(group_members), [{'user_id': u, 'group_id': (u % groups) + 1}
+                                               for u in range(1, members + 1)])
+    start = datetime.utcnow() - timedelta(days=days)
+    for model, count, row in (
+            (Message, messages, lambda n, ts: {'group_id': rng.randint(1, groups), 'user_id': rng.randint(1, members),
+                                               'content': f'message {n} about the next contribution', 'timestamp': ts}),
+            (Notification, notifications, lambda n, ts: {'user_id': rng.randint(1, members), 'is_read': rng.random() < 0.9,
+                                                         'message': f'notification {n}', 'timestamp': ts})):
+        step = days * 86400 / count
+        batch = []
+        for n in range(count):
+            batch.append(row(n, start + timedelta(seconds=n * step)))
+            if len(batch) == 50000:
+                db.session.execute(insert(model), batch)
+                batch = []
+        if batch:
+            db.session.execute(insert(model), batch)
+    db.session.commit()
+
+
+def table_pages(names):
+    """Pages used by each table together with its indexes."""
+    rows = db.session.execute(text("SELECT tbl_name, name FROM sqlite_master WHERE type IN ('table', 'index')")).all()
+    pages = {}
+    for table in names:
+        objects = [name for tbl, name in rows if tbl == table]
+        pages[table] = sum(db.session.execute(text("SELECT count(*) FROM dbstat WHERE name = :name"),
+                                              {'name': name}).scalar() for name in objects)
+    return pages
+
+
+def timed(label, calls):
+    latencies = []
+    for call in calls:
+        start = time.perf_counter()
+        call()
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    print(f"  {label:<34} p50 {statistics.median(latencies) * 1000:6.2f} ms  "
+          f"p95 {latencies[int(len(latencies) * 0.95)] * 1000:6.2f} ms")
+
+
+def report(label, members, groups, rng, queries):
+    page_size = db.session.execute(text('PRAGMA page_size')).scalar()
+    pages = table_pages(['message', 'notification', 'message_archive', 'notification_archive'])
+    print(f"{label}: " + ', '.join(f"{table} {n * page_size / 2 ** 20:.1f} MiB" for table, n in pages.items()))
+    timed('inbox, first page', [lambda u=rng.randint(1, members): NotificationService.get_inbox(u)
+                                for _ in range(queries)])
+    timed('chat backlog, first page', [lambda g=rng.randint(1, groups): MessageService.get_backlog(g)
+                                       for _ in range(queries)])
+
+
+def deep_pages(members, groups, rng, queries):
+    """Scroll 20 pages back: the later pages come from the archive."""
+    def inbox(user_id):
+        before = None
+        for _ in range(20):
+            _, before = NotificationService.get_inbox(user_id, before=before)
+
+    def backlog(group_id):
+        before = None
+        for _ in range(20):
+            _, before = MessageService.get_backlog(group_id, before_id=before)
+
+    timed('inbox, 20 pages back', [lambda u=rng.randint(1, members): inbox(u) for _ in range(queries // 10)])
+    timed('chat backlog, 20 pages back', [lambda g=rng.randint(1, groups): backlog(g) for _ in range(queries // 10)])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=2000000)
+    parser.add_argument('--notifications', type=int, default=1000000)
+    parser.add_argument('--members', type=int, default=20000)
+    parser.add_argument('--groups', type=int, default=2000)
+    parser.add_argument('--days', type=int, default=730, help='history spread over this many days')
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    with app.app_context():
+        db.create_all()
+        start = time.perf_counter()
+        seed(args.members, args.groups, args.messages, args.notifications, args.days, rng)
+        print(f"seeded {args.messages} messages and {args.notifications} notifications over {args.days} days "
+              f"in {time.perf_counter() - start:.0f} s")
+        print(f"archiving messages older than {app.config['ARCHIVE_MESSAGES_AFTER_DAYS']} days and read "
+              f"notifications older than {app.config['ARCHIVE_NOTIFICATIONS_AFTER_DAYS']} days")
+        report('before', args.members, args.groups, rng, args.queries)
+        deep_pages(args.members, args.groups, rng, args.queries)
+
+    # A member keeps chatting and reading notifications while the archive job runs
+    stop = threading.Event()
+    commits = []
+
+    def writer():
+        with app.app_context():
+            while not stop.is_set():
+                start = time.perf_counter()
+                MessageService.save_messages([Message(user_id=1, group_id=1, content='live message')])
+                NotificationService.mark_read(rng.randint(1, args.members))
+                commits.append(time.perf_counter() - start)
+                time.sleep(0.005)
+            db.session.remove()
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    with app.app_context():
+        start = time.perf_counter()
+        messages = archive_messages(args.batch_size)
+        notifications = archive_notifications(args.batch_size)
+        elapsed = time.perf_counter() - start
+    stop.set()
+    thread.join()
+    commits.sort()
+    print(f"archived {messages} messages and {notifications} notifications in {elapsed:.1f} s "
+          f"({(messages + notifications) / elapsed:.0f} rows/s, batches of {args.batch_size})")
+    print(f"  live writer meanwhile: {len(commits)} commits, p50 {statistics.median(commits) * 1000:.1f} ms, "
+          f"p99 {commits[int(len(commits) * 0.99)] * 1000:.1f} ms, max {commits[-1] * 1000:.1f} ms")
+
+    with app.app_context():
+        report('after', args.members, args.groups, rng, args.queries)
+        deep_pages(args.members, args.groups, rng, args.queries)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+"""Time the month-end batch jobs and check they are restartable under live traffic.
+
+Seeds ``--members`` members with savings and (for a share of them) approved
+loans, then runs interest accrual and dividend distribution while a
+background thread keeps posting deposits and repayments. Each job is interrupted after a few
+slices and resumed, to show checkpoints apply every member exactly once.
+Reports rows/sec per job and checks the ledger against the balance snapshots.
+
+Usage (from the sacco-app directory):
+
+    python benchmarks/bench_batch_jobs.py --members 100000 --chunk-size 1000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_tmpdir = tempfile.mkdtemp(prefix='sacco-bench-')
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(_tmpdir, 'bench.db')}")
+
+from sqlalchemy import func, insert, select  # noqa: E402
+
+from app import app, db  # noqa: E402
+from app.jobs import accrue_interest, distribute_dividends  # noqa: E402
+from app.models import Group, JobRun, LedgerEntry, Loan, MemberBalance, User  # noqa: E402
+from app.services import LedgerError, LedgerService  # noqa: E402
+
+
+class Interrupted(Exception):
+    pass
+
+
+def seed(members, borrowers):
+    rng = random.Random(11)
+    db.session.execute(insert(User), [
+        {'username': f'job{i}', 'email': f'job{i}@example.com', 'password': 'x'} for i in range(members)
+    ])
+    db.session.execute(insert(Group), [{'id': 1, 'name': 'Job savers', 'admin': 1}])
+    loans = [{'id': n, 'borrower_id': i, 'group_id': 1, 'amount': rng.choice([5000, 10000, 50000]),
+              'interest_rate': rng.choice([5.0, 10.0, 12.0]), 'repayment_period': rng.choice([6, 12, 24]),
+              'status': 'approved', 'approved_at': datetime(2026, 9, 1)}
+             for n, i in enumerate(rng.sample(range(1, members + 1), int(members * borrowers)), 1)]
+    db.session.execute(insert(Loan), loans)
+    postings = [(i, 'deposit', rng.randint(100, 50000), 'seed') for i in range(1, members + 1)]
+    postings += [(loan['borrower_id'], 'loan_disbursement', loan['amount'], loan['id']) for loan in loans]
+    for start in range(0, len(postings), 20000):
+        LedgerService.post_many(postings[start:start + 20000])
+
+
+def live_traffic(members, stop, counts):
+    """Post deposits and repayments from another connection until ``stop`` is set."""
+    rng = random.Random(5)
+    with app.app_context():
+        while not stop.is_set():
+            member_id = rng.randint(1, members)
+            try:
+                if rng.random() < 0.5:
+                    LedgerService.post(member_id, 'deposit', rng.randint(10, 500))
+                else:
+                    LedgerService.post(member_id, 'loan_repayment', rng.randint(10, 100))
+                counts['posted'] += 1
+            except LedgerError:
+                db.session.rollback()  # No loan to repay
+            time.sleep(0.001)
+
+
+def run_with_restart(job, interrupt_after, **kwargs):
+    """Run ``job``, kill it after ``interrupt_after`` slices, then resume it."""
+    def stop_early(run, rows, elapsed):
+        stop_early.slices += 1
+        if stop_early.slices >= interrupt_after:
+            raise Interrupted()
+    stop_early.slices = 0
+
+    try:
+        job(progress=stop_early, **kwargs)
+    except Interrupted:
+        pass
+    first = JobRun.query.order_by(JobRun.id.desc()).first()
+    print(f"  interrupted at member {first.cursor} ({first.rows_processed} rows, status {first.status})")
+    return job(**kwargs)
+
+
+def check_snapshots():
+    """Members whose snapshot disagrees with their latest ledger entry."""
+    latest = select(func.max(LedgerEntry.id).label('id')).group_by(LedgerEntry.member_id).subquery()
+    rows = db.session.execute(
+        select(func.count()).select_from(LedgerEntry)
+        .join(latest, LedgerEntry.id == latest.c.id)
+        .join(MemberBalance, MemberBalance.member_id == LedgerEntry.member_id)
+        .where((MemberBalance.loan_cents != LedgerEntry.loan_after_cents)
+               | (MemberBalance.savings_cents != LedgerEntry.savings_after_cents))
+    ).scalar()
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--members', type=int, default=100000)
+    parser.add_argument('--borrowers', type=float, default=0.4, help='share of members with a loan')
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    parser.add_argument('--pool', default='1000000.00')
+    args = parser.parse_args()
+
+    with app.app_context():
+        db.create_all()
+        start = time.perf_counter()
+        seed(args.members, args.borrowers)
+        print(f"seeded {args.members} members in {time.perf_counter() - start:.1f} s")
+
+    stop = threading.Event()
+    counts = {'posted': 0}
+    traffic = threading.Thread(target=live_traffic, args=(args.members, stop, counts), daemon=True)
+    traffic.start()
+
+    with app.app_context():
+        for label, job, kwargs in (
+            ('interest', accrue_interest, {'period': '2026-10'}),
+            ('dividends', distribute_dividends, {'period': '2026', 'pool': args.pool}),
+        ):
+            print(f"{label}:")
+            result = run_with_restart(job, 5, chunk_size=args.chunk_size, **kwargs)
+            run = JobRun.query.filter_by(job=result['job'], period=result['period']).one()
+            print(f"  resumed: {result['rows']} rows in {result['elapsed']:.2f} s "
+                  f"({result['rows_per_second']:.0f} rows/s), run total {run.rows_processed} rows")
+            again = job(chunk_size=args.chunk_size, **kwargs)
+            print(f"  re-run of completed job applied {again['rows']} rows")
+
+    stop.set()
+    traffic.join()
+
+    with app.app_context():
+        borrowers_charged = db.session.execute(
+            select(func.count(func.distinct(LedgerEntry.member_id))).where(LedgerEntry.entry_type == 'interest_accrual')
+        ).scalar()
+        interest_rows = LedgerEntry.query.filter_by(entry_type='interest_accrual').count()
+        dividend_cents = db.session.execute(
+            select(func.sum(LedgerEntry.amount_cents)).where(LedgerEntry.entry_type == 'dividend')
+        ).scalar()
+        earnings = db.session.execute(select(func.sum(User.earnings))).scalar()
+        pool = JobRun.query.filter_by(job='dividend').one().params['pool_cents']
+        print(f"live postings during jobs  {counts['posted']}")
+        print(f"interest entries           {interest_rows} for {borrowers_charged} borrowers (duplicates: "
+              f"{interest_rows - borrowers_charged})")
+        print(f"dividends paid             {dividend_cents / 100:.2f} of {pool / 100:.2f} "
+              f"(earnings credited {earnings:.2f})")
+        print(f"snapshot mismatches        {check_snapshots()}")
+
+
+if __name__ == '__main__':
+    main()
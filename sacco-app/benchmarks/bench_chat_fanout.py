@@ -0,0 +1,96 @@
+"""Measure group chat fan-out with many simulated Socket.IO clients.
+
+Connects ``--clients`` authenticated Socket.IO test clients spread evenly
+over ``--groups`` group rooms, sends ``--messages`` chat messages from random
+members and reports the delivery rate, checks that no message leaked outside
+its room, and waits for the batched persistence to catch up.
+
+Usage (from the sacco-app directory):
+
+    python benchmarks/bench_chat_fanout.py --clients 5000 --groups 500 --messages 5000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_tmpdir = tempfile.mkdtemp(prefix='sacco-bench-')
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(_tmpdir, 'bench.db')}")
+
+from sqlalchemy import func, insert  # noqa: E402
+
+from app import app, db, socketio  # noqa: E402
+from app.models import Group, Message, User, group_members  # noqa: E402
+from app.views.chat import chat_messages  # noqa: E402
+
+
+def seed(clients, groups):
+    db.session.execute(insert(User), [
+        {'username': f'chat{i}', 'email': f'chat{i}@example.com', 'password': 'x'} for i in range(clients)
+    ])
+    user_ids = [row.id for row in User.query.with_entities(User.id).order_by(User.id)]
+    db.session.execute(insert(Group), [
+        {'name': f'Group {g}', 'description': '', 'admin': user_ids[g]} for g in range(groups)
+    ])
+    group_ids = [row.id for row in Group.query.with_entities(Group.id).order_by(Group.id)]
+    membership = [(user_ids[i], group_ids[i % groups]) for i in range(clients)]
+    db.session.execute(insert(group_members), [{'user_id': u, 'group_id': g} for u, g in membership])
+    db.session.commit()
+    return membership
+
+
+def connect(user_id, group_id):
+    http_client = app.test_client()
+    with http_client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+        session['_fresh'] = True
+    client = socketio.test_client(app, namespace='/chat', flask_test_client=http_client)
+    client.emit('join', {'group_id': group_id}, namespace='/chat')
+    client.get_received('/chat')  # discard the join backlog
+    return client
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', type=int, default=5000)
+    parser.add_argument('--groups', type=int, default=500)
+    parser.add_argument('--messages', type=int, default=5000)
+    args = parser.parse_args()
+
+    with app.app_context():
+        db.create_all()
+        membership = seed(args.clients, args.groups)
+
+    start = time.perf_counter()
+    clients = [(connect(user_id, group_id), group_id) for user_id, group_id in membership]
+    print(f"connected {len(clients)} clients to {args.groups} rooms in {time.perf_counter() - start:.1f} s")
+
+    rng = random.Random(7)
+    start = time.perf_counter()
+    for n in range(args.messages):
+        client, group_id = rng.choice(clients)
+        client.emit('message', {'group_id': group_id, 'content': f'msg {n}'}, namespace='/chat')
+    elapsed = time.perf_counter() - start
+
+    delivered = leaked = 0
+    for client, group_id in clients:
+        for packet in client.get_received('/chat'):
+            delivered += 1
+            if packet['args']['group_id'] != group_id:
+                leaked += 1
+    print(f"sent {args.messages} messages in {elapsed:.2f} s ({args.messages / elapsed:.0f} msg/s)")
+    print(f"delivered {delivered} copies ({delivered / elapsed:.0f} deliveries/s), leaked across rooms: {leaked}")
+
+    start = time.perf_counter()
+    chat_messages.join()
+    with app.app_context():
+        persisted = db.session.query(func.count(Message.id)).scalar()
+    print(f"persisted {persisted} messages (waited {time.perf_counter() - start:.2f} s for the last batch)")
+
+
+if __name__ == '__main__':
+    main()
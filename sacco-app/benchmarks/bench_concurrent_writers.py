@@ -0,0 +1,139 @@
+"""Compare SQLite throughput with concurrent writers, with and without WAL.
+
+Each mode runs in a fresh process tree (the engine is configured at
+start-up): ``--writers`` worker processes post deposits and withdrawals
+through ``LedgerService.post`` while ``--readers`` processes page through
+balances and ledger history, all for ``--seconds``, much like several web
+workers sharing one SQLite file. Reports committed writes/s, reads/s,
+write latency and how many operations failed with "database is locked".
+
+Usage (from the sacco-app directory):
+
+    python benchmarks/bench_concurrent_writers.py --writers 4 --readers 4 --seconds 10
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MEMBERS = 2000
+
+
+def worker(role, seed, go, deadline, results):
+    """One web worker process: post writes or read pages until the deadline."""
+    import random
+    import time
+
+    from sqlalchemy.exc import OperationalError
+
+    from app import app, db
+    from app.services import LedgerError, LedgerService
+
+    rng = random.Random(seed)
+    latencies, done, locked = [], 0, 0
+    go.wait()
+    with app.app_context():
+        while time.time() < deadline.value:
+            member_id = rng.randint(1, MEMBERS)
+            start = time.perf_counter()
+            try:
+                if role == 'reader':
+                    LedgerService.get_balance(member_id)
+                    LedgerService.get_history(member_id, limit=20)
+                    db.session.rollback()  # End the read transaction, as a request would
+                elif rng.random() < 0.8:
+                    LedgerService.post(member_id, 'deposit', rng.randint(10, 500))
+                else:
+                    LedgerService.post(member_id, 'withdrawal', rng.randint(10, 100))
+                done += 1
+                latencies.append(time.perf_counter() - start)
+            except LedgerError:
+                db.session.rollback()
+            except OperationalError:
+                db.session.rollback()
+                locked += 1
+    results.put((role, done, locked, latencies))
+
+
+def run_mode(args):
+    """Body of one measurement; runs inside the child process."""
+    import multiprocessing
+    import statistics
+    import time
+
+    sys.path.insert(0, ROOT)
+    from sqlalchemy import insert
+
+    from app import app, db
+    from app.models import User
+    from app.services import LedgerService
+
+    with app.app_context():
+        db.create_all()
+        db.session.execute(insert(User), [
+            {'username': f'w{i}', 'email': f'w{i}@example.com', 'password': 'x'} for i in range(MEMBERS)
+        ])
+        LedgerService.post_many([(i, 'deposit', 1000, 'seed') for i in range(1, MEMBERS + 1)])
+        journal_mode = db.session.execute(db.text('PRAGMA journal_mode')).scalar()
+        db.session.remove()
+        db.engine.dispose()  # Each forked worker opens its own connections
+
+    context = multiprocessing.get_context('fork')
+    go, deadline, results = context.Event(), context.Value('d', 0.0), context.Queue()
+    roles = ['writer'] * args.writers + ['reader'] * args.readers
+    processes = [context.Process(target=worker, args=(role, n, go, deadline, results)) for n, role in enumerate(roles)]
+    for process in processes:
+        process.start()
+    deadline.value = time.time() + args.seconds
+    go.set()
+    totals = {'writer': 0, 'reader': 0}
+    locked, write_latencies = 0, []
+    for _ in processes:
+        role, done, role_locked, latencies = results.get()
+        totals[role] += done
+        locked += role_locked
+        if role == 'writer':
+            write_latencies += latencies
+    for process in processes:
+        process.join()
+
+    write_latencies = sorted(write_latencies) or [0.0]
+    print(json.dumps({
+        'journal_mode': journal_mode,
+        'writes_per_s': totals['writer'] / args.seconds,
+        'reads_per_s': totals['reader'] / args.seconds,
+        'p50_ms': statistics.median(write_latencies) * 1000,
+        'p99_ms': write_latencies[int(len(write_latencies) * 0.99)] * 1000,
+        'locked': locked,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        run_mode(args)
+        return
+
+    for label, wal in (('rollback journal', 'false'), ('WAL + pragmas', 'true')):
+        tmpdir = tempfile.mkdtemp(prefix='sacco-bench-')
+        env = dict(os.environ, SQLITE_WAL=wal, DATABASE_URL=f"sqlite:///{os.path.join(tmpdir, 'bench.db')}")
+        output = subprocess.run(
+            [sys.executable, '-W', 'ignore', os.path.abspath(__file__), '--child', '--writers', str(args.writers),
+             '--readers', str(args.readers), '--seconds', str(args.seconds)],
+            env=env, check=True, capture_output=True, text=True
+        ).stdout
+        r = json.loads(output.strip().splitlines()[-1])
+        print(f"{label:<17} ({r['journal_mode']:>6}): {r['writes_per_s']:7.0f} writes/s  {r['reads_per_s']:7.0f} reads/s  "
+              f"write p50 {r['p50_ms']:6.1f} ms  p99 {r['p99_ms']:7.1f} ms  locked errors {r['locked']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,201 @@
+"""Benchmark loan eligibility: credit profiles against per-request aggregate scans.
+
+Seeds ``--members`` members with savings, approved loans and a history of
+repayments in the ledger, builds the credit profiles with the rebuild job,
+then compares, for single members and for loan-queue pages of ``--page``
+requests:
+
+* scan - what deciding by hand needed: savings and exposure summed from the
+  ledger and loans, and every repayment replayed against its loan's schedule;
+* profile - ``LoanService.available_credit`` / ``available_credit_many``.
+
+Finally it posts ``--repayments`` live repayments through
+``LoanService.record_repayment`` and checks that the incrementally maintained
+profiles equal a fresh rebuild.
+
+Usage (from the sacco-app directory):
+
+    python benchmarks/bench_eligibility.py --members 20000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_tmpdir = tempfile.mkdtemp(prefix='sacco-bench-')
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(_tmpdir, 'bench.db')}")
+os.environ.setdefault('MAIL_OUTBOX_WORKER', 'false')
+os.environ.setdefault('SEARCH_INDEX_WORKER', 'false')
+
+from sqlalchemy import case, event, func, insert, select  # noqa: E402
+
+from app import app, db  # noqa: E402
+from app.eligibility import credit_limit, rebuild_profiles, repayment_on_time  # noqa: E402
+from app.models import CreditProfile, Group, LedgerEntry, Loan, MemberBalance, User  # noqa: E402
+from app.money import to_cents  # noqa: E402
+from app.services import LoanService  # noqa: E402
+
+
+def seed(members, loans_per_member, rng):
+    db.session.execute(insert(User), [{'id': i, 'username': f'member{i}', 'email': f'member{i}@example.com',
+                                       'password': 'x'} for i in range(1, members + 1)])
+    db.session.execute(insert(Group), [{'id': 1, 'name': 'Group', 'description': '', 'admin': 1}])
+    now = datetime.utcnow()
+    balances, loans, entries = [], [], []
+    loan_id = 0
+    for member_id in range(1, members + 1):
+        savings_cents = rng.randint(0, 5 * 10 ** 7)
+        entries.append({'member_id': member_id, 'entry_type': 'deposit', 'amount_cents': savings_cents,
+                        'savings_after_cents': savings_cents, 'loan_after_cents': 0, 'reference': None,
+                        'created_at': now - timedelta(days=800)})
+        owed = 0
+        for _ in range(rng.randint(0, loans_per_member)):
+            loan_id += 1
+            amount = rng.choice([5000, 10000, 20000, 50000])
+            period = rng.choice([6, 12, 24])
+            approved = now - timedelta(days=rng.randint(30, 720))
+            due_cents = to_cents(amount * 1.1)
+            instalment = due_cents // period
+            paid = 0
+            punctual = rng.random() < 0.8
+            for month in range(1, period + 1):
+                at = approved + timedelta(days=30 * month + (2 if punctual or rng.random() < 0.7 else 45))
+                if at >= now:
+                    break
+                paid += instalment
+                entries.append({'member_id': member_id, 'entry_type': 'loan_repayment', 'amount_cents': instalment,
+                                'savings_after_cents': savings_cents, 'loan_after_cents': 0,
+                                'reference': str(loan_id), 'created_at': at})
+            loans.append({'id': loan_id, 'borrower_id': member_id, 'group_id': 1, 'amount': amount,
+                          'interest_rate': 10.0, 'repayment_period': period, 'status': 'approved',
+                          'requested_at': approved, 'approved_at': approved, 'total_paid': paid / 100})
+            owed += due_cents - paid
+        balances.append({'member_id': member_id, 'savings_cents': savings_cents, 'loan_cents': owed,
+                         'updated_at': now})
+    db.session.execute(insert(MemberBalance), balances)
+    db.session.execute(insert(Loan), loans)
+    entries.sort(key=lambda entry: entry['created_at'])
+    db.session.execute(insert(LedgerEntry), entries)
+    db.session.commit()
+    return loan_id, len(entries)
+
+
+def scan_credit(member_id):
+    """The profile computed from history, as a manual review would."""
+    savings_cents = db.session.execute(
+        select(func.coalesce(func.sum(case(
+            (LedgerEntry.entry_type == 'deposit', LedgerEntry.amount_cents),
+            (LedgerEntry.entry_type == 'withdrawal', -LedgerEntry.amount_cents), else_=0)), 0))
+        .where(LedgerEntry.member_id == member_id)
+    ).scalar()
+    loans = db.session.execute(
+        select(Loan.id, Loan.amount, Loan.interest_rate, Loan.repayment_period, Loan.approved_at, Loan.total_paid)
+        .where(Loan.borrower_id == member_id, Loan.status == 'approved')
+    ).all()
+    exposure_cents = sum(max(to_cents(loan.amount * (1 + loan.interest_rate / 100)) - to_cents(loan.total_paid), 0)
+                         for loan in loans)
+    repayments = on_time = 0
+    by_id = {str(loan.id): loan for loan in loans}
+    paid = {}
+    for reference, cents, at in db.session.execute(
+        select(LedgerEntry.reference, LedgerEntry.amount_cents, LedgerEntry.created_at)
+        .where(LedgerEntry.member_id == member_id, LedgerEntry.entry_type == 'loan_repayment')
+        .order_by(LedgerEntry.id)
+    ):
+        loan = by_id[reference]
+        paid[reference] = paid.get(reference, 0) + cents
+        repayments += 1
+        on_time += repayment_on_time(to_cents(loan.amount * (1 + loan.interest_rate / 100)), loan.repayment_period,
+                                     loan.approved_at, paid[reference], at)
+    return credit_limit(savings_cents, exposure_cents, repayments, on_time)
+
+
+class Counter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, *args):
+        self.count += 1
+
+
+def timed(label, calls, counter):
+    latencies, queries = [], []
+    for call in calls:
+        db.session.expunge_all()
+        counter.count = 0
+        start = time.perf_counter()
+        call()
+        latencies.append(time.perf_counter() - start)
+        queries.append(counter.count)
+    latencies.sort()
+    print(f"  {label:<24} p50 {statistics.median(latencies) * 1000:7.2f} ms  "
+          f"p95 {latencies[int(len(latencies) * 0.95)] * 1000:7.2f} ms  SQL/call {sum(queries) / len(queries):5.1f}")
+
+
+def profiles():
+    return {row.member_id: (row.repayments, row.on_time_repayments)
+            for row in db.session.execute(select(CreditProfile.member_id, CreditProfile.repayments,
+                                                 CreditProfile.on_time_repayments))}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--members', type=int, default=20000)
+    parser.add_argument('--loans', type=int, default=3, help='maximum loans per member')
+    parser.add_argument('--samples', type=int, default=300)
+    parser.add_argument('--page', type=int, default=20, help='loan requests per queue page')
+    parser.add_argument('--repayments', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=11)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    with app.app_context():
+        db.create_all()
+        start = time.perf_counter()
+        loan_count, entry_count = seed(args.members, args.loans, rng)
+        print(f"seeded {args.members} members, {loan_count} loans and {entry_count} ledger entries "
+              f"in {time.perf_counter() - start:.1f} s")
+
+        result = rebuild_profiles()
+        print(f"rebuild: {result['profiles']} profiles for {result['members']} members in "
+              f"{result['elapsed']:.2f} s ({result['members'] / result['elapsed']:.0f} members/s)")
+
+        counter = Counter()
+        event.listen(db.engine, 'before_cursor_execute', counter)
+        members = [rng.randint(1, args.members) for _ in range(args.samples)]
+        mismatched = sum(scan_credit(m)['available_cents'] != LoanService.available_credit(m)['available_cents']
+                         for m in members[:100])
+        print(f"profile vs scan: {mismatched} of 100 members differ")
+        print("single member:")
+        timed('scan', [lambda m=m: scan_credit(m) for m in members], counter)
+        timed('profile', [lambda m=m: LoanService.available_credit(m) for m in members], counter)
+        pages = [rng.sample(range(1, args.members + 1), args.page) for _ in range(max(args.samples // 10, 10))]
+        print(f"loan queue page ({args.page} members):")
+        timed('scan', [lambda p=p: [scan_credit(m) for m in p] for p in pages], counter)
+        timed('profile', [lambda p=p: LoanService.available_credit_many(p) for p in pages], counter)
+        event.remove(db.engine, 'before_cursor_execute', counter)
+
+        # Live repayments keep the profiles equal to a rebuild
+        open_loans = [loan for loan in db.session.execute(select(Loan)).scalars()
+                      if loan.calculate_total_due() - loan.total_paid >= loan.calculate_total_due() / loan.repayment_period]
+        loans = rng.sample(open_loans, min(args.repayments, len(open_loans)))
+        start = time.perf_counter()
+        for loan in loans:
+            LoanService.record_repayment(loan.id, round(loan.calculate_total_due() / loan.repayment_period / 2, 2))
+        elapsed = time.perf_counter() - start
+        incremental = profiles()
+        rebuild_profiles()
+        rebuilt = profiles()
+        differ = sum(incremental.get(m) != rebuilt.get(m) for m in set(incremental) | set(rebuilt))
+        print(f"{len(loans)} live repayments in {elapsed:.2f} s; incremental vs rebuild: "
+              f"{differ} profiles differ")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+"""Benchmark streamed statement exports: rows/sec and peak RSS for a very long history.
+
+Seeds one member with ``--rows`` ledger entries (1M by default), then downloads
+``/exports/statement.csv`` and ``.xlsx`` in child processes, reading the
+response chunk by chunk, and reports rows/sec and how much the child's peak
+RSS grew. For comparison the ``naive`` child loads the same history with
+``.all()`` and writes the CSV in memory, as the old read paths did. Finally a
+small workbook is checked for well-formed sheets and a PDF statement is
+rendered through the process pool.
+
+Usage (from the sacco-app directory):
+
+    python benchmarks/bench_exports.py --rows 1000000
+"""
+import argparse
+import csv
+import io
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+from datetime import datetime, timedelta
+from xml.etree import ElementTree
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_tmpdir = tempfile.mkdtemp(prefix='sacco-bench-')
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(_tmpdir, 'bench.db')}")
+os.environ.setdefault('EXPORT_DIR', os.path.join(_tmpdir, 'exports'))
+
+from sqlalchemy import insert  # noqa: E402
+
+from app import app, db, pdf_exporter  # noqa: E402
+from app.models import LedgerEntry, User  # noqa: E402
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def seed(rows, member_id=1):
+    db.session.execute(insert(User), [{'username': f'auditee{i}', 'email': f'auditee{i}@example.com',
+                                       'password': 'x', 'role': 'admin' if i == 0 else 'member'} for i in range(2)])
+    start = datetime(2015, 1, 1)
+    savings = 0
+    batch = []
+    for n in range(rows):
+        cents = 1000 + (n % 97) * 100
+        savings += cents
+        batch.append({'member_id': member_id, 'entry_type': 'deposit', 'amount_cents': cents,
+                      'savings_after_cents': savings, 'loan_after_cents': 0, 'reference': f'MP{n:09d}',
+                      'created_at': start + timedelta(minutes=5 * n)})
+        if len(batch) == 50000:
+            db.session.execute(insert(LedgerEntry), batch)
+            batch = []
+    if batch:
+        db.session.execute(insert(LedgerEntry), batch)
+    db.session.commit()
+
+
+def logged_in_client(user_id=1):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+    return client
+
+
+def run_child(mode):
+    """Export in this (fresh) process and print rows/s, bytes and peak RSS growth."""
+    client = logged_in_client()
+    baseline = peak_rss_mb()
+    start = time.perf_counter()
+    size = 0
+    if mode == 'naive':
+        with app.app_context():
+            entries = LedgerEntry.query.filter_by(member_id=1).order_by(LedgerEntry.id).all()
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            for entry in entries:
+                writer.writerow([entry.created_at, entry.entry_type, entry.amount_cents / 100,
+                                 entry.savings_after_cents / 100, entry.loan_after_cents / 100, entry.reference])
+            size = len(buffer.getvalue().encode())
+            rows = len(entries)
+    else:
+        response = client.get(f'/exports/statement.{mode}', buffered=False)
+        assert response.status_code == 200, response.status_code
+        for chunk in response.response:
+            size += len(chunk)
+        response.close()
+        rows = None
+    elapsed = time.perf_counter() - start
+    print(f"{elapsed:.3f} {size} {peak_rss_mb() - baseline:.1f} {rows or 0}")
+
+
+def check_workbook(client):
+    data = client.get('/exports/statement.xlsx?member_id=1').get_data()
+    with zipfile.ZipFile(io.BytesIO(data)) as workbook:
+        sheets = sorted(name for name in workbook.namelist() if name.startswith('xl/worksheets/'))
+        ElementTree.fromstring(workbook.read('xl/workbook.xml'))
+        rows = sum(len(ElementTree.fromstring(workbook.read(name))[0]) for name in sheets)
+    return sheets, rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--child', choices=['csv', 'xlsx', 'naive'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child)
+        return
+
+    with app.app_context():
+        db.create_all()
+        start = time.perf_counter()
+        seed(args.rows)
+        print(f"seeded {args.rows} ledger entries in {time.perf_counter() - start:.1f} s")
+
+    for mode in ('csv', 'xlsx', 'naive'):
+        out = subprocess.run([sys.executable, __file__, '--child', mode], env=os.environ.copy(),
+                             capture_output=True, text=True, check=True).stdout.split()
+        elapsed, size, rss = float(out[-4]), int(out[-3]), float(out[-2])
+        label = {'csv': 'streamed CSV ', 'xlsx': 'streamed XLSX', 'naive': '.all() + CSV '}[mode]
+        print(f"  {label} {args.rows / elapsed:9.0f} rows/s  {elapsed:6.1f} s  {size / 2 ** 20:7.1f} MiB  "
+              f"peak RSS +{rss:.0f} MiB")
+
+    client = logged_in_client()
+    import app.exports as exports
+    exports.XLSX_MAX_ROWS = 1500  # Force sheet rollover on a small export
+    with app.app_context():
+        # Keep 4000 entries on member 1, one with markup that must be escaped
+        db.session.execute(LedgerEntry.__table__.update().where(LedgerEntry.member_id == 1,
+                                                                LedgerEntry.id > 4000).values(member_id=2))
+        db.session.execute(LedgerEntry.__table__.update().where(LedgerEntry.id == 1).values(reference='a & b <c>'))
+        db.session.commit()
+    sheets, rows = check_workbook(client)
+    print(f"workbook check: {len(sheets)} sheets, {rows} rows (4000 entries + 1 header per sheet) parsed OK")
+
+    start = time.perf_counter()
+    job = client.post('/exports/statement.pdf?member_id=1').get_json()
+    while True:
+        response = client.get(job['url'])
+        if response.status_code != 202:
+            break
+        time.sleep(0.05)
+    print(f"PDF statement: {response.status_code} {response.mimetype}, {len(response.data) // 1024} KiB "
+          f"in {time.perf_counter() - start:.2f} s (process pool, includes worker start-up)")
+    pdf_exporter.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+"""Benchmark bulk import of contributions from statement files.
+
+Seeds ``--members`` members with M-Pesa numbers and writes an M-Pesa-style
+statement of ``--rows`` rows (preamble, withdrawals and charges mixed in, a
+few rows naming unknown numbers) as CSV and as XLSX. Then:
+
+* one-at-a-time: ``SavingsService.deposit_savings`` for ``--baseline`` rows,
+  the only way to record a contribution before;
+* dry run and import of the CSV, with rows/sec and the growth of peak RSS;
+* an XLSX import that fails part-way (injected after ``--fail-after`` chunks)
+  and is resumed, then run a third time (a no-op);
+* checks: every credit row imported exactly once, and the savings balance
+  snapshots equal the deposits on file.
+
+Usage (from the sacco-app directory):
+
+    python benchmarks/bench_imports.py --rows 1000000
+"""
+import argparse
+import csv
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_tmpdir = tempfile.mkdtemp(prefix='sacco-bench-')
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(_tmpdir, 'bench.db')}")
+os.environ.setdefault('MAIL_OUTBOX_WORKER', 'false')
+os.environ.setdefault('SEARCH_INDEX_WORKER', 'false')
+os.environ.setdefault('NOTIFICATION_PUSH', 'false')
+
+from sqlalchemy import func, insert, select  # noqa: E402
+
+from app import app, db  # noqa: E402
+from app.exports import stream_xlsx  # noqa: E402
+from app.imports import import_statement  # noqa: E402
+from app.models import MemberBalance, Notification, Savings, User  # noqa: E402
+from app.services import SavingsService  # noqa: E402
+
+HEADERS = ('Receipt No.', 'Completion Time', 'Details', 'Transaction Status', 'Paid In', 'Withdrawn', 'Balance')
+
+
+def seed(members):
+    db.session.execute(insert(User), [{'id': i, 'username': f'member{i}', 'email': f'member{i}@example.com',
+                                       'phone_number': f'07{i:08d}', 'password': 'x'}
+                                      for i in range(1, members + 1)])
+    db.session.commit()
+
+
+def statement_rows(rows, members, prefix, rng):
+    """Statement lines and the number of credits among them that name a member."""
+    start = datetime(2026, 1, 1)
+    credits = 0
+    lines = []
+    for n in range(rows):
+        when = (start + timedelta(seconds=n * 20)).strftime('%Y-%m-%d %H:%M:%S')
+        roll = rng.random()
+        if roll < 0.05:
+            lines.append((f'{prefix}W{n:09d}', when, 'Withdrawal Charge', 'Completed', '', '33.00', ''))
+        elif roll < 0.06:
+            lines.append((f'{prefix}{n:010d}', when, '254799999999 - UNKNOWN PAYER', 'Completed', '500.00', '', ''))
+        else:
+            member = rng.randint(1, members)
+            lines.append((f'{prefix}{n:010d}', when, f'2547{member:08d} - MEMBER {member}', 'Completed',
+                          f'{rng.randint(1, 500) * 10}.00', '', ''))
+            credits += 1
+    return lines, credits
+
+
+def write_csv(path, lines):
+    with open(path, 'w', newline='') as handle:
+        writer = csv.writer(handle)
+        writer.writerow(['M-PESA STATEMENT'])
+        writer.writerow(['Customer Name:', 'SACCO TREASURER'])
+        writer.writerow([])
+        writer.writerow(HEADERS)
+        writer.writerows(lines)
+
+
+def write_xlsx(path, lines):
+    with open(path, 'wb') as handle:
+        for chunk in stream_xlsx(HEADERS, lines, sheet_name='Statement'):
+            handle.write(chunk)
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def report(label, result, rss_before):
+    print(f"  {label:<22} {result['rows']:>9} rows in {result['elapsed']:6.2f} s "
+          f"({result['rows_per_second']:>8.0f} rows/s)  imported {result['imported']}, "
+          f"duplicates {result['duplicates']}, not credits {result['skipped']}, rejected {result['rejected']}, "
+          f"peak RSS +{peak_rss_mb() - rss_before:.0f} MB")
+
+
+class Interrupted(Exception):
+    pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--members', type=int, default=20000)
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--baseline', type=int, default=2000, help='rows deposited one at a time')
+    parser.add_argument('--chunk-size', type=int)
+    parser.add_argument('--fail-after', type=int, default=3, help='chunks before the injected failure')
+    parser.add_argument('--seed', type=int, default=5)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    with app.app_context():
+        db.create_all()
+        seed(args.members)
+        csv_path, xlsx_path = os.path.join(_tmpdir, 'statement.csv'), os.path.join(_tmpdir, 'statement.xlsx')
+        lines, csv_credits = statement_rows(args.rows, args.members, 'QA', rng)
+        write_csv(csv_path, lines)
+        lines, xlsx_credits = statement_rows(args.rows, args.members, 'QB', rng)
+        write_xlsx(xlsx_path, lines)
+        del lines
+        print(f"statements: {args.rows} rows each, CSV {os.path.getsize(csv_path) / 1e6:.1f} MB, "
+              f"XLSX {os.path.getsize(xlsx_path) / 1e6:.1f} MB")
+
+        started = time.perf_counter()
+        for n in range(args.baseline):
+            SavingsService.deposit_savings(rng.randint(1, args.members), 100, transaction_id=f'BASE{n}')
+        elapsed = time.perf_counter() - started
+        print(f"  {'one at a time':<22} {args.baseline:>9} rows in {elapsed:6.2f} s "
+              f"({args.baseline / elapsed:>8.0f} rows/s)")
+
+        rss = peak_rss_mb()
+        report('CSV dry run', import_statement(csv_path, dry_run=True, chunk_size=args.chunk_size), rss)
+        rss = peak_rss_mb()
+        report('CSV import', import_statement(csv_path, chunk_size=args.chunk_size), rss)
+
+        chunks = 0
+
+        def fail(summary, elapsed):
+            nonlocal chunks
+            chunks += 1
+            if chunks == args.fail_after:
+                raise Interrupted()
+
+        rss = peak_rss_mb()
+        try:
+            import_statement(xlsx_path, chunk_size=args.chunk_size, progress=fail)
+        except Interrupted:
+            print(f"  XLSX import interrupted after {args.fail_after} chunks")
+        result = import_statement(xlsx_path, chunk_size=args.chunk_size)
+        report(f"XLSX resumed (row {result['resumed_from']})", result, rss)
+        report('XLSX again', import_statement(xlsx_path, chunk_size=args.chunk_size), rss)
+
+        imported = db.session.execute(select(func.count(Savings.id)).where(Savings.transaction_id.like('Q%'))).scalar()
+        deposits = db.session.execute(select(func.sum(Savings.amount))).scalar()
+        balances = db.session.execute(select(func.sum(MemberBalance.savings_cents))).scalar() / 100
+        notifications = db.session.execute(select(func.count(Notification.id))).scalar()
+        print(f"imported {imported} of {csv_credits + xlsx_credits} credits; {notifications} notifications; "
+              f"deposits {deposits:.2f} vs balances {balances:.2f}")
+
+
+if __name__ == '__main__':
+    main()
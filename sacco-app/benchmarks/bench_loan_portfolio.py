@@ -0,0 +1,88 @@
+"""Benchmark portfolio analytics over a large Loan table.
+
+Bulk-loads ``--loans`` approved loans, then times the vectorized
+``LoanService.portfolio_summary`` (load + aggregate) against a per-object
+loop over ``Loan`` ORM instances computing the same outstanding totals.
+
+Usage (from the sacco-app directory):
+
+    python benchmarks/bench_loan_portfolio.py --loans 100000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_tmpdir = tempfile.mkdtemp(prefix='sacco-bench-')
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(_tmpdir, 'bench.db')}")
+
+from sqlalchemy import insert  # noqa: E402
+
+from app import app, db  # noqa: E402
+from app.models import Group, Loan, User  # noqa: E402
+from app.services import LoanService  # noqa: E402
+
+
+def seed(loans, groups=200, members=5000):
+    rng = random.Random(3)
+    db.session.execute(insert(User), [
+        {'username': f'loan{i}', 'email': f'loan{i}@example.com', 'password': 'x'} for i in range(members)
+    ])
+    db.session.execute(insert(Group), [{'name': f'Group {g}', 'description': '', 'admin': 1} for g in range(groups)])
+    now = datetime.utcnow()
+    rows = []
+    for i in range(loans):
+        amount = rng.choice([5000, 10000, 20000, 50000, 100000])
+        period = rng.choice([3, 6, 12, 24])
+        approved = now - timedelta(days=rng.randint(0, 720))
+        due = amount * 1.1
+        rows.append({'borrower_id': rng.randint(1, members), 'group_id': rng.randint(1, groups), 'amount': amount,
+                     'interest_rate': 10.0, 'repayment_period': period, 'status': 'approved',
+                     'requested_at': approved, 'approved_at': approved,
+                     'total_paid': round(due * rng.random(), 2)})
+    db.session.execute(insert(Loan), rows)
+    db.session.commit()
+
+
+def per_object_summary():
+    outstanding = 0.0
+    exposure = {}
+    for loan in Loan.query.filter_by(status='approved').all():
+        remaining = max(loan.calculate_total_due() - loan.total_paid, 0.0)
+        outstanding += remaining
+        exposure[loan.group_id] = exposure.get(loan.group_id, 0.0) + remaining
+    return outstanding, exposure
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--loans', type=int, default=100000)
+    args = parser.parse_args()
+
+    with app.app_context():
+        db.create_all()
+        seed(args.loans)
+
+        for method in ('flat', 'reducing'):
+            db.session.expunge_all()
+            start = time.perf_counter()
+            summary = LoanService.portfolio_summary(method=method)
+            elapsed = time.perf_counter() - start
+            print(f"vectorized ({method:>8}): {elapsed * 1000:7.1f} ms  loans={summary['loan_count']} "
+                  f"outstanding={summary['outstanding']:.2f} arrears={summary['arrears']:.2f}")
+
+        db.session.expunge_all()
+        start = time.perf_counter()
+        outstanding, _ = per_object_summary()
+        elapsed = time.perf_counter() - start
+        print(f"per-object loop     : {elapsed * 1000:7.1f} ms  outstanding={outstanding:.2f} "
+              f"(outstanding and group exposure only)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""Benchmark meeting scheduling fan-out for groups of different sizes.
+
+Compares the old per-member ``add`` + ``commit`` loop against
+``GroupService.schedule_meeting`` (one bulk insert, one commit) and reports
+latency and the number of database commits for each group size.
+
+Usage (from the sacco-app directory):
+
+    python benchmarks/bench_meeting_fanout.py --sizes 10 1000 10000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import date, time as dtime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_tmpdir = tempfile.mkdtemp(prefix='sacco-bench-')
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(_tmpdir, 'bench.db')}")
+os.environ.setdefault('TASK_QUEUE_EAGER', 'true')
+
+from sqlalchemy import event, insert  # noqa: E402
+
+from app import app, db  # noqa: E402
+from app.models import Group, Meeting, Notification, User, group_members  # noqa: E402
+from app.services import GroupService  # noqa: E402
+
+
+class CommitCounter:
+    """Count COMMITs issued on the engine."""
+
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine, 'commit', self._on_commit)
+
+    def _on_commit(self, conn):
+        self.count += 1
+
+
+def seed_group(size, offset):
+    """Create a group with ``size`` members using bulk inserts."""
+    db.session.execute(insert(User), [
+        {'username': f'bench{offset + i}', 'email': f'bench{offset + i}@example.com', 'password': 'x'}
+        for i in range(size)
+    ])
+    admin = User.query.filter_by(username=f'bench{offset}').first()
+    group = Group(name=f'Bench group {size}', description='benchmark', admin=admin.id)
+    db.session.add(group)
+    db.session.flush()
+    user_ids = [row.id for row in User.query.filter(User.username.like('bench%'))
+                .order_by(User.id).offset(offset).limit(size)]
+    db.session.execute(insert(group_members), [{'user_id': uid, 'group_id': group.id} for uid in user_ids])
+    db.session.commit()
+    return group.id
+
+
+def legacy_schedule_meeting(group_id, title):
+    """The pre-bulk implementation: one commit per notified member."""
+    meeting = Meeting(title=title, date=date.today(), time=dtime(10, 0), description='', group_id=group_id)
+    db.session.add(meeting)
+    db.session.commit()
+    group = db.session.get(Group, group_id)
+    for member in group.members:
+        db.session.add(Notification(user_id=member.id,
+                                    message=f"Meeting scheduled: {meeting.title} on {meeting.date} at {meeting.time}"))
+        db.session.commit()
+
+
+def bulk_schedule_meeting(group_id, title):
+    GroupService.schedule_meeting(group_id, title, date.today(), dtime(10, 0), '')
+
+
+def measure(counter, func, group_id, label):
+    db.session.expire_all()
+    before = counter.count
+    start = time.perf_counter()
+    func(group_id, label)
+    elapsed = time.perf_counter() - start
+    return elapsed, counter.count - before
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 1000, 10000])
+    parser.add_argument('--legacy-max', type=int, default=1000,
+                        help='skip the per-member commit loop for larger groups (it is very slow)')
+    args = parser.parse_args()
+
+    with app.app_context():
+        db.create_all()
+        counter = CommitCounter(db.engine)
+        print(f"{'members':>8} {'impl':>8} {'latency_ms':>11} {'commits':>8}")
+        offset = 0
+        for size in args.sizes:
+            group_id = seed_group(size, offset)
+            offset += size
+            if size <= args.legacy_max:
+                elapsed, commits = measure(counter, legacy_schedule_meeting, group_id, 'legacy')
+                print(f"{size:>8} {'legacy':>8} {elapsed * 1000:>11.1f} {commits:>8}")
+            else:
+                print(f"{size:>8} {'legacy':>8} {'skipped':>11} {size + 1:>8}")
+            elapsed, commits = measure(counter, bulk_schedule_meeting, group_id, 'bulk')
+            print(f"{size:>8} {'bulk':>8} {elapsed * 1000:>11.1f} {commits:>8}")
+
+
+if __name__ == '__main__':
+    main()
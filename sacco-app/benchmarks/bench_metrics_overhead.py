@@ -0,0 +1,92 @@
+"""Benchmark the cost of per-request metrics and check the histograms stay exact under threads.
+
+* end to end: ``--requests`` GETs of ``/notifications`` with metrics on, then
+  the same in a child process started with ``METRICS_ENABLED=false``;
+* recording: the cost of one start/finish pair (four histogram observations);
+* threads: ``--threads`` threads record concurrently and the merged counts
+  scraped from ``/metrics`` must add up exactly.
+
+Usage (from the sacco-app directory):
+
+    python benchmarks/bench_metrics_overhead.py --requests 2000
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_tmpdir = tempfile.mkdtemp(prefix='sacco-bench-')
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(_tmpdir, 'bench.db')}")
+
+from app import app, db, metrics  # noqa: E402
+from app.models import User  # noqa: E402
+
+
+def time_requests(count):
+    with app.app_context():
+        db.create_all()
+        if db.session.get(User, 1) is None:
+            db.session.add(User(username='bench', email='bench@example.com', password='x'))
+            db.session.commit()
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = '1'
+    for _ in range(50):
+        client.get('/notifications')  # Warm up templates and the pool
+    start = time.perf_counter()
+    for _ in range(count):
+        assert client.get('/notifications').status_code == 200
+    return (time.perf_counter() - start) / count * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--observations', type=int, default=20000)
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(f"{time_requests(args.requests):.1f}")
+        return
+
+    with_metrics = time_requests(args.requests)
+    env = dict(os.environ, METRICS_ENABLED='false', DATABASE_URL=f"sqlite:///{os.path.join(_tmpdir, 'off.db')}")
+    without = float(subprocess.run([sys.executable, __file__, '--child', '--requests', str(args.requests)],
+                                   env=env, capture_output=True, text=True, check=True).stdout.split()[-1])
+    print(f"/notifications: {with_metrics:.0f} us/request with metrics, {without:.0f} us without "
+          f"({with_metrics - without:+.0f} us)")
+
+    start = time.perf_counter()
+    for _ in range(args.observations):
+        metrics.start()
+        metrics.finish('http', 'bench')
+    print(f"recording: {(time.perf_counter() - start) / args.observations * 1e6:.2f} us per request "
+          f"(start/finish, four histograms)")
+
+    def record(n):
+        for _ in range(args.observations):
+            metrics.start()
+            metrics.finish('socketio', f'/bench:{n % 2}')
+
+    threads = [threading.Thread(target=record, args=(n,)) for n in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    text = app.test_client().get('/metrics').get_data(as_text=True)
+    counted = sum(int(line.rsplit(' ', 1)[1]) for line in text.splitlines()
+                  if line.startswith('sacco_request_duration_seconds_count{kind="socketio",endpoint="/bench:'))
+    expected = args.threads * args.observations
+    print(f"threads: {args.threads} x {args.observations} observations, scraped {counted} "
+          f"({'OK' if counted == expected else 'MISMATCH'}), /metrics is {len(text) // 1024} KiB")
+
+
+if __name__ == '__main__':
+    main()
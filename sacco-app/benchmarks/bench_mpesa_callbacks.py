@@ -0,0 +1,105 @@
+"""Replay a burst of synthetic M-Pesa callbacks against /mpesa/callback.
+
+Seeds pending deposits, then POSTs one callback per deposit (plus a share of
+retried duplicates) through the Flask test client from several threads.
+Reports acknowledgement latency, ingest rate, time until every callback has
+been applied, and checks that duplicates were stored and applied exactly once.
+
+Usage (from the sacco-app directory):
+
+    python benchmarks/bench_mpesa_callbacks.py --callbacks 5000 --duplicates 0.2
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_tmpdir = tempfile.mkdtemp(prefix='sacco-bench-')
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(_tmpdir, 'bench.db')}")
+
+from sqlalchemy import func, insert  # noqa: E402
+
+from app import app, db  # noqa: E402
+from app.models import LedgerEntry, Notification, PaymentCallback, Savings, User  # noqa: E402
+from app.views.savings import payment_callbacks  # noqa: E402
+
+MEMBERS = 500
+
+
+def seed(callbacks):
+    db.session.execute(insert(User), [
+        {'username': f'cb{i}', 'email': f'cb{i}@example.com', 'password': 'x'} for i in range(MEMBERS)
+    ])
+    member_ids = [row.id for row in User.query.with_entities(User.id)]
+    db.session.execute(insert(Savings), [
+        {'member_id': member_ids[i % MEMBERS], 'amount': 100.0, 'transaction_id': f'TX{i:09d}',
+         'payment_status': 'pending'}
+        for i in range(callbacks)
+    ])
+    db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--callbacks', type=int, default=5000)
+    parser.add_argument('--duplicates', type=float, default=0.2, help='share of callbacks that are retried')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--failed', type=float, default=0.05, help='share of payments reported as failed')
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    payloads = [{'transaction_id': f'TX{i:09d}', 'status': 'failed' if rng.random() < args.failed else 'completed'}
+                for i in range(args.callbacks)]
+    payloads += rng.sample(payloads, int(args.callbacks * args.duplicates))
+    rng.shuffle(payloads)
+    expected_completed = sum(1 for p in {p['transaction_id']: p for p in payloads}.values()
+                             if p['status'] == 'completed')
+
+    with app.app_context():
+        db.create_all()
+        seed(args.callbacks)
+
+    latencies = []
+
+    def post(payload):
+        with app.test_client() as client:
+            start = time.perf_counter()
+            response = client.post('/mpesa/callback', json=payload)
+            latencies.append(time.perf_counter() - start)
+            return response.status_code
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        codes = list(pool.map(post, payloads))
+    ingest_elapsed = time.perf_counter() - start
+    payment_callbacks.join()
+    applied_elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    print(f"callbacks sent      {len(payloads)} ({len(payloads) - args.callbacks} duplicates)")
+    print(f"non-200 responses   {sum(1 for c in codes if c != 200)}")
+    print(f"ack p50 / p99       {statistics.median(latencies) * 1000:.2f} ms / "
+          f"{latencies[int(len(latencies) * 0.99)] * 1000:.2f} ms")
+    print(f"ingest rate         {len(payloads) / ingest_elapsed:.0f} callbacks/s")
+    print(f"all applied after   {applied_elapsed:.2f} s ({len(payloads) / applied_elapsed:.0f} callbacks/s)")
+
+    with app.app_context():
+        completed = Savings.query.filter_by(payment_status='completed').count()
+        ledger_entries = db.session.query(func.count(LedgerEntry.id)).scalar()
+        notifications = db.session.query(func.count(Notification.id)).scalar()
+        stored = PaymentCallback.query.count()
+        waiting = PaymentCallback.query.filter_by(applied_at=None).count()
+    print(f"completed deposits  {completed} (expected {expected_completed})")
+    print(f"ledger entries      {ledger_entries} (expected {expected_completed})")
+    print(f"notifications       {notifications} (expected {args.callbacks})")
+    print(f"callbacks stored    {stored} (expected {args.callbacks}), {waiting} still waiting")
+
+
+if __name__ == '__main__':
+    main()
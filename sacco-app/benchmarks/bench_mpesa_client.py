@@ -0,0 +1,78 @@
+"""Benchmark M-Pesa payment submission against the local stub server.
+
+Compares the old per-call flow (fresh token + unpooled ``requests.post``) with
+the shared ``MpesaClient`` (pooled session, cached token) and reports
+throughput, p50/p99 latency and how many tokens were requested.
+
+Usage (from the sacco-app directory):
+
+    python benchmarks/bench_mpesa_client.py --payments 2000 --concurrency 16
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import requests  # noqa: E402
+
+from mpesa_stub import MpesaStubServer  # noqa: E402
+
+
+def legacy_payment(base_url):
+    token = requests.get(f'{base_url}oauth/v1/generate?grant_type=client_credentials',
+                         auth=requests.auth.HTTPBasicAuth('key', 'secret')).json().get('access_token')
+    response = requests.post(f'{base_url}mpesa/paybill/v1/processpayment',
+                             json={'amount': 100, 'phone_number': '254700000000'},
+                             headers={'Authorization': f'Bearer {token}'})
+    return response.json().get('transaction_id')
+
+
+def run(label, func, payments, concurrency, server):
+    token_before = server.token_requests
+    latencies = []
+
+    def timed(_):
+        start = time.perf_counter()
+        result = func()
+        latencies.append(time.perf_counter() - start)
+        return result
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(timed, range(payments)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    failures = sum(1 for r in results if not r)
+    print(f"{label:>8} {payments / elapsed:>10.1f} {statistics.median(latencies) * 1000:>9.1f} "
+          f"{p99 * 1000:>9.1f} {server.token_requests - token_before:>7} {failures:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--payments', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--token-latency', type=float, default=0.05)
+    parser.add_argument('--payment-latency', type=float, default=0.01)
+    args = parser.parse_args()
+
+    server = MpesaStubServer(token_latency=args.token_latency, payment_latency=args.payment_latency).start()
+    os.environ['MPESA_LIVE_URL'] = server.base_url
+    os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+    from app import app, mpesa
+
+    print(f"{'impl':>8} {'req/s':>10} {'p50_ms':>9} {'p99_ms':>9} {'tokens':>7} {'failures':>8}")
+    run('legacy', lambda: legacy_payment(server.base_url), args.payments, args.concurrency, server)
+    with app.app_context():
+        run('client', lambda: mpesa.initiate_payment('254700000000', 100), args.payments, args.concurrency, server)
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
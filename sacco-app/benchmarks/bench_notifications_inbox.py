@@ -0,0 +1,140 @@
+"""Benchmark the notifications inbox for a member with a very large history.
+
+Seeds ``--notifications`` rows for one member, then times the first and the
+deepest inbox page through ``/notifications`` (keyset cursor) against the
+equivalent OFFSET query. It then races writers adding notifications against
+bulk mark-reads and checks the cached unread counter still matches the table,
+and checks that a connected Socket.IO client receives pushed notifications.
+
+Usage (from the sacco-app directory):
+
+    python benchmarks/bench_notifications_inbox.py --notifications 50000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_tmpdir = tempfile.mkdtemp(prefix='sacco-bench-')
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(_tmpdir, 'bench.db')}")
+
+from sqlalchemy import func, insert, select, update  # noqa: E402
+
+from app import app, db, socketio  # noqa: E402
+from app.models import Notification, User  # noqa: E402
+from app.services import NotificationService  # noqa: E402
+
+
+def seed(count):
+    db.session.execute(insert(User), [
+        {'username': f'inbox{i}', 'email': f'inbox{i}@example.com', 'password': 'x'} for i in range(2)
+    ])
+    start = datetime.utcnow() - timedelta(days=365)
+    rows = [{'user_id': 1, 'message': f'Notification {n}', 'is_read': n % 3 == 0,
+             'timestamp': start + timedelta(minutes=n // 5)} for n in range(count)]
+    db.session.execute(insert(Notification), rows)
+    db.session.execute(update(User).where(User.id == 1)
+                       .values(unread_notifications=sum(1 for r in rows if not r['is_read'])))
+    db.session.commit()
+
+
+def logged_in_client(user_id):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+        session['_fresh'] = True
+    return client
+
+
+def time_call(func, repeat=20):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        response = func()
+        assert getattr(response, 'status_code', 200) == 200, response.status_code
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def actual_unread(user_id):
+    return db.session.execute(
+        select(func.count(Notification.id)).where(Notification.user_id == user_id, Notification.is_read.is_(False))
+    ).scalar()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--notifications', type=int, default=50000)
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--rounds', type=int, default=200)
+    args = parser.parse_args()
+
+    with app.app_context():
+        db.create_all()
+        seed(args.notifications)
+        per_page = app.config['POSTS_PER_PAGE']
+
+        # Walk to the last page to find its cursor
+        cursor, pages = None, 0
+        while True:
+            _, next_before = NotificationService.get_inbox(1, before=cursor)
+            pages += 1
+            if next_before is None:
+                break
+            cursor = next_before
+        deepest_offset = (pages - 1) * per_page
+
+        client = logged_in_client(1)
+        first_ms = time_call(lambda: client.get('/notifications'))
+        last_ms = time_call(lambda: client.get(f'/notifications?before={cursor}'))
+        offset_ms = time_call(lambda: Notification.query.filter_by(user_id=1)
+                              .order_by(Notification.timestamp.desc(), Notification.id.desc())
+                              .offset(deepest_offset).limit(per_page).all())
+        print(f"{args.notifications} notifications, {pages} pages of {per_page}")
+        print(f"  keyset first page  {first_ms:6.2f} ms (full request)")
+        print(f"  keyset last page   {last_ms:6.2f} ms (full request)")
+        print(f"  OFFSET last page   {offset_ms:6.2f} ms (query only)")
+
+    # Concurrent inserts and bulk mark-reads against the cached counter
+    def writer(seed):
+        rng = random.Random(seed)
+        with app.app_context():
+            for n in range(args.rounds * 2):
+                NotificationService.notify_each([(2, f'w{seed}-{n}')] * rng.randint(1, 3))
+
+    def reader():
+        rng = random.Random(99)
+        with app.app_context():
+            for _ in range(args.rounds):
+                page, _ = NotificationService.get_inbox(2, limit=10)
+                if rng.random() < 0.05:
+                    NotificationService.mark_read(2)
+                else:
+                    NotificationService.mark_read(2, [n.id for n in page if not n.is_read])
+
+    threads = [threading.Thread(target=writer, args=(i,)) for i in range(args.writers)] + [
+        threading.Thread(target=reader) for _ in range(2)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    with app.app_context():
+        cached, actual = NotificationService.unread_count(2), actual_unread(2)
+    print(f"concurrent inserts + mark-reads ({time.perf_counter() - start:.1f} s): "
+          f"cached unread {cached}, actual {actual}, {'OK' if cached == actual else 'MISMATCH'}")
+
+    # Push delivery
+    socket = socketio.test_client(app, namespace='/notifications', flask_test_client=logged_in_client(2))
+    with app.app_context():
+        NotificationService.notify_many([2], 'Pushed notification')
+    received = [p for p in socket.get_received('/notifications') if p['name'] == 'notification']
+    print(f"pushed to open socket: {len(received)} ({received[0]['args'][0]['message'] if received else '-'})")
+
+
+if __name__ == '__main__':
+    main()
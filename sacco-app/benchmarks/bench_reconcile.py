@@ -0,0 +1,180 @@
+"""Benchmark reconciling an M-Pesa settlement statement against the deposits on file.
+
+Seeds ``--members`` members and a month of deposits, and writes the month's
+settlement statement of ``--lines`` credits with the usual faults planted:
+settled deposits still pending (lost callbacks), pending deposits whose
+callback never brought a receipt, lines repeated, amounts that differ,
+settlements with no deposit at all, and completed deposits the statement
+does not settle. Then:
+
+* per line: one ``Savings`` lookup per statement line for ``--baseline``
+  lines, the way it is done by hand today;
+* a report-only reconciliation, with lines/sec and the growth of peak RSS,
+  checked against the planted faults;
+* a reconciliation with ``--repair``, then another that must find nothing
+  left to repair, and a check that the repairs credited exactly the settled
+  amounts.
+
+Usage (from the sacco-app directory):
+
+    python benchmarks/bench_reconcile.py --lines 1000000
+"""
+import argparse
+import csv
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_tmpdir = tempfile.mkdtemp(prefix='sacco-bench-')
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(_tmpdir, 'bench.db')}")
+os.environ.setdefault('MAIL_OUTBOX_WORKER', 'false')
+os.environ.setdefault('SEARCH_INDEX_WORKER', 'false')
+os.environ.setdefault('NOTIFICATION_PUSH', 'false')
+
+from sqlalchemy import func, insert, select  # noqa: E402
+
+from app import app, db  # noqa: E402
+from app.models import MemberBalance, Savings, User  # noqa: E402
+from app.reconcile import reconcile_statement  # noqa: E402
+
+HEADERS = ('Receipt No.', 'Completion Time', 'Initiation Time', 'Details', 'Transaction Status', 'Paid In',
+           'Withdrawn', 'Balance', 'Other Party Info')
+NAIROBI = timedelta(hours=3)
+
+
+def seed(members, lines, rng, path):
+    """Write the statement and the deposits on file.
+
+    Returns the counts each class and action should come to, and the cents the repairs should credit.
+    """
+    db.session.execute(insert(User), [{'id': i, 'username': f'member{i}', 'email': f'member{i}@example.com',
+                                       'phone_number': f'07{i:08d}', 'password': 'x'}
+                                      for i in range(1, members + 1)])
+    expected = dict.fromkeys(('matched', 'complete', 'attach', 'duplicated', 'amount_mismatch', 'missing',
+                              'unsettled', 'fail'), 0)
+    start = datetime(2026, 9, 1)
+    deposits = []
+    credit = 0
+    with open(path, 'w', newline='') as handle:
+        writer = csv.writer(handle)
+        writer.writerow(['M-PESA PAYBILL SETTLEMENT'])
+        writer.writerow([])
+        writer.writerow(HEADERS)
+        for n in range(lines):
+            at = start + timedelta(seconds=n * 2)
+            member, cents = rng.randint(1, members), rng.randint(1, 500) * 1000
+            receipt = f'S{n:09d}'
+            roll = rng.random()
+            deposit = {'member_id': member, 'amount': cents / 100, 'transaction_id': receipt,
+                       'payment_status': 'completed', 'created_at': at + timedelta(seconds=rng.randint(0, 30))}
+            if roll < 0.02:
+                deposit['payment_status'] = 'pending'  # Callback lost
+                expected['complete'] += 1
+            elif roll < 0.03:
+                deposit.update(transaction_id=None, payment_status='pending')  # Receipt never came back
+                expected['attach'] += 1
+            elif roll < 0.035:
+                deposit['amount'] += 10
+                expected['amount_mismatch'] += 1
+            elif roll < 0.04:
+                deposit = None  # Settled, but never recorded
+                expected['missing'] += 1
+            if roll < 0.03:
+                credit += cents
+            if deposit is not None:
+                deposits.append(deposit)
+            row = (receipt, (at + NAIROBI).strftime('%Y-%m-%d %H:%M:%S'), '', 'Pay Bill from ...', 'Completed',
+                   f'{cents / 100:.2f}', '', '', f'2547{member:08d} - MEMBER {member}')
+            writer.writerow(row)
+            if rng.random() < 0.002:
+                writer.writerow(row)  # Exported twice
+                expected['duplicated'] += 1
+            if n % 200 == 0:
+                # Recorded but never settled: completed (left for finance) and stale pending (failed)
+                deposits.append({'member_id': member, 'amount': 77.0, 'transaction_id': f'U{n:09d}',
+                                 'payment_status': 'completed', 'created_at': at})
+                deposits.append({'member_id': member, 'amount': 66.0, 'transaction_id': None,
+                                 'payment_status': 'pending', 'created_at': at})
+                expected['unsettled'] += 2
+                expected['fail'] += 1
+            if len(deposits) >= 50000:
+                db.session.execute(insert(Savings), deposits)
+                deposits = []
+    if deposits:
+        db.session.execute(insert(Savings), deposits)
+    db.session.commit()
+    expected['matched'] = lines - expected['amount_mismatch'] - expected['missing']
+    return expected, credit
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def report(label, result, rss_before):
+    counts = ', '.join(f'{kind} {count}' for kind, count in result['counts'].items() if count)
+    print(f"  {label:<18} {result['lines']:>9} lines in {result['elapsed']:6.2f} s "
+          f"({result['lines_per_second']:>8.0f} lines/s), peak RSS +{peak_rss_mb() - rss_before:.0f} MB")
+    print(f"    {counts}; actions {result['actions']}; repaired {result['repaired']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--members', type=int, default=50000)
+    parser.add_argument('--lines', type=int, default=300000)
+    parser.add_argument('--baseline', type=int, default=5000, help='lines looked up one at a time')
+    parser.add_argument('--run-size', type=int, help='statement lines sorted in memory per run')
+    parser.add_argument('--seed', type=int, default=9)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    with app.app_context():
+        db.create_all()
+        path = os.path.join(_tmpdir, 'settlement.csv')
+        started = time.perf_counter()
+        expected, credit = seed(args.members, args.lines, rng, path)
+        print(f"seeded {args.lines} settlement lines, {db.session.execute(select(func.count(Savings.id))).scalar()} "
+              f"deposits in {time.perf_counter() - started:.1f} s; statement {os.path.getsize(path) / 1e6:.0f} MB")
+
+        started = time.perf_counter()
+        with open(path, newline='') as handle:
+            rows = csv.reader(handle)
+            for _ in range(3):
+                next(rows)
+            for _, row in zip(range(args.baseline), rows):
+                db.session.execute(select(Savings.id, Savings.amount, Savings.payment_status)
+                                   .where(Savings.transaction_id == row[0])).first()
+        elapsed = time.perf_counter() - started
+        print(f"  {'one at a time':<18} {args.baseline:>9} lines in {elapsed:6.2f} s "
+              f"({args.baseline / elapsed:>8.0f} lines/s)")
+
+        rss = peak_rss_mb()
+        result = reconcile_statement(path, report=os.path.join(_tmpdir, 'report.csv'), run_size=args.run_size)
+        report('report only', result, rss)
+        got = {**result['counts'], **result['actions']}
+        # Pending deposits from the statement's last window may still settle, so fewer are failed
+        wrong = {kind: (got.get(kind, 0), count) for kind, count in expected.items()
+                 if got.get(kind, 0) != count and not (kind == 'fail' and 0 < count - got.get(kind, 0) < 10)}
+        print(f"    expected {expected}; {'all classes as planted' if not wrong else f'differ (got, planted): {wrong}'}")
+
+        rss = peak_rss_mb()
+        report('repair', reconcile_statement(path, repair=True, report=os.path.join(_tmpdir, 'repair.csv'),
+                                             run_size=args.run_size), rss)
+        report('repair again', reconcile_statement(path, repair=True, report=os.path.join(_tmpdir, 'again.csv'),
+                                                   run_size=args.run_size), rss)
+
+        deposits = db.session.execute(select(func.coalesce(func.sum(Savings.amount), 0))
+                                      .where(Savings.payment_status == 'completed')).scalar()
+        credited = db.session.execute(select(func.coalesce(func.sum(MemberBalance.savings_cents), 0))).scalar()
+        # The seeded deposits were never posted to the ledger, so balances hold exactly what the repairs credited
+        print(f"repairs credited {credited / 100:.2f} (planted {credit / 100:.2f}); "
+              f"completed deposits now total {deposits:.2f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+"""Benchmark registration throughput with inline SMTP versus the email outbox.
+
+Starts the aiosmtpd stub (see ``smtp_stub.py``) with a per-session connect
+delay, then posts ``--registrations`` sign-ups to ``/register``:
+
+* inline: what the route used to do, one ``mail.send`` (and so one SMTP
+  session) inside every request;
+* outbox: the current route, which only inserts an ``OutboundEmail`` row and
+  leaves sending to the mail dispatcher.
+
+Reports requests/s for both, then waits for the dispatcher to drain the
+outbox and reports how many SMTP sessions it needed. A second pass with
+``--reject-rate`` shows temporary rejections being retried.
+
+Usage (from the sacco-app directory):
+
+    python benchmarks/bench_registration_email.py --registrations 300
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_tmpdir = tempfile.mkdtemp(prefix='sacco-bench-')
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(_tmpdir, 'bench.db')}")
+os.environ.setdefault('MAIL_SERVER', '127.0.0.1')
+os.environ.setdefault('MAIL_PORT', '8025')
+os.environ['MAIL_USE_TLS'] = 'false'
+os.environ['MAIL_POLL_INTERVAL'] = '0.2'
+os.environ['MAIL_RETRY_BACKOFF'] = '0.2'
+
+from flask_mail import Message  # noqa: E402
+from sqlalchemy import delete, func, select  # noqa: E402
+
+from app import app, db, mail_dispatcher  # noqa: E402
+from app.models import OutboundEmail, User  # noqa: E402
+from smtp_stub import SmtpStubServer  # noqa: E402
+
+app.config['WTF_CSRF_ENABLED'] = False
+
+
+def register(client, n, prefix):
+    response = client.post('/register', data={
+        'username': f'{prefix}{n}', 'email': f'{prefix}{n}@example.com',
+        'password': 'secret123', 'confirm_password': 'secret123',
+    })
+    assert response.status_code == 302, response.status_code
+
+
+def inline_send(user):
+    """The pre-outbox behaviour: send on the request thread before redirecting."""
+    mail_dispatcher.mail.send(Message('Account Verification', recipients=[user.email],
+                                      body='Your verification code is: X',
+                                      sender=app.config['MAIL_DEFAULT_SENDER']))
+
+
+def run_inline(count):
+    client = app.test_client()
+    app.config['MAIL_OUTBOX_WORKER'] = False  # Only the inline sends talk to SMTP in this pass
+    start = time.perf_counter()
+    for n in range(count):
+        register(client, n, 'inline')
+        with app.app_context():
+            inline_send(db.session.execute(select(User).where(User.username == f'inline{n}')).scalar_one())
+    elapsed = time.perf_counter() - start
+    with app.app_context():
+        db.session.execute(delete(OutboundEmail))
+        db.session.commit()
+    app.config['MAIL_OUTBOX_WORKER'] = True
+    return elapsed
+
+
+def run_outbox(count, prefix):
+    client = app.test_client()
+    start = time.perf_counter()
+    for n in range(count):
+        register(client, n, prefix)
+    return time.perf_counter() - start
+
+
+def outbox_counts():
+    with app.app_context():
+        rows = db.session.execute(
+            select(OutboundEmail.status, func.count(OutboundEmail.id)).group_by(OutboundEmail.status)).all()
+        return dict(rows)
+
+
+def wait_for_drain(timeout=120):
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        counts = outbox_counts()
+        if not counts.get('queued') and not counts.get('sending'):
+            return time.perf_counter() - start, counts
+        time.sleep(0.05)
+    return time.perf_counter() - start, outbox_counts()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--registrations', type=int, default=300)
+    parser.add_argument('--session-latency', type=float, default=0.05, help='SMTP connect/EHLO delay in seconds')
+    parser.add_argument('--message-latency', type=float, default=0.002)
+    parser.add_argument('--reject-rate', type=float, default=0.1)
+    args = parser.parse_args()
+
+    with app.app_context():
+        db.create_all()
+    port = app.config['MAIL_PORT']
+    server = SmtpStubServer(port, args.session_latency, args.message_latency).start()
+    handler = server.handler
+    try:
+        count = args.registrations
+        inline = run_inline(count)
+        inline_sessions = handler.sessions
+        print(f"{count} registrations, SMTP session setup {args.session_latency * 1000:.0f} ms")
+        print(f"  inline send   {count / inline:7.1f} req/s  ({inline_sessions} SMTP sessions)")
+
+        handler.sessions, handler.delivered = 0, []
+        outbox = run_outbox(count, 'outbox')
+        drain, counts = wait_for_drain()
+        print(f"  outbox        {count / outbox:7.1f} req/s  "
+              f"(drained in {drain:.2f} s after the last request, {handler.sessions} SMTP sessions, "
+              f"{mail_dispatcher.connections} opened by the dispatcher)")
+        print(f"  outbox rows   {counts}, delivered {len(handler.delivered)}")
+
+        handler.sessions, handler.delivered, handler.reject_rate = 0, [], args.reject_rate
+        run_outbox(count, 'retry')
+        drain, counts = wait_for_drain()
+        print(f"  with {args.reject_rate:.0%} temporary rejections: {handler.rejected} rejected, "
+              f"{len(handler.delivered)} delivered after retries in {drain:.2f} s, rows {counts}")
+    finally:
+        mail_dispatcher.stop()
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
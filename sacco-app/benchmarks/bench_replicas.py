@@ -0,0 +1,195 @@
+"""Benchmark and check read/write splitting onto read replicas (app/replicas.py).
+
+Uses an SQLite primary with two SQLite replicas kept in sync by the copy job
+(``batch.py replicas --sync`` does the same on a schedule). Seeds
+``--members`` members with ledger history, ``--pending`` pending loan and
+membership requests and a loan book, then:
+
+* the admin queues, the loan portfolio and the CSV exports with and without
+  replicas: latency and SQL statements run on the primary and the replicas;
+* read-your-writes: after an admin approves a loan, their next queue page
+  is read from the primary and no longer lists it, while another admin's
+  comes from a replica until ``REPLICA_MAX_LAG`` has passed;
+* fallback: a replica that stops being synced is dropped once it lags past
+  ``REPLICA_MAX_LAG``, and a replica whose file disappears is skipped; with
+  neither usable every read goes to the primary.
+
+Usage (from the sacco-app directory):
+
+    python benchmarks/bench_replicas.py --members 20000 --pending 2000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_tmpdir = tempfile.mkdtemp(prefix='sacco-bench-')
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(_tmpdir, 'bench.db')}")
+os.environ.setdefault('DATABASE_REPLICA_URLS', ','.join(
+    f"sqlite:///file:{os.path.join(_tmpdir, f'replica{n}.db')}?mode=ro&uri=true" for n in (1, 2)))
+os.environ.setdefault('REPLICA_MAX_LAG', '3')
+os.environ.setdefault('REPLICA_CHECK_INTERVAL', '0.2')
+os.environ.setdefault('MAIL_OUTBOX_WORKER', 'false')
+os.environ.setdefault('SEARCH_INDEX_WORKER', 'false')
+os.environ.setdefault('NOTIFICATION_PUSH', 'false')
+
+from sqlalchemy import event, insert  # noqa: E402
+
+from app import app, db, replicas  # noqa: E402
+from app.models import Group, LedgerEntry, Loan, LoanRequest, MemberBalance, MembershipRequest, User  # noqa: E402
+
+
+def seed(members, pending, rng):
+    db.session.execute(insert(User), [{'id': 1, 'username': 'admin', 'email': 'admin@example.com', 'password': 'x',
+                                       'role': 'admin'}, {'id': 2, 'username': 'admin2', 'email': 'admin2@example.com',
+                                                          'password': 'x', 'role': 'admin'}] +
+                       [{'id': i, 'username': f'm{i}', 'email': f'm{i}@example.com', 'password': 'x'}
+                        for i in range(3, members + 3)])
+    db.session.execute(insert(Group), [{'id': 1, 'name': 'Savers', 'description': '', 'admin': 1}])
+    start = datetime(2026, 1, 1)
+    entries = []
+    for member in range(3, members + 3):
+        savings = 0
+        for n in range(10):
+            amount = rng.randint(1, 500) * 100
+            savings += amount
+            entries.append({'member_id': member, 'entry_type': 'deposit', 'amount_cents': amount,
+                            'savings_after_cents': savings, 'loan_after_cents': 0, 'reference': f'D{member}-{n}',
+                            'created_at': start + timedelta(days=n * 30)})
+        if len(entries) >= 50000:
+            db.session.execute(insert(LedgerEntry), entries)
+            entries = []
+    if entries:
+        db.session.execute(insert(LedgerEntry), entries)
+    db.session.execute(insert(MemberBalance), [{'member_id': m, 'savings_cents': 100000, 'loan_cents': 0}
+                                               for m in range(3, members + 3)])
+    db.session.execute(insert(Loan), [{'borrower_id': 3 + i % members, 'group_id': 1, 'amount': 10000.0,
+                                       'interest_rate': 10.0, 'repayment_period': 12, 'status': 'approved',
+                                       'approved_at': start, 'total_paid': 1000.0} for i in range(members // 4)])
+    db.session.execute(insert(LoanRequest), [{'member_id': 3 + i % members, 'amount': 1000.0,
+                                              'total_repayment': 1050.0, 'status': 'pending'} for i in range(pending)])
+    db.session.execute(insert(MembershipRequest), [{'user_id': 3 + i % members, 'status': 'pending'}
+                                                   for i in range(pending)])
+    db.session.commit()
+
+
+class Counter:
+    def __init__(self, engines):
+        self.counts = {}
+        for name, engine in engines.items():
+            event.listen(engine, 'before_cursor_execute', self._counter(name))
+
+    def _counter(self, name):
+        def count(conn, cursor, statement, *args):
+            if 'replica_sync' not in statement:  # Lag checks
+                self.counts[name] = self.counts.get(name, 0) + 1
+        return count
+
+    def take(self):
+        counts, self.counts = self.counts, {}
+        return counts
+
+
+def client_for(user_id):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+        session['_fresh'] = True
+    return client
+
+
+def measure(client, url, repeat, counter):
+    counter.take()
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        response = client.get(url)
+        response.get_data()  # Streamed exports run as they are read
+        samples.append(time.perf_counter() - started)
+        assert response.status_code == 200, (url, response.status_code)
+    counts = counter.take()
+    where = ', '.join(f'{name} {count / repeat:.1f}' for name, count in sorted(counts.items()))
+    return f"p50 {statistics.median(samples) * 1000:8.1f} ms  SQL/request: {where}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--members', type=int, default=5000)
+    parser.add_argument('--pending', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=3)
+    args = parser.parse_args()
+    max_lag = app.config['REPLICA_MAX_LAG']
+
+    with app.app_context():
+        db.create_all()
+        started = time.perf_counter()
+        seed(args.members, args.pending, random.Random(args.seed))
+        print(f"seeded {args.members} members, {args.members * 10} ledger entries and {args.pending} pending requests "
+              f"in {time.perf_counter() - started:.1f} s")
+        print(f"copy job: both replicas synced in {replicas.sync(db.engine):.2f} s")
+        engines = {'primary': db.engine}
+        engines.update({f'replica{n}': replica.engine for n, replica in enumerate(replicas._replicas, 1)})
+        counter = Counter(engines)
+
+    admin, other_admin = client_for(1), client_for(2)
+    pages = [('loan queue', '/admin/approve_loans'), ('membership queue', '/admin/admit_members'),
+             ('loan portfolio', '/admin/loan_portfolio'), ('loan book CSV', '/admin/exports/loan_book.csv'),
+             ('statement CSV', '/exports/statement.csv?member_id=3')]
+    configured = replicas._replicas
+    for label, use_replicas in (('primary only', False), ('with replicas', True)):
+        replicas._replicas, replicas._checked_at = (configured if use_replicas else []), None
+        print(f"{label}:")
+        for name, url in pages:
+            print(f"  {name:<18} {measure(other_admin, url, args.repeat, counter)}")
+
+    # Read-your-writes: the deciding admin sees the primary; the other admin may see the replica's stale queue
+    with app.app_context():
+        loan_id = db.session.execute(db.select(LoanRequest.id).where(LoanRequest.status == 'pending')
+                                     .order_by(LoanRequest.id)).scalars().first()
+    assert admin.post(f'/admin/approve_loan/{loan_id}').status_code == 302
+    counter.take()
+    mine = admin.get('/admin/approve_loans').get_data(as_text=True)
+    mine_from = sorted(counter.take())
+    theirs = other_admin.get('/admin/approve_loans').get_data(as_text=True)
+    theirs_from = sorted(counter.take())
+    listed = f'/admin/approve_loan/{loan_id}"'
+    print(f"after approving loan request {loan_id}: the approver's queue read from {mine_from}, "
+          f"{'still lists it (WRONG)' if listed in mine else 'no longer lists it'}; another admin's from "
+          f"{theirs_from}, {'still lists it (stale replica)' if listed in theirs else 'no longer lists it'}")
+    time.sleep(max_lag + 0.1)
+    with app.app_context():
+        replicas.sync(db.engine)
+    mine = admin.get('/admin/approve_loans').get_data(as_text=True)
+    print(f"  {max_lag:.0f} s later, after a sync, the approver reads from {sorted(counter.take())}, "
+          f"{'still listed (WRONG)' if listed in mine else 'not listed'}")
+
+    # Lagging and missing replicas
+    with app.app_context():
+        replicas.sync(db.engine)
+        time.sleep(max_lag + 0.5)  # No sync for longer than the allowed lag
+        other_admin.get('/admin/approve_loans')
+        counter.take()
+        other_admin.get('/admin/approve_loans')
+        print(f"replicas {max_lag + 0.5:.1f} s behind: queue read from {sorted(counter.take())}; "
+              f"status {[(r['replica'][-30:], r['healthy']) for r in replicas.status()]}")
+        replicas.sync(db.engine)
+        # As a replica server going away: its file is gone and its pooled connections are closed
+        os.remove(os.path.join(_tmpdir, 'replica2.db'))
+        replicas._replicas[1].engine.dispose()
+        replicas.check()
+        counter.take()
+        for _ in range(4):
+            other_admin.get('/admin/approve_loans')
+        print(f"replica2 deleted after a sync: queue read from {sorted(counter.take())}; "
+              f"status {[(r['replica'][-30:], r['healthy']) for r in replicas.status()]}")
+
+
+if __name__ == '__main__':
+    main()
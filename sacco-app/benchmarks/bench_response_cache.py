@@ -0,0 +1,153 @@
+"""Benchmark the response cache on the dashboard, group, calendar and admin dashboard pages.
+
+Seeds ``--members`` members in ``--groups`` groups with meetings and
+notifications, then requests each page through the test client as a group
+member (and the admin dashboard as the group's admin) four ways:
+
+* cache off (``CACHE_ENABLED=false``), the cost of every hit before;
+* cache on, starting empty: each member's first view (group blocks are
+  shared with earlier members of the same group);
+* cache on, a repeat view without validators (blocks come from the cache);
+* cache on, a repeat view with ``If-None-Match`` (304, nothing rendered).
+
+Latency and SQL statements per request are reported for each. Finally it
+checks that scheduling a meeting changes the group page's ETag.
+
+Usage (from the sacco-app directory):
+
+    python benchmarks/bench_response_cache.py --members 20000 --groups 200
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, datetime, time as clock, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_tmpdir = tempfile.mkdtemp(prefix='sacco-bench-')
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(_tmpdir, 'bench.db')}")
+os.environ.setdefault('MAIL_OUTBOX_WORKER', 'false')
+os.environ.setdefault('SEARCH_INDEX_WORKER', 'false')
+
+from sqlalchemy import event, insert  # noqa: E402
+
+from app import app, db, response_cache  # noqa: E402
+from app.cache import MemoryCache  # noqa: E402
+from app.models import Group, Meeting, MemberBalance, Notification, User, group_members  # noqa: E402
+from app.services import GroupService  # noqa: E402
+
+
+def seed(members, groups, meetings, notifications, rng):
+    db.session.execute(insert(User), [{'id': i, 'username': f'member{i}', 'email': f'member{i}@example.com',
+                                       'password': 'x'} for i in range(1, members + 1)])
+    # Member g administers group g
+    db.session.execute(insert(Group), [{'id': g, 'name': f'Group {g}', 'description': 'Monthly savers', 'admin': g}
+                                       for g in range(1, groups + 1)])
+    db.session.execute(insert(group_members), [{'user_id': u, 'group_id': (u % groups) + 1}
+                                               for u in range(1, members + 1)])
+    db.session.execute(insert(MemberBalance), [{'member_id': u, 'savings_cents': rng.randint(0, 10 ** 7),
+                                                'loan_cents': 0} for u in range(1, members + 1)])
+    today = date.today()
+    db.session.execute(insert(Meeting), [{'group_id': g, 'title': f'Meeting {n}', 'description': 'Contributions',
+                                          'date': today + timedelta(days=rng.randint(-400, 120)),
+                                          'time': clock(rng.randint(8, 18), 0)}
+                                         for g in range(1, groups + 1) for n in range(meetings)])
+    now = datetime.utcnow()
+    db.session.execute(insert(Notification), [{'user_id': rng.randint(1, members), 'message': f'notification {n}',
+                                               'is_read': rng.random() < 0.8,
+                                               'timestamp': now - timedelta(minutes=n)}
+                                              for n in range(notifications)])
+    db.session.commit()
+
+
+class Counter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, *args):
+        self.count += 1
+
+
+def measure(label, client, requests, counter, conditional=False, warm=True):
+    """Time ``requests`` (user_id, url) pairs; ``warm`` primes each URL first."""
+    etags = {}
+    if warm:
+        for user_id, url in requests:
+            etags[user_id, url] = get(client, user_id, url).headers.get('ETag')
+    latencies, queries, statuses = [], [], {}
+    for user_id, url in requests:
+        headers = {'If-None-Match': etags[user_id, url]} if conditional else {}
+        counter.count = 0
+        start = time.perf_counter()
+        response = get(client, user_id, url, headers)
+        latencies.append(time.perf_counter() - start)
+        queries.append(counter.count)
+        statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+    latencies.sort()
+    print(f"  {label:<28} p50 {statistics.median(latencies) * 1000:6.2f} ms  "
+          f"p95 {latencies[int(len(latencies) * 0.95)] * 1000:6.2f} ms  "
+          f"SQL/request {sum(queries) / len(queries):4.1f}  status {statuses}")
+
+
+def get(client, user_id, url, headers=None):
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+    return client.get(url, headers=headers or {})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--members', type=int, default=20000)
+    parser.add_argument('--groups', type=int, default=200)
+    parser.add_argument('--meetings', type=int, default=60, help='meetings per group')
+    parser.add_argument('--notifications', type=int, default=500000)
+    parser.add_argument('--requests', type=int, default=300, help='requests per page and mode')
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    with app.app_context():
+        db.create_all()
+        start = time.perf_counter()
+        seed(args.members, args.groups, args.meetings, args.notifications, rng)
+        print(f"seeded {args.members} members, {args.groups} groups, {args.groups * args.meetings} meetings and "
+              f"{args.notifications} notifications in {time.perf_counter() - start:.0f} s")
+        counter = Counter()
+        event.listen(db.engine, 'before_cursor_execute', counter)
+
+    client = app.test_client()
+    member_ids = rng.sample(range(args.groups + 1, args.members + 1), args.requests)
+    admin_ids = rng.sample(range(1, args.groups + 1), min(args.requests, args.groups))
+    pages = {
+        'dashboard': [(u, '/dashboard') for u in member_ids],
+        'group': [(u, f'/group/{(u % args.groups) + 1}') for u in member_ids],
+        'calendar': [(u, f'/group/{(u % args.groups) + 1}/calendar') for u in member_ids],
+        'admin dashboard': [(a, f'/admin/dashboard/{a}') for a in admin_ids],
+    }
+    for page, requests in pages.items():
+        print(f"{page} ({len(requests)} requests):")
+        app.config['CACHE_ENABLED'] = False
+        measure('cache off', client, requests, counter, warm=False)
+        app.config['CACHE_ENABLED'] = True
+        response_cache.backend = MemoryCache(app.config['CACHE_MAX_ENTRIES'])  # Start empty
+        measure('cache on, first view', client, requests, counter, warm=False)
+        measure('cache on, repeat view', client, requests, counter)
+        measure('cache on, If-None-Match', client, requests, counter, conditional=True)
+
+    # A change is visible on the next view: scheduling a meeting changes the group page's ETag
+    user_id = member_ids[0]
+    group_id = (user_id % args.groups) + 1
+    before = get(client, user_id, f'/group/{group_id}')
+    with app.app_context():
+        GroupService.schedule_meeting(group_id, 'Extra meeting', date.today() + timedelta(days=1), clock(9, 0), None)
+    after = get(client, user_id, f'/group/{group_id}', {'If-None-Match': before.headers['ETag']})
+    print(f"after scheduling a meeting: {after.status_code}, "
+          f"{'new meeting shown' if b'Extra meeting' in after.data else 'NEW MEETING MISSING'}")
+
+
+if __name__ == '__main__':
+    main()
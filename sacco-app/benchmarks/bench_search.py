@@ -0,0 +1,170 @@
+"""Benchmark full-text search: indexing throughput and query latency at millions of chat messages.
+
+Seeds ``--members`` users in ``--groups`` groups and ``--messages`` chat
+messages drawn from a Zipf-distributed vocabulary, builds the index in batches
+(as the background indexer does), then times ``SearchService.search`` for
+members searching their groups' chats (whole words, short and long prefixes),
+SACCO admins searching everything, and group and member lookups. For
+comparison it times a ``LIKE '%term%'`` scan, which is the only way to find a
+message without the index. Finally it measures incremental indexing of newly
+saved messages.
+
+Usage (from the sacco-app directory):
+
+    python benchmarks/bench_search.py --messages 10000000
+"""
+import argparse
+import itertools
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_tmpdir = tempfile.mkdtemp(prefix='sacco-bench-')
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(_tmpdir, 'bench.db')}")
+os.environ.setdefault('MAIL_OUTBOX_WORKER', 'false')
+os.environ.setdefault('SEARCH_INDEX_WORKER', 'false')
+
+from sqlalchemy import insert, select  # noqa: E402
+
+from app import app, db, search_indexer  # noqa: E402
+from app.models import Group, Message, User, group_members  # noqa: E402
+from app.services import GroupService, MessageService, SearchService  # noqa: E402
+
+SYLLABLES = ['ka', 'ma', 'ta', 'na', 'ri', 'zi', 'mu', 'ji', 'po', 'se', 'lu', 'we', 'ndo', 'chi', 'ba', 'ge']
+
+
+def vocabulary(size, rng):
+    words = set()
+    while len(words) < size:
+        words.add(''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))))
+    return sorted(words, key=lambda w: rng.random())
+
+
+def seed(members, groups, messages, rng, words):
+    db.session.execute(insert(User), [{'id': i, 'username': f'{words[i % len(words)]}{i}', 'email': f'u{i}@example.com',
+                                       'password': 'x', 'role': 'admin' if i == 1 else 'member'}
+                                      for i in range(1, members + 1)])
+    db.session.execute(insert(Group), [{'id': g, 'name': f'{words[g * 7 % len(words)].title()} Savers',
+                                        'description': ' '.join(rng.choices(words[:500], k=8)), 'admin': 2}
+                                       for g in range(1, groups + 1)])
+    membership = {}
+    for user_id in range(2, members + 1):
+        membership[user_id] = rng.sample(range(1, groups + 1), rng.randint(1, 3))
+    db.session.execute(insert(group_members), [{'user_id': u, 'group_id': g}
+                                               for u, gs in membership.items() for g in gs])
+    db.session.commit()
+
+    cum_weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(words))))  # Zipf: long tail
+    members_of = {}
+    for user_id, gs in membership.items():
+        for g in gs:
+            members_of.setdefault(g, []).append(user_id)
+    start = datetime(2024, 1, 1)
+    batch = []
+    for n in range(messages):
+        g = rng.randint(1, groups)
+        batch.append({'group_id': g, 'user_id': rng.choice(members_of.get(g) or [2]),
+                      'content': ' '.join(rng.choices(words, cum_weights=cum_weights, k=rng.randint(4, 14))),
+                      'timestamp': start + timedelta(seconds=n)})
+        if len(batch) == 50000:
+            db.session.execute(insert(Message), batch)
+            batch = []
+    if batch:
+        db.session.execute(insert(Message), batch)
+    db.session.commit()
+    return membership
+
+
+def time_queries(label, runs):
+    """Run (user, source, query, group_id) searches and print latency percentiles."""
+    latencies, hits = [], []
+    for user, source, query, group_id in runs:
+        start = time.perf_counter()
+        results, _ = SearchService.search(user, source, query, group_id=group_id)
+        latencies.append(time.perf_counter() - start)
+        hits.append(len(results))
+    latencies.sort()
+    print(f"  {label:<34} p50 {statistics.median(latencies) * 1000:6.1f} ms  "
+          f"p95 {latencies[int(len(latencies) * 0.95)] * 1000:6.1f} ms  max {latencies[-1] * 1000:6.1f} ms  "
+          f"avg hits {sum(hits) / len(hits):4.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=1000000)
+    parser.add_argument('--members', type=int, default=50000)
+    parser.add_argument('--groups', type=int, default=5000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+    words = vocabulary(20000, rng)
+
+    with app.app_context():
+        db.create_all()
+        start = time.perf_counter()
+        membership = seed(args.members, args.groups, args.messages, rng, words)
+        print(f"seeded {args.messages} messages in {args.groups} groups in {time.perf_counter() - start:.0f} s")
+
+        start = time.perf_counter()
+        indexed = search_indexer.sync()
+        elapsed = time.perf_counter() - start
+        print(f"indexed {indexed} rows in {elapsed:.0f} s ({indexed / elapsed:.0f} rows/s, "
+              f"batches of {app.config['SEARCH_INDEX_BATCH_SIZE']})")
+
+        member_ids = rng.sample(sorted(membership), args.queries)
+        members = {u.id: u for u in User.query.filter(User.id.in_(member_ids))}
+        admin = db.session.get(User, 1)
+        common, mid, rare = words[:20], words[200:1000], words[5000:]
+
+        def runs(pick, user_for=lambda: members[rng.choice(member_ids)], source='messages', group=False):
+            out = []
+            for _ in range(args.queries):
+                user = user_for()
+                group_id = rng.choice(membership[user.id]) if group else None
+                out.append((user, source, pick(), group_id))
+            return out
+
+        print(f"{args.queries} queries each (page size {app.config['SEARCH_PAGE_SIZE']}):")
+        time_queries('member: common word', runs(lambda: rng.choice(common)))
+        time_queries('member: two-letter prefix', runs(lambda: rng.choice(common)[:2]))
+        time_queries('member: four-letter prefix', runs(lambda: rng.choice(mid)[:4]))
+        time_queries('member: five-letter prefix', runs(lambda: rng.choice(common)[:5]))
+        time_queries('member: two words', runs(lambda: f'{rng.choice(common)} {rng.choice(mid)[:4]}'))
+        time_queries('member: rare word', runs(lambda: rng.choice(rare)))
+        time_queries('member: one group, common word', runs(lambda: rng.choice(common), group=True))
+        time_queries('admin: all groups, common word', runs(lambda: rng.choice(common), user_for=lambda: admin))
+        time_queries('admin: all groups, rare word', runs(lambda: rng.choice(rare), user_for=lambda: admin))
+        time_queries('admin: all groups, two words', runs(lambda: f'{rng.choice(mid)} {rng.choice(mid)}',
+                                                        user_for=lambda: admin))
+        time_queries('groups: name prefix', runs(lambda: rng.choice(words[:2000])[:4], source='groups'))
+        time_queries('members: username prefix', runs(lambda: rng.choice(words)[:4], source='members'))
+
+        # The newest 20 messages containing a rare word, found without the index
+        term = rng.choice(rare)
+        group_ids = GroupService.get_user_group_ids(member_ids[0])
+        start = time.perf_counter()
+        db.session.execute(select(Message.id).where(Message.group_id.in_(group_ids), Message.content.like(f'%{term}%'))
+                           .order_by(Message.id.desc()).limit(20)).all()
+        print(f"  LIKE scan of the member's groups    {(time.perf_counter() - start) * 1000:6.1f} ms")
+        start = time.perf_counter()
+        db.session.execute(select(Message.id).where(Message.content.like(f'%{term}%'))
+                           .order_by(Message.id.desc()).limit(20)).all()
+        print(f"  LIKE scan of every message          {(time.perf_counter() - start) * 1000:6.1f} ms")
+
+        new = [Message(user_id=2, group_id=membership[2][0], content=' '.join(rng.choices(words, k=8)))
+               for _ in range(5000)]
+        MessageService.save_messages(new)
+        start = time.perf_counter()
+        indexed = search_indexer.sync()
+        print(f"incremental: {indexed} new messages indexed in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""Measure process start-up: importing the app and serving the first request.
+
+Each sample is a fresh interpreter against a migrated SQLite database:
+
+* ``from app import app`` - the default app, with Flask-Migrate for the CLI;
+* ``... + create_all`` - the same, then ``db.create_all()``, which is what
+  every process used to do on start-up;
+* ``wsgi (create_app)`` - the server entry point, ``create_app(migrations=False)``;
+* ``preload + fork`` - a Gunicorn-style preloading master: it builds and warms
+  up the app once, then each sample forks a worker, runs ``after_fork`` and
+  serves the first request. Only the fork-to-response time is per worker.
+
+``import`` is the time to import and build the app, ``first request`` the
+time until the first ``/login`` response (for forked workers, from the fork).
+
+Usage (from the sacco-app directory):
+
+    python benchmarks/bench_startup.py --runs 10
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = r'''
+import json, time
+start = time.perf_counter()
+{build}
+imported = time.perf_counter()
+if {create_all}:
+    with app.app_context():
+        db.create_all()
+ready = time.perf_counter()
+response = app.test_client().get('/login')
+first = time.perf_counter()
+assert response.status_code == 200, response.status_code
+print(json.dumps({{'import': imported - start, 'ready': ready - start, 'first_request': first - start}}))
+'''
+
+BUILDS = {
+    'default': 'from app import app, db',
+    'wsgi': 'from wsgi import app\nfrom app import db',
+}
+
+FORK_PROBE = r'''
+import json, os, time
+start = time.perf_counter()
+from wsgi import app
+from app import after_fork, warm_up
+warm_up(app)
+imported = time.perf_counter()
+samples = []
+for _ in range({runs}):
+    read_end, write_end = os.pipe()
+    forked = time.perf_counter()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_end)
+        after_fork(app)
+        response = app.test_client().get('/login')
+        os.write(write_end, str(response.status_code).encode())
+        os._exit(0)
+    os.close(write_end)
+    status = os.read(read_end, 16)
+    samples.append(time.perf_counter() - forked)
+    os.close(read_end)
+    os.waitpid(pid, 0)
+    assert status == b'200', status
+print(json.dumps({{'import': imported - start, 'first_request': samples}}))
+'''
+
+
+def sample(build, create_all, env):
+    probe = PROBE.format(build=BUILDS[build], create_all=create_all)
+    output = subprocess.run([sys.executable, '-W', 'ignore', '-c', probe],
+                            cwd=ROOT, env=env, check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def report(label, samples, runs):
+    medians = {key: statistics.median(s[key] for s in samples) * 1000 for key in samples[0]}
+    print(f"{label:<24} import {medians['import']:7.1f} ms   first request {medians['first_request']:7.1f} ms   "
+          f"(median of {runs})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10)
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp(prefix='sacco-bench-')
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(tmpdir, 'bench.db')}",
+               MAIL_OUTBOX_WORKER='false', SEARCH_INDEX_WORKER='false')
+    subprocess.run([sys.executable, '-m', 'flask', '--app', 'app', 'db', 'upgrade'],
+                   cwd=ROOT, env=env, check=True, capture_output=True)
+
+    for label, build, create_all in (('from app import app', 'default', False),
+                                     ('... + create_all', 'default', True),
+                                     ('wsgi (create_app)', 'wsgi', False)):
+        report(label, [sample(build, create_all, env) for _ in range(args.runs)], args.runs)
+
+    if hasattr(os, 'fork'):
+        output = subprocess.run([sys.executable, '-W', 'ignore', '-c', FORK_PROBE.format(runs=args.runs)],
+                                cwd=ROOT, env=env, check=True, capture_output=True, text=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(f"{'preload + fork':<24} master {result['import'] * 1000:7.1f} ms   first request "
+              f"{statistics.median(result['first_request']) * 1000:7.1f} ms   (after fork, median of {args.runs})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,246 @@
+"""Benchmark and check several SACCOs on one deployment (app/tenancy.py).
+
+Creates three tenants: ``alpha`` and ``beta`` share the main database,
+``gamma`` has a database of its own and ``--large`` times as many members.
+Each gets members in groups, with deposits and outstanding loans. Then:
+
+* the cost of resolving a request's tenant, and dashboard latency per tenant;
+* isolation: every tenant's member requests another tenant's group, searches
+  for its groups and presents its session cookie at another tenant's host;
+  scoped queries must only ever count the tenant's own rows;
+* settings: a change made in this process applies at once, and a change made
+  by another process (a bumped ``version``) within ``TENANT_CACHE_TTL``;
+* a large tenant's interest run (gamma, own database) against alpha's dashboard
+  latency while it runs, and the interest each tenant was charged at the rate
+  its loans were made at (beta's later rate changes leave them alone).
+  The job runs on a thread of this process, so alpha's requests share the GIL
+  with it; in production it is a ``batch.py --tenant gamma`` process and only
+  the database is shared, which for gamma it is not.
+
+Usage (from the sacco-app directory):
+
+    python benchmarks/bench_tenancy.py --members 5000 --large 10
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_tmpdir = tempfile.mkdtemp(prefix='sacco-bench-')
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(_tmpdir, 'bench.db')}")
+os.environ.setdefault('MAIL_OUTBOX_WORKER', 'false')
+os.environ.setdefault('SEARCH_INDEX_WORKER', 'false')
+os.environ.setdefault('NOTIFICATION_PUSH', 'false')
+
+from sqlalchemy import func, insert, select, update  # noqa: E402
+
+from app import app, db, search_indexer, tenants  # noqa: E402
+from app.jobs import accrue_interest  # noqa: E402
+from app.models import Group, LedgerEntry, Loan, MemberBalance, Savings, Tenant, User, group_members  # noqa: E402
+from app.services import TenantService  # noqa: E402
+from app.tenancy import setting, tenant_context  # noqa: E402
+
+GROUP_SIZE = 50
+LOAN_CENTS, LOAN_MONTHS = 120000, 12  # Every member's loan, approved the month before the interest run
+
+
+def seed(tenant, members, first_id):
+    """Members (ids from ``first_id``) in groups of GROUP_SIZE, each with a deposit and a loan at the tenant's rate."""
+    ids = range(first_id, first_id + members)
+    with tenant_context(tenant):
+        db.session.execute(insert(User), [{'id': i, 'username': f'{tenant.slug}{i}',
+                                           'email': f'{tenant.slug}{i}@example.com', 'password': 'x'} for i in ids])
+        groups = [{'id': first_id + n, 'name': f'{tenant.slug.title()} savers {n}', 'description': 'Monthly',
+                   'admin': first_id + n * GROUP_SIZE} for n in range((members + GROUP_SIZE - 1) // GROUP_SIZE)]
+        db.session.execute(insert(Group), groups)
+        db.session.execute(insert(group_members), [{'user_id': i, 'group_id': first_id + (i - first_id) // GROUP_SIZE}
+                                                   for i in ids])
+        db.session.execute(insert(Savings), [{'member_id': i, 'amount': 100.0, 'payment_status': 'completed'}
+                                             for i in ids])
+        db.session.execute(insert(Loan), [{'borrower_id': i, 'group_id': first_id + (i - first_id) // GROUP_SIZE,
+                                           'amount': LOAN_CENTS / 100, 'interest_rate': setting('LOAN_INTEREST_RATE'),
+                                           'repayment_period': LOAN_MONTHS, 'status': 'approved',
+                                           'approved_at': datetime(2026, 9, 15)} for i in ids])
+        db.session.execute(insert(MemberBalance), [{'member_id': i, 'savings_cents': 10000, 'loan_cents': LOAN_CENTS}
+                                                   for i in ids])
+        db.session.commit()
+    return [group['id'] for group in groups]
+
+
+def get(client, host, user_id, url):
+    with client.session_transaction(base_url=f'http://{host}') as session:
+        session['_user_id'] = str(user_id)
+    return client.get(url, base_url=f'http://{host}')
+
+
+def latencies(client, host, user_ids, url, stop=None):
+    samples = []
+    for user_id in user_ids:
+        if stop is not None and stop.is_set():
+            break
+        start = time.perf_counter()
+        response = get(client, host, user_id, url)
+        samples.append(time.perf_counter() - start)
+        assert response.status_code == 200, response.status_code
+    return samples
+
+
+def describe(samples):
+    samples = sorted(samples)
+    return (f"p50 {statistics.median(samples) * 1000:6.2f} ms  p95 {samples[int(len(samples) * 0.95)] * 1000:6.2f} ms"
+            f"  ({len(samples)} requests)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--members', type=int, default=2000, help='members of alpha and beta')
+    parser.add_argument('--large', type=int, default=10, help='gamma has this many times as many members')
+    parser.add_argument('--requests', type=int, default=300)
+    args = parser.parse_args()
+    app.config['TENANT_CACHE_TTL'] = 0.5
+
+    with app.app_context():
+        db.create_all()
+        TenantService.create_tenant('alpha', 'Alpha SACCO', hostname='alpha.test',
+                                    settings={'LOAN_INTEREST_RATE': 12.0})
+        TenantService.create_tenant('beta', 'Beta SACCO', hostname='beta.test', settings={'LOAN_INTEREST_RATE': 6.0})
+        TenantService.create_tenant('gamma', 'Gamma SACCO', hostname='gamma.test',
+                                    database_uri=f"sqlite:///{os.path.join(_tmpdir, 'gamma.db')}",
+                                    settings={'LOAN_INTEREST_RATE': 24.0})
+        alpha, beta, gamma = (tenants.get(slug) for slug in ('alpha', 'beta', 'gamma'))
+        db.metadata.create_all(tenants.engine_for(gamma))
+        started = time.perf_counter()
+        # alpha and beta share the main database, so their ids do not overlap; gamma's repeat alpha's
+        sizes = {alpha: (args.members, 1), beta: (args.members, args.members + 1), gamma: (args.members * args.large, 1)}
+        groups = {tenant: seed(tenant, members, first) for tenant, (members, first) in sizes.items()}
+        for tenant in (None, gamma):
+            with tenant_context(tenant):
+                search_indexer.rebuild()
+        print(f"seeded alpha and beta with {args.members} members, gamma with {args.members * args.large} "
+              f"in {time.perf_counter() - started:.1f} s")
+
+        with app.test_request_context(base_url='http://beta.test'):
+            tenants.resolve('beta.test')
+            started = time.perf_counter()
+            for _ in range(100000):
+                tenants._request_tenant()
+            print(f"tenant resolution: {(time.perf_counter() - started) * 10:.2f} us per request")
+
+        wrong = []
+        for tenant, (members, _) in sizes.items():
+            with tenant_context(tenant):
+                counts = (db.session.execute(select(func.count(User.id))).scalar(),
+                          db.session.execute(select(func.count(Savings.id))).scalar(),
+                          db.session.execute(select(func.count()).select_from(MemberBalance)).scalar(),
+                          db.session.execute(select(func.count(Group.id))).scalar())
+                if counts != (members, members, members, len(groups[tenant])):
+                    wrong.append(f'{tenant.slug} sees {counts}')
+                # A bulk UPDATE only touches the tenant's own rows
+                touched = db.session.execute(update(User).values(tier='standard')).rowcount
+                db.session.rollback()
+                if touched != members:
+                    wrong.append(f'{tenant.slug} updated {touched} members')
+        print(f"scoped queries: {'only own rows' if not wrong else 'LEAK ' + '; '.join(wrong)}")
+
+    client = app.test_client()
+    hosts = {alpha: 'alpha.test', beta: 'beta.test', gamma: 'gamma.test'}
+    for tenant, (members, first) in sizes.items():
+        user_ids = [first + (n * 7919) % members for n in range(args.requests)]
+        print(f"{tenant.slug} dashboard: {describe(latencies(client, hosts[tenant], user_ids, '/dashboard'))}")
+
+    leaks = []
+    for tenant, (_, first) in sizes.items():
+        for other, other_groups in groups.items():
+            if other is tenant:
+                continue
+            other_group = other_groups[-1]  # Past the end of alpha's groups, for gamma's repeated ids
+            if other_group not in groups[tenant]:
+                status = get(client, hosts[tenant], first, f'/group/{other_group}').status_code
+                if status != 404:
+                    leaks.append(f'{tenant.slug} got {status} for {other.slug} group {other_group}')
+        with app.app_context(), tenant_context(tenant):
+            db.session.execute(update(User).where(User.id == first).values(role='admin'))
+            db.session.commit()
+        for other in sizes:
+            body = get(client, hosts[tenant], first, f'/search?type=groups&q={other.slug}').data.decode()
+            found = f'{other.slug.title()} savers' in body
+            if found != (other is tenant):
+                leaks.append(f"{tenant.slug} searching for {other.slug}: {'found' if found else 'missing'}")
+    # Signed in at alpha, then presenting the same cookie at gamma, where user 1 is someone else
+    # (as a cookie set for a parent domain shared by both would be)
+    get(client, 'alpha.test', 1, '/dashboard')
+    cookie = client.get_cookie(app.config['SESSION_COOKIE_NAME'], domain='alpha.test')
+    client.set_cookie(cookie.key, cookie.value, domain='gamma.test')
+    response = client.get('/notifications', base_url='http://gamma.test')
+    if response.status_code not in (302, 401):
+        leaks.append(f'alpha session at gamma: {response.status_code}')
+    status = client.get('/dashboard', base_url='http://unknown.test').status_code
+    if status != 404:
+        leaks.append(f'unknown host: {status}')
+    print(f"isolation between tenants: {'no leaks' if not leaks else 'LEAK ' + '; '.join(leaks)}")
+
+    with app.app_context():
+        with tenant_context(tenants.get('beta')):
+            before = setting('LOAN_INTEREST_RATE')
+        TenantService.update_tenant('beta', {'LOAN_INTEREST_RATE': 9.0})
+        with tenant_context(tenants.get('beta')):
+            after = setting('LOAN_INTEREST_RATE')
+        print(f"setting changed here: beta rate {before} -> {after}")
+        # As another process would: change the row and bump the version behind this process's back
+        db.session.execute(update(Tenant).where(Tenant.slug == 'beta')
+                           .values(settings={'LOAN_INTEREST_RATE': 7.5}, version=Tenant.version + 1))
+        db.session.commit()
+        started = time.perf_counter()
+        while True:
+            with tenant_context(tenants.get('beta')):
+                if setting('LOAN_INTEREST_RATE') == 7.5:
+                    break
+            time.sleep(0.01)
+        print(f"setting changed elsewhere: seen after {time.perf_counter() - started:.2f} s "
+              f"(TENANT_CACHE_TTL {app.config['TENANT_CACHE_TTL']} s)")
+        # Snapshots are replaced when a tenant changes
+        alpha, beta, gamma = (tenants.get(slug) for slug in ('alpha', 'beta', 'gamma'))
+        sizes = {tenants.get(tenant.slug): size for tenant, size in sizes.items()}
+
+    user_ids = [1 + (n * 7919) % args.members for n in range(args.requests)]
+    idle = latencies(client, 'alpha.test', user_ids, '/dashboard')
+    results = {}
+
+    def run_interest():
+        with app.app_context(), tenant_context(gamma):
+            results['gamma'] = accrue_interest('2026-10')
+
+    job = threading.Thread(target=run_interest)
+    job.start()
+    busy = []
+    while job.is_alive():
+        busy += latencies(client, 'alpha.test', user_ids[:20], '/dashboard')
+    job.join()
+    print(f"alpha dashboard, idle:              {describe(idle)}")
+    print(f"alpha dashboard, gamma interest on: {describe(busy)}")
+    print(f"gamma interest: {results['gamma']['rows']} rows in {results['gamma']['elapsed']:.2f} s")
+
+    with app.app_context():
+        for tenant in (alpha, beta):
+            with tenant_context(tenant):
+                accrue_interest('2026-10')
+        for tenant, (members, _) in sizes.items():
+            with tenant_context(tenant):
+                charged = db.session.execute(select(func.sum(LedgerEntry.amount_cents))
+                                             .where(LedgerEntry.entry_type == 'interest_accrual')).scalar() or 0
+                rate = db.session.execute(select(func.max(Loan.interest_rate))).scalar()
+                current = setting('LOAN_INTEREST_RATE')
+            # First month of the term: 1/12 of the flat interest, rounded down
+            expected = members * (round(LOAN_CENTS * rate / 100) // LOAN_MONTHS)
+            print(f"{tenant.slug} interest on loans at {rate}% (rate now {current}%): {charged} cents "
+                  f"({'as expected' if charged == expected else f'EXPECTED {expected}'})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+"""Benchmark sliding-window withdrawal limits: check cost, rebuild cost and the concurrency guarantee.
+
+Seeds one member with ``--history`` ledger entries (withdrawals spread over
+the last few days) and compares:
+
+* the limiter's check-and-reserve on a warm in-memory window (per call);
+* a SUM over the member's withdrawals in the window, the per-request query the
+  limiter replaces;
+* rebuilding the member's window from the ledger after a restart.
+
+It then fires ``--threads`` concurrent withdrawals at one member through
+``SavingsService.withdraw_savings``, checks that the total never exceeds the
+limit, and checks that the window slides.
+
+Usage (from the sacco-app directory):
+
+    python benchmarks/bench_withdrawal_limits.py --history 200000 --threads 16
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_tmpdir = tempfile.mkdtemp(prefix='sacco-bench-')
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(_tmpdir, 'bench.db')}")
+os.environ.setdefault('MAIL_OUTBOX_WORKER', 'false')
+
+from sqlalchemy import func, insert, select  # noqa: E402
+
+from app import app, db, withdrawal_limiter  # noqa: E402
+from app.limits import MemoryWindowStore  # noqa: E402
+from app.models import LedgerEntry, User  # noqa: E402
+from app.services import LedgerError, LedgerService, SavingsService  # noqa: E402
+
+
+def seed(history):
+    db.session.execute(insert(User), [{'id': i, 'username': f'saver{i}', 'email': f'saver{i}@example.com',
+                                       'password': 'x'} for i in (1, 2)])
+    now = datetime.utcnow()
+    start = now - timedelta(minutes=history)
+    savings = 0
+    batch = []
+    for n in range(history):
+        withdrawal = n % 10 == 9 and savings >= 5000
+        cents = 5000 if withdrawal else 20000
+        savings += -cents if withdrawal else cents
+        batch.append({'member_id': 1, 'entry_type': 'withdrawal' if withdrawal else 'deposit', 'amount_cents': cents,
+                      'savings_after_cents': savings, 'loan_after_cents': 0, 'created_at': start + timedelta(minutes=n)})
+        if len(batch) == 50000:
+            db.session.execute(insert(LedgerEntry), batch)
+            batch = []
+    if batch:
+        db.session.execute(insert(LedgerEntry), batch)
+    db.session.commit()
+
+
+def timed(func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--history', type=int, default=200000, help='ledger entries for the benchmarked member')
+    parser.add_argument('--threads', type=int, default=16)
+    args = parser.parse_args()
+    app.config['WITHDRAWAL_TIER_LIMITS'] = {'gold': 10 ** 9}  # Never refuses, so every timed call reserves
+
+    with app.app_context():
+        db.create_all()
+        seed(args.history)
+        window = app.config['WITHDRAWAL_WINDOW']
+
+        def naive_sum():
+            since = datetime.utcnow() - timedelta(seconds=window)
+            db.session.execute(select(func.coalesce(func.sum(LedgerEntry.amount_cents), 0))
+                               .where(LedgerEntry.member_id == 1, LedgerEntry.entry_type == 'withdrawal',
+                                      LedgerEntry.created_at >= since)).scalar()
+
+        def rebuild():
+            withdrawal_limiter.store = MemoryWindowStore()
+            withdrawal_limiter.reserve(1, 100, 'gold')
+
+        def reserve_release():
+            withdrawal_limiter.release(1, withdrawal_limiter.reserve(1, 100, 'gold'))
+
+        print(f"member with {args.history} ledger entries, window {window // 3600} h")
+        print(f"  SUM query per request      {timed(naive_sum, 50) * 1e6:9.1f} us")
+        print(f"  rebuild window from ledger {timed(rebuild, 50) * 1e6:9.1f} us  (first withdrawal after restart)")
+        withdrawal_limiter.reserve(1, 100, 'gold')
+        print(f"  warm check + reserve       {timed(reserve_release, 100000) * 1e6:9.2f} us")
+
+        # Concurrent withdrawals against the default limit for a member with plenty of savings
+        withdrawal_limiter.store = MemoryWindowStore()
+        LedgerService.post(2, 'deposit', 1000000)
+        limit = withdrawal_limiter.limit_for()
+        per_withdrawal = limit // 8 + 1  # Eight of these would exceed the limit
+        outcomes = {'ok': 0, 'refused': 0}
+        lock = threading.Lock()
+        barrier = threading.Barrier(args.threads)
+
+    def withdraw():
+        with app.app_context():
+            barrier.wait()
+            try:
+                SavingsService.withdraw_savings(2, per_withdrawal / 100)
+                outcome = 'ok'
+            except LedgerError:
+                outcome = 'refused'
+            finally:
+                db.session.remove()
+        with lock:
+            outcomes[outcome] += 1
+
+    threads = [threading.Thread(target=withdraw) for _ in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    with app.app_context():
+        withdrawn = db.session.execute(select(func.sum(LedgerEntry.amount_cents))
+                                       .where(LedgerEntry.member_id == 2, LedgerEntry.entry_type == 'withdrawal')
+                                       ).scalar() or 0
+        print(f"{args.threads} concurrent withdrawals of {per_withdrawal / 100:.2f} (limit {limit / 100:.2f}): "
+              f"{outcomes['ok']} ok, {outcomes['refused']} refused, {withdrawn / 100:.2f} withdrawn "
+              f"-> {'within limit' if withdrawn <= limit else 'LIMIT EXCEEDED'}")
+
+        # Shrink the window: earlier withdrawals slide out and the budget comes back
+        app.config['WITHDRAWAL_WINDOW'] = 1
+        time.sleep(1.1)
+        SavingsService.withdraw_savings(2, per_withdrawal / 100)
+        print("after the window passed, a further withdrawal was accepted")
+
+
+if __name__ == '__main__':
+    main()
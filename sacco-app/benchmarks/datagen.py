@@ -0,0 +1,231 @@
+"""Seeded synthetic SACCO data for scale tests.
+
+Bulk-loads users, groups, group memberships, savings deposits and the ledger
+(deposits, withdrawals, loan disbursements and repayments with consistent
+running balances and snapshots), loans, pending loan and membership requests,
+meetings, chat messages and notifications (with matching unread counters).
+The same ``--seed`` always produces the same data. Everything goes in with
+chunked executemany inserts, so 100k members and 1M transactions load in a
+few minutes on SQLite.
+
+User 1 is an admin (``admin@sacco.test``); members are ``member<N>`` with
+password ``password``.
+
+Usage (from the sacco-app directory, against an empty database):
+
+    DATABASE_URL=sqlite:////tmp/scale.db python benchmarks/datagen.py --scale large
+    python benchmarks/datagen.py --members 5000 --transactions 50000 --seed 7
+
+Import ``generate()`` to seed a database from another benchmark.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import date, datetime, time as dtime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SCALES = {
+    'small': {'members': 2000, 'transactions': 20000},
+    'medium': {'members': 20000, 'transactions': 200000},
+    'large': {'members': 100000, 'transactions': 1000000},
+}
+
+START = datetime(2023, 1, 1)
+SPAN_MINUTES = 3 * 365 * 24 * 60  # Histories spread over three years
+
+
+def _money(rng, low, high):
+    """Random whole-shilling amount between low and high shillings, in cents."""
+    return rng.randint(low, high) * 100
+
+
+def generate(members=2000, transactions=20000, seed=42, chunk_size=20000, progress=print):
+    """Load a synthetic data set into the app's (empty) database and return row counts per table."""
+    from sqlalchemy import bindparam, func, insert, select
+
+    from app import db
+    from app.models import (Group, LedgerEntry, Loan, LoanRequest, Meeting, MemberBalance, MembershipRequest,
+                            Message, Notification, Savings, User, group_members)
+    from app.money import from_cents
+
+    if db.session.execute(select(func.count(User.id))).scalar():
+        raise RuntimeError('datagen needs an empty database')
+    rng = random.Random(seed)
+    counts = {}
+    started = time.perf_counter()
+
+    def load(table, rows):
+        name = getattr(table, '__tablename__', None) or table.name
+        batch, total = [], 0
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= chunk_size:
+                db.session.execute(insert(table), batch)
+                total += len(batch)
+                batch = []
+        if batch:
+            db.session.execute(insert(table), batch)
+            total += len(batch)
+        db.session.commit()
+        counts[name] = counts.get(name, 0) + total
+        if progress:
+            progress(f"  {name:<20} {counts[name]:>9} rows  ({time.perf_counter() - started:6.1f} s)")
+
+    member_ids = range(2, members + 2)
+    group_count = max(1, members // 50)
+
+    # Notifications are planned up front so each user's unread counter is right on insert
+    notification_plan = {user_id: rng.randint(0, 10) for user_id in range(1, members + 2)}
+    unread_plan = {user_id: rng.randint(0, n) for user_id, n in notification_plan.items()}
+
+    load(User, [{'id': 1, 'username': 'admin', 'email': 'admin@sacco.test', 'password': 'password',
+                 'role': 'admin', 'unread_notifications': unread_plan[1]}] +
+         [{'id': i, 'username': f'member{i}', 'email': f'member{i}@sacco.test', 'password': 'password',
+           'phone_number': f'2547{i:08d}', 'role': 'member', 'unread_notifications': unread_plan[i]}
+          for i in member_ids])
+
+    group_admins = [rng.choice(member_ids) for _ in range(group_count)]
+    load(Group, ({'id': g, 'name': f'Chama {g}', 'description': f'Savings group {g}', 'admin': group_admins[g - 1]}
+                 for g in range(1, group_count + 1)))
+
+    memberships = {g: {group_admins[g - 1]} for g in range(1, group_count + 1)}
+    member_groups = {}
+    for member_id in member_ids:
+        joined = rng.sample(range(1, group_count + 1), min(group_count, rng.choice((1, 1, 1, 2, 2, 3))))
+        member_groups[member_id] = joined
+        for g in joined:
+            memberships[g].add(member_id)
+    load(group_members, ({'group_id': g, 'user_id': m} for g, users in memberships.items() for m in sorted(users)))
+    group_member_lists = {g: sorted(users) for g, users in memberships.items()}
+
+    # Loans: about one member in five has one; approved loans are disbursed through the ledger
+    loans = []
+    for loan_id, borrower in enumerate(sorted(rng.sample(member_ids, members // 5)), 1):
+        status = rng.choices(('approved', 'pending', 'paid', 'rejected'), (70, 10, 15, 5))[0]
+        amount = rng.randrange(5000, 200001, 500)
+        groups_of = member_groups.get(borrower) or [1]
+        loans.append({'id': loan_id, 'borrower_id': borrower, 'group_id': rng.choice(groups_of),
+                      'amount': float(amount), 'interest_rate': 10.0, 'repayment_period': rng.choice((6, 12, 24, 36)),
+                      'status': status, 'total_paid': 0.0, 'admin_id': 1})
+    loans_by_member = {loan['borrower_id']: loan for loan in loans if loan['status'] in ('approved', 'paid')}
+
+    # Transactions: skewed towards active members, each member's history in time order
+    activity = [rng.paretovariate(1.5) for _ in member_ids]
+    per_member = {}
+    for member_id in rng.choices(member_ids, weights=activity, k=transactions):
+        per_member[member_id] = per_member.get(member_id, 0) + 1
+
+    balances = {}
+    savings_rows = []
+
+    def ledger_rows():
+        reference = 0
+        for member_id in sorted(per_member):
+            n = per_member[member_id]
+            savings = loan_balance = 0
+            when = START + timedelta(minutes=rng.randrange(SPAN_MINUTES // 2))
+            step = max(1, (SPAN_MINUTES // 2) // n)
+            loan = loans_by_member.get(member_id)
+            for k in range(n):
+                when += timedelta(minutes=rng.randrange(1, step + 1))
+                reference += 1
+                if loan is not None and k == 0:
+                    cents = round(loan['amount'] * (1 + loan['interest_rate'] / 100) * 100)
+                    entry_type, loan_balance = 'loan_disbursement', loan_balance + cents
+                    ref = str(loan['id'])
+                elif loan_balance and rng.random() < 0.2:
+                    cents = min(loan_balance, _money(rng, 500, 20000))
+                    entry_type, loan_balance = 'loan_repayment', loan_balance - cents
+                    loan['total_paid'] += cents / 100
+                    ref = str(loan['id'])
+                elif savings and rng.random() < 0.15:
+                    cents = min(savings, _money(rng, 100, 1000))
+                    entry_type, savings = 'withdrawal', savings - cents
+                    ref = None
+                else:
+                    cents = _money(rng, 100, 10000)
+                    entry_type, savings = 'deposit', savings + cents
+                    ref = f'GEN{reference:010d}'
+                    savings_rows.append({'member_id': member_id, 'amount': cents / 100, 'transaction_id': ref,
+                                         'payment_status': 'completed', 'created_at': when})
+                yield {'member_id': member_id, 'entry_type': entry_type, 'amount_cents': cents,
+                       'savings_after_cents': savings, 'loan_after_cents': loan_balance, 'reference': ref,
+                       'created_at': when}
+            balances[member_id] = (savings, loan_balance, when)
+            if len(savings_rows) >= chunk_size:
+                db.session.execute(insert(Savings), savings_rows)
+                counts['savings'] = counts.get('savings', 0) + len(savings_rows)
+                savings_rows.clear()
+
+    load(LedgerEntry, ledger_rows())
+    load(Savings, savings_rows)
+    load(MemberBalance, ({'member_id': m, 'savings_cents': s, 'loan_cents': l, 'updated_at': when} for m, (s, l, when) in balances.items()))
+    table = User.__table__
+    db.session.execute(table.update().where(table.c.id == bindparam('u_id')).values(savings=bindparam('u_savings')),
+                       [{'u_id': m, 'u_savings': float(from_cents(s))} for m, (s, _, _) in balances.items()])
+    db.session.commit()
+
+    load(Loan, ({**loan, 'total_paid': round(loan['total_paid'], 2),
+                 'requested_at': START + timedelta(minutes=rng.randrange(SPAN_MINUTES // 2)),
+                 'approved_at': START + timedelta(minutes=SPAN_MINUTES // 2) if loan['status'] in ('approved', 'paid')
+                 else None} for loan in loans))
+    load(LoanRequest, ({'member_id': rng.choice(member_ids), 'amount': float(rng.randrange(1000, 50001, 500)),
+                        'interest_rate': 0.05, 'total_repayment': 0.0, 'status': 'pending',
+                        'created_at': START + timedelta(minutes=rng.randrange(SPAN_MINUTES))}
+                       for _ in range(max(1, members // 20))))
+    load(MembershipRequest, ({'user_id': rng.choice(member_ids), 'status': 'pending',
+                              'created_at': START + timedelta(minutes=rng.randrange(SPAN_MINUTES))}
+                             for _ in range(max(1, members // 50))))
+    load(Meeting, ({'title': f'Monthly meeting {month + 1}', 'group_id': g,
+                    'date': date(2025, 1, 1) + timedelta(days=30 * month), 'time': dtime(rng.choice((10, 14, 17))),
+                    'description': 'Contributions, loan reviews and any other business.'}
+                   for g in range(1, group_count + 1) for month in range(12)))
+
+    def message_rows():
+        for n in range(max(1, transactions // 5)):
+            g = rng.randrange(1, group_count + 1)
+            yield {'group_id': g, 'user_id': rng.choice(group_member_lists[g]),
+                   'content': f'Message {n} about contributions and upcoming meetings',
+                   'timestamp': START + timedelta(minutes=n * SPAN_MINUTES // max(1, transactions // 5))}
+    load(Message, message_rows())
+
+    def notification_rows():
+        for user_id, n in notification_plan.items():
+            unread = unread_plan[user_id]
+            for k in range(n):
+                yield {'user_id': user_id, 'message': f'Notification {k + 1}: your statement is ready',
+                       'is_read': k < n - unread, 'timestamp': START + timedelta(days=30 * k, minutes=user_id)}
+    load(Notification, notification_rows())
+
+    if progress:
+        progress(f"generated {sum(counts.values())} rows in {time.perf_counter() - started:.1f} s")
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scale', choices=sorted(SCALES), default='small')
+    parser.add_argument('--members', type=int, help='override the scale preset')
+    parser.add_argument('--transactions', type=int, help='override the scale preset')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--chunk-size', type=int, default=20000)
+    args = parser.parse_args()
+
+    from app import app, db
+    options = dict(SCALES[args.scale])
+    if args.members:
+        options['members'] = args.members
+    if args.transactions:
+        options['transactions'] = args.transactions
+    with app.app_context():
+        db.create_all()
+        print(f"{app.config['SQLALCHEMY_DATABASE_URI']}: {options['members']} members, "
+              f"{options['transactions']} transactions, seed {args.seed}")
+        generate(seed=args.seed, chunk_size=args.chunk_size, **options)
+
+
+if __name__ == '__main__':
+    main()
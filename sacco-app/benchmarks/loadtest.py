@@ -0,0 +1,383 @@
+"""Route-level load test: throughput and p50/p95/p99 latency per route, with stored baselines.
+
+Drives the main member, admin, M-Pesa and Socket.IO paths against a seeded
+data set (see ``datagen.py``; an empty database is seeded first). By default
+the app runs in-process behind Flask/Socket.IO test clients; with ``--url``
+the same scenarios hit a running server over HTTP. M-Pesa is served by the
+local stub from ``mpesa_stub.py``. Each worker thread is logged in as a
+different member.
+
+``--save-baseline NAME`` writes the results to ``benchmarks/baselines/NAME.json``;
+``--compare NAME`` checks a run against it and exits non-zero if any route's
+p95 grew, or its throughput dropped, by more than ``--tolerance``.
+
+Usage (from the sacco-app directory):
+
+    python benchmarks/loadtest.py --members 5000 --transactions 50000 --save-baseline local
+    python benchmarks/loadtest.py --compare local --routes dashboard,savings,chat_message
+
+    # Against a server that shares the database and SECRET_KEY (session cookies are
+    # signed locally) and has MPESA_LIVE_URL pointing at benchmarks/mpesa_stub.py:
+    DATABASE_URL=sqlite:////tmp/scale.db python benchmarks/loadtest.py --url http://127.0.0.1:5000
+"""
+import argparse
+import json
+import os
+import random
+import re
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+_tmpdir = tempfile.mkdtemp(prefix='sacco-bench-')
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(_tmpdir, 'bench.db')}")
+os.environ.setdefault('EXPORT_DIR', os.path.join(_tmpdir, 'exports'))
+os.environ.setdefault('MAIL_OUTBOX_WORKER', 'false')
+
+from mpesa_stub import MpesaStubServer  # noqa: E402
+
+# Started before the app is imported so the M-Pesa URLs in the config point at it
+_mpesa_stub = MpesaStubServer(token_latency=0.05, payment_latency=0.01).start()
+os.environ.setdefault('MPESA_LIVE_URL', _mpesa_stub.base_url)
+
+from sqlalchemy import func, select  # noqa: E402
+
+from app import app, db, socketio  # noqa: E402
+from app.models import Group, Savings, User, group_members  # noqa: E402
+import datagen  # noqa: E402
+
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines')
+CSRF_FIELD = re.compile(rb'name="csrf_token" type="hidden" value="([^"]+)"')
+
+SCENARIOS = {}
+
+
+def scenario(name, user='member'):
+    """Register a scenario run as ``user``: 'member', 'group_admin' or 'admin'."""
+    def register(func):
+        SCENARIOS[name] = (user, func)
+        return func
+    return register
+
+
+class InProcessClient:
+    """Flask test client with a logged-in session."""
+
+    def __init__(self, user_id):
+        self.http = app.test_client()
+        with self.http.session_transaction() as session:
+            session['_user_id'] = str(user_id)
+            session['_fresh'] = True
+
+    def request(self, method, path, **kwargs):
+        response = self.http.open(path, method=method, **kwargs)
+        return response.status_code, response.get_data()  # Drains streamed bodies too
+
+    def socket(self, namespace):
+        client = socketio.test_client(app, namespace=namespace, flask_test_client=self.http)
+        if not client.is_connected(namespace):
+            raise ConnectionError(f'{namespace} connection refused')
+        return InProcessSocket(client, namespace)
+
+
+class InProcessSocket:
+    def __init__(self, client, namespace):
+        self.client, self.namespace = client, namespace
+
+    def emit(self, event, data):
+        self.client.emit(event, data, namespace=self.namespace)
+        return self.client.get_received(self.namespace)
+
+    def close(self):
+        self.client.disconnect(namespace=self.namespace)
+
+
+class HttpClient:
+    """requests session against a running server, carrying a locally signed session cookie."""
+
+    def __init__(self, base_url, user_id):
+        import requests
+        from urllib.parse import urlsplit
+        self.base_url = base_url.rstrip('/')
+        self.http = requests.Session()
+        cookie = app.session_interface.get_signing_serializer(app).dumps({'_user_id': str(user_id), '_fresh': True})
+        # Same domain/path as the server's Set-Cookie, so updates replace it rather than sit beside it
+        self.http.cookies.set(app.config['SESSION_COOKIE_NAME'], cookie, domain=urlsplit(base_url).hostname, path='/')
+
+    def request(self, method, path, **kwargs):
+        response = self.http.request(method, self.base_url + path, allow_redirects=False, **kwargs)
+        return response.status_code, response.content
+
+    def socket(self, namespace):
+        import socketio as socketio_client
+        client = socketio_client.SimpleClient()
+        cookies = '; '.join(f'{name}={value}' for name, value in self.http.cookies.items())
+        client.connect(self.base_url, namespace=namespace, headers={'Cookie': cookies})
+        return HttpSocket(client)
+
+
+class HttpSocket:
+    def __init__(self, client):
+        self.client = client
+
+    def emit(self, event, data):
+        self.client.emit(event, data)
+        try:
+            return [self.client.receive(timeout=1)]
+        except Exception:  # TimeoutError from socketio; nothing pushed back
+            return []
+
+    def close(self):
+        self.client.disconnect()
+
+
+# Member pages
+
+@scenario('dashboard')
+def hit_dashboard(client, ctx):
+    return client.request('GET', '/dashboard')[0]
+
+
+@scenario('savings')
+def hit_savings(client, ctx):
+    return client.request('GET', '/savings')[0]
+
+
+@scenario('savings_deposit')
+def hit_savings_deposit(client, ctx):
+    # The CSRF token lives in the session, so one form fetch per worker is enough
+    if 'csrf_token' not in ctx:
+        ctx['csrf_token'] = CSRF_FIELD.search(client.request('GET', '/savings')[1]).group(1).decode()
+    status = client.request('POST', '/savings', data={'amount': '100', 'csrf_token': ctx['csrf_token']})[0]
+    return 'form rejected' if status == 200 else status  # Success redirects
+
+
+@scenario('mpesa_callback')
+def hit_mpesa_callback(client, ctx):
+    transaction_id = ctx['rng'].choice(ctx['transaction_ids'])
+    return client.request('POST', '/mpesa/callback', json={'transaction_id': transaction_id,
+                                                           'status': 'completed'})[0]
+
+
+@scenario('notifications')
+def hit_notifications(client, ctx):
+    return client.request('GET', '/notifications')[0]
+
+
+@scenario('mark_read')
+def hit_mark_read(client, ctx):
+    return client.request('POST', '/notifications/mark_read', json={'all': True})[0]
+
+
+@scenario('group_chat_page')
+def hit_group_chat_page(client, ctx):
+    return client.request('GET', f"/group/{ctx['group_id']}/chat")[0]
+
+
+@scenario('statement_csv')
+def hit_statement_csv(client, ctx):
+    return client.request('GET', '/exports/statement.csv')[0]
+
+
+# Admin pages
+
+@scenario('admin_dashboard', user='group_admin')
+def hit_admin_dashboard(client, ctx):
+    return client.request('GET', f"/admin/dashboard/{ctx['group_id']}")[0]
+
+
+@scenario('loan_queue', user='admin')
+def hit_loan_queue(client, ctx):
+    return client.request('GET', '/admin/approve_loans')[0]
+
+
+@scenario('membership_queue', user='admin')
+def hit_membership_queue(client, ctx):
+    return client.request('GET', '/admin/admit_members')[0]
+
+
+@scenario('loan_portfolio', user='admin')
+def hit_loan_portfolio(client, ctx):
+    return client.request('GET', '/admin/loan_portfolio')[0]
+
+
+# Socket.IO: connect, do the work, disconnect
+
+@scenario('chat_message')
+def hit_chat_message(client, ctx):
+    socket = client.socket('/chat')
+    try:
+        socket.emit('join', {'group_id': ctx['group_id']})
+        socket.emit('message', {'group_id': ctx['group_id'], 'content': 'Load test message'})
+    finally:
+        socket.close()
+    return 200
+
+
+@scenario('notifications_socket')
+def hit_notifications_socket(client, ctx):
+    client.socket('/notifications').close()
+    return 200
+
+
+def pick_users(count):
+    """Members with a group, group admins and the SACCO admin to run the scenarios as."""
+    with app.app_context():
+        members = db.session.execute(select(group_members.c.user_id, group_members.c.group_id)
+                                     .where(group_members.c.user_id > 1)
+                                     .order_by(func.random()).limit(count)).all()
+        group_admins = db.session.execute(select(Group.admin, Group.id).order_by(func.random()).limit(count)).all()
+        admin_id = db.session.execute(select(User.id).where(User.role == 'admin').limit(1)).scalar()
+        transaction_ids = db.session.execute(select(Savings.transaction_id).where(Savings.transaction_id.isnot(None))
+                                             .limit(2000)).scalars().all()
+    return {
+        'member': [dict(user_id=u, group_id=g) for u, g in members],
+        'group_admin': [dict(user_id=u, group_id=g) for u, g in group_admins],
+        'admin': [dict(user_id=admin_id, group_id=None)],
+    }, transaction_ids or ['NONE']
+
+
+def run_scenario(name, users, transaction_ids, make_client, requests, concurrency, warmup, seed):
+    """Run ``requests`` timed calls of one scenario over ``concurrency`` threads."""
+    role, func = SCENARIOS[name]
+    latencies, errors = [], []
+    lock = threading.Lock()
+    barrier = threading.Barrier(concurrency + 1)
+
+    def worker(index, count):
+        ctx = dict(users[role][index % len(users[role])], rng=random.Random(seed + index),
+                   transaction_ids=transaction_ids)
+        client = make_client(ctx['user_id'])
+        for _ in range(warmup):
+            try:
+                func(client, ctx)
+            except Exception:
+                pass  # Counted in the timed run; a dead worker would stall the barrier
+        barrier.wait()
+        mine, failed = [], []
+        for _ in range(count):
+            start = time.perf_counter()
+            try:
+                status = func(client, ctx)
+            except Exception as exc:
+                status = type(exc).__name__
+            mine.append(time.perf_counter() - start)
+            if not isinstance(status, int) or status >= 400:
+                failed.append(status)
+        with lock:
+            latencies.extend(mine)
+            errors.extend(failed)
+
+    share, extra = divmod(requests, concurrency)
+    threads = [threading.Thread(target=worker, args=(i, share + (i < extra))) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+
+    def percentile(q):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * q))] * 1000
+
+    return {
+        'requests': len(latencies),
+        'rps': len(latencies) / elapsed,
+        'p50_ms': statistics.median(latencies) * 1000,
+        'p95_ms': percentile(0.95),
+        'p99_ms': percentile(0.99),
+        'errors': len(errors),
+        'error_sample': sorted({str(status) for status in errors})[:3],
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Print deltas against a baseline and return the routes that regressed."""
+    regressed = []
+    print(f"\ncompared with baseline (tolerance {tolerance:.0%}):")
+    for name, result in results.items():
+        before = baseline['routes'].get(name)
+        if before is None:
+            print(f"  {name:<22} (not in baseline)")
+            continue
+        p95_delta = result['p95_ms'] / before['p95_ms'] - 1 if before['p95_ms'] else 0.0
+        rps_delta = result['rps'] / before['rps'] - 1 if before['rps'] else 0.0
+        worse = p95_delta > tolerance or rps_delta < -tolerance
+        if worse:
+            regressed.append(name)
+        print(f"  {name:<22} p95 {p95_delta:+7.1%}  req/s {rps_delta:+7.1%}{'  REGRESSION' if worse else ''}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', help='base URL of a running server (default: in-process test clients)')
+    parser.add_argument('--routes', help=f"comma-separated subset of: {', '.join(SCENARIOS)}")
+    parser.add_argument('--requests', type=int, default=300, help='timed requests per route')
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--warmup', type=int, default=3, help='untimed requests per worker before each route')
+    parser.add_argument('--members', type=int, default=2000, help='members to seed into an empty database')
+    parser.add_argument('--transactions', type=int, default=20000, help='transactions to seed into an empty database')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--save-baseline', metavar='NAME')
+    parser.add_argument('--compare', metavar='NAME')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed p95/throughput change (0.25 = 25%%)')
+    args = parser.parse_args()
+
+    names = args.routes.split(',') if args.routes else list(SCENARIOS)
+    unknown = set(names) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown routes: {', '.join(sorted(unknown))}")
+
+    with app.app_context():
+        db.create_all()
+        if not db.session.execute(select(func.count(User.id))).scalar():
+            print(f"seeding {args.members} members and {args.transactions} transactions")
+            datagen.generate(args.members, args.transactions, seed=args.seed, progress=None)
+
+    users, transaction_ids = pick_users(max(args.concurrency, 1))
+    if args.url:
+        def make_client(user_id):
+            return HttpClient(args.url, user_id)
+    else:
+        make_client = InProcessClient
+    mode = args.url or 'in-process'
+
+    print(f"{mode}: {args.requests} requests per route, concurrency {args.concurrency}")
+    print(f"  {'route':<22} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    results = {}
+    for name in names:
+        result = run_scenario(name, users, transaction_ids, make_client, args.requests, args.concurrency,
+                              args.warmup, args.seed)
+        results[name] = result
+        sample = f"  {', '.join(result['error_sample'])}" if result['errors'] else ''
+        print(f"  {name:<22} {result['rps']:8.1f} {result['p50_ms']:8.1f} {result['p95_ms']:8.1f} "
+              f"{result['p99_ms']:8.1f} {result['errors']:7d}{sample}")
+    print(f"M-Pesa stub: {_mpesa_stub.payment_requests} payments, {_mpesa_stub.token_requests} token requests")
+
+    report = {'mode': mode, 'requests': args.requests, 'concurrency': args.concurrency,
+              'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'), 'routes': results}
+    if args.save_baseline:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        path = os.path.join(BASELINE_DIR, f'{args.save_baseline}.json')
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"baseline saved to {path}")
+    if args.compare:
+        with open(os.path.join(BASELINE_DIR, f'{args.compare}.json')) as f:
+            regressed = compare(results, json.load(f), args.tolerance)
+        if regressed:
+            print(f"regressions: {', '.join(regressed)}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""Local stand-in for the M-Pesa token and paybill endpoints.
+
+Serves ``/oauth/v1/generate`` and ``/mpesa/paybill/v1/processpayment`` with a
+configurable artificial latency so the client can be benchmarked offline.
+Run it on its own with ``python benchmarks/mpesa_stub.py --port 8099`` and
+point the app at it with ``MPESA_LIVE_URL=http://127.0.0.1:8099/``.
+"""
+import argparse
+import itertools
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class MpesaStubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, so connection pooling is measurable
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        server = self.server
+        if not self.path.startswith('/oauth/v1/generate'):
+            return self._send_json(404, {'error': 'not found'})
+        time.sleep(server.token_latency)
+        with server.lock:
+            server.token_requests += 1
+            token = uuid.uuid4().hex
+            server.tokens.add(token)
+        self._send_json(200, {'access_token': token, 'expires_in': str(server.token_ttl)})
+
+    def do_POST(self):
+        server = self.server
+        length = int(self.headers.get('Content-Length', 0))
+        self.rfile.read(length)
+        if not self.path.startswith('/mpesa/paybill/v1/processpayment'):
+            return self._send_json(404, {'error': 'not found'})
+        auth = self.headers.get('Authorization', '')
+        if auth.removeprefix('Bearer ') not in server.tokens:
+            return self._send_json(401, {'error': 'invalid token'})
+        time.sleep(server.payment_latency)
+        with server.lock:
+            server.payment_requests += 1
+        self._send_json(200, {'transaction_id': f'STUB{next(server.counter):010d}'})
+
+
+class MpesaStubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port=0, token_latency=0.05, payment_latency=0.01, token_ttl=3599):
+        super().__init__(('127.0.0.1', port), MpesaStubHandler)
+        self.token_latency = token_latency
+        self.payment_latency = payment_latency
+        self.token_ttl = token_ttl
+        self.tokens = set()
+        self.token_requests = 0
+        self.payment_requests = 0
+        self.counter = itertools.count(1)
+        self.lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}/'
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run the M-Pesa stub server.')
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--token-latency', type=float, default=0.05)
+    parser.add_argument('--payment-latency', type=float, default=0.01)
+    args = parser.parse_args()
+    server = MpesaStubServer(args.port, args.token_latency, args.payment_latency)
+    print(f'M-Pesa stub listening on {server.base_url}')
+    server.serve_forever()
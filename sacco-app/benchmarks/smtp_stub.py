@@ -0,0 +1,80 @@
+"""Local SMTP stand-in built on aiosmtpd.
+
+Accepts mail on ``127.0.0.1:<port>`` with a configurable delay per session
+(greeting/EHLO, the cost of connecting to a real relay) and per message, and
+can reject a share of messages with a temporary 451 to exercise retries.
+Counts sessions and delivered messages. Run it on its own with
+``python benchmarks/smtp_stub.py --port 8025`` and point the app at it with
+``MAIL_SERVER=127.0.0.1 MAIL_PORT=8025 MAIL_USE_TLS=false``.
+"""
+import argparse
+import asyncio
+import random
+import threading
+import time
+
+from aiosmtpd.controller import Controller
+
+
+class StubHandler:
+    def __init__(self, session_latency, message_latency, reject_rate):
+        self.session_latency = session_latency
+        self.message_latency = message_latency
+        self.reject_rate = reject_rate
+        self.sessions = 0
+        self.delivered = []
+        self.rejected = 0
+        self.lock = threading.Lock()
+        self.random = random.Random(1)
+
+    async def handle_EHLO(self, server, session, envelope, hostname, responses):
+        await asyncio.sleep(self.session_latency)
+        with self.lock:
+            self.sessions += 1
+        session.host_name = hostname
+        return responses
+
+    async def handle_DATA(self, server, session, envelope):
+        await asyncio.sleep(self.message_latency)
+        with self.lock:
+            if self.random.random() < self.reject_rate:
+                self.rejected += 1
+                return '451 Temporary failure, try again later'
+            self.delivered.extend(envelope.rcpt_tos)
+        return '250 Message accepted'
+
+
+class SmtpStubServer:
+    def __init__(self, port=8025, session_latency=0.05, message_latency=0.005, reject_rate=0.0):
+        self.handler = StubHandler(session_latency, message_latency, reject_rate)
+        self.controller = Controller(self.handler, hostname='127.0.0.1', port=port)
+        self.port = port
+
+    def start(self):
+        self.controller.start()
+        return self
+
+    def stop(self):
+        self.controller.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=8025)
+    parser.add_argument('--session-latency', type=float, default=0.05)
+    parser.add_argument('--message-latency', type=float, default=0.005)
+    parser.add_argument('--reject-rate', type=float, default=0.0)
+    args = parser.parse_args()
+    server = SmtpStubServer(args.port, args.session_latency, args.message_latency, args.reject_rate).start()
+    print(f"SMTP stub listening on 127.0.0.1:{args.port}")
+    try:
+        while True:
+            time.sleep(5)
+            handler = server.handler
+            print(f"sessions={handler.sessions} delivered={len(handler.delivered)} rejected={handler.rejected}")
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -4,6 +4,23 @@ class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'your_default_secret_key'
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///site.db'  # Change as needed
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # Database engine (see app/database.py). Pool sizing applies per process.
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '10'))
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', '20'))
+    DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', '10'))  # Seconds to wait for a free connection
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', '1800'))  # Reconnect before server-side idle timeouts
+    DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING', 'true').lower() in ['true', 'on', '1']
+    # SQLite (dev/single node): WAL journal and connection PRAGMAs
+    SQLITE_WAL = os.environ.get('SQLITE_WAL', 'true').lower() in ['true', 'on', '1']
+    SQLITE_BUSY_TIMEOUT = int(os.environ.get('SQLITE_BUSY_TIMEOUT', '5000'))  # Milliseconds
+    SQLITE_CACHE_KB = int(os.environ.get('SQLITE_CACHE_KB', '20000'))
+    # Read replicas (see app/replicas.py): comma-separated URLs that work marked read-only (reports,
+    # exports, admin listings) runs on; unset sends everything to the primary
+    DATABASE_REPLICA_URLS = [url for url in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if url]
+    REPLICA_MAX_LAG = float(os.environ.get('REPLICA_MAX_LAG', '30'))  # Seconds; a replica further behind is skipped
+    REPLICA_CHECK_INTERVAL = float(os.environ.get('REPLICA_CHECK_INTERVAL', '5'))  # Seconds between lag checks
+    REPLICA_SYNC_INTERVAL = float(os.environ.get('REPLICA_SYNC_INTERVAL', '10'))  # SQLite copies (batch.py replicas --sync)
     
     # Email configuration
     MAIL_SERVER = os.environ.get('MAIL_SERVER', 'smtp.googlemail.com')
@@ -11,30 +28,134 @@ class Config:
     MAIL_USE_TLS = os.environ.get('MAIL_USE_TLS', 'true').lower() in ['true', 'on', '1']
     MAIL_USERNAME = os.environ.get('MAIL_USERNAME')  # Set your environment variables
     MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD')  # Set your environment variables
+    MAIL_DEFAULT_SENDER = os.environ.get('MAIL_DEFAULT_SENDER', 'no-reply@sacco.example.com')
+    # Outbox: requests only queue mail; a dispatcher sends it in batches over one SMTP connection
+    MAIL_OUTBOX_WORKER = os.environ.get('MAIL_OUTBOX_WORKER', 'true').lower() in ['true', 'on', '1']  # In-process dispatcher thread
+    MAIL_BATCH_SIZE = int(os.environ.get('MAIL_BATCH_SIZE', '50'))  # Messages claimed and sent per SMTP session
+    MAIL_POLL_INTERVAL = float(os.environ.get('MAIL_POLL_INTERVAL', '2.0'))  # Seconds between outbox checks when idle
+    MAIL_MAX_ATTEMPTS = int(os.environ.get('MAIL_MAX_ATTEMPTS', '6'))  # Then the message is marked failed
+    MAIL_RETRY_BACKOFF = float(os.environ.get('MAIL_RETRY_BACKOFF', '30'))  # Seconds; doubles with every attempt
+    MAIL_CLAIM_TIMEOUT = int(os.environ.get('MAIL_CLAIM_TIMEOUT', '300'))  # Seconds before a stuck claim is retried
     ADMINS = ['your_admin_email@example.com']
     
+    # Background work: run deferred jobs inline instead of on the worker thread
+    TASK_QUEUE_EAGER = os.environ.get('TASK_QUEUE_EAGER', 'false').lower() in ['true', 'on', '1']
+    # Send bulk notifications (e.g. meeting fan-out) from the worker thread
+    NOTIFY_IN_BACKGROUND = os.environ.get('NOTIFY_IN_BACKGROUND', 'false').lower() in ['true', 'on', '1']
+
+    # Group chat: Socket.IO message queue (e.g. redis://localhost:6379/0) lets several
+    # worker processes share rooms; leave unset for a single in-process server
+    SOCKETIO_MESSAGE_QUEUE = os.environ.get('SOCKETIO_MESSAGE_QUEUE')
+    # threading, eventlet or gevent; must match the server's worker class (unset: the first one installed)
+    SOCKETIO_ASYNC_MODE = os.environ.get('SOCKETIO_ASYNC_MODE')
+    CHAT_BACKLOG_PAGE_SIZE = 50  # Messages sent to a client when it joins a group room
+    CHAT_PERSIST_BATCH_SIZE = 200  # Chat messages written per insert
+    CHAT_PERSIST_FLUSH_INTERVAL = 0.25  # Max seconds a message waits before it is written
+
+    # Push new notifications to the member's open pages over Socket.IO (/notifications namespace)
+    NOTIFICATION_PUSH = os.environ.get('NOTIFICATION_PUSH', 'true').lower() in ['true', 'on', '1']
+
+    # Fail any request that runs more SQL statements than its @query_budget (on in tests)
+    ENFORCE_QUERY_BUDGETS = os.environ.get('ENFORCE_QUERY_BUDGETS', 'false').lower() in ['true', 'on', '1']
+
+    # Per-endpoint latency/SQL/external-call histograms served on /metrics (Prometheus text format)
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() in ['true', 'on', '1']
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')  # Bearer token required to scrape, if set
+    # Sample the stacks of in-flight requests and keep profiles of those slower than the threshold
+    PROFILE_SLOW_REQUESTS = os.environ.get('PROFILE_SLOW_REQUESTS', 'false').lower() in ['true', 'on', '1']
+    SLOW_REQUEST_THRESHOLD = float(os.environ.get('SLOW_REQUEST_THRESHOLD', '1.0'))  # Seconds
+    PROFILER_INTERVAL = float(os.environ.get('PROFILER_INTERVAL', '0.005'))  # Seconds between stack samples
+    PROFILER_KEEP = 20  # Slow-request profiles kept in memory
+
     # Pagination settings for groups, loans, and other records
     POSTS_PER_PAGE = 20
 
+    # Full-text search (app/search.py): index new and edited rows in batches off the request path
+    SEARCH_INDEX_WORKER = os.environ.get('SEARCH_INDEX_WORKER', 'true').lower() in ['true', 'on', '1']  # In-process indexer thread
+    SEARCH_INDEX_BATCH_SIZE = int(os.environ.get('SEARCH_INDEX_BATCH_SIZE', '5000'))  # Rows indexed per transaction
+    SEARCH_INDEX_INTERVAL = float(os.environ.get('SEARCH_INDEX_INTERVAL', '5.0'))  # Max seconds between catch-ups
+    SEARCH_PAGE_SIZE = 20
+
+    # Response cache (app/cache.py): page blocks, values and ETags keyed on per-user/per-group versions
+    CACHE_ENABLED = os.environ.get('CACHE_ENABLED', 'true').lower() in ['true', 'on', '1']
+    # 'memory' for a single process; a redis:// URL shares entries and versions between workers and nodes
+    CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'memory')
+    CACHE_DEFAULT_TIMEOUT = int(os.environ.get('CACHE_DEFAULT_TIMEOUT', '300'))  # Seconds an entry is kept
+    CACHE_MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES', '10000'))  # Memory backend: LRU size
+    CALENDAR_HISTORY_DAYS = int(os.environ.get('CALENDAR_HISTORY_DAYS', '365'))  # Past meetings in calendars/feeds
+
+    # Archival (app/archive.py, `python batch.py archive`): keep the hot message/notification tables small
+    ARCHIVE_MESSAGES_AFTER_DAYS = int(os.environ.get('ARCHIVE_MESSAGES_AFTER_DAYS', '180'))
+    ARCHIVE_NOTIFICATIONS_AFTER_DAYS = int(os.environ.get('ARCHIVE_NOTIFICATIONS_AFTER_DAYS', '30'))  # Read ones only
+    ARCHIVE_BATCH_SIZE = int(os.environ.get('ARCHIVE_BATCH_SIZE', '1000'))  # Rows moved per transaction
+    ARCHIVE_BATCH_PAUSE = float(os.environ.get('ARCHIVE_BATCH_PAUSE', '0.05'))  # Seconds; lets live writers in
+
+    # Exports: rows fetched per server-side cursor batch, and the PDF statement process pool
+    EXPORT_CHUNK_SIZE = int(os.environ.get('EXPORT_CHUNK_SIZE', '2000'))
+    EXPORT_PDF_WORKERS = int(os.environ.get('EXPORT_PDF_WORKERS', '2'))
+    EXPORT_DIR = os.environ.get('EXPORT_DIR')  # Finished PDFs; defaults to <instance>/exports
+
+    # Statement imports: rows per transaction, and where uploaded statements are kept
+    IMPORT_CHUNK_SIZE = int(os.environ.get('IMPORT_CHUNK_SIZE', '5000'))
+    IMPORT_DIR = os.environ.get('IMPORT_DIR')  # Defaults to <instance>/imports
+
+    # Settlement reconciliation: how far apart a pending deposit and its settlement may be (seconds),
+    # statement lines sorted in memory per run, the statement's clock (Nairobi time), and where reports go
+    RECONCILE_WINDOW = int(os.environ.get('RECONCILE_WINDOW', '900'))
+    RECONCILE_RUN_SIZE = int(os.environ.get('RECONCILE_RUN_SIZE', '200000'))
+    RECONCILE_STATEMENT_UTC_OFFSET = float(os.environ.get('RECONCILE_STATEMENT_UTC_OFFSET', '3'))
+    RECONCILE_DIR = os.environ.get('RECONCILE_DIR')  # Defaults to <instance>/reconciliation
+
     # File upload settings
     UPLOADED_PHOTOS_DEST = os.environ.get('UPLOADED_PHOTOS_DEST', 'static/images/uploads')
 
     # Timezone settings
     TIMEZONE = os.environ.get('TIMEZONE', 'UTC')
 
-    # Loan interest rate settings (configurable per SACCO)
+    # Tenants (several SACCOs on one deployment; see app/tenancy.py). A request's tenant comes from its host,
+    # or from this header when a proxy sets it; unknown hosts get TENANT_DEFAULT. Tenant rows are re-read
+    # at most every TENANT_CACHE_TTL seconds when another process changes one
+    TENANT_HEADER = os.environ.get('TENANT_HEADER')  # e.g. 'X-Tenant'
+    TENANT_DEFAULT = os.environ.get('TENANT_DEFAULT', 'default')
+    TENANT_CACHE_TTL = float(os.environ.get('TENANT_CACHE_TTL', '5'))
+
+    # Loan interest rate settings (the default; each SACCO may override it, see app.tenancy.TENANT_SETTINGS)
     LOAN_INTEREST_RATE = float(os.environ.get('LOAN_INTEREST_RATE', '5.0'))  # Default interest rate 5%
+    # Loan eligibility (see app/eligibility.py): members may owe up to this multiple of their savings...
+    LOAN_SAVINGS_MULTIPLE = float(os.environ.get('LOAN_SAVINGS_MULTIPLE', '3.0'))
+    # ...while at least this share of their repayments were made on time
+    LOAN_MIN_ON_TIME_RATIO = float(os.environ.get('LOAN_MIN_ON_TIME_RATIO', '0.75'))
+
+    # Scheduled batch jobs (batch.py): members handled per transaction/checkpoint
+    BATCH_CHUNK_SIZE = int(os.environ.get('BATCH_CHUNK_SIZE', '1000'))
+    BATCH_SLICE_PAUSE = float(os.environ.get('BATCH_SLICE_PAUSE', '0'))  # Seconds between slices; lets other writers in
 
-    # Savings withdrawal limit per day
-    DAILY_WITHDRAWAL_LIMIT = float(os.environ.get('DAILY_WITHDRAWAL_LIMIT', '1000.00'))
+    # Savings withdrawals: at most the member's tier limit within any rolling window (see app/limits.py)
+    DAILY_WITHDRAWAL_LIMIT = float(os.environ.get('DAILY_WITHDRAWAL_LIMIT', '1000.00'))  # SACCO-wide default
+    # Per-tier overrides, e.g. "premium=5000,staff=20000"; other tiers get DAILY_WITHDRAWAL_LIMIT
+    WITHDRAWAL_TIER_LIMITS = {tier.strip(): float(limit) for tier, _, limit in
+                              (item.partition('=') for item in os.environ.get('WITHDRAWAL_TIER_LIMITS', '').split(',') if item)}
+    WITHDRAWAL_WINDOW = int(os.environ.get('WITHDRAWAL_WINDOW', str(24 * 3600)))  # Seconds
+    # 'memory' for a single node; a redis:// URL shares the counters between workers and nodes
+    WITHDRAWAL_LIMIT_STORE = os.environ.get('WITHDRAWAL_LIMIT_STORE', 'memory')
+    WEB_CONCURRENCY = int(os.environ.get('WEB_CONCURRENCY', '1'))  # Gunicorn worker processes (gunicorn.conf.py)
 
     # M-Pesa API configuration
     MPESA_CONSUMER_KEY = os.environ.get('MPESA_CONSUMER_KEY')  # M-Pesa Consumer Key
     MPESA_CONSUMER_SECRET = os.environ.get('MPESA_CONSUMER_SECRET')  # M-Pesa Consumer Secret
     MPESA_SHORTCODE = os.environ.get('MPESA_SHORTCODE')  # M-Pesa Shortcode
-    MPESA_LIVE_URL = 'https://api.safaricom.co.ke/'
+    MPESA_LIVE_URL = os.environ.get('MPESA_LIVE_URL', 'https://api.safaricom.co.ke/')  # Point at a stub for offline runs
     MPESA_TOKEN_URL = f'{MPESA_LIVE_URL}oauth/v1/generate?grant_type=client_credentials'
     MPESA_PAYBILL_URL = f'{MPESA_LIVE_URL}mpesa/paybill/v1/processpayment'  # Paybill endpoint
+    MPESA_TIMEOUT = (3.05, float(os.environ.get('MPESA_READ_TIMEOUT', '15')))  # (connect, read) seconds
+    MPESA_MAX_RETRIES = int(os.environ.get('MPESA_MAX_RETRIES', '2'))  # Connect errors; gateway errors only on the token fetch
+    MPESA_POOL_SIZE = int(os.environ.get('MPESA_POOL_SIZE', '20'))  # Pooled keep-alive connections
+    MPESA_TOKEN_REFRESH_MARGIN = 60  # Refresh the cached token this many seconds before expiry
+    MPESA_ASYNC_PAYMENTS = os.environ.get('MPESA_ASYNC_PAYMENTS', 'true').lower() in ['true', 'on', '1']
+    MPESA_ASYNC_WORKERS = int(os.environ.get('MPESA_ASYNC_WORKERS', '8'))
+    MPESA_CALLBACK_BATCH_SIZE = int(os.environ.get('MPESA_CALLBACK_BATCH_SIZE', '500'))  # Callbacks applied per transaction
+    MPESA_CALLBACK_FLUSH_INTERVAL = float(os.environ.get('MPESA_CALLBACK_FLUSH_INTERVAL', '0.05'))  # Max seconds a callback waits
+    MPESA_CALLBACK_RETRIES = int(os.environ.get('MPESA_CALLBACK_RETRIES', '3'))  # Attempts after a failed batch
 
 # Example for different environments
 class DevelopmentConfig(Config):
@@ -52,6 +173,10 @@ class TestingConfig(Config):
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'  # In-memory database for testing
     DEBUG = True
+    TASK_QUEUE_EAGER = True  # Run background jobs inline so tests stay deterministic
+    ENFORCE_QUERY_BUDGETS = True  # Fail requests that exceed their @query_budget
+    MPESA_ASYNC_PAYMENTS = False
+    WTF_CSRF_ENABLED = False  # Test clients post forms without a token
     # Additional testing-specific settings can be added here
 
 # You can add configurations for staging, QA, etc., as necessary
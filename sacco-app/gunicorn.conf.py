@@ -0,0 +1,55 @@
+"""Gunicorn settings for the SACCO web app (``gunicorn -c gunicorn.conf.py wsgi:app``).
+
+Workers are async (gevent by default): a worker serves many HTTP requests
+and Socket.IO connections at once while others wait on the database, SMTP
+or M-Pesa. With ``preload_app`` the master imports and warms up the app once
+(``app.warm_up``) and forks the workers from it, so a worker is ready as soon
+as it is forked; ``post_fork`` resets what a worker must not share with the
+master (``app.after_fork``).
+
+Every setting can be overridden from the environment:
+
+* ``GUNICORN_BIND`` (default ``0.0.0.0:8000``);
+* ``WEB_CONCURRENCY`` - worker processes (default 1);
+* ``GUNICORN_WORKER_CLASS`` - ``gevent`` (default), ``eventlet``,
+  ``geventwebsocket.gunicorn.workers.GeventWebSocketWorker`` or ``gthread``;
+* ``GUNICORN_WORKER_CONNECTIONS`` - concurrent clients per async worker;
+* ``GUNICORN_PRELOAD`` - set to ``false`` to import the app in each worker.
+
+With more than one worker, Socket.IO needs ``SOCKETIO_MESSAGE_QUEUE`` so that
+rooms span workers, and either sticky sessions at the load balancer or
+clients that connect with the websocket transport only: Gunicorn does not
+route a long-polling client back to the worker that holds its session. The
+withdrawal limits need a Redis ``WITHDRAWAL_LIMIT_STORE`` as well; the app
+will not start with the in-process store and more than one worker.
+"""
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('WEB_CONCURRENCY', '1'))
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gevent')
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', '1000'))
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'true').lower() in ['true', 'on', '1']
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '30'))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', '30'))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', '5'))
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG', '-')
+
+if preload_app and 'gevent' in worker_class:
+    # The master imports the app before forking, so patch before anything creates locks or sockets;
+    # gevent's worker would otherwise patch only after the fork
+    from gevent import monkey
+    monkey.patch_all()
+
+
+def when_ready(server):
+    if preload_app:
+        from app import warm_up
+        from wsgi import app
+        warm_up(app)
+
+
+def post_fork(server, worker):
+    from app import after_fork
+    from wsgi import app
+    after_fork(app)
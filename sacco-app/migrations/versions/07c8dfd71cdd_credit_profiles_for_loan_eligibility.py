@@ -0,0 +1,38 @@
+"""Credit profiles for loan eligibility
+
+Revision ID: 07c8dfd71cdd
+Revises: 824f93e78c70
+Create Date: 2026-10-18 18:59:19.263164
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '07c8dfd71cdd'
+down_revision = '824f93e78c70'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Existing repayment history is counted by `python batch.py eligibility` (app/eligibility.py)
+    op.create_table('credit_profile',
+    sa.Column('member_id', sa.Integer(), nullable=False),
+    sa.Column('repayments', sa.Integer(), nullable=False),
+    sa.Column('on_time_repayments', sa.Integer(), nullable=False),
+    sa.Column('last_repayment_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['member_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('member_id')
+    )
+    with op.batch_alter_table('loan_request', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('purpose', sa.String(length=500), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('loan_request', schema=None) as batch_op:
+        batch_op.drop_column('purpose')
+
+    op.drop_table('credit_profile')
@@ -0,0 +1,54 @@
+"""Archive tables for old chat messages and read notifications
+
+Revision ID: 824f93e78c70
+Revises: e4b19d7c3a58
+Create Date: 2026-10-18 18:26:47.505478
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '824f93e78c70'
+down_revision = 'e4b19d7c3a58'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Filled by `python batch.py archive` (app/archive.py); rows keep the ids they had in the hot tables
+    op.create_table('notification_archive',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('message', sa.String(length=255), nullable=False),
+    sa.Column('timestamp', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('notification_archive', schema=None) as batch_op:
+        batch_op.create_index('ix_notification_archive_user_id_timestamp_id', ['user_id', 'timestamp', 'id'], unique=False)
+
+    op.create_table('message_archive',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('content', sa.Text(), nullable=False),
+    sa.Column('timestamp', sa.DateTime(), nullable=True),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('group_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['group_id'], ['group.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('message_archive', schema=None) as batch_op:
+        batch_op.create_index('ix_message_archive_group_id_id', ['group_id', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('message_archive', schema=None) as batch_op:
+        batch_op.drop_index('ix_message_archive_group_id_id')
+
+    op.drop_table('message_archive')
+    with op.batch_alter_table('notification_archive', schema=None) as batch_op:
+        batch_op.drop_index('ix_notification_archive_user_id_timestamp_id')
+
+    op.drop_table('notification_archive')
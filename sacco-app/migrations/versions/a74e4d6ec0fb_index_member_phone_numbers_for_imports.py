@@ -0,0 +1,27 @@
+"""Index member phone numbers for statement imports
+
+Revision ID: a74e4d6ec0fb
+Revises: 07c8dfd71cdd
+Create Date: 2026-10-18 19:04:36.082264
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a74e4d6ec0fb'
+down_revision = '07c8dfd71cdd'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Statement imports (app/imports.py) look members up by phone number, a chunk at a time
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_user_phone_number'), ['phone_number'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_user_phone_number'))
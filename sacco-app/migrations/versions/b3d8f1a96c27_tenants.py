@@ -0,0 +1,56 @@
+"""Tenants: host several SACCOs, with the core tables scoped by tenant_id
+
+Revision ID: b3d8f1a96c27
+Revises: a74e4d6ec0fb
+Create Date: 2026-10-18 21:12:48.530117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b3d8f1a96c27'
+down_revision = 'a74e4d6ec0fb'
+branch_labels = None
+depends_on = None
+
+# Existing rows belong to the default tenant (app.tenancy.DEFAULT_TENANT_ID)
+SCOPED_TABLES = ('user', 'group', 'savings', 'loan_request', 'loan', 'ledger_entry', 'member_balance', 'job_run')
+
+
+def upgrade():
+    tenant = op.create_table('tenant',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('slug', sa.String(length=50), nullable=False),
+    sa.Column('name', sa.String(length=150), nullable=False),
+    sa.Column('hostname', sa.String(length=255), nullable=True),
+    sa.Column('database_uri', sa.String(length=500), nullable=True),
+    sa.Column('settings', sa.JSON(), nullable=False),
+    sa.Column('active', sa.Boolean(), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('hostname'),
+    sa.UniqueConstraint('slug')
+    )
+    now = sa.func.current_timestamp()
+    op.execute(tenant.insert().values(id=1, slug='default', name='Default SACCO', settings={}, active=True,
+                                      version=1, created_at=now, updated_at=now))
+    for table in SCOPED_TABLES:
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.add_column(sa.Column('tenant_id', sa.Integer(), server_default='1', nullable=False))
+    with op.batch_alter_table('job_run', schema=None) as batch_op:
+        batch_op.drop_constraint('uq_job_run_job_period', type_='unique')
+        batch_op.create_unique_constraint('uq_job_run_tenant_id_job_period', ['tenant_id', 'job', 'period'])
+
+
+def downgrade():
+    with op.batch_alter_table('job_run', schema=None) as batch_op:
+        batch_op.drop_constraint('uq_job_run_tenant_id_job_period', type_='unique')
+        batch_op.create_unique_constraint('uq_job_run_job_period', ['job', 'period'])
+    for table in reversed(SCOPED_TABLES):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.drop_column('tenant_id')
+    op.drop_table('tenant')
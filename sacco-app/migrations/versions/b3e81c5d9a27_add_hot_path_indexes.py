@@ -0,0 +1,45 @@
+"""Add indexes on hot foreign keys and status filters
+
+Revision ID: b3e81c5d9a27
+Revises: 4f2f0101b857
+Create Date: 2026-10-18 16:52:08.114203
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b3e81c5d9a27'
+down_revision = '4f2f0101b857'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # message.group_id is already covered by ix_message_group_id_id (group_id, id)
+    with op.batch_alter_table('notification', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_notification_user_id'), ['user_id'], unique=False)
+
+    with op.batch_alter_table('savings', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_savings_member_id'), ['member_id'], unique=False)
+
+    with op.batch_alter_table('loan_request', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_loan_request_status'), ['status'], unique=False)
+
+    with op.batch_alter_table('membership_request', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_membership_request_status'), ['status'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('membership_request', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_membership_request_status'))
+
+    with op.batch_alter_table('loan_request', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_loan_request_status'))
+
+    with op.batch_alter_table('savings', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_savings_member_id'))
+
+    with op.batch_alter_table('notification', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_notification_user_id'))
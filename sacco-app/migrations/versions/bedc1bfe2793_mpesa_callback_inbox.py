@@ -0,0 +1,39 @@
+"""M-Pesa callback inbox
+
+Revision ID: bedc1bfe2793
+Revises: f3a6c1d8b492
+Create Date: 2026-10-19 09:14:27.666818
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'bedc1bfe2793'
+down_revision = 'f3a6c1d8b492'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('payment_callback',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('transaction_id', sa.String(length=64), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('received_at', sa.DateTime(), nullable=False),
+    sa.Column('applied_at', sa.DateTime(), nullable=True),
+    sa.Column('tenant_id', sa.Integer(), server_default='1', nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('tenant_id', 'transaction_id', 'status', name='uq_payment_callback_tenant_id_transaction_id_status')
+    )
+    with op.batch_alter_table('payment_callback', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_payment_callback_applied_at'), ['applied_at'], unique=False)
+        batch_op.create_index(batch_op.f('ix_payment_callback_transaction_id'), ['transaction_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('payment_callback', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_payment_callback_transaction_id'))
+        batch_op.drop_index(batch_op.f('ix_payment_callback_applied_at'))
+    op.drop_table('payment_callback')
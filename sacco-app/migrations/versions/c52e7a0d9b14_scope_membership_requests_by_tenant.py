@@ -0,0 +1,29 @@
+"""Scope membership requests by tenant
+
+Revision ID: c52e7a0d9b14
+Revises: b3d8f1a96c27
+Create Date: 2026-10-18 22:41:09.614230
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c52e7a0d9b14'
+down_revision = 'b3d8f1a96c27'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('membership_request', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('tenant_id', sa.Integer(), server_default='1', nullable=False))
+    # Requests belong to the tenant of the member who made them
+    op.execute('UPDATE membership_request SET tenant_id = '
+               '(SELECT coalesce(max("user".tenant_id), 1) FROM "user" WHERE "user".id = membership_request.user_id)')
+
+
+def downgrade():
+    with op.batch_alter_table('membership_request', schema=None) as batch_op:
+        batch_op.drop_column('tenant_id')
@@ -0,0 +1,35 @@
+"""Member withdrawal tiers; drop calendar-day withdrawal counters
+
+Revision ID: c71e4b2a9f03
+Revises: 9e98da28c0e6
+Create Date: 2026-10-18 17:40:12.204117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c71e4b2a9f03'
+down_revision = '9e98da28c0e6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('tier', sa.String(length=20), server_default='standard', nullable=False))
+
+    # Withdrawal limits are now a sliding window kept by the limiter (app/limits.py)
+    with op.batch_alter_table('member_balance', schema=None) as batch_op:
+        batch_op.drop_column('withdrawn_today_cents')
+        batch_op.drop_column('withdrawal_day')
+
+
+def downgrade():
+    with op.batch_alter_table('member_balance', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('withdrawal_day', sa.Date(), nullable=True))
+        batch_op.add_column(sa.Column('withdrawn_today_cents', sa.BigInteger(), server_default='0', nullable=False))
+
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_column('tier')
@@ -0,0 +1,42 @@
+"""Notification inbox keyset index and per-user unread counter
+
+Revision ID: d5a90e2c7f14
+Revises: b3e81c5d9a27
+Create Date: 2026-10-18 17:20:41.503117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd5a90e2c7f14'
+down_revision = 'b3e81c5d9a27'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('unread_notifications', sa.Integer(), server_default='0', nullable=False))
+
+    # The (user_id, timestamp, id) index serves inbox pages and every user_id lookup
+    with op.batch_alter_table('notification', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_notification_user_id'))
+        batch_op.create_index('ix_notification_user_id_timestamp_id', ['user_id', 'timestamp', 'id'], unique=False)
+
+    op.execute("UPDATE notification SET is_read = false WHERE is_read IS NULL")
+    op.execute("UPDATE notification SET timestamp = CURRENT_TIMESTAMP WHERE timestamp IS NULL")
+    op.execute(
+        'UPDATE "user" SET unread_notifications = ('
+        'SELECT COUNT(*) FROM notification WHERE notification.user_id = "user".id AND notification.is_read = false)'
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('notification', schema=None) as batch_op:
+        batch_op.drop_index('ix_notification_user_id_timestamp_id')
+        batch_op.create_index(batch_op.f('ix_notification_user_id'), ['user_id'], unique=False)
+
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_column('unread_notifications')
@@ -0,0 +1,57 @@
+"""Full-text search index tables and indexer high-water marks
+
+Revision ID: e4b19d7c3a58
+Revises: c71e4b2a9f03
+Create Date: 2026-10-18 18:05:41.736200
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4b19d7c3a58'
+down_revision = 'c71e4b2a9f03'
+branch_labels = None
+depends_on = None
+
+INDEX_TABLES = ('search_group', 'search_member', 'search_message', 'search_term')
+
+SQLITE_SCHEMA = (
+    "CREATE VIRTUAL TABLE search_group USING fts5("
+    "name, description, tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+    "CREATE VIRTUAL TABLE search_member USING fts5("
+    "username, tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+    "CREATE VIRTUAL TABLE search_message USING fts5("
+    "content, grp, content='', tokenize='unicode61 remove_diacritics 2', prefix='2 3 4')",
+    "CREATE TABLE search_term (term TEXT PRIMARY KEY) WITHOUT ROWID",
+)
+
+POSTGRES_SCHEMA = (
+    "CREATE TABLE search_group (id integer PRIMARY KEY, document tsvector NOT NULL)",
+    "CREATE TABLE search_member (id integer PRIMARY KEY, document tsvector NOT NULL)",
+    "CREATE TABLE search_message (id bigint PRIMARY KEY, group_id integer NOT NULL, document tsvector NOT NULL)",
+    "CREATE INDEX search_group_document ON search_group USING gin (document)",
+    "CREATE INDEX search_member_document ON search_member USING gin (document)",
+    "CREATE INDEX search_message_document ON search_message USING gin (document)",
+    "CREATE INDEX search_message_group_id ON search_message (group_id)",
+)
+
+
+def upgrade():
+    op.create_table('search_index_state',
+    sa.Column('source', sa.String(length=20), nullable=False),
+    sa.Column('last_id', sa.BigInteger(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('source')
+    )
+    # The index starts empty; the indexer fills it from id 0 (or run `python batch.py search --once`)
+    dialect = op.get_bind().dialect.name
+    for statement in {'sqlite': SQLITE_SCHEMA, 'postgresql': POSTGRES_SCHEMA}.get(dialect, ()):
+        op.execute(statement)
+
+
+def downgrade():
+    for table in INDEX_TABLES:
+        op.execute(f'DROP TABLE IF EXISTS {table}')
+    op.drop_table('search_index_state')
@@ -0,0 +1,44 @@
+"""Unique usernames and emails per tenant
+
+Revision ID: f3a6c1d8b492
+Revises: c52e7a0d9b14
+Create Date: 2026-10-18 23:37:52.104871
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3a6c1d8b492'
+down_revision = 'c52e7a0d9b14'
+branch_labels = None
+depends_on = None
+
+# The initial schema left these unnamed; batch mode names them by this convention on SQLite
+NAMING_CONVENTION = {'uq': 'uq_%(table_name)s_%(column_0_name)s'}
+
+
+def _unique_constraint(column):
+    """Name of the single-column unique constraint on user.``column``."""
+    for constraint in sa.inspect(op.get_bind()).get_unique_constraints('user'):
+        if constraint['column_names'] == [column]:
+            return constraint['name'] or f'uq_user_{column}'
+    raise LookupError(f'user.{column} has no unique constraint')
+
+
+def upgrade():
+    names = [_unique_constraint('username'), _unique_constraint('email')]
+    with op.batch_alter_table('user', schema=None, naming_convention=NAMING_CONVENTION) as batch_op:
+        for name in names:
+            batch_op.drop_constraint(name, type_='unique')
+        batch_op.create_unique_constraint('uq_user_tenant_id_username', ['tenant_id', 'username'])
+        batch_op.create_unique_constraint('uq_user_tenant_id_email', ['tenant_id', 'email'])
+
+
+def downgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_constraint('uq_user_tenant_id_email', type_='unique')
+        batch_op.drop_constraint('uq_user_tenant_id_username', type_='unique')
+        batch_op.create_unique_constraint('uq_user_email', ['email'])
+        batch_op.create_unique_constraint('uq_user_username', ['username'])
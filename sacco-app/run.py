@@ -1,4 +1,9 @@
-from app import app, socketio  # Import both 'app' and 'socketio' from your __init__.py
+"""Development server: ``python run.py``. Production runs Gunicorn (see gunicorn.conf.py)."""
+import os
+
+from app import create_app, socketio
 
 if __name__ == '__main__':
-    socketio.run(app, host='127.0.0.1', port=5000, debug=True)  # Use socketio.run to start the app
+    app = create_app()
+    socketio.run(app, host=os.environ.get('HOST', '127.0.0.1'), port=int(os.environ.get('PORT', '5000')),
+                 debug=os.environ.get('FLASK_DEBUG', 'true').lower() in ['true', 'on', '1'])
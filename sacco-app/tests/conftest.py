@@ -0,0 +1,149 @@
+"""Fixtures shared by the test suite.
+
+The app is built once with ``TestingConfig``: an in-memory database,
+background jobs run inline and ``ENFORCE_QUERY_BUDGETS`` on, so any request
+that runs more SQL than its view's ``@query_budget`` fails the test with
+``QueryBudgetExceeded``. Every test gets empty tables and an empty response
+cache.
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app, db as _db, mpesa, response_cache, tenants  # noqa: E402
+from app.cache import MemoryCache  # noqa: E402
+from app.instrumentation import QueryCounter  # noqa: E402
+from app.models import User  # noqa: E402
+from app.services import TenantService  # noqa: E402
+from app.tenancy import tenant_context  # noqa: E402
+from config import TestingConfig  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def app():
+    app = create_app(TestingConfig, migrations=False)
+    # Tenants are re-read once per test (below), so the lookup isn't counted against a view's budget
+    app.config['TENANT_CACHE_TTL'] = 3600
+    return app
+
+
+@pytest.fixture(autouse=True)
+def db(app):
+    """Empty tables for every test. Tests open their own app context for setup, as requests do."""
+    with app.app_context():
+        _db.create_all()
+        response_cache.backend = MemoryCache(app.config['CACHE_MAX_ENTRIES'])
+        tenants.invalidate()
+        tenants.all()
+    yield _db
+    with app.app_context():
+        _db.drop_all()
+
+
+@pytest.fixture
+def two_tenants(app, db):
+    """Two SACCOs sharing the database, ``alpha`` (the default tenant's id) at alpha.test and ``beta`` at beta.test."""
+    with app.app_context():
+        for slug in ('alpha', 'beta'):
+            TenantService.create_tenant(slug, f'{slug.title()} SACCO', hostname=f'{slug}.test')
+        return {slug: tenants.get(slug) for slug in ('alpha', 'beta')}
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def make_user(app, db):
+    """Create a member (or ``role='admin'``, of ``tenant``) with unique defaults; returns their id."""
+    created = []
+
+    def make(username=None, tenant=None, **fields):
+        username = username or f'user{len(created) + 1}'
+        fields.setdefault('email', f'{username}@example.com')
+        fields.setdefault('password', 'x')
+        fields.setdefault('phone_number', f'2547000{len(created) + 1:05d}')
+        with app.app_context(), tenant_context(tenant):
+            user = User(username=username, **fields)
+            db.session.add(user)
+            db.session.commit()
+            created.append(user.id)
+        return created[-1]
+    return make
+
+
+@pytest.fixture
+def login(client):
+    """Sign a user in on the test client by id (as Flask-Login would after the password step), at ``host``."""
+    def sign_in(user_id, host='localhost'):
+        with client.session_transaction(base_url=f'http://{host}') as session:
+            session['_user_id'] = str(user_id)
+            session['_fresh'] = True
+        return client
+    return sign_in
+
+
+class FakeGateway:
+    """Stands in for the pooled ``requests`` session: answers token fetches and payments, records the calls."""
+
+    def __init__(self):
+        self.calls = []
+
+    def get(self, url, **kwargs):
+        self.calls.append(('GET', url, kwargs))
+        return FakeResponse(200, {'access_token': 'token', 'expires_in': '3599'})
+
+    def post(self, url, json=None, **kwargs):
+        self.calls.append(('POST', url, json))
+        return FakeResponse(200, {'transaction_id': f'TX{len(self.calls)}'})
+
+
+class FakeResponse:
+    def __init__(self, status_code, body):
+        self.status_code = status_code
+        self._body = body
+
+    def json(self):
+        return self._body
+
+    def raise_for_status(self):
+        pass
+
+
+@pytest.fixture
+def mpesa_gateway(monkeypatch):
+    """Answer the M-Pesa client's HTTP calls in-process instead of calling Safaricom."""
+    gateway = FakeGateway()
+    monkeypatch.setattr(mpesa, '_session', gateway)
+    monkeypatch.setattr(mpesa, '_tokens', {})
+    return gateway
+
+
+@pytest.fixture
+def budgeted(app, client):
+    """Make a request to a view with a ``@query_budget`` and return the response.
+
+    The budget itself is enforced by the app (``ENFORCE_QUERY_BUDGETS``); this
+    also refuses requests to views that declare none, and attaches the number
+    of statements the request ran, counted with ``QueryCounter``, as
+    ``response.queries`` so tests can show how close a route is to its budget.
+    """
+    assert app.config['ENFORCE_QUERY_BUDGETS']
+    with app.app_context():
+        engine = _db.engine
+
+    def request(method, url, **kwargs):
+        endpoint, _ = app.url_map.bind('localhost').match(url.partition('?')[0], method=method)
+        budget = getattr(app.view_functions[endpoint], 'query_budget', None)
+        assert budget is not None, f'{endpoint} has no @query_budget'
+        with QueryCounter(engine) as counter:
+            response = client.open(url, method=method, **kwargs)
+            response.get_data()
+        response.queries = counter.count
+        response.query_budget = budget
+        return response
+    return request
@@ -0,0 +1,33 @@
+"""Registration and the MFA step of signing in."""
+import pyotp
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+from app.models import User
+from app.tenancy import tenant_context
+
+
+def test_username_and_email_are_unique_per_tenant(app, db, client, two_tenants):
+    form = {'username': 'wanjiku', 'email': 'wanjiku@example.com', 'password': 'secret', 'confirm_password': 'secret'}
+    for host in ('alpha.test', 'beta.test'):
+        assert client.post('/register', data=form, base_url=f'http://{host}').status_code == 302
+
+    with app.app_context(), tenant_context(two_tenants['beta']):
+        assert User.query.filter_by(username='wanjiku').count() == 1
+        db.session.add(User(username='wanjiku', email='other@example.com', password='x'))
+        with pytest.raises(IntegrityError):
+            db.session.commit()
+
+
+def test_mfa_verification(client, login, make_user):
+    secret = pyotp.random_base32()
+    login(make_user(two_factor_secret=secret, is_mfa_enabled=True))
+
+    assert client.get('/mfa_verification').status_code == 200
+    code = pyotp.TOTP(secret).now()
+    wrong = client.post('/mfa_verification', data={'mfa_code': f'{(int(code) + 1) % 10 ** 6:06d}'})
+    assert wrong.status_code == 200
+    assert b'Invalid MFA code' in wrong.data
+    right = client.post('/mfa_verification', data={'mfa_code': code})
+    assert right.status_code == 302
+    assert right.headers['Location'].endswith('/dashboard')
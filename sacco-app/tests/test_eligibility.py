@@ -0,0 +1,74 @@
+"""Loan eligibility: credit profiles and their rebuild (app/eligibility.py)."""
+from datetime import datetime, timedelta
+
+from app.eligibility import credit_limit, rebuild_profiles
+from app.models import CreditProfile, Group, Loan
+from app.services import LedgerService, LoanService
+from app.tenancy import tenant_context
+
+CONFIG = {'LOAN_SAVINGS_MULTIPLE': 3.0, 'LOAN_MIN_ON_TIME_RATIO': 0.75}
+
+
+def test_credit_limit():
+    credit = credit_limit(100_000, 20_000, 4, 3, CONFIG, pending_cents=50_000, approved_cents=30_000)
+    assert credit['max_loan'] == 3000
+    assert (credit['approvable_cents'], credit['available_cents'], credit['reason']) == (250_000, 200_000, None)
+    assert credit['on_time_ratio'] == 0.75
+
+    assert credit_limit(100_000, 300_000, 0, 0, CONFIG)['reason'] == 'Savings do not cover any more borrowing.'
+    late = credit_limit(100_000, 0, 4, 2, CONFIG)
+    assert (late['available_cents'], late['approvable_cents'], late['reason']) == (0, 0, 'Too few repayments made on time.')
+
+
+def profile(db, member):
+    row = db.session.get(CreditProfile, member, populate_existing=True)
+    return row.repayments, row.on_time_repayments
+
+
+def test_repayments_update_the_loan_and_profile_as_a_rebuild_would(app, db, make_user):
+    member, other = make_user('borrower'), make_user('other')
+    with app.app_context():
+        group = Group(name='Savers', admin=member)
+        db.session.add(group)
+        db.session.commit()
+        # Past its last instalment, so on time only once paid in full (1320)
+        loan = Loan(borrower_id=member, group_id=group.id, amount=1200.0, interest_rate=10.0, repayment_period=12,
+                    status='approved', approved_at=datetime.utcnow() - timedelta(days=400))
+        db.session.add(loan)
+        db.session.commit()
+        LedgerService.post(member, 'loan_disbursement', 1200, reference=loan.id)
+        LedgerService.post(member, 'interest_accrual', 120, reference=loan.id)
+        LedgerService.post(other, 'loan_disbursement', 100)
+
+        LoanService.record_repayment(loan.id, 1000)
+        assert profile(db, member) == (1, 0)
+        LedgerService.post(member, 'loan_repayment', 320, reference=loan.id)
+        # Not their loan: the balance moves, the loan and profiles do not
+        LedgerService.post(other, 'loan_repayment', 50, reference=loan.id)
+
+        loan = db.session.get(Loan, loan.id, populate_existing=True)
+        assert (loan.total_paid, loan.status) == (1320.0, 'paid')
+        assert profile(db, member) == (2, 1)
+        assert db.session.get(CreditProfile, other) is None
+
+        rebuild_profiles(chunk_size=1)
+        assert profile(db, member) == (2, 1)
+        assert db.session.get(CreditProfile, other) is None
+
+
+def test_rebuild_leaves_other_tenants_profiles_alone(app, db, make_user, two_tenants):
+    alpha, beta = two_tenants['alpha'], two_tenants['beta']
+    # Ids interleave between tenants sharing the database
+    members = [make_user(f'member{n}', tenant=tenant) for n, tenant in enumerate((alpha, beta, alpha))]
+    for member, tenant in zip(members, (alpha, beta, alpha)):
+        with app.app_context(), tenant_context(tenant):
+            LedgerService.post(member, 'deposit', 100)
+            db.session.add(CreditProfile(member_id=member, repayments=4, on_time_repayments=3))
+            db.session.commit()
+
+    with app.app_context(), tenant_context(alpha):
+        assert rebuild_profiles(chunk_size=10)['members'] == 2
+
+    with app.app_context():
+        # alpha's members have no repayments on the ledger; beta's profile is not alpha's to rebuild
+        assert [profile.member_id for profile in CreditProfile.query.all()] == [members[1]]
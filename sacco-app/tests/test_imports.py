@@ -0,0 +1,102 @@
+"""Statement imports (app/imports.py) and settlement reconciliation (app/reconcile.py)."""
+import csv
+from datetime import datetime
+
+from app.imports import import_statement
+from app.models import LedgerEntry, Savings
+from app.reconcile import reconcile_statement
+from app.tenancy import tenant_context
+
+
+def statement(path, rows, header=('Receipt No', 'Completion Time', 'Paid In', 'Phone')):
+    with open(path, 'w', newline='') as handle:
+        csv.writer(handle).writerows([('Statement for SACCO collections',), header, *rows])
+    return str(path)
+
+
+def test_import_records_deposits_and_reports_the_rest(app, db, make_user, tmp_path):
+    member = make_user('payer', phone_number='254700000001')
+    first = statement(tmp_path / 'first.csv', [
+        ('R1', '2026-10-01 10:00:00', '1,000.50', '0700 000 001'),
+        ('R2', '2026-10-01 10:05:00', 'abc', '0700000001'),
+        ('R3', '01/10/2026', '50', '0799999999'),
+        ('R1', '2026-10-01 10:00:00', '1,000.50', '0700000001'),
+        ('R4', '2026-10-01 11:00:00', '(20.00)', '0700000001'),
+        ('', '2026-10-01 12:00:00', '10', '0700000001'),
+    ])
+    with app.app_context():
+        preview = import_statement(first, dry_run=True)
+        assert (preview['status'], preview['imported'], Savings.query.count()) == ('dry_run', 1, 0)
+
+        summary = import_statement(first)
+        assert {key: summary[key] for key in ('rows', 'imported', 'duplicates', 'skipped', 'rejected')} == \
+            {'rows': 6, 'imported': 1, 'duplicates': 1, 'skipped': 1, 'rejected': 3}
+        assert summary['reasons'] == {"unreadable amount 'abc'": 1, 'member not found': 1, 'missing reference': 1}
+        assert summary['amount_cents'] == 100_050
+        [deposit] = Savings.query.all()
+        assert (deposit.member_id, deposit.transaction_id, deposit.payment_status) == (member, 'R1', 'completed')
+        assert LedgerEntry.query.filter_by(member_id=member, entry_type='deposit').count() == 1
+
+        assert import_statement(first)['imported'] == 0  # A completed import is not run again
+        overlapping = import_statement(statement(tmp_path / 'second.csv', [
+            ('R1', '2026-10-01 10:00:00', '1000.50', '0700000001'),
+            ('R5', '2026-10-02 09:00:00', '200', '0700000001'),
+        ]))
+        assert (overlapping['imported'], overlapping['duplicates']) == (1, 1)
+
+
+def test_reference_of_another_tenant_is_a_conflict_not_a_duplicate(app, db, make_user, two_tenants, tmp_path):
+    alpha, beta = two_tenants['alpha'], two_tenants['beta']
+    make_user('alpha-payer', tenant=alpha, phone_number='254700000001')
+    make_user('beta-payer', tenant=beta, phone_number='254700000002')
+    with app.app_context(), tenant_context(alpha):
+        import_statement(statement(tmp_path / 'alpha.csv', [('R1', '2026-10-01 10:00:00', '100', '0700000001')]))
+
+    path = statement(tmp_path / 'beta.csv', [('R1', '2026-10-01 10:00:00', '100', '0700000002'),
+                                             ('R2', '2026-10-01 11:00:00', '100', '0700000002')])
+    with app.app_context(), tenant_context(beta):
+        for summary in (import_statement(path, dry_run=True), import_statement(path)):
+            assert (summary['imported'], summary['duplicates'], summary['rejected']) == (1, 0, 1)
+            assert summary['errors'] == [(1, 'reference on file for another SACCO')]
+        assert [deposit.transaction_id for deposit in Savings.query.all()] == ['R2']
+
+
+def test_reconcile_repairs_deposits_the_statement_settles(app, db, make_user, tmp_path, monkeypatch):
+    monkeypatch.setitem(app.config, 'RECONCILE_STATEMENT_UTC_OFFSET', 3)
+    member = make_user('payer', phone_number='254700000001')
+    with app.app_context():
+        deposits = [
+            Savings(member_id=member, amount=100.0, transaction_id='M1', payment_status='pending',
+                    created_at=datetime(2026, 10, 1, 9, 0)),  # Callback lost
+            Savings(member_id=member, amount=200.0, payment_status='pending',
+                    created_at=datetime(2026, 10, 1, 9, 10)),  # Receipt never attached
+            Savings(member_id=member, amount=300.0, transaction_id='M3', payment_status='completed',
+                    created_at=datetime(2026, 10, 1, 9, 30)),
+            Savings(member_id=member, amount=400.0, payment_status='pending',
+                    created_at=datetime(2026, 10, 1, 8, 50)),  # Never paid
+        ]
+        db.session.add_all(deposits)
+        db.session.commit()
+        ids = [deposit.id for deposit in deposits]
+    # Statement times are local (UTC+3)
+    path = statement(tmp_path / 'settlement.csv', [
+        ('M1', '2026-10-01 12:00:30', '100', '0700000001'),
+        ('M2', '2026-10-01 12:11:00', '200', '0700000001'),
+        ('M3', '2026-10-01 12:30:00', '350', '0700000001'),
+        ('M9', '2026-10-01 12:20:00', '75', '0799999999'),
+    ])
+
+    with app.app_context():
+        summary = reconcile_statement(path, report=str(tmp_path / 'dry.csv'))
+        assert summary['repaired'] == 0
+        assert {kind: n for kind, n in summary['counts'].items() if n} == \
+            {'matched': 2, 'amount_mismatch': 1, 'missing': 1, 'unsettled': 1}
+        assert summary['actions'] == {'complete': 1, 'attach': 1, 'fail': 1}
+
+        assert reconcile_statement(path, repair=True, report=str(tmp_path / 'repair.csv'))['repaired'] == 3
+        states = [(deposit.transaction_id, deposit.payment_status)
+                  for deposit in (db.session.get(Savings, i, populate_existing=True) for i in ids)]
+        assert states == [('M1', 'completed'), ('M2', 'completed'), ('M3', 'completed'), (None, 'failed')]
+        assert LedgerEntry.query.filter_by(entry_type='deposit').count() == 2
+
+        assert reconcile_statement(path, repair=True, report=str(tmp_path / 'again.csv'))['repaired'] == 0
@@ -0,0 +1,45 @@
+"""Monthly interest accrual (app/jobs.py)."""
+from datetime import datetime
+
+from app.jobs import accrue_interest
+from app.models import Group, LedgerEntry, Loan, MemberBalance
+from app.services import LoanService
+
+
+def test_loan_is_charged_its_flat_interest_once_over_its_term(app, db, make_user, monkeypatch):
+    monkeypatch.setitem(app.config, 'LOAN_INTEREST_RATE', 5.0)
+    member = make_user('borrower')
+    with app.app_context():
+        group = Group(name='Savers', admin=member)
+        db.session.add(group)
+        db.session.commit()
+        loan = Loan(borrower_id=member, group_id=group.id, amount=1000.0, interest_rate=10.0, repayment_period=3)
+        db.session.add(loan)
+        db.session.commit()
+        LoanService.approve_loan(loan.id)
+        loan.approved_at = datetime(2026, 9, 20)
+        db.session.commit()
+        assert db.session.get(MemberBalance, member).loan_cents == 100000  # Principal only
+
+        charged = [accrue_interest(period)['amount_cents'] for period in ('2026-09', '2026-10', '2026-11', '2026-12',
+                                                                          '2027-01')]
+        # The loan's own 10% (not the tenant's 5%), in three parts of the principal's interest
+        assert charged == [0, 3333, 3333, 3334, 0]
+        assert accrue_interest('2026-11')['rows'] == 0  # A completed period is not charged twice
+        assert db.session.get(MemberBalance, member).loan_cents == round(loan.calculate_total_due() * 100)
+        assert LedgerEntry.query.filter_by(entry_type='interest_accrual').count() == 3
+
+
+def test_only_approved_loans_accrue(app, db, make_user):
+    member = make_user('borrower')
+    with app.app_context():
+        group = Group(name='Savers', admin=member)
+        db.session.add(group)
+        db.session.commit()
+        db.session.add_all([Loan(borrower_id=member, group_id=group.id, amount=600.0, interest_rate=12.0,
+                                 repayment_period=6, status=status, approved_at=datetime(2026, 9, 1))
+                            for status in ('approved', 'paid', 'rejected')])
+        db.session.commit()
+        db.session.add(MemberBalance(member_id=member, savings_cents=0, loan_cents=60000))
+        db.session.commit()
+        assert accrue_interest('2026-10')['amount_cents'] == 1200
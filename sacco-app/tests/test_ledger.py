@@ -0,0 +1,74 @@
+"""The ledger and its balance snapshots (LedgerService in app/services.py)."""
+import pytest
+from sqlalchemy import func, select
+
+from app.models import LedgerEntry, MemberBalance, User
+from app.services import LedgerError, LedgerService
+
+
+def snapshot_matches_entries(db, member):
+    """The member's snapshot equals the sum of their entries, and the last entry's running balances."""
+    balance = db.session.get(MemberBalance, member, populate_existing=True)
+    totals = dict(db.session.execute(
+        select(LedgerEntry.entry_type, func.sum(LedgerEntry.amount_cents))
+        .where(LedgerEntry.member_id == member).group_by(LedgerEntry.entry_type)
+    ).all())
+    savings, loan = 0, 0
+    for entry_type, cents in totals.items():
+        savings_sign, loan_sign = LedgerService.ENTRY_EFFECTS[entry_type]
+        savings += savings_sign * cents
+        loan += loan_sign * cents
+    last = LedgerEntry.query.filter_by(member_id=member).order_by(LedgerEntry.id.desc()).first()
+    return ((balance.savings_cents, balance.loan_cents) == (savings, loan)
+            == (last.savings_after_cents, last.loan_after_cents))
+
+
+def test_post_moves_the_snapshot_with_each_entry(app, db, make_user):
+    member = make_user('saver')
+    with app.app_context():
+        LedgerService.post(member, 'deposit', 100.50)
+        LedgerService.post(member, 'loan_disbursement', 300)
+        entry = LedgerService.post(member, 'withdrawal', '40.25', reference='W1')
+        LedgerService.post(member, 'loan_repayment', 100)
+
+        assert (entry.amount_cents, entry.savings_after_cents, entry.reference) == (4025, 6025, 'W1')
+        assert snapshot_matches_entries(db, member)
+        balance = LedgerService.get_balance(member)
+        assert (balance.savings_cents, balance.loan_cents) == (6025, 20000)
+        assert db.session.get(User, member).savings == 60.25
+
+
+def test_post_refuses_overdrafts_and_over_repayment(app, db, make_user):
+    member = make_user('saver')
+    with app.app_context():
+        LedgerService.post(member, 'deposit', 100)
+        LedgerService.post(member, 'loan_disbursement', 50)
+        with pytest.raises(LedgerError, match='Insufficient savings'):
+            LedgerService.post(member, 'withdrawal', 100.01)
+        with pytest.raises(LedgerError, match='exceeds the outstanding loan balance'):
+            LedgerService.post(member, 'loan_repayment', 51)
+        with pytest.raises(LedgerError, match='must be positive'):
+            LedgerService.post(member, 'deposit', 0)
+        db.session.rollback()
+
+        assert LedgerEntry.query.count() == 2
+        assert snapshot_matches_entries(db, member)
+        assert LedgerService.get_balance(make_user('newcomer')).savings_cents == 0
+
+
+def test_post_many_matches_posting_one_at_a_time(app, db, make_user):
+    first, second = make_user('first'), make_user('second')
+    with app.app_context():
+        LedgerService.post(first, 'deposit', 10)
+        assert LedgerService.post_many([(first, 'deposit', 100, 'R1'), (second, 'loan_disbursement', 250, None),
+                                        (first, 'loan_disbursement', 30, None), (first, 'deposit', 5, 'R2')]) == 4
+
+        running = [(entry.savings_after_cents, entry.loan_after_cents)
+                   for entry in LedgerEntry.query.filter_by(member_id=first).order_by(LedgerEntry.id)]
+        assert running == [(1000, 0), (11000, 0), (11000, 3000), (11500, 3000)]
+        assert snapshot_matches_entries(db, first) and snapshot_matches_entries(db, second)
+        assert db.session.get(User, first).savings == 115.0
+
+        with pytest.raises(LedgerError, match='one at a time'):
+            LedgerService.post_many([(first, 'withdrawal', 1, None)])
+        assert LedgerService.post_many([]) == 0
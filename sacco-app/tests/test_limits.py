@@ -0,0 +1,81 @@
+"""Sliding-window withdrawal limits (app/limits.py)."""
+from datetime import datetime, timedelta
+
+import pytest
+from flask import Flask
+
+from app import withdrawal_limiter
+from app.limits import MemoryWindowStore, WithdrawalLimiter
+from app.models import LedgerEntry
+from app.services import LedgerError, LedgerService, SavingsService
+
+
+@pytest.fixture
+def saver(app, db, make_user, monkeypatch):
+    """A member with 1000 saved and a limit of 500, against an empty store."""
+    monkeypatch.setitem(app.config, 'DAILY_WITHDRAWAL_LIMIT', 500.0)
+    monkeypatch.setattr(withdrawal_limiter, 'store', MemoryWindowStore())
+    member = make_user('saver')
+    with app.app_context():
+        LedgerService.post(member, 'deposit', 1000)
+    return member
+
+
+def withdrawn(member):
+    return [entry.amount_cents for entry in LedgerEntry.query.filter_by(member_id=member, entry_type='withdrawal')]
+
+
+def test_withdrawals_over_the_limit_are_refused(app, db, saver):
+    with app.app_context():
+        SavingsService.withdraw_savings(saver, 300)
+        with pytest.raises(LedgerError, match='at most 500.00 in any 24 hours'):
+            SavingsService.withdraw_savings(saver, 201)
+        SavingsService.withdraw_savings(saver, 200)
+        assert withdrawn(saver) == [30_000, 20_000]
+
+
+def test_refused_withdrawal_gives_its_reservation_back(app, db, saver, make_user):
+    member = make_user('member')
+    with app.app_context():
+        LedgerService.post(member, 'deposit', 100)
+        with pytest.raises(LedgerError, match='Insufficient savings'):
+            SavingsService.withdraw_savings(member, 400)
+        LedgerService.post(member, 'deposit', 1000)
+        SavingsService.withdraw_savings(member, 500)
+        assert withdrawn(member) == [50_000]
+
+
+def test_window_is_seeded_from_the_ledger_after_a_restart(app, db, saver, monkeypatch):
+    with app.app_context():
+        SavingsService.withdraw_savings(saver, 300)
+        monkeypatch.setattr(withdrawal_limiter, 'store', MemoryWindowStore())
+        with pytest.raises(LedgerError, match='Withdrawal limit exceeded'):
+            SavingsService.withdraw_savings(saver, 201)
+
+        # Withdrawals older than the window no longer count
+        LedgerEntry.query.filter_by(member_id=saver, entry_type='withdrawal').update(
+            {'created_at': datetime.utcnow() - timedelta(hours=25)})
+        db.session.commit()
+        monkeypatch.setattr(withdrawal_limiter, 'store', MemoryWindowStore())
+        SavingsService.withdraw_savings(saver, 500)
+
+
+def test_memory_store_drops_empty_windows():
+    store = MemoryWindowStore()
+    token, used = store.reserve('a', 100, 500, 1000.0, 60, history=[])
+    assert used == 100
+    store.release('a', token)
+    assert 'a' not in store._windows
+
+    store.reserve('b', 100, 500, 1000.0, 60, history=[])
+    store.reserve('c', 100, 500, 1061.0, 60, history=[])
+    assert set(store._windows) == {'c'}
+
+
+def test_memory_store_refuses_several_workers():
+    app = Flask(__name__)
+    app.config['WEB_CONCURRENCY'] = 2
+    with pytest.raises(RuntimeError, match='WITHDRAWAL_LIMIT_STORE'):
+        WithdrawalLimiter(app)
+    app.config['WEB_CONCURRENCY'] = 1
+    assert isinstance(WithdrawalLimiter(app).store, MemoryWindowStore)
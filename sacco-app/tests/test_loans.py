@@ -0,0 +1,80 @@
+"""Loans: requests against the credit limit, and portfolio analytics."""
+from datetime import datetime
+
+import pytest
+
+from app.models import CreditProfile, Group, Loan, LoanRequest
+from app.services import LedgerError, LedgerService, LoanService
+from app.tenancy import tenant_context
+
+
+@pytest.fixture
+def saver(app, db, make_user, monkeypatch):
+    """A member with 1000 saved, so a limit of 3000."""
+    monkeypatch.setitem(app.config, 'LOAN_SAVINGS_MULTIPLE', 3.0)
+    member = make_user('saver')
+    with app.app_context():
+        LedgerService.post(member, 'deposit', 1000)
+    return member
+
+
+def test_outstanding_requests_use_up_the_credit_limit(app, db, saver):
+    with app.app_context():
+        LoanService.request_loan(saver, 2000)
+        assert LoanService.available_credit(saver)['available'] == 1000
+        with pytest.raises(LedgerError, match='at most 1000.00'):
+            LoanService.request_loan(saver, 1500)
+        LoanService.decide_loan_requests(approve=True)
+        # Approved requests are not on the ledger yet, but still count
+        assert LoanService.available_credit(saver)['available'] == 1000
+        LoanService.request_loan(saver, 1000)
+        with pytest.raises(LedgerError, match='beyond the loan requests outstanding'):
+            LoanService.request_loan(saver, 1)
+        assert LoanRequest.query.filter_by(member_id=saver).count() == 2
+
+
+def test_late_repayers_cannot_request_a_loan(app, db, saver):
+    with app.app_context():
+        db.session.add(CreditProfile(member_id=saver, repayments=4, on_time_repayments=2))
+        db.session.commit()
+        with pytest.raises(LedgerError, match='Too few repayments made on time'):
+            LoanService.request_loan(saver, 100)
+        assert LoanRequest.query.count() == 0
+
+
+def test_bulk_approval_stops_at_the_credit_limit(app, db, saver):
+    with app.app_context():
+        # Filed past the check (e.g. before the limit fell); the queue must not approve them all
+        requests = [LoanRequest(member_id=saver, amount=amount, total_repayment=amount, status='pending')
+                    for amount in (1200.0, 1200.0, 1200.0, 500.0)]
+        db.session.add_all(requests)
+        db.session.commit()
+        ids = [request.id for request in requests]
+
+        results = LoanService.decide_loan_requests(approve=True)
+        assert [results[i] for i in ids] == ['approved', 'approved', 'over_limit', 'approved']
+        assert db.session.get(LoanRequest, ids[2]).status == 'pending'
+        assert LoanService.decide_loan_requests([ids[2]])[ids[2]] == 'over_limit'
+
+
+def test_portfolio_only_covers_the_tenants_loans(app, db, make_user, login, budgeted, two_tenants):
+    admins = {}
+    for slug, amount in (('alpha', 1000.0), ('beta', 2000.0)):
+        tenant = two_tenants[slug]
+        admin = admins[slug] = make_user(f'{slug}-admin', tenant=tenant, role='admin')
+        with app.app_context(), tenant_context(tenant):
+            group = Group(name=f'{slug} savers', admin=admin)
+            db.session.add(group)
+            db.session.commit()
+            db.session.add(Loan(borrower_id=admin, group_id=group.id, amount=amount, repayment_period=6,
+                                status='approved', approved_at=datetime(2026, 9, 1)))
+            db.session.commit()
+
+    with app.app_context(), tenant_context(two_tenants['alpha']):
+        summary = LoanService.portfolio_summary()
+    assert (summary['loan_count'], summary['disbursed']) == (1, 1000.0)
+
+    login(admins['alpha'], host='alpha.test')
+    body = budgeted('GET', '/admin/loan_portfolio', base_url='http://alpha.test').get_data(as_text=True)
+    assert 'alpha savers' in body
+    assert 'beta savers' not in body
@@ -0,0 +1,96 @@
+"""The M-Pesa client (app/mpesa.py) and its payment callbacks."""
+from sqlalchemy.exc import OperationalError
+
+from app import mpesa
+from app.models import LedgerEntry, PaymentCallback, Savings
+from app.services import SavingsService
+from app.views.savings import payment_callbacks
+
+
+def test_async_deposit_attaches_transaction(app, db, make_user, login, client, mpesa_gateway, monkeypatch):
+    monkeypatch.setitem(app.config, 'MPESA_ASYNC_PAYMENTS', True)
+    monkeypatch.setattr(mpesa, '_executor', None)  # A pool of this test's own, drained below
+    login(make_user('saver'))
+
+    response = client.post('/savings', data={'amount': '250'})
+    mpesa._executor.shutdown(wait=True)
+
+    assert response.status_code == 302
+    [payment] = [json for method, _, json in mpesa_gateway.calls if method == 'POST']
+    assert payment['shortcode'] == app.config['MPESA_SHORTCODE']
+    with app.app_context():
+        savings = Savings.query.one()
+        assert savings.transaction_id is not None
+        assert savings.payment_status == 'pending'
+
+
+def pending_deposit(app, db, member, transaction_id=None):
+    with app.app_context():
+        savings = Savings(member_id=member, amount=250.0, transaction_id=transaction_id, payment_status='pending')
+        db.session.add(savings)
+        db.session.commit()
+        return savings.id
+
+
+def deposit_state(app, db, savings_id):
+    """The deposit's status, the member's ledger deposits and the callbacks still waiting in the inbox."""
+    with app.app_context():
+        savings = db.session.get(Savings, savings_id)
+        return (savings.payment_status, LedgerEntry.query.filter_by(entry_type='deposit').count(),
+                PaymentCallback.query.filter_by(applied_at=None).count())
+
+
+def test_repeated_callback_is_applied_once(app, db, client, make_user):
+    savings_id = pending_deposit(app, db, make_user('saver'), 'TX1')
+
+    for _ in range(2):
+        response = client.post('/mpesa/callback', json={'transaction_id': 'TX1', 'status': 'completed'})
+        assert response.json == {'status': 'ok'}
+
+    assert deposit_state(app, db, savings_id) == ('completed', 1, 0)
+    with app.app_context():
+        assert PaymentCallback.query.count() == 1
+
+
+def test_failed_batch_is_retried_and_kept_in_the_inbox(app, db, client, make_user, monkeypatch):
+    monkeypatch.setitem(app.config, 'TASK_QUEUE_EAGER', False)
+    member = make_user('saver')
+    settle = SavingsService.settle_deposits
+    failures = []
+
+    def flaky_settle(*args, **kwargs):
+        if len(failures) < failures_wanted:
+            failures.append(args)
+            raise OperationalError('UPDATE savings', {}, Exception('database is locked'))
+        return settle(*args, **kwargs)
+    monkeypatch.setattr(SavingsService, 'settle_deposits', staticmethod(flaky_settle))
+
+    # One failure: the batch is put back and applied on the next attempt
+    failures_wanted = 1
+    retried = pending_deposit(app, db, member, 'TX1')
+    assert client.post('/mpesa/callback', json={'transaction_id': 'TX1', 'status': 'completed'}).status_code == 200
+    payment_callbacks.join()
+    assert deposit_state(app, db, retried) == ('completed', 1, 0)
+
+    # Every attempt fails: the acknowledged callback waits in the inbox until the sweep applies it
+    failures.clear()
+    failures_wanted = payment_callbacks.retries + 1
+    stuck = pending_deposit(app, db, member, 'TX2')
+    assert client.post('/mpesa/callback', json={'transaction_id': 'TX2', 'status': 'completed'}).status_code == 200
+    payment_callbacks.join()
+    assert len(failures) == failures_wanted
+    assert deposit_state(app, db, stuck) == ('pending', 1, 1)
+    with app.app_context():
+        assert SavingsService.apply_payment_callbacks() == 1
+    assert deposit_state(app, db, stuck) == ('completed', 2, 0)
+
+
+def test_callback_before_the_receipt_is_stored_waits_for_it(app, db, client, make_user):
+    savings_id = pending_deposit(app, db, make_user('saver'))
+
+    assert client.post('/mpesa/callback', json={'transaction_id': 'TX1', 'status': 'completed'}).status_code == 200
+    assert deposit_state(app, db, savings_id) == ('pending', 0, 1)
+
+    with app.app_context():
+        SavingsService.attach_transaction(savings_id, 'TX1')
+    assert deposit_state(app, db, savings_id) == ('completed', 1, 0)
@@ -0,0 +1,84 @@
+"""Every view with a ``@query_budget`` is requested here, with data on the page, and must stay within it."""
+from datetime import date, datetime, time, timedelta
+
+import pytest
+
+from app.instrumentation import QueryBudgetExceeded
+from app.models import Group, Loan, LoanRequest, Meeting, MembershipRequest, Message, User
+from app.services import GroupService, LedgerService, NotificationService
+
+TOMORROW = date.today() + timedelta(days=1)
+
+# (endpoint, signed in as, method, url, request kwargs, expected status)
+REQUESTS = [
+    ('main.dashboard', 'member', 'GET', '/dashboard', {}, 200),
+    ('main.search', 'member', 'GET', '/search?type=groups&q=savers', {}, 200),
+    ('main.view_notifications', 'member', 'GET', '/notifications', {}, 200),
+    ('main.mark_notifications_read', 'member', 'POST', '/notifications/mark_read', {'json': {'all': True}}, 200),
+    ('savings.savings', 'member', 'GET', '/savings', {}, 200),
+    ('savings.savings', 'member', 'POST', '/savings', {'data': {'amount': '250'}}, 302),
+    ('savings.withdraw_savings', 'member', 'POST', '/savings/withdraw', {'data': {'withdraw-amount': '100'}}, 302),
+    ('groups.schedule_meeting', 'admin', 'GET', '/group/{group}/meeting', {}, 200),
+    ('groups.schedule_meeting', 'admin', 'POST', '/group/{group}/meeting',
+     {'data': {'title': 'AGM', 'date': TOMORROW.isoformat(), 'time': '10:00', 'description': 'Annual'}}, 302),
+    ('groups.group', 'member', 'GET', '/group/{group}', {}, 200),
+    ('groups.calendar', 'member', 'GET', '/group/{group}/calendar', {}, 200),
+    ('groups.group_calendar_feed', 'member', 'GET', '/group/{group}/calendar.ics', {}, 200),
+    ('groups.promote_admin', 'admin', 'POST', '/group/{group}/promote_admin/{member}', {}, 200),
+    ('loans.request_loan', 'member', 'GET', '/loans/request', {}, 200),
+    ('loans.request_loan', 'member', 'POST', '/loans/request', {'data': {'amount': '50', 'purpose': 'Stock'}}, 302),
+    ('loans.approve_loans', 'admin', 'GET', '/admin/approve_loans', {}, 200),
+    ('loans.loan_portfolio', 'admin', 'GET', '/admin/loan_portfolio', {}, 200),
+    ('loans.decide_loan_requests', 'admin', 'POST', '/admin/loan_requests/approve', {'json': {'all': True}}, 200),
+    ('chat.group_chat', 'member', 'GET', '/group/{group}/chat', {}, 200),
+    ('admin.admin_dashboard', 'admin', 'GET', '/admin/dashboard/{group}', {}, 200),
+    ('admin.admit_members', 'admin', 'GET', '/admin/admit_members', {}, 200),
+    ('admin.decide_membership_requests', 'admin', 'POST', '/admin/membership_requests/admit',
+     {'json': {'all': True}}, 200),
+]
+
+
+@pytest.fixture
+def sacco(app, db, make_user):
+    """An admin and a group of members with savings, meetings, notifications, chat and pending requests."""
+    admin = make_user('admin', role='admin')
+    members = [make_user(f'member{n}') for n in range(1, 6)]
+    with app.app_context():
+        group = Group(name='Savers', description='Monthly savers', admin=admin)
+        db.session.add(group)
+        db.session.commit()
+        for member in members:
+            GroupService.add_member(group.id, db.session.get(User, member))
+            LedgerService.post(member, 'deposit', 1000)
+        db.session.add_all([Meeting(title=f'Meeting {n}', date=TOMORROW + timedelta(days=n), time=time(10),
+                                    group_id=group.id) for n in range(3)])
+        db.session.add_all([Message(content=f'Hello {n}', user_id=members[n], group_id=group.id) for n in range(5)])
+        db.session.add_all([LoanRequest(member_id=member, amount=100.0, total_repayment=105.0) for member in members])
+        db.session.add_all([MembershipRequest(user_id=member) for member in members])
+        db.session.add_all([Loan(borrower_id=member, group_id=group.id, amount=500.0, repayment_period=6,
+                                 status='approved', approved_at=datetime(2026, 1, 1)) for member in members])
+        db.session.commit()
+        NotificationService.notify_many(members, 'Welcome to Savers')
+        return {'admin': admin, 'member': members[0], 'group': group.id}
+
+
+def test_every_budgeted_view_is_requested(app):
+    budgeted = {endpoint for endpoint, view in app.view_functions.items() if hasattr(view, 'query_budget')}
+    assert budgeted == {endpoint for endpoint, *_ in REQUESTS}
+
+
+@pytest.mark.parametrize('endpoint, who, method, url, kwargs, status', REQUESTS,
+                         ids=[f'{method} {endpoint}' for endpoint, _, method, *_ in REQUESTS])
+def test_route_within_query_budget(sacco, login, budgeted, mpesa_gateway, endpoint, who, method, url, kwargs,
+                                   status):
+    login(sacco[who])
+    response = budgeted(method, url.format(group=sacco['group'], member=sacco['member']), **kwargs)
+    assert response.status_code == status
+    assert response.queries <= response.query_budget
+
+
+def test_budget_overrun_fails_the_request(app, sacco, login, client, monkeypatch):
+    monkeypatch.setattr(app.view_functions['main.view_notifications'], 'query_budget', 1)
+    login(sacco['member'])
+    with pytest.raises(QueryBudgetExceeded):
+        client.get('/notifications')
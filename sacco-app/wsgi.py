@@ -0,0 +1,10 @@
+"""WSGI entry point for production servers.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+The app is built without Flask-Migrate (only ``flask db`` needs it); run
+``flask --app app db upgrade`` before starting or restarting the workers.
+"""
+from app import create_app
+
+app = create_app(migrations=False)